@@ -0,0 +1,419 @@
+#!/usr/bin/python3
+"""
+Minimal Assisted Installer API client.
+
+Keeps one keep-alive connection and one access token (refreshed from the
+offline token before it expires) for the whole wait, instead of an aicli
+fork that authenticates again every poll. Polling is adaptive: tight
+right after a change and while the cluster is one step before the
+awaited status, relaxed during long phases such as the disk writes of
+"installing". Host install progress is printed as it moves.
+
+The API and credentials are those of aicli: AI_URL (a local mock API can
+be used without credentials) and AI_OFFLINETOKEN or
+~/.aicli/offlinetoken.txt.
+
+Exit status: 0 when the status was reached, 1 on timeout or when the
+cluster failed, 2 when the API cannot be used, in which case callers fall
+back to aicli. A malformed command line exits with 3.
+"""
+
+import http.client
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+from urllib.parse import urlencode, urlparse
+
+from cli import ArgumentParser
+
+EXIT_FAILED = 1
+EXIT_UNAVAILABLE = 2
+
+DEFAULT_URL = "https://api.openshift.com/api/assisted-install/v2"
+TOKEN_URL = "https://sso.redhat.com/auth/realms/redhat-external/protocol/openid-connect/token"
+TOKEN_CLIENT_ID = "cloud-services"
+OFFLINE_TOKEN_FILE = os.path.expanduser("~/.aicli/offlinetoken.txt")
+# Refresh the access token this many seconds before it expires
+TOKEN_MARGIN = 60
+
+# Same budget as wait_for_cluster_status: 120 attempts * 60s
+DEFAULT_TIMEOUT = 7200
+# Poll intervals: after a change, at most when the awaited status is next,
+# and at most during long phases
+MIN_INTERVAL = 2
+NEAR_INTERVAL = 5
+MAX_INTERVAL = 30
+BACKOFF = 1.5
+# Progress from which a long phase is considered close to its end
+NEAR_PROGRESS = 80
+
+# Cluster statuses in installation order
+FLOW = ("pending-for-input", "insufficient", "ready", "preparing-for-installation",
+        "installing", "finalizing", "installed")
+LONG_PHASES = {"installing", "finalizing"}
+FAILED_STATUSES = {"error", "cancelled"}
+
+
+class AssistedUnavailable(Exception):
+    """Raised when the Assisted Installer API cannot be used."""
+
+
+class AssistedError(Exception):
+    def __init__(self, status: int, reason: str, body: str = ""):
+        super().__init__(f"{status} {reason}: {body[:200]}")
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+
+def offline_token() -> Optional[str]:
+    token = os.environ.get("AI_OFFLINETOKEN")
+    if token:
+        return token.strip()
+    try:
+        with open(OFFLINE_TOKEN_FILE) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+class AssistedClient:
+    """
+    API client with a keep-alive connection and a cached access token.
+    """
+
+    def __init__(self, url: str = DEFAULT_URL, token: Optional[str] = None,
+                 token_url: str = TOKEN_URL, timeout: float = 30):
+        """
+        Args:
+            url: The API base URL, e.g. .../api/assisted-install/v2
+            token: The offline token; requests are not authenticated without one
+            token_url: The SSO endpoint exchanging the offline token
+            timeout: Seconds per request
+        """
+        parsed = urlparse(url.rstrip("/"))
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.prefix = parsed.path
+        self.offline_token = token
+        self.token_url = token_url
+        self.timeout = timeout
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._access_token: Optional[str] = None
+        self._expires = 0.0
+
+    @classmethod
+    def from_environment(cls) -> "AssistedClient":
+        url = os.environ.get("AI_URL", DEFAULT_URL)
+        token = offline_token()
+        if token is None and url == DEFAULT_URL:
+            raise AssistedUnavailable(f"no offline token in AI_OFFLINETOKEN or {OFFLINE_TOKEN_FILE}")
+        return cls(url, token)
+
+    def _connect(self, scheme: str, host: str, port: Optional[int]) -> http.client.HTTPConnection:
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _authorization(self, refresh: bool = False) -> dict:
+        """
+        Returns the Authorization header, exchanging the offline token for
+        a new access token when the cached one is about to expire.
+        Raises:
+            AssistedUnavailable: The exchange was refused or its reply is malformed
+        """
+        if not self.offline_token:
+            return {}
+        if refresh or not self._access_token or time.time() >= self._expires - TOKEN_MARGIN:
+            url = urlparse(self.token_url)
+            conn = self._connect(url.scheme, url.hostname, url.port)
+            try:
+                conn.request("POST", url.path, body=urlencode({
+                    "grant_type": "refresh_token", "client_id": TOKEN_CLIENT_ID,
+                    "refresh_token": self.offline_token}),
+                    headers={"Content-Type": "application/x-www-form-urlencoded"})
+                response = conn.getresponse()
+                data = response.read()
+            finally:
+                conn.close()
+            if response.status >= 400:
+                raise AssistedUnavailable(f"token exchange failed: {response.status} "
+                                          f"{data.decode('utf-8', 'replace')[:200]}")
+            try:
+                reply = json.loads(data)
+                self._access_token = reply["access_token"]
+                self._expires = time.time() + float(reply.get("expires_in", 300))
+            except (ValueError, KeyError, TypeError) as e:
+                raise AssistedUnavailable(f"malformed token exchange reply: {e!r}")
+        return {"Authorization": f"Bearer {self._access_token}"}
+
+    def request(self, method: str, path: str, query: Optional[dict] = None,
+                body: Optional[dict] = None):
+        """
+        Sends a request over the kept-alive connection and decodes the JSON reply.
+        Args:
+            method: The HTTP method
+            path: The path below the API base URL, e.g. /clusters
+            query: Query parameters; None values are dropped
+            body: The JSON request body
+        Returns:
+            The decoded response
+        """
+        query = {k: v for k, v in (query or {}).items() if v is not None}
+        url = self.prefix + path + ("?" + urlencode(query) if query else "")
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        refreshed = False
+        attempt = 0
+        while True:
+            headers = {"Accept": "application/json", "User-Agent": "openshift-dpf/ai-client",
+                       **self._authorization(refresh=refreshed)}
+            if data is not None:
+                headers["Content-Type"] = "application/json"
+            if self._conn is None:
+                self._conn = self._connect(self.scheme, self.host, self.port)
+            try:
+                self._conn.request(method, url, body=data, headers=headers)
+                response = self._conn.getresponse()
+                reply = response.read()
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                    BrokenPipeError, ConnectionResetError):
+                # The server closed the idle keep-alive connection
+                self._conn.close()
+                self._conn = None
+                attempt += 1
+                if attempt > 1:
+                    raise
+                continue
+            if response.status == 401 and self.offline_token and not refreshed:
+                refreshed = True
+                continue
+            break
+        if response.status >= 400:
+            raise AssistedError(response.status, response.reason,
+                                reply.decode("utf-8", "replace"))
+        return json.loads(reply) if reply else {}
+
+    def find_cluster(self, name: str) -> dict:
+        """
+        Returns the cluster with the given name or id; of several clusters
+        with the same name, the most recently updated one.
+        """
+        clusters = [c for c in self.request("GET", "/clusters")
+                    if c.get("name") == name or c.get("id") == name]
+        if not clusters:
+            raise Exception(f"Cluster {name} not found")
+        return max(clusters, key=lambda c: c.get("updated_at", ""))
+
+    def cluster(self, cluster_id: str) -> dict:
+        return self.request("GET", f"/clusters/{cluster_id}")
+
+    def hosts(self, cluster: dict) -> list[dict]:
+        """
+        Returns the cluster's hosts, fetching the cluster when the object
+        (e.g. from a list) does not embed them.
+        """
+        if cluster.get("hosts") is not None:
+            return cluster["hosts"]
+        return self.cluster(cluster["id"]).get("hosts") or []
+
+    def install(self, cluster_id: str) -> dict:
+        return self.request("POST", f"/clusters/{cluster_id}/actions/install")
+
+
+@dataclass
+class HostProgress:
+    name: str
+    status: str
+    percentage: int
+    stage: str
+
+    @classmethod
+    def from_host(cls, host: dict) -> "HostProgress":
+        progress = host.get("progress") or {}
+        return cls(host.get("requested_hostname") or host.get("id", ""),
+                   host.get("status", ""),
+                   int(progress.get("installation_percentage") or 0),
+                   progress.get("current_stage", ""))
+
+    def describe(self) -> str:
+        return f"{self.name}: {self.status} {self.percentage}%" + (
+            f" {self.stage}" if self.stage else "")
+
+
+def next_interval(interval: float, changed: bool, status: str, target: str,
+                  progress: int) -> float:
+    """
+    Picks the delay before the next poll: back to the minimum after a
+    change, growing by BACKOFF while nothing moves, capped lower when the
+    awaited status is the next one (except early in a long phase).
+    Args:
+        interval: The previous delay
+        changed: Whether the status or a host stage changed since the last poll
+        status: The current cluster status
+        target: The awaited status
+        progress: The cluster's total install percentage
+    Returns:
+        float: Seconds to wait
+    """
+    if changed:
+        return MIN_INTERVAL
+    near = False
+    if status in FLOW and target in FLOW:
+        steps = FLOW.index(target) - FLOW.index(status)
+        near = steps == 1 and (status not in LONG_PHASES or progress >= NEAR_PROGRESS)
+    return min(interval * BACKOFF, NEAR_INTERVAL if near else MAX_INTERVAL)
+
+
+def reached(status: str, target: str) -> bool:
+    """
+    Whether status is target or a later step of the installation, which
+    a poll may see when the cluster passes target between two polls.
+    """
+    if status in FLOW and target in FLOW:
+        return FLOW.index(status) >= FLOW.index(target)
+    return status == target
+
+
+@dataclass
+class Waiter:
+    client: AssistedClient
+    name: str
+    timeout: float = DEFAULT_TIMEOUT
+    hosts: dict[str, HostProgress] = field(default_factory=dict)
+
+    def _report_hosts(self, cluster: dict) -> bool:
+        """
+        Prints the hosts whose status, stage or percentage moved.
+        Returns:
+            bool: Whether a host status or stage changed
+        """
+        changed = False
+        for host in map(HostProgress.from_host, self.client.hosts(cluster)):
+            previous = self.hosts.get(host.name)
+            if previous != host:
+                print(f"  {host.describe()}", flush=True)
+                changed = changed or previous is None or \
+                    (previous.status, previous.stage) != (host.status, host.stage)
+                self.hosts[host.name] = host
+        return changed
+
+    def wait(self, target: str) -> bool:
+        """
+        Polls the cluster until it reaches target (or a later status),
+        fails or the timeout expires.
+        Returns:
+            bool: Whether the status was reached
+        """
+        print(f"Waiting for cluster {self.name} to reach status: {target}", flush=True)
+        deadline = time.monotonic() + self.timeout
+        cluster_id = None
+        status = None
+        interval = MIN_INTERVAL
+        while True:
+            try:
+                if cluster_id is None:
+                    cluster_id = self.client.find_cluster(self.name)["id"]
+                cluster = self.client.cluster(cluster_id)
+            # A failed token refresh or a garbled reply is retried like a
+            # failed poll: SSO and the API have short outages during long waits
+            except (AssistedError, AssistedUnavailable, ValueError, OSError,
+                    http.client.HTTPException) as e:
+                print(f"Failed to get cluster status: {e}", flush=True)
+                cluster = None
+            changed = False
+            progress = 0
+            if cluster is not None:
+                current = cluster.get("status", "unknown")
+                progress = int((cluster.get("progress") or {}).get("total_percentage") or 0)
+                if current != status:
+                    info = cluster.get("status_info", "")
+                    print(f"Cluster {self.name} status: {current}" + (f" ({info})" if info else "")
+                          + (f", {progress}%" if progress else ""), flush=True)
+                    changed = status is not None
+                    status = current
+                changed = self._report_hosts(cluster) or changed
+                if reached(status, target):
+                    print(f"Cluster {self.name} reached status: {status}", flush=True)
+                    return True
+                if status in FAILED_STATUSES:
+                    print(f"Cluster {self.name} failed: {cluster.get('status_info', status)}",
+                          flush=True)
+                    return False
+                interval = next_interval(interval, changed, status, target, progress)
+            else:
+                interval = min(interval * BACKOFF, MAX_INTERVAL)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"Timeout waiting for cluster {self.name} to reach status: {target}",
+                      flush=True)
+                return False
+            time.sleep(min(interval, remaining))
+
+    def install(self) -> bool:
+        """
+        Waits for ready, starts the installation and waits for it to
+        finish, in one session.
+        Returns:
+            bool: Whether the cluster is installed
+        """
+        if not self.wait("ready"):
+            return False
+        cluster = self.client.find_cluster(self.name)
+        # Any later status means an installation is already under way, and
+        # posting install again would be rejected with 409
+        if cluster.get("status") == "ready":
+            print(f"Starting installation of cluster {self.name}", flush=True)
+            self.client.install(cluster["id"])
+        else:
+            print(f"Cluster {self.name} is {cluster.get('status')}, waiting for the installation",
+                  flush=True)
+        return self.wait("finalizing") and self.wait("installed")
+
+
+def main() -> int:
+    parser = ArgumentParser(description='Assisted Installer cluster status and install')
+    parser.add_argument('--cluster', default=os.environ.get('CLUSTER_NAME', 'doca'),
+                        help='Cluster name or id (default: $CLUSTER_NAME)')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help=f'Seconds per awaited status (default: {DEFAULT_TIMEOUT})')
+    sub = parser.add_subparsers(dest='command', required=True)
+    wait = sub.add_parser('wait', help='Wait for a cluster status')
+    wait.add_argument('status', help='e.g. ready, finalizing or installed')
+    sub.add_parser('install', help='Wait for ready, start the installation and wait for installed')
+    sub.add_parser('status', help='Print the cluster status and host progress')
+    args = parser.parse_args()
+
+    try:
+        client = AssistedClient.from_environment()
+        # Fail over to aicli before waiting if the API is not usable
+        client.find_cluster(args.cluster)
+    except (AssistedUnavailable, AssistedError, ValueError, OSError,
+            http.client.HTTPException) as e:
+        print(f"Cannot use the Assisted Installer API: {e}", file=sys.stderr)
+        return EXIT_UNAVAILABLE
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+
+    waiter = Waiter(client, args.cluster, args.timeout)
+    try:
+        if args.command == 'status':
+            cluster = client.cluster(client.find_cluster(args.cluster)["id"])
+            print(cluster.get("status", "unknown"))
+            waiter._report_hosts(cluster)
+            return 0
+        if args.command == 'install':
+            return 0 if waiter.install() else EXIT_FAILED
+        return 0 if waiter.wait(args.status) else EXIT_FAILED
+    except (AssistedError, AssistedUnavailable, ValueError, OSError,
+            http.client.HTTPException) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+"""
+Compares gzip compression levels for the inner ignition encoding.
+
+For each level the ignition is encoded the way gen_template.py does it and
+the encoded (base64) size and CPU time are reported, so the size/latency
+tradeoff of --compression-level can be chosen on real-sized payloads.
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import sys
+import time
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from gen_template import EncodeOptions, encode_ignition, encode_ignition_stream  # noqa: E402
+
+WORDS = ("dpu", "ovn", "bridge", "kubelet", "node", "mtu", "vlan", "ovs", "cni",
+         "route", "enable", "disable", "true", "false", "interface", "address",
+         "timeout", "mode", "port", "policy", "service", "network", "config")
+
+
+def _config_text(rng: random.Random, size: int) -> str:
+    lines = []
+    total = 0
+    while total < size:
+        line = "{}_{}={}".format(rng.choice(WORDS), rng.choice(WORDS),
+                                 rng.choice(WORDS) if rng.random() < 0.7 else rng.randint(0, 65535))
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines) + "\n"
+
+
+def _certificate(rng: random.Random) -> str:
+    body = base64.encodebytes(rng.randbytes(rng.randint(900, 1500))).decode()
+    return f"-----BEGIN CERTIFICATE-----\n{body}-----END CERTIFICATE-----\n"
+
+
+def synthetic_ignition(size: int, units: int = 40, seed: int = 0) -> dict:
+    """
+    Builds an ignition document of roughly the given serialized size.
+
+    Files mix generated config text and certificate bundles, both embedded
+    as base64 data URLs like MachineConfig content in a real hosted-cluster
+    ignition, so compression ratios are representative.
+    Args:
+        size: The target serialized size in bytes
+        units: The number of systemd units
+        seed: The random seed, so runs are comparable
+    Returns:
+        dict: The ignition document
+    """
+    rng = random.Random(seed)
+    ign = {
+        "ignition": {"version": "3.2.0"},
+        "passwd": {"users": [{"name": "core", "sshAuthorizedKeys": ["ssh-ed25519 AAAA"]}]},
+        "storage": {"files": []},
+        "systemd": {"units": [
+            {"name": "machine-config-daemon-firstboot.service", "enabled": True},
+            {"name": "openvswitch.service", "enabled": False},
+        ]},
+    }
+    for i in range(units):
+        ign["systemd"]["units"].append({
+            "name": f"synthetic-{i}.service",
+            "enabled": bool(i % 2),
+            "contents": "[Unit]\nDescription=Synthetic unit {}\n\n[Service]\n"
+                        "Type=oneshot\nExecStart=/usr/bin/true\n\n[Install]\n"
+                        "WantedBy=multi-user.target\n".format(i),
+        })
+    current = len(json.dumps(ign))
+    i = 0
+    while current < size:
+        if i % 4 == 3:
+            content = "".join(_certificate(rng) for _ in range(rng.randint(1, 8)))
+        else:
+            content = _config_text(rng, min(rng.randint(512, 64 * 1024), size))
+        entry = {
+            "path": f"/etc/synthetic/file-{i}.conf",
+            "mode": 420,
+            "overwrite": True,
+            "contents": {"source": "data:text/plain;charset=utf-8;base64,"
+                         + base64.b64encode(content.encode()).decode()},
+        }
+        ign["storage"]["files"].append(entry)
+        current += len(json.dumps(entry)) + 1
+        i += 1
+    return ign
+
+
+def check_encoders(ign: dict, levels: list[int]) -> None:
+    """
+    Verifies that encode_ignition and encode_ignition_stream produce the
+    same bytes at each level, so switching between them keeps generated
+    manifests identical.
+    """
+    for level in levels:
+        options = EncodeOptions(compresslevel=level)
+        streamed = io.BytesIO()
+        encode_ignition_stream(ign, streamed, options)
+        if encode_ignition(ign, options).encode() != streamed.getvalue():
+            raise Exception(f"encode_ignition and encode_ignition_stream differ at level {level}")
+
+
+class _CountingWriter:
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        return len(data)
+
+    def seekable(self) -> bool:
+        return False
+
+
+def bench_levels(ign: dict, levels: list[int], repeat: int) -> list[dict]:
+    """
+    Encodes ign at each compression level and measures size and CPU time.
+    Returns:
+        list: One result per level with the best of `repeat` runs
+    """
+    raw_size = len(json.dumps(ign, separators=(',', ':')).encode('utf-8'))
+    results = []
+    for level in levels:
+        best_cpu: Optional[float] = None
+        best_wall: Optional[float] = None
+        for _ in range(repeat):
+            out = _CountingWriter()
+            cpu, wall = time.process_time(), time.perf_counter()
+            encode_ignition_stream(ign, out, EncodeOptions(compresslevel=level))
+            cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+            best_cpu = cpu if best_cpu is None else min(best_cpu, cpu)
+            best_wall = wall if best_wall is None else min(best_wall, wall)
+        results.append({
+            "level": level,
+            "raw_bytes": raw_size,
+            "encoded_bytes": out.size,
+            "ratio": round(out.size / raw_size, 4),
+            "cpu_seconds": round(best_cpu, 4),
+            "wall_seconds": round(best_wall, 4),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare gzip compression levels for the ignition encoding')
+    parser.add_argument('--ignition', type=str,
+                        help='Ignition JSON file to encode (default: synthetic payloads)')
+    parser.add_argument('--sizes', type=str, default='1M,5M,20M',
+                        help='Comma separated synthetic payload sizes (K/M suffixes)')
+    parser.add_argument('--levels', type=str, default='1,6,9',
+                        help='Comma separated gzip levels (default: 1,6,9)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per level; the fastest is reported (default: 3)')
+    parser.add_argument('--json', action='store_true',
+                        help='Print results as JSON')
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(",")]
+    payloads: list[tuple[str, dict]] = []
+    if args.ignition:
+        with open(args.ignition) as f:
+            payloads.append((args.ignition, json.load(f)))
+    else:
+        for size in args.sizes.split(","):
+            multiplier = {"K": 1024, "M": 1024 * 1024}.get(size[-1].upper(), 1)
+            target = int(size.rstrip("kKmM")) * multiplier
+            payloads.append((f"synthetic-{size}", synthetic_ignition(target)))
+
+    for _, ign in payloads:
+        check_encoders(ign, levels)
+    report = {name: bench_levels(ign, levels, args.repeat) for name, ign in payloads}
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for name, results in report.items():
+        print(f"{name} ({results[0]['raw_bytes']} bytes raw):")
+        print(f"  {'level':>5} {'encoded':>12} {'ratio':>7} {'cpu s':>8} {'wall s':>8}")
+        for r in results:
+            print(f"  {r['level']:>5} {r['encoded_bytes']:>12} {r['ratio']:>7.3f} "
+                  f"{r['cpu_seconds']:>8.3f} {r['wall_seconds']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
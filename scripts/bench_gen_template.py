@@ -0,0 +1,295 @@
+#!/usr/bin/python3
+"""
+Benchmarks the template generation pipeline stage by stage.
+
+Synthetic ignition documents are served by a local HTTPS stub (self-signed
+certificate from openssl) and run through pull, preprocess, encode, outer
+ignition creation and ConfigMap writing for each DPU mode. Each stage
+reports wall time and peak RSS growth; a second pass under tracemalloc
+reports allocated bytes and block counts. Results can be saved as a JSON
+baseline and compared against one to catch regressions.
+"""
+
+import argparse
+import contextlib
+import http.server
+import io
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Callable, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import gen_template  # noqa: E402
+from bench_encode import synthetic_ignition  # noqa: E402
+from ignition_overlay import MODES, build_overlay_set, mode_layers  # noqa: E402
+
+DEFAULT_SIZES = "100K,1M,10M,50M"
+DEFAULT_TOLERANCE = 0.25
+# Differences below these are measurement noise, not regressions.
+NOISE_FLOOR = {"wall_seconds": 0.01, "peak_rss_bytes": 4 * 1024 * 1024,
+               "alloc_peak_bytes": 1024 * 1024, "alloc_blocks": 1000}
+STAGES = ["pull_ignition", "preprocess_ignition_file", "encode_ignition",
+          "create_ignition_file", "create_bfb_template_cm"]
+
+
+class _IgnitionHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body = self.server.payload
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubIgnitionServer:
+    """
+    Local HTTPS server returning a fixed ignition payload on any path.
+    """
+
+    def __init__(self, workdir: str):
+        cert = os.path.join(workdir, "stub.crt")
+        key = os.path.join(workdir, "stub.key")
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+                        "-keyout", key, "-out", cert, "-days", "1",
+                        "-subj", "/CN=localhost"],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _IgnitionHandler)
+        self.server.payload = b"{}"
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        self.endpoint = f"127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def serve(self, payload: bytes) -> None:
+        self.server.payload = payload
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StaticBackend:
+    """
+    Cluster lookup backend pointing at the stub server.
+    """
+    name = "bench"
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+
+    def get_ignition_endpoint(self, cluster_name: str, hc_namespace: str) -> str:
+        return self.endpoint
+
+    def get_ignition_token(self, cluster_name: str, namespace: str) -> str:
+        return "bench"
+
+
+def _proc_status(field: str) -> Optional[int]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss() -> bool:
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux >= 4.0).
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def measure(fn: Callable, trace: bool):
+    """
+    Runs fn and measures it.
+    Args:
+        fn: The stage to run
+        trace: Measure allocations with tracemalloc instead of time and RSS
+    Returns:
+        tuple: The stage result and its metrics
+    """
+    if trace:
+        tracemalloc.start()
+        blocks = sys.getallocatedblocks()
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return result, {"alloc_peak_bytes": peak,
+                        "alloc_blocks": sys.getallocatedblocks() - blocks}
+
+    rss_resettable = _reset_peak_rss()
+    rss_before = _proc_status("VmRSS")
+    start = time.perf_counter()
+    result = fn()
+    wall = time.perf_counter() - start
+    metrics = {"wall_seconds": round(wall, 4)}
+    if rss_resettable and rss_before is not None:
+        metrics["peak_rss_bytes"] = max(0, _proc_status("VmHWM") - rss_before)
+    return result, metrics
+
+
+def run_pipeline(server: StubIgnitionServer, mode: str, workdir: str, trace: bool) -> dict:
+    """
+    Runs every pipeline stage once for a mode.
+    Returns:
+        dict: Metrics keyed by stage name
+    """
+    overlay = build_overlay_set(mode_layers(mode))
+    backend = StaticBackend(server.endpoint)
+    output = os.path.join(workdir, f"hcp_template-{mode}.yaml")
+    metrics = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        inner, metrics["pull_ignition"] = measure(
+            lambda: gen_template.pull_ignition("bench", "clusters", None, backend=backend), trace)
+        inner, metrics["preprocess_ignition_file"] = measure(
+            lambda: gen_template.preprocess_ignition_file(inner), trace)
+        with tempfile.SpooledTemporaryFile(gen_template.SPOOL_SIZE, dir=workdir) as encoded:
+            _, metrics["encode_ignition"] = measure(
+                lambda: gen_template.encode_ignition_stream(inner, encoded), trace)
+            del inner
+            ign, metrics["create_ignition_file"] = measure(
+                lambda: gen_template.create_ignition_file(
+                    gen_template.ENCODED_IGN_PLACEHOLDER, overlay), trace)
+            _, metrics["create_bfb_template_cm"] = measure(
+                lambda: gen_template.create_bfb_template_cm(ign, output, encoded), trace)
+    metrics["output_bytes"] = os.path.getsize(output)
+    return metrics
+
+
+def parse_size(size: str) -> int:
+    multiplier = {"K": 1024, "M": 1024 * 1024}.get(size[-1].upper(), 1)
+    return int(size.rstrip("kKmM")) * multiplier
+
+
+def run_benchmarks(sizes: list[str], modes: list[str], repeat: int, trace: bool) -> dict:
+    """
+    Runs the pipeline for every payload size and mode.
+    Returns:
+        dict: Results keyed by "<size>/<mode>"; timings are the best of `repeat` runs
+    """
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench-gen-template-") as workdir:
+        server = StubIgnitionServer(workdir)
+        try:
+            for size in sizes:
+                target = parse_size(size)
+                # Scale unit and file counts with the payload, like a real cluster
+                ign = synthetic_ignition(target, units=max(10, target // (256 * 1024)))
+                payload = json.dumps(ign).encode('utf-8')
+                del ign
+                server.serve(payload)
+                for mode in modes:
+                    runs = [run_pipeline(server, mode, workdir, False) for _ in range(repeat)]
+                    result = {"payload_bytes": len(payload),
+                              "output_bytes": runs[0]["output_bytes"], "stages": {}}
+                    for stage in STAGES:
+                        result["stages"][stage] = {
+                            key: min(run[stage][key] for run in runs) for key in runs[0][stage]
+                        }
+                    if trace:
+                        traced = run_pipeline(server, mode, workdir, True)
+                        for stage in STAGES:
+                            result["stages"][stage].update(traced[stage])
+                    results[f"{size}/{mode}"] = result
+                    print(f"{size}/{mode}: done", file=sys.stderr)
+        finally:
+            server.close()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compares results against a baseline.
+    Returns:
+        list: One message per metric that regressed by more than tolerance
+    """
+    regressions = []
+    for case, result in results.items():
+        base = baseline.get("results", {}).get(case)
+        if not base:
+            continue
+        for stage, metrics in result["stages"].items():
+            for key, value in metrics.items():
+                old = base["stages"].get(stage, {}).get(key)
+                if old is None:
+                    continue
+                if value - old > max(old * tolerance, NOISE_FLOOR.get(key, 0)):
+                    regressions.append(
+                        f"{case} {stage} {key}: {old} -> {value}")
+    return regressions
+
+
+def print_table(results: dict) -> None:
+    for case, result in results.items():
+        print(f"{case} (payload {result['payload_bytes']} bytes, "
+              f"output {result['output_bytes']} bytes):")
+        for stage, metrics in result["stages"].items():
+            cells = " ".join(f"{key}={value}" for key, value in metrics.items())
+            print(f"  {stage:<26} {cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the ignition template generation pipeline')
+    parser.add_argument('--sizes', type=str, default=DEFAULT_SIZES,
+                        help=f'Comma separated synthetic ignition sizes (default: {DEFAULT_SIZES})')
+    parser.add_argument('--modes', type=str, default=",".join(MODES),
+                        help='Comma separated DPU modes (default: all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per case; the best timing is kept (default: 3)')
+    parser.add_argument('--no-tracemalloc', action='store_true',
+                        help='Skip the allocation tracking pass')
+    parser.add_argument('--output', '-o', type=str,
+                        help='Write results as a JSON baseline to this file')
+    parser.add_argument('--baseline', type=str,
+                        help='Compare results against this JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'Allowed relative regression (default: {DEFAULT_TOLERANCE})')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes.split(","), args.modes.split(","),
+                             max(1, args.repeat), not args.no_tracemalloc)
+    print_table(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version.split()[0], "created": int(time.time()),
+                       "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+#!/usr/bin/python3
+"""
+Local cache of BFB images, so installs and redeploys skip the WAN download.
+
+A BFB is downloaded once with parallel HTTP range requests into the cache
+directory (by default in the NFS export directory). Finished ranges are
+recorded next to the partial file, so an interrupted download resumes
+where it stopped. The image is verified against a SHA-256 (given, or from
+a "<url>.sha256" file next to the image) before it replaces the partial
+file. The cache keeps the most recently used images within a disk budget.
+
+The cache directory is served over HTTP (the serve command, or any web
+server) so that the BFB object can point at the local copy: fetch prints
+the local URL and can rewrite the url and fileName of a bfb.yaml.
+
+Exit status: 0 on success, 1 when the download or the verification
+failed, 2 when no local URL is configured, in which case callers keep the
+remote URL. A malformed command line exits with 3.
+"""
+
+import hashlib
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import quote, urlparse
+
+from cli import ArgumentParser
+
+EXIT_FAILED = 1
+EXIT_UNAVAILABLE = 2
+
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get("NFS_EXPORT_DIR", "/nfs/exports"), "bfb")
+DEFAULT_BUDGET_GB = 40
+DEFAULT_JOBS = 8
+CHUNK_SIZE = 64 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+DEFAULT_PORT = 8080
+INDEX_FILE = "index.json"
+RETRIES = 3
+
+
+class CacheError(Exception):
+    """Raised when a BFB cannot be downloaded or verified."""
+
+
+@dataclass
+class Remote:
+    size: Optional[int]
+    ranges: bool
+    etag: Optional[str]
+
+
+def _connect(url) -> http.client.HTTPConnection:
+    if url.scheme == "https":
+        return http.client.HTTPSConnection(url.hostname, url.port, timeout=60)
+    return http.client.HTTPConnection(url.hostname, url.port, timeout=60)
+
+
+def _target(url) -> str:
+    return (url.path or "/") + (f"?{url.query}" if url.query else "")
+
+
+def _get(url: str, headers: Optional[dict] = None, method: str = "GET"):
+    """
+    Sends a request, following redirects.
+    Returns:
+        tuple: The connection and the response, to be read and closed by the caller
+    """
+    for _ in range(5):
+        parsed = urlparse(url)
+        conn = _connect(parsed)
+        conn.request(method, _target(parsed), headers=headers or {})
+        response = conn.getresponse()
+        if response.status in (301, 302, 303, 307, 308) and response.getheader("Location"):
+            url = response.getheader("Location")
+            conn.close()
+            continue
+        return conn, response
+    raise CacheError(f"too many redirects for {url}")
+
+
+def probe(url: str) -> Remote:
+    """
+    Asks for the first byte to learn the size and whether ranges are served.
+    """
+    conn, response = _get(url, {"Range": "bytes=0-0"})
+    try:
+        response.read()
+        if response.status == 206:
+            total = (response.getheader("Content-Range") or "").rpartition("/")[2]
+            return Remote(int(total) if total.isdigit() else None, True,
+                          response.getheader("ETag"))
+        if response.status == 200:
+            length = response.getheader("Content-Length")
+            return Remote(int(length) if length else None, False, response.getheader("ETag"))
+        raise CacheError(f"{url}: {response.status} {response.reason}")
+    finally:
+        conn.close()
+
+
+def remote_sha256(url: str) -> Optional[str]:
+    """
+    Reads "<url>.sha256" (sha256sum format) when the server has one.
+    """
+    try:
+        conn, response = _get(url + ".sha256")
+    except (OSError, http.client.HTTPException, CacheError):
+        return None
+    try:
+        data = response.read(4096)
+        if response.status != 200:
+            return None
+        digest = data.decode("utf-8", "replace").split()[0].lower() if data.strip() else ""
+        return digest if len(digest) == 64 else None
+    finally:
+        conn.close()
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(READ_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class RangeDownload:
+    """
+    Downloads a file in fixed size chunks over parallel range requests,
+    recording finished chunks so the download can resume.
+    """
+
+    def __init__(self, url: str, path: str, remote: Remote, jobs: int = DEFAULT_JOBS,
+                 chunk_size: int = CHUNK_SIZE):
+        self.url = url
+        self.path = path
+        self.remote = remote
+        self.jobs = jobs
+        self.chunk_size = chunk_size
+        self.state_path = f"{path}.json"
+        self.done: set[int] = set()
+        self._lock = threading.Lock()
+        self._fetched = 0
+
+    def _load_state(self) -> None:
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        # A changed image, or chunks of another size, restart the download
+        if state.get("size") == self.remote.size and state.get("etag") == self.remote.etag \
+                and state.get("chunk_size") == self.chunk_size and os.path.exists(self.path):
+            self.done = set(state.get("done", []))
+
+    def _save_state(self) -> None:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".state-")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"url": self.url, "size": self.remote.size, "etag": self.remote.etag,
+                       "chunk_size": self.chunk_size, "done": sorted(self.done)}, f)
+        os.replace(tmp, self.state_path)
+
+    def _chunk(self, fd: int, index: int) -> None:
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, self.remote.size) - 1
+        for attempt in range(1, RETRIES + 1):
+            try:
+                conn, response = _get(self.url, {"Range": f"bytes={start}-{end}"})
+                try:
+                    if response.status != 206:
+                        raise CacheError(f"range {start}-{end}: {response.status} {response.reason}")
+                    offset = start
+                    while block := response.read(READ_SIZE):
+                        os.pwrite(fd, block, offset)
+                        offset += len(block)
+                    if offset != end + 1:
+                        raise CacheError(f"range {start}-{end}: short read")
+                finally:
+                    conn.close()
+                break
+            except (OSError, http.client.HTTPException, CacheError):
+                if attempt == RETRIES:
+                    raise
+                time.sleep(attempt)
+        with self._lock:
+            self.done.add(index)
+            self._fetched += end + 1 - start
+            self._save_state()
+
+    def _stream(self) -> None:
+        conn, response = _get(self.url)
+        try:
+            if response.status != 200:
+                raise CacheError(f"{self.url}: {response.status} {response.reason}")
+            length = response.getheader("Content-Length")
+            expected = int(length) if length else self.remote.size
+            written = 0
+            with open(self.path, "wb") as f:
+                while block := response.read(READ_SIZE):
+                    f.write(block)
+                    written += len(block)
+                    self._fetched += len(block)
+            # A dropped connection ends the body early without an error
+            if expected is not None and written != expected:
+                raise CacheError(f"{self.url}: short read, {written} of {expected} bytes")
+        finally:
+            conn.close()
+
+    def run(self) -> int:
+        """
+        Downloads the missing chunks.
+        Returns:
+            int: The number of bytes fetched
+        """
+        if not self.remote.ranges or not self.remote.size:
+            self._stream()
+            return self._fetched
+        self._load_state()
+        chunks = [i for i in range((self.remote.size + self.chunk_size - 1) // self.chunk_size)
+                  if i not in self.done]
+        if self.done:
+            print(f"Resuming download, {len(chunks)} of "
+                  f"{len(chunks) + len(self.done)} chunks left", file=sys.stderr, flush=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, self.remote.size)
+            with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+                list(pool.map(lambda index: self._chunk(fd, index), chunks))
+        finally:
+            os.close(fd)
+        return self._fetched
+
+
+class BfbCache:
+    """
+    Cache directory of BFB images with an LRU index under a disk budget.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR,
+                 budget: int = DEFAULT_BUDGET_GB * 1024 ** 3):
+        self.directory = directory
+        self.budget = budget
+        self.index_path = os.path.join(directory, INDEX_FILE)
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index: dict) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".index-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f, indent=2)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, self.index_path)
+
+    def entries(self) -> dict:
+        return self._read_index()
+
+    def fetch(self, url: str, sha256: Optional[str] = None, jobs: int = DEFAULT_JOBS) -> str:
+        """
+        Returns the cached copy of url, downloading it if it is missing,
+        incomplete or does not match the checksum.
+        Args:
+            url: The BFB URL
+            sha256: The expected SHA-256 (default: from "<url>.sha256" if served)
+            jobs: Concurrent range requests
+        Returns:
+            str: The file name in the cache directory
+        Raises:
+            CacheError: The download or verification failed
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        name = os.path.basename(urlparse(url).path)
+        if not name:
+            raise CacheError(f"{url} has no file name")
+        path = os.path.join(self.directory, name)
+        index = self._read_index()
+        entry = index.get(name)
+        sha256 = sha256.lower() if sha256 else None
+
+        if entry and entry.get("url") == url and os.path.exists(path) \
+                and os.path.getsize(path) == entry.get("size") \
+                and (sha256 is None or sha256 == entry.get("sha256")):
+            print(f"Using cached {name} ({entry['size'] / 1024 ** 3:.2f} GiB)",
+                  file=sys.stderr, flush=True)
+        else:
+            remote = probe(url)
+            expected = sha256 or remote_sha256(url)
+            started = time.monotonic()
+            streams = jobs if remote.ranges and remote.size else 1
+            size = f" ({remote.size / 1024 ** 3:.2f} GiB, {streams} streams)" if remote.size else ""
+            print(f"Downloading {url}{size}", file=sys.stderr, flush=True)
+            part = f"{path}.part"
+            fetched = RangeDownload(url, part, remote, jobs).run()
+            seconds = time.monotonic() - started
+            print(f"Downloaded {fetched / 1024 ** 2:.0f} MiB in {seconds:.1f}s "
+                  f"({fetched / 1024 ** 2 / max(seconds, 0.001):.0f} MiB/s)",
+                  file=sys.stderr, flush=True)
+            digest = sha256_file(part)
+            if expected and digest != expected:
+                os.unlink(part)
+                if os.path.exists(f"{part}.json"):
+                    os.unlink(f"{part}.json")
+                raise CacheError(f"{name}: SHA-256 {digest} does not match {expected}")
+            note = "" if expected else " (no checksum to compare)"
+            print(f"Verified {name}: sha256 {digest}{note}", file=sys.stderr, flush=True)
+            os.chmod(part, 0o644)
+            os.replace(part, path)
+            if os.path.exists(f"{part}.json"):
+                os.unlink(f"{part}.json")
+            entry = {"url": url, "size": os.path.getsize(path), "sha256": digest,
+                     "verified": bool(expected)}
+            index = self._read_index()
+
+        index[name] = {**entry, "last_used": time.time()}
+        self._evict(index, keep=name)
+        self._write_index(index)
+        return name
+
+    def _evict(self, index: dict, keep: str) -> None:
+        """
+        Removes the least recently used images until the cache fits the budget.
+        """
+        total = sum(e.get("size", 0) for e in index.values())
+        for name in sorted(index, key=lambda n: index[n].get("last_used", 0)):
+            if total <= self.budget:
+                break
+            if name == keep:
+                continue
+            print(f"Evicting {name} from the BFB cache", file=sys.stderr, flush=True)
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= index.pop(name).get("size", 0)
+
+
+def rewrite_manifest(path: str, url: str, file_name: str) -> None:
+    """
+    Points the BFB objects of a manifest file at url.
+    """
+    import yaml
+    with open(path) as f:
+        docs = list(yaml.safe_load_all(f))
+    for doc in docs:
+        if doc and doc.get("kind") == "BFB":
+            doc.setdefault("spec", {}).update({"url": url, "fileName": file_name})
+    with open(path, "w") as f:
+        yaml.safe_dump_all([doc for doc in docs if doc], f, sort_keys=False)
+
+
+def serve(directory: str, port: int) -> None:
+    """
+    Serves the cache directory over HTTP until interrupted.
+    """
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=directory, **kwargs)
+
+    server = ThreadingHTTPServer(("", port), Handler)
+    print(f"Serving {directory} on :{port}", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def main() -> int:
+    parser = ArgumentParser(description='Local cache of BFB images')
+    parser.add_argument('--cache-dir', default=os.environ.get('BFB_CACHE_DIR', DEFAULT_CACHE_DIR),
+                        help=f'Cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--budget-gb', type=float,
+                        default=float(os.environ.get('BFB_CACHE_BUDGET_GB', DEFAULT_BUDGET_GB)),
+                        help=f'Disk budget of the cache in GiB (default: {DEFAULT_BUDGET_GB})')
+    sub = parser.add_subparsers(dest='command', required=True)
+    fetch = sub.add_parser('fetch', help='Download a BFB into the cache and print its local URL')
+    fetch.add_argument('url')
+    fetch.add_argument('--sha256', default=os.environ.get('BFB_SHA256') or None,
+                       help='Expected SHA-256 (default: <url>.sha256 when served)')
+    fetch.add_argument('--base-url', default=os.environ.get('BFB_CACHE_URL'),
+                       help='URL the cache directory is served at (default: $BFB_CACHE_URL)')
+    fetch.add_argument('--jobs', '-j', type=int, default=DEFAULT_JOBS,
+                       help=f'Concurrent range requests (default: {DEFAULT_JOBS})')
+    fetch.add_argument('--manifest', help='Point the BFB objects of this manifest at the local copy')
+    serve_cmd = sub.add_parser('serve', help='Serve the cache directory over HTTP')
+    serve_cmd.add_argument('--port', type=int, default=DEFAULT_PORT,
+                           help=f'Port to listen on (default: {DEFAULT_PORT})')
+    sub.add_parser('list', help='List the cached images, most recently used first')
+    args = parser.parse_args()
+
+    cache = BfbCache(args.cache_dir, int(args.budget_gb * 1024 ** 3))
+    if args.command == 'serve':
+        serve(args.cache_dir, args.port)
+        return 0
+    if args.command == 'list':
+        for name, entry in sorted(cache.entries().items(),
+                                  key=lambda item: -item[1].get("last_used", 0)):
+            print(f"{name}  {entry['size'] / 1024 ** 3:.2f} GiB  sha256:{entry['sha256']}  "
+                  f"{entry['url']}")
+        return 0
+
+    if not args.base_url:
+        print("BFB_CACHE_URL is not set, the cached BFB could not be served", file=sys.stderr)
+        return EXIT_UNAVAILABLE
+    try:
+        name = cache.fetch(args.url, args.sha256, max(1, args.jobs))
+    except (CacheError, OSError, http.client.HTTPException) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    local_url = f"{args.base_url.rstrip('/')}/{quote(name)}"
+    if args.manifest:
+        rewrite_manifest(args.manifest, local_url, name)
+        print(f"Pointed {args.manifest} at {local_url}", file=sys.stderr)
+    print(local_url)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,312 @@
+#!/usr/bin/python3
+"""
+Applies manifest files with server side apply in dependency order.
+
+All documents are parsed once and grouped into tiers by kind (namespaces,
+CRDs, SCCs and RBAC, IPAM, service templates, service configurations,
+other resources, and the DPUDeployment last). Each tier is applied
+concurrently over the client's keep-alive connections, and a tier only
+starts once the previous one is fully applied. Transient failures
+(webhooks not ready yet, a CRD not yet served) are retried per object.
+
+Exit status: 0 when everything was applied, 1 when an object failed, 2
+when the API cannot be used (nothing was applied), in which case callers
+fall back to oc apply. A malformed command line exits with 3.
+"""
+
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+from cli import ArgumentParser
+from kube_client import ApiError, KubeClient, KubeConfigError, resource_path
+
+EXIT_FAILED = 1
+EXIT_UNAVAILABLE = 2
+
+FIELD_MANAGER = "openshift-dpf"
+DEFAULT_JOBS = 8
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_DELAY = 10
+
+# Apply order by kind; kinds not listed go to the "resources" tier.
+TIERS = (
+    ("namespaces", {"Namespace"}),
+    ("crds", {"CustomResourceDefinition"}),
+    ("prerequisites", {"SecurityContextConstraints", "ServiceAccount", "ClusterRole",
+                       "ClusterRoleBinding", "Role", "RoleBinding", "Secret", "ConfigMap",
+                       "PersistentVolume", "OperatorGroup"}),
+    ("ipam", {"DPUServiceIPAM"}),
+    ("templates", {"DPUServiceTemplate"}),
+    ("configurations", {"DPUServiceConfiguration"}),
+    ("resources", set()),
+    ("deployments", {"DPUDeployment"}),
+)
+DEFAULT_TIER = "resources"
+
+
+class ApplyUnavailable(Exception):
+    """Raised when applying through the API is not possible."""
+
+
+class KindNotServed(Exception):
+    """Raised when the API does not (yet) serve a kind, e.g. right after its CRD."""
+
+
+@dataclass
+class Manifest:
+    source: str
+    obj: dict
+
+    @property
+    def kind(self) -> str:
+        return self.obj["kind"]
+
+    @property
+    def name(self) -> str:
+        return self.obj["metadata"]["name"]
+
+    def describe(self) -> str:
+        group = self.obj["apiVersion"].rpartition("/")[0]
+        kind = f"{self.kind.lower()}.{group}" if group else self.kind.lower()
+        return f"{kind}/{self.name}"
+
+
+@dataclass
+class Result:
+    manifest: Manifest
+    status: str
+    error: Optional[str] = None
+
+
+def load_manifests(paths: list[str]) -> list[Manifest]:
+    """
+    Parses every YAML document of the given files (directories contribute
+    their *.yaml files), skipping empty documents and flattening Lists.
+    """
+    import yaml
+
+    # Unquoted timestamps stay strings, as oc apply sends them, instead of
+    # becoming datetimes that JSON cannot encode
+    class Loader(yaml.SafeLoader):
+        pass
+    Loader.yaml_implicit_resolvers = {
+        first: [(tag, regexp) for tag, regexp in resolvers if tag != "tag:yaml.org,2002:timestamp"]
+        for first, resolvers in yaml.SafeLoader.yaml_implicit_resolvers.items()}
+
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, name) for name in os.listdir(path)
+                            if name.endswith(".yaml"))
+        else:
+            files.append(path)
+
+    manifests = []
+    for path in files:
+        with open(path) as f:
+            docs = list(yaml.load_all(f, Loader=Loader))
+        for doc in docs:
+            if not doc:
+                continue
+            items = doc.get("items", []) if doc.get("kind", "").endswith("List") else [doc]
+            for obj in items:
+                if not obj.get("apiVersion") or not obj.get("kind") \
+                        or not obj.get("metadata", {}).get("name"):
+                    raise Exception(f"{path}: document without apiVersion, kind or metadata.name")
+                manifests.append(Manifest(path, obj))
+    return manifests
+
+
+def tiers(manifests: list[Manifest]) -> list[tuple[str, list[Manifest]]]:
+    """
+    Groups manifests into the apply tiers, keeping file order within a tier.
+    """
+    by_kind = {kind: name for name, kinds in TIERS for kind in kinds}
+    grouped: dict[str, list[Manifest]] = {name: [] for name, _ in TIERS}
+    for manifest in manifests:
+        grouped[by_kind.get(manifest.kind, DEFAULT_TIER)].append(manifest)
+    return [(name, grouped[name]) for name, _ in TIERS if grouped[name]]
+
+
+class RestMapper:
+    """
+    Maps apiVersion and kind to the resource plural and scope, fetching
+    each group version's discovery document once.
+    """
+
+    def __init__(self, client: KubeClient):
+        self.client = client
+        self._cache: dict[str, dict[str, tuple[str, bool]]] = {}
+        self._lock = threading.Lock()
+
+    def _fetch(self, api_version: str) -> dict[str, tuple[str, bool]]:
+        path = "/api/v1" if api_version == "v1" else f"/apis/{api_version}"
+        try:
+            resources = self.client.get(path).get("resources", [])
+        except ApiError as e:
+            if e.status in (404, 503):
+                return {}
+            raise
+        return {r["kind"]: (r["name"], r["namespaced"])
+                for r in resources if "/" not in r["name"]}
+
+    def resolve(self, api_version: str, kind: str, refresh: bool = False) -> tuple[str, bool]:
+        with self._lock:
+            if refresh or api_version not in self._cache:
+                self._cache[api_version] = self._fetch(api_version)
+            if kind not in self._cache[api_version]:
+                raise KindNotServed(f"{kind} is not served by {api_version}")
+            return self._cache[api_version][kind]
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, ApiError):
+        return error.status >= 500 or error.status in (404, 409, 429)
+    return isinstance(error, (KindNotServed, OSError, http.client.HTTPException))
+
+
+def _parse_time(value: str) -> float:
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()
+
+
+class Applier:
+    def __init__(self, client: KubeClient, namespace: Optional[str] = None,
+                 field_manager: str = FIELD_MANAGER, jobs: int = DEFAULT_JOBS,
+                 retries: int = DEFAULT_RETRIES, retry_delay: float = DEFAULT_RETRY_DELAY,
+                 dry_run: bool = False):
+        """
+        Args:
+            client: The API client
+            namespace: The namespace for namespaced objects without one
+                (default: the namespace of the kubeconfig context)
+            field_manager: The server side apply field manager
+            jobs: Objects applied concurrently within a tier
+            retries: Attempts per object for transient errors
+            retry_delay: Seconds between attempts
+            dry_run: Validate on the server without persisting
+        """
+        self.client = client
+        self.mapper = RestMapper(client)
+        self.namespace = namespace or client.config.namespace
+        self.field_manager = field_manager
+        self.jobs = jobs
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.dry_run = dry_run
+        self.started = time.time()
+
+    def _status(self, applied: dict) -> str:
+        """
+        Tells created, configured and unchanged objects apart from the
+        timestamps the server records, without an extra GET.
+        """
+        if self.dry_run:
+            return "applied (dry run)"
+        metadata = applied.get("metadata", {})
+        times = [entry["time"] for entry in metadata.get("managedFields", [])
+                 if entry.get("manager") == self.field_manager and entry.get("time")]
+        if not times:
+            return "configured"
+        last = _parse_time(max(times))
+        if metadata.get("creationTimestamp") == max(times) and last >= self.started - 1:
+            return "created"
+        return "configured" if last >= self.started - 1 else "unchanged"
+
+    def _apply_once(self, manifest: Manifest, refresh: bool) -> str:
+        obj = manifest.obj
+        plural, namespaced = self.mapper.resolve(obj["apiVersion"], manifest.kind, refresh)
+        namespace = None
+        if namespaced:
+            namespace = obj["metadata"].get("namespace") or self.namespace
+        path = resource_path(obj["apiVersion"], plural, namespace, manifest.name)
+        query = {"fieldManager": self.field_manager, "force": "true",
+                 "dryRun": "All" if self.dry_run else None}
+        applied = self.client.request("PATCH", path, query, body=json.dumps(obj).encode("utf-8"),
+                                      content_type="application/apply-patch+yaml")
+        return self._status(applied)
+
+    def apply(self, manifest: Manifest) -> Result:
+        for attempt in range(1, self.retries + 1):
+            try:
+                # Rediscover on retries, the kind may have been added by a CRD
+                return Result(manifest, self._apply_once(manifest, refresh=attempt > 1))
+            except Exception as e:
+                if attempt == self.retries or not _is_transient(e):
+                    return Result(manifest, "failed", str(e))
+                print(f"{manifest.describe()}: {e}, retrying in {self.retry_delay:g}s", flush=True)
+                time.sleep(self.retry_delay)
+
+    def run(self, manifests: list[Manifest]) -> list[Result]:
+        """
+        Applies the manifests tier by tier, stopping after a tier with failures.
+        Returns:
+            list: The results of the applied tiers
+        """
+        results = []
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            for name, tier in tiers(manifests):
+                print(f"Applying {name} ({len(tier)} objects)", flush=True)
+                tier_results = list(pool.map(self.apply, tier))
+                for result in tier_results:
+                    line = f"{result.manifest.describe()} {result.status}"
+                    print(f"{line}: {result.error}" if result.error else line, flush=True)
+                results += tier_results
+                if any(result.error for result in tier_results):
+                    break
+        return results
+
+
+def main() -> int:
+    parser = ArgumentParser(
+        description='Apply manifests with server side apply, in dependency order')
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help='Manifest files, or directories of *.yaml files')
+    parser.add_argument('--namespace', '-n',
+                        help='Namespace for namespaced objects without one '
+                             '(default: the namespace of the kubeconfig context)')
+    parser.add_argument('--field-manager', default=FIELD_MANAGER,
+                        help=f'Server side apply field manager (default: {FIELD_MANAGER})')
+    parser.add_argument('--jobs', '-j', type=int, default=DEFAULT_JOBS,
+                        help=f'Objects applied concurrently within a tier (default: {DEFAULT_JOBS})')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help=f'Attempts per object on transient errors (default: {DEFAULT_RETRIES})')
+    parser.add_argument('--retry-delay', type=float, default=DEFAULT_RETRY_DELAY,
+                        help=f'Seconds between attempts (default: {DEFAULT_RETRY_DELAY})')
+    parser.add_argument('--dry-run', action='store_true', help='Validate on the server only')
+    args = parser.parse_args()
+
+    try:
+        manifests = load_manifests(args.paths)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+
+    try:
+        client = KubeClient.from_kubeconfig()
+        # Fail over to oc before anything is applied if the API is not usable
+        client.get("/api")
+    except (KubeConfigError, ApiError, OSError, http.client.HTTPException) as e:
+        print(f"Cannot apply through the API: {e}", file=sys.stderr)
+        return EXIT_UNAVAILABLE
+
+    applier = Applier(client, args.namespace, args.field_manager, max(1, args.jobs),
+                      max(1, args.retries), args.retry_delay, args.dry_run)
+    results = applier.run(manifests)
+    failed = [r for r in results if r.error]
+    skipped = len(manifests) - len(results)
+    print(f"Applied {len(results) - len(failed)} of {len(manifests)} objects"
+          + (f", {len(failed)} failed" if failed else "")
+          + (f", {skipped} not attempted" if skipped else ""))
+    return EXIT_FAILED if failed or skipped else 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,21 @@
+"""
+Command line parsing shared by the tools that the shell scripts call with a
+fallback: their exit status 2 means "unavailable, use the old path".
+"""
+
+import argparse
+import sys
+
+# Exit status of a malformed command line. argparse exits with 2, which the
+# shell would read as "unavailable" and silently fall back on.
+EXIT_USAGE = 3
+
+
+class ArgumentParser(argparse.ArgumentParser):
+    """
+    ArgumentParser that exits with EXIT_USAGE on errors.
+    """
+
+    def error(self, message):
+        self.print_usage(sys.stderr)
+        self.exit(EXIT_USAGE, f"{self.prog}: error: {message}\n")
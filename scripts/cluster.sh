@@ -179,12 +179,31 @@ function delete_cluster() {
     fi
 }
 
+# Exit status of ai_client.py when the Assisted Installer API cannot be used
+AI_CLIENT_UNAVAILABLE=2
+
+# Run ai_client.py for the current cluster.
+# Returns its exit status, or AI_CLIENT_UNAVAILABLE when USE_AI_CLIENT=false.
+function ai_client() {
+    if [ "${USE_AI_CLIENT:-true}" != "true" ]; then
+        return "$AI_CLIENT_UNAVAILABLE"
+    fi
+    python3 "$(dirname "${BASH_SOURCE[0]}")/ai_client.py" --cluster "$CLUSTER_NAME" "$@"
+}
+
 function wait_for_cluster_status() {
     local status=$1
     local max_retries=${2:-120}
     local sleep_time=${3:-60}
     local retries=0
-    
+    local rc=0
+
+    # Adaptive polling over one API session; the aicli loop is the fallback
+    ai_client --timeout "$((max_retries * sleep_time))" wait "$status" || rc=$?
+    if [ "$rc" -ne "$AI_CLIENT_UNAVAILABLE" ]; then
+        return "$rc"
+    fi
+
     log "INFO" "Waiting for cluster ${CLUSTER_NAME} to reach status: ${status}"
     while [ $retries -lt $max_retries ]; do
         # Capture aicli output, handle potential failures
@@ -223,13 +242,20 @@ function start_cluster_installation() {
         return 0
     fi
 
-    log "INFO" "Waiting for cluster to be ready..."
-    wait_for_cluster_status "ready"
-    aicli start cluster ${CLUSTER_NAME}
-    log "INFO" "Waiting for cluster to be finalizing..."
-    wait_for_cluster_status "finalizing"
-    log "INFO" "Waiting for installation to complete..."
-    wait_for_cluster_status "installed"
+    local rc=0
+    ai_client install || rc=$?
+    if [ "$rc" -eq "$AI_CLIENT_UNAVAILABLE" ]; then
+        log "INFO" "Waiting for cluster to be ready..."
+        wait_for_cluster_status "ready"
+        aicli start cluster ${CLUSTER_NAME}
+        log "INFO" "Waiting for cluster to be finalizing..."
+        wait_for_cluster_status "finalizing"
+        log "INFO" "Waiting for installation to complete..."
+        wait_for_cluster_status "installed"
+    elif [ "$rc" -ne 0 ]; then
+        log "ERROR" "Installation of cluster ${CLUSTER_NAME} failed"
+        return 1
+    fi
     log "INFO" "Cluster installation completed successfully"
     get_kubeconfig
     if [ "${USE_V419_WORKAROUND}" == "true" ]; then
@@ -302,7 +328,7 @@ function deploy_lso() {
     get_kubeconfig
     
     # Check if LSO subscription already exists
-    if oc get subscription -n openshift-local-storage local-storage-operator &>/dev/null; then
+    if resource_exists subscriptions.operators.coreos.com local-storage-operator openshift-local-storage; then
         log "INFO" "LSO subscription already exists. Skipping subscription deployment."
     else
         log "INFO" "Deploying LSO subscription..."
@@ -346,7 +372,7 @@ function deploy_odf() {
     get_kubeconfig
     
     # Check if ODF subscription already exists
-    if oc get subscription -n openshift-storage odf-operator &>/dev/null; then
+    if resource_exists subscriptions.operators.coreos.com odf-operator openshift-storage; then
         log "INFO" "ODF subscription already exists. Skipping subscription deployment."
     else
         log "INFO" "Deploying ODF subscription using catalog: ${CATALOG_SOURCE_NAME}"
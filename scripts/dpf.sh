@@ -22,7 +22,7 @@ function deploy_nfd() {
     get_kubeconfig
 
     # Check if NFD subscription exists, if not apply it
-    if ! oc get subscription -n openshift-nfd nfd &>/dev/null; then
+    if ! resource_exists subscriptions.operators.coreos.com nfd openshift-nfd; then
         log [INFO] "NFD subscription not found. Applying NFD subscription..."
         apply_manifest "$MANIFESTS_DIR/cluster-installation/nfd-subscription.yaml"
         
@@ -38,10 +38,8 @@ function deploy_nfd() {
     fi
 
     log [INFO] "Creating NFD instance..."
-    mkdir -p "$GENERATED_DIR"
-    cp "$MANIFESTS_DIR/dpf-installation/nfd-cr-template.yaml" "$GENERATED_DIR/nfd-cr-template.yaml"
-    echo
-    sed -i "s|api.<CLUSTER_FQDN>|$HOST_CLUSTER_API|g" "$GENERATED_DIR/nfd-cr-template.yaml"
+    render_manifests "$MANIFESTS_DIR/dpf-installation/nfd-cr-template.yaml" "$GENERATED_DIR/nfd-cr-template.yaml" \
+        --replace nfd-cr-template.yaml "api.<CLUSTER_FQDN>" "$HOST_CLUSTER_API"
 
     # Apply the NFD CR
     KUBECONFIG=$KUBECONFIG oc apply -f "$GENERATED_DIR/nfd-cr-template.yaml"
@@ -63,7 +61,7 @@ function deploy_metallb() {
     get_kubeconfig
     
     # Check if MetalLB subscription already exists
-    if oc get subscription -n openshift-operators metallb-operator &>/dev/null; then
+    if resource_exists subscriptions.operators.coreos.com metallb-operator openshift-operators; then
         log [INFO] "MetalLB subscription already exists. Skipping subscription deployment."
     else
         log [INFO] "Deploying MetalLB subscription..."
@@ -129,7 +127,7 @@ function deploy_cert_manager() {
     local cert_manager_file="$GENERATED_DIR/openshift-cert-manager.yaml"
     if [ -f "$cert_manager_file" ]; then
         # Check if cert-manager is already installed
-        if oc get deployment -n cert-manager cert-manager &>/dev/null; then
+        if resource_exists deployments.apps cert-manager cert-manager; then
             log [INFO] "Cert-manager already installed. Skipping deployment."
             return 0
         fi
@@ -167,12 +165,19 @@ function deploy_hosted_cluster() {
 }
 
 function deploy_hypershift() {
+    create_hosted_cluster
+    configure_hypershift
+    create_ignition_template
+}
+
+# Install the Hypershift operator and create the hosted cluster, up to etcd being ready
+function create_hosted_cluster() {
     if [ "${ENABLE_HCP_MULTUS}" = "true" ]; then
         log [INFO] "HCP Multus enabled mode is active. Using custom hypershift image: ${HYPERSHIFT_IMAGE}"
     fi
     
     # Check if Hypershift operator is already installed
-    if oc get deployment -n hypershift hypershift-operator &>/dev/null; then
+    if resource_exists deployments.apps hypershift-operator hypershift; then
         log [INFO] "Hypershift operator already installed. Skipping deployment."
     else
         log [INFO] "Installing latest hypershift operator"
@@ -189,7 +194,7 @@ function deploy_hypershift() {
     fi
 
     log [INFO] "Checking if Hypershift hosted cluster ${HOSTED_CLUSTER_NAME} already exists..."
-    if oc get hostedcluster -n ${CLUSTERS_NAMESPACE} ${HOSTED_CLUSTER_NAME} &>/dev/null; then
+    if resource_exists hostedclusters.hypershift.openshift.io "${HOSTED_CLUSTER_NAME}" "${CLUSTERS_NAMESPACE}"; then
         log [INFO] "Hypershift hosted cluster ${HOSTED_CLUSTER_NAME} already exists. Skipping creation."
     else
         wait_for_pods "hypershift" "app=operator" 30 5
@@ -244,9 +249,6 @@ function deploy_hypershift() {
     oc -n ${HOSTED_CONTROL_PLANE_NAMESPACE} get pods
     log [INFO] "Waiting for etcd pods..."
     wait_for_pods ${HOSTED_CONTROL_PLANE_NAMESPACE} "app=etcd" 60 10
-    
-    configure_hypershift
-    create_ignition_template
 }
 
 function add_cno_image_override() {
@@ -271,17 +273,45 @@ function add_cno_image_override() {
     done
 }
 
+# Exit status of gen_template.py when the template is already up to date
+GEN_TEMPLATE_UNCHANGED=3
+
+# Run gen_template.py, treating an unchanged template as success.
+# Sets IGNITION_TEMPLATE_CHANGED to true or false.
+function run_gen_template() {
+    local rc=0
+    IGNITION_TEMPLATE_CHANGED=true
+    "$(dirname "${BASH_SOURCE[0]}")/gen_template.py" "$@" || rc=$?
+    if [ "$rc" -eq "$GEN_TEMPLATE_UNCHANGED" ]; then
+        IGNITION_TEMPLATE_CHANGED=false
+        return 0
+    fi
+    return "$rc"
+}
+
 function create_ignition_template() {
     log [INFO] "Creating ignition template..."
-    retry 10 40 "$(dirname "${BASH_SOURCE[0]}")/gen_template.py" -f "${GENERATED_DIR}/hcp_template.yaml" -c "${HOSTED_CLUSTER_NAME}" -hc "${CLUSTERS_NAMESPACE}"
+    retry 10 40 run_gen_template -f "${GENERATED_DIR}/hcp_template.yaml" -c "${HOSTED_CLUSTER_NAME}" -hc "${CLUSTERS_NAMESPACE}"
+    if [ "$IGNITION_TEMPLATE_CHANGED" = "false" ] && \
+       resource_exists configmap custom-bfb.cfg dpf-operator-system; then
+        log [INFO] "Ignition template unchanged, skipping apply"
+        return 0
+    fi
     log [INFO] "Ignition template created"
     oc apply -f "$GENERATED_DIR/hcp_template.yaml"
 }
 
+# Keep the ignition template in sync with the hosted cluster until interrupted
+function watch_ignition_template() {
+    log [INFO] "Watching hosted cluster ${HOSTED_CLUSTER_NAME} for ignition changes..."
+    "$(dirname "${BASH_SOURCE[0]}")/gen_template.py" --watch -f "${GENERATED_DIR}/hcp_template.yaml" \
+        -c "${HOSTED_CLUSTER_NAME}" -hc "${CLUSTERS_NAMESPACE}"
+}
+
 function configure_hypershift() {
     log [INFO] "Creating kubeconfig for Hypershift hosted cluster..."
 
-    if oc get secret -n dpf-operator-system "${HOSTED_CLUSTER_NAME}-admin-kubeconfig" &>/dev/null; then
+    if resource_exists secret "${HOSTED_CLUSTER_NAME}-admin-kubeconfig" dpf-operator-system; then
         log [INFO] "Secret ${HOSTED_CLUSTER_NAME}-admin-kubeconfig already exists. Skipping creation."
     else
       # Wait for the HostedCluster resource to create the admin-kubeconfig secret with valid data
@@ -335,6 +365,7 @@ function copy_hypershift_kubeconfig() {
 
 function apply_remaining() {
     log [INFO] "Applying remaining manifests..."
+    local files=()
     for file in "$GENERATED_DIR"/*.yaml; do
         # Skip NFD deployment if DISABLE_NFD is set to true
         if [[ "${DISABLE_NFD}" = "true" && "$file" =~ .*dpf-nfd\.yaml$ ]]; then
@@ -346,11 +377,21 @@ function apply_remaining() {
               ! "$file" =~ .*(-crd)\.yaml$ && \
               "$file" != "$GENERATED_DIR/cert-manager-manifests.yaml" && \
               "$file" != "$GENERATED_DIR/scc.yaml" ]]; then
-            retry 5 30 apply_manifest "$file" true
-            if [[ "$file" =~ .*operator.*\.yaml$ ]]; then
-                log [INFO] "Waiting for operator resources..."
-                sleep 10
-            fi
+            files+=("$file")
+        fi
+    done
+
+    local rc=0
+    bulk_apply --retries 5 --retry-delay 30 "${files[@]}" || rc=$?
+    if [ "$rc" -ne "$BULK_APPLY_UNAVAILABLE" ]; then
+        return "$rc"
+    fi
+
+    for file in "${files[@]}"; do
+        retry 5 30 apply_manifest "$file" true
+        if [[ "$file" =~ .*operator.*\.yaml$ ]]; then
+            log [INFO] "Waiting for operator resources..."
+            sleep 10
         fi
     done
 }
@@ -361,7 +402,7 @@ function deploy_argocd() {
     # Ensure kubeconfig is set and accessible
     get_kubeconfig
 
-    if ! oc get subscription openshift-gitops-operator -n openshift-gitops-operator &>/dev/null; then
+    if ! resource_exists subscriptions.operators.coreos.com openshift-gitops-operator openshift-gitops-operator; then
         log [INFO] "Installing GitOps operator..."
         mkdir -p "$GENERATED_DIR"
         process_template \
@@ -384,7 +425,7 @@ function deploy_argocd() {
 
     log [INFO] "Creating ArgoCD instance..."
     # Ensure target namespace exists before applying CR
-    oc get ns dpf-operator-system &>/dev/null || oc create ns dpf-operator-system
+    resource_exists namespace dpf-operator-system || oc create ns dpf-operator-system
 
     apply_manifest "${MANIFESTS_DIR}/gitops-operator/argocd.yaml"
     wait_for_pods "dpf-operator-system" "app.kubernetes.io/name=argocd-application-controller" 60 10
@@ -416,14 +457,12 @@ function deploy_maintenance_operator() {
     log [INFO] "Maintenance Operator deployment complete!"
 }
 
-function apply_dpf() {
-    log "INFO" "Starting DPF deployment sequence..."
-    log "INFO" "Provided kubeconfig ${KUBECONFIG}"
-    log "INFO" "NFD deployment is $([ "${DISABLE_NFD}" = "true" ] && echo "disabled" || echo "enabled")"
-    
-    get_kubeconfig
-    
-    # Verify cluster is accessible before any deployments
+# DPF v25.7+ requires ArgoCD and the Maintenance Operator
+function dpf_requires_argocd() {
+    [[ "$DPF_VERSION" =~ ^v25\.[7-9] ]] || [[ "$DPF_VERSION" =~ ^v2[6-9] ]]
+}
+
+function verify_cluster_access() {
     log "INFO" "Verifying cluster accessibility..."
     if ! oc cluster-info &>/dev/null; then
         log "ERROR" "Cluster is not accessible. Cannot proceed with DPF deployment."
@@ -432,23 +471,15 @@ function apply_dpf() {
         return 1
     fi
     log "INFO" "Cluster is accessible, proceeding with DPF deployment..."
-    
-    # Deploy ArgoCD and Maintenance Operator for DPF v25.7+
-    if [[ "$DPF_VERSION" =~ ^v25\.[7-9] ]] || [[ "$DPF_VERSION" =~ ^v2[6-9] ]]; then
-        log [INFO] "DPF version $DPF_VERSION requires ArgoCD and Maintenance Operator"
-        deploy_argocd
-        deploy_maintenance_operator
-    fi
+}
 
+function enable_ip_forwarding() {
     log "INFO" "Enabling IP forwarding for OVN Kubernetes..."
     oc patch network.operator.openshift.io cluster --type=merge -p \
     '{"spec":{"defaultNetwork":{ "ovnKubernetesConfig":{"gatewayConfig":{"ipForwarding":"Global"}}}}}'
-    
-    deploy_nfd
-    
-    apply_namespaces
-    deploy_cert_manager
-    
+}
+
+function install_dpf_operator() {
     # Install/upgrade DPF Operator using helm (idempotent operation)
     log "INFO" "Installing/upgrading DPF Operator to $DPF_VERSION..."
     
@@ -519,12 +550,50 @@ function apply_dpf() {
         log "ERROR" "Helm deployment failed"
         return 1
     fi
-    
+}
+
+function apply_dpf_manifests() {
     apply_remaining
     apply_scc
-    deploy_hosted_cluster
+}
 
+function wait_for_dpf_operator() {
     wait_for_pods "dpf-operator-system" "dpu.nvidia.com/component=dpf-operator-controller-manager" 30 5
+}
+
+function apply_dpf() {
+    log "INFO" "Starting DPF deployment sequence..."
+    log "INFO" "Provided kubeconfig ${KUBECONFIG}"
+    log "INFO" "NFD deployment is $([ "${DISABLE_NFD}" = "true" ] && echo "disabled" || echo "enabled")"
+    
+    get_kubeconfig
+    
+    # Verify cluster is accessible before any deployments
+    verify_cluster_access
+
+    # List the collections the idempotency checks below ask about
+    inventory_snapshot
+    
+    # Deploy ArgoCD and Maintenance Operator for DPF v25.7+
+    if dpf_requires_argocd; then
+        log [INFO] "DPF version $DPF_VERSION requires ArgoCD and Maintenance Operator"
+        deploy_argocd
+        deploy_maintenance_operator
+    fi
+
+    enable_ip_forwarding
+    
+    deploy_nfd
+    
+    apply_namespaces
+    deploy_cert_manager
+    
+    install_dpf_operator
+    
+    apply_dpf_manifests
+    deploy_hosted_cluster
+
+    wait_for_dpf_operator
 
     log [INFO] "DPF deployment complete"
 }
@@ -559,12 +628,55 @@ function main() {
             create-ignition-template)
                 create_ignition_template
                 ;;
+            verify-cluster-access)
+                get_kubeconfig
+                verify_cluster_access
+                ;;
+            apply-namespaces)
+                get_kubeconfig
+                apply_namespaces
+                ;;
+            enable-ip-forwarding)
+                get_kubeconfig
+                enable_ip_forwarding
+                ;;
+            deploy-cert-manager)
+                get_kubeconfig
+                deploy_cert_manager
+                ;;
+            install-dpf-operator)
+                get_kubeconfig
+                install_dpf_operator
+                ;;
+            apply-dpf-manifests)
+                get_kubeconfig
+                apply_dpf_manifests
+                ;;
+            create-hosted-cluster)
+                get_kubeconfig
+                create_hosted_cluster
+                ;;
+            configure-hypershift)
+                get_kubeconfig
+                configure_hypershift
+                create_ignition_template
+                ;;
+            wait-dpf-operator)
+                get_kubeconfig
+                wait_for_dpf_operator
+                ;;
+            watch-ignition-template)
+                watch_ignition_template
+                ;;
             copy_hypershift_kubeconfig)
                 copy_hypershift_kubeconfig
                 ;;
             *)
                 log [INFO] "Unknown command: $command"
-                log [INFO] "Available commands: deploy-nfd, deploy-metallb, deploy-argocd, deploy-maintenance-operator, apply-dpf, deploy-hypershift"
+                log [INFO] "Available commands: deploy-nfd, deploy-metallb, deploy-argocd, deploy-maintenance-operator, apply-dpf, deploy-hypershift,"
+                log [INFO] "  create-ignition-template, watch-ignition-template, verify-cluster-access, apply-namespaces,"
+                log [INFO] "  enable-ip-forwarding, deploy-cert-manager, install-dpf-operator, apply-dpf-manifests,"
+                log [INFO] "  create-hosted-cluster, configure-hypershift, wait-dpf-operator"
                 exit 1
                 ;;
         esac
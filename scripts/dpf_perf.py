@@ -0,0 +1,554 @@
+#!/usr/bin/python3
+"""
+Datapath performance tests for the DPU workers, compared to baselines.
+
+Uses the workload and DPU worker discovery of the sanity checks. For every
+Ready DPU worker it measures
+
+    pod-hbn/<worker>    sriov test pod to its doca-hbn pod: latency
+    host-hbn/<worker>   hostnetwork test pod to its doca-hbn pod: latency
+    pod-pod/<worker>    sriov test pod to the next worker's: latency,
+                        TCP bandwidth and UDP packets per second
+    host-host/<worker>  hostnetwork test pod to the next worker's: the same
+
+(with a single worker the test pods are paired with the sriov master pod
+instead). Latency percentiles come from ping, bandwidth and packet rates
+from iperf3 (the netshoot image ships both). Latency tests run
+concurrently; throughput tests run --jobs at a time, one by default, so
+they do not compete for the same links.
+
+Every metric is compared to the baseline file, failing when it is worse
+than the baseline by more than the metric's tolerance. --save-baseline
+records the measured values.
+
+With --local the tests run against a stand-in made of network namespaces
+joined by veth pairs to a bridge (see local-setup), for development
+without a cluster.
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterator, Optional, Union
+
+from dpf_sanity import (DEFAULT_PARALLELISM, DEFAULT_WORKLOAD_FILE, DEFAULT_WORKLOAD_NAMESPACE,
+                        DPF_NAMESPACE, EXEC_GRACE, EXIT_FAILED, EXIT_UNAVAILABLE, HBN_CONTAINER,
+                        HBN_INTERFACE, Inventory, SetupError, Target, TestResult, Worker,
+                        discover_workers, ensure_workload, exec_batch, hosted_kubeconfig,
+                        write_json, write_junit)
+from kube_client import ApiError, KubeClient, KubeConfigError
+
+DEFAULT_BASELINE = "perf-baseline.json"
+DEFAULT_DURATION = 10
+DEFAULT_LATENCY_COUNT = 100
+LATENCY_INTERVAL = 0.2
+IPERF_PORT = 5201
+# Datagram size of the packet rate test
+PPS_PAYLOAD = 64
+
+# Fraction by which a metric may be worse than its baseline.
+DEFAULT_TOLERANCES = {
+    "bandwidth_gbps": 0.10,
+    "pps": 0.15,
+    "latency_p50_ms": 0.25,
+    "latency_p99_ms": 0.50,
+}
+HIGHER_IS_BETTER = {"bandwidth_gbps", "pps"}
+
+LOCAL_PREFIX = "dpfperf"
+LOCAL_FABRIC = f"{LOCAL_PREFIX}-fabric"
+LOCAL_BRIDGE = "br0"
+LOCAL_MTU = 9000
+# Local endpoint roles and the last octet of their 10.199.<worker>.0/16 address
+LOCAL_ROLES = {"hbn": 1, "pod": 2, "host": 3}
+LOCAL_NAMESPACE = re.compile(rf"^{LOCAL_PREFIX}-(hbn|pod|host)(\d+)\b")
+
+PING_TIME = re.compile(r"time=([0-9.]+) ms")
+PACKET_LOSS = re.compile(r"([0-9.]+)% packet loss")
+
+
+@dataclass
+class NetnsTarget:
+    """
+    A network namespace of the local stand-in, in place of a pod.
+    """
+    pod: str
+
+    def exec_args(self, command: list[str]) -> list[str]:
+        return ["ip", "netns", "exec", self.pod] + command
+
+
+@dataclass
+class Endpoint:
+    name: str
+    ip: Optional[str]
+    target: Optional[Union[Target, NetnsTarget]] = None
+
+
+@dataclass
+class Site:
+    """
+    The endpoints of one DPU worker.
+    """
+    name: str
+    hbn: Endpoint
+    pod: Endpoint
+    host: Endpoint
+
+
+@dataclass
+class PerfPath:
+    key: str
+    source: Endpoint
+    destination: Endpoint
+    throughput: bool
+    metrics: dict[str, float] = field(default_factory=dict)
+    output: str = ""
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+
+def build_paths(sites: list[Site], master: Optional[Endpoint]) -> list[PerfPath]:
+    """
+    Lists the measured paths. Pod to pod paths go to the next worker, or to
+    the master pod when there is a single worker.
+    """
+    paths = []
+    for i, site in enumerate(sites):
+        paths += [PerfPath(f"pod-hbn/{site.name}", site.pod, site.hbn, False),
+                  PerfPath(f"host-hbn/{site.name}", site.host, site.hbn, False)]
+        if len(sites) > 1:
+            peer = sites[(i + 1) % len(sites)]
+            paths += [PerfPath(f"pod-pod/{site.name}", site.pod, peer.pod, True),
+                      PerfPath(f"host-host/{site.name}", site.host, peer.host, True)]
+        elif master:
+            paths += [PerfPath(f"pod-master/{site.name}", site.pod, master, True),
+                      PerfPath(f"host-master/{site.name}", site.host, master, True)]
+    for path in paths:
+        # Endpoints that cannot be used are named after the reason
+        if path.source.target is None:
+            path.error = path.source.name
+        elif path.destination.ip is None or (path.throughput and path.destination.target is None):
+            path.error = path.destination.name
+    return paths
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def latency_metrics(output: str) -> dict[str, float]:
+    """
+    Computes latency percentiles from the per packet times of ping.
+    """
+    times = [float(t) for t in PING_TIME.findall(output)]
+    loss = PACKET_LOSS.search(output)
+    if not times or not loss:
+        raise Exception("no replies in the ping output")
+    if float(loss.group(1)) > 0:
+        raise Exception(f"{loss.group(1)}% packet loss")
+    return {"latency_p50_ms": percentile(times, 50), "latency_p90_ms": percentile(times, 90),
+            "latency_p99_ms": percentile(times, 99), "latency_max_ms": max(times)}
+
+
+class PerfRunner:
+    def __init__(self, duration: int, latency_count: int, parallelism: int, jobs: int):
+        """
+        Args:
+            duration: Seconds per iperf3 test
+            latency_count: Pings per latency test
+            parallelism: Concurrent execs of the latency tests
+            jobs: Paths measured for throughput at the same time
+        """
+        self.duration = duration
+        self.latency_count = latency_count
+        self.parallelism = parallelism
+        self.jobs = jobs
+        self._ports = iter(range(IPERF_PORT, IPERF_PORT + 1000))
+        self._lock = threading.Lock()
+
+    def measure_latency(self, paths: list[PerfPath]) -> None:
+        """
+        Pings all paths at once, one exec per source.
+        """
+        groups: dict[str, list[PerfPath]] = {}
+        for path in paths:
+            if not path.error:
+                groups.setdefault(json.dumps(path.source.target.exec_args([])), []).append(path)
+
+        def run_group(group: list[PerfPath]) -> None:
+            commands = [["ping", "-c", str(self.latency_count), "-i", str(LATENCY_INTERVAL),
+                         p.destination.ip] for p in group]
+            timeout = self.latency_count * LATENCY_INTERVAL + EXEC_GRACE
+            for path, (output, _, seconds) in zip(group, exec_batch(group[0].source.target,
+                                                                     commands, timeout)):
+                path.output += output
+                path.seconds += seconds
+                try:
+                    path.metrics.update(latency_metrics(output))
+                except Exception as e:
+                    path.error = f"latency: {e}"
+
+        with ThreadPoolExecutor(max_workers=self.parallelism) as pool:
+            list(pool.map(run_group, groups.values()))
+
+    def _port(self) -> int:
+        with self._lock:
+            return next(self._ports)
+
+    def iperf3(self, path: PerfPath, options: list[str]) -> dict:
+        """
+        Runs one iperf3 test from the path's source to a one-off server on
+        its destination.
+        Returns:
+            dict: The client's JSON report
+        """
+        port = str(self._port())
+        timeout = self.duration + EXEC_GRACE
+        # --forceflush, or iperf3 holds the "listening" banner in its buffer
+        # when stdout is a pipe
+        server = subprocess.Popen(path.destination.target.exec_args(
+            ["iperf3", "-s", "-1", "--forceflush", "-p", port]),
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        timer = threading.Timer(timeout, server.kill)
+        timer.start()
+        try:
+            # iperf3 announces the port once it accepts connections
+            lines = []
+            for line in server.stdout:
+                lines.append(line.strip())
+                if "listening" in line:
+                    break
+            else:
+                detail = f": {lines[-1]}" if lines else ""
+                raise Exception(f"iperf3 server did not start on {path.destination.name}{detail}")
+            command = ["iperf3", "-c", path.destination.ip, "-p", port, "-t", str(self.duration),
+                       "-J", *options]
+            output, _, _ = exec_batch(path.source.target, [command], timeout)[0]
+        finally:
+            try:
+                server.wait(EXEC_GRACE)
+            except subprocess.TimeoutExpired:
+                server.kill()
+            timer.cancel()
+        try:
+            report = json.loads(output)
+        except ValueError:
+            raise Exception(f"iperf3: {output.splitlines()[-1] if output else 'no output'}")
+        if report.get("error"):
+            raise Exception(f"iperf3: {report['error']}")
+        return report
+
+    def measure_throughput(self, path: PerfPath) -> None:
+        started = time.monotonic()
+        try:
+            tcp = self.iperf3(path, [])
+            received = tcp["end"]["sum_received"]
+            path.metrics["bandwidth_gbps"] = received["bits_per_second"] / 1e9
+            path.metrics["retransmits"] = tcp["end"]["sum_sent"].get("retransmits", 0)
+            udp = self.iperf3(path, ["-u", "-b", "0", "-l", str(PPS_PAYLOAD)])
+            total = udp["end"]["sum"]
+            path.metrics["pps"] = (total["packets"] - total.get("lost_packets", 0)) / total["seconds"]
+            path.metrics["udp_loss_percent"] = total.get("lost_percent", 0.0)
+        except Exception as e:
+            path.error = f"throughput: {e}"
+        path.seconds += time.monotonic() - started
+
+    def run(self, paths: list[PerfPath]) -> None:
+        print(f"Measuring latency on {len(paths)} paths ({self.latency_count} pings each)", flush=True)
+        self.measure_latency(paths)
+        throughput = [p for p in paths if p.throughput and not p.error]
+        print(f"Measuring throughput on {len(throughput)} paths, {self.jobs} at a time", flush=True)
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            list(pool.map(self.measure_throughput, throughput))
+
+
+def load_baseline(path: str) -> dict:
+    try:
+        with open(path) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {}
+    baseline.setdefault("tolerances", {})
+    baseline.setdefault("paths", {})
+    return baseline
+
+
+def save_baseline(path: str, baseline: dict, paths: list[PerfPath]) -> None:
+    """
+    Records the measured metrics of the compared kinds as the new
+    baseline, keeping the entries of paths not measured in this run.
+    """
+    for p in paths:
+        measured = {k: round(v, 4) for k, v in p.metrics.items() if k in DEFAULT_TOLERANCES}
+        if measured:
+            baseline["paths"][p.key] = measured
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(paths: list[PerfPath], baseline: dict, tolerances: dict[str, float]) -> list[TestResult]:
+    """
+    Turns the measurements into test results, one per path and metric.
+    """
+    results = []
+    for p in paths:
+        if p.error:
+            results.append(TestResult(p.key, p.key.partition("/")[0], False, p.seconds, p.error,
+                                      p.output, {"metrics": p.metrics}))
+            continue
+        for metric in DEFAULT_TOLERANCES:
+            if metric not in p.metrics:
+                continue
+            value = p.metrics[metric]
+            reference = baseline["paths"].get(p.key, {}).get(metric)
+            tolerance = tolerances[metric]
+            details = {"source": p.source.name, "destination": p.destination.name, "value": value,
+                       "baseline": reference, "tolerance": tolerance, "metrics": p.metrics}
+            if reference is None:
+                passed, message = True, f"{value:g} (no baseline)"
+            else:
+                change = (value - reference) / reference if reference else 0.0
+                worse = -change if metric in HIGHER_IS_BETTER else change
+                passed = worse <= tolerance
+                message = f"{value:g} vs baseline {reference:g} ({change:+.1%}, tolerance {tolerance:.0%})"
+            results.append(TestResult(f"{p.key} {metric}", p.key.partition("/")[0], passed,
+                                      p.seconds, message, p.output, details))
+    return results
+
+
+@contextmanager
+def cluster_sites(args: argparse.Namespace) -> Iterator[tuple[list[Site], Optional[Endpoint], list[Worker]]]:
+    """
+    Discovers the DPU workers and test pods the way the sanity checks do.
+    The hosted cluster kubeconfig the doca-hbn endpoints exec with is
+    removed on exit.
+    Returns:
+        tuple: The sites, the master pod endpoint and the workers
+    """
+    mgmt_kubeconfig = os.environ.get("KUBECONFIG", "").split(os.pathsep)[0]
+    mgmt = KubeClient.from_kubeconfig(mgmt_kubeconfig)
+    hosted_path = hosted_kubeconfig(mgmt, args.hosted_cluster)
+    try:
+        ensure_workload(mgmt, args.namespace, args.workload_file, mgmt_kubeconfig)
+        inventory = Inventory(mgmt, KubeClient.from_kubeconfig(hosted_path), args.namespace)
+        workers = discover_workers(inventory, hosted_path, args.parallel)
+        master_pod = inventory.master_pod()
+
+        def pod(name: Optional[str], missing: str) -> Endpoint:
+            if not name:
+                return Endpoint(f"no {missing}", None)
+            ip = inventory.pod_ips.get(name)
+            return Endpoint(name if ip else f"{name} has no pod IP", ip,
+                            Target(mgmt_kubeconfig, args.namespace, name))
+
+        def hbn(worker: Worker) -> Endpoint:
+            if not worker.hbn_pod:
+                return Endpoint(f"no doca-hbn pod on {worker.name}", None)
+            return Endpoint(worker.hbn_pod if worker.hbn_ip
+                            else f"{worker.hbn_pod} has no {HBN_INTERFACE} address", worker.hbn_ip,
+                            Target(hosted_path, DPF_NAMESPACE, worker.hbn_pod, HBN_CONTAINER))
+
+        sites = [Site(w.name, hbn(w), pod(w.pod, f"test pod on {w.name}"),
+                      pod(w.hostnetwork_pod, f"hostnetwork test pod on {w.name}")) for w in workers]
+        yield sites, pod(master_pod, "sriov master test pod") if master_pod else None, workers
+    finally:
+        os.unlink(hosted_path)
+
+
+def discover_sites(args: argparse.Namespace,
+                   stack: ExitStack) -> tuple[list[Site], Optional[Endpoint], list[Worker]]:
+    """
+    Returns the sites of the local stand-in (args.local) or of the cluster,
+    keeping what the cluster's endpoints need until the stack closes.
+    """
+    if args.local:
+        return local_sites(), None, []
+    return stack.enter_context(cluster_sites(args))
+
+
+def _ip(*args: str) -> None:
+    result = subprocess.run(["ip", *args], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"ip {' '.join(args)}: {result.stderr.strip()}")
+
+
+def local_address(worker: int, role: str) -> str:
+    return f"10.199.{worker}.{LOCAL_ROLES[role]}"
+
+
+def local_setup(workers: int, mtu: int, worker_mtus: dict[int, int]) -> None:
+    """
+    Creates the local stand-in: per worker one namespace per endpoint role,
+    each joined by a veth pair to a bridge in a fabric namespace.
+    Args:
+        workers: Number of workers
+        mtu: MTU of the links
+        worker_mtus: MTU overrides for the links of single workers
+    """
+    _ip("netns", "add", LOCAL_FABRIC)
+    _ip("-n", LOCAL_FABRIC, "link", "add", LOCAL_BRIDGE, "mtu", str(max(mtu, *worker_mtus.values(), 0)),
+        "type", "bridge")
+    _ip("-n", LOCAL_FABRIC, "link", "set", LOCAL_BRIDGE, "up")
+    for i in range(workers):
+        link_mtu = str(worker_mtus.get(i, mtu))
+        for role in LOCAL_ROLES:
+            namespace = f"{LOCAL_PREFIX}-{role}{i}"
+            port = f"{role}{i}"
+            _ip("netns", "add", namespace)
+            _ip("link", "add", port, "netns", LOCAL_FABRIC, "mtu", link_mtu, "type", "veth",
+                "peer", "name", "eth0", "netns", namespace, "mtu", link_mtu)
+            _ip("-n", LOCAL_FABRIC, "link", "set", port, "master", LOCAL_BRIDGE, "up")
+            _ip("-n", namespace, "addr", "add", f"{local_address(i, role)}/16", "dev", "eth0")
+            _ip("-n", namespace, "link", "set", "eth0", "up")
+            _ip("-n", namespace, "link", "set", "lo", "up")
+    print(f"Local stand-in with {workers} workers ready (MTU {mtu})")
+
+
+def local_namespaces() -> list[str]:
+    result = subprocess.run(["ip", "netns", "list"], capture_output=True, text=True)
+    return [line.split()[0] for line in result.stdout.splitlines()
+            if line.startswith(f"{LOCAL_PREFIX}-")]
+
+
+def local_teardown() -> None:
+    for namespace in local_namespaces():
+        _ip("netns", "delete", namespace)
+
+
+def local_sites() -> list[Site]:
+    """
+    Builds the sites from the namespaces created by local-setup.
+    """
+    indexes = sorted({int(m.group(2)) for m in map(LOCAL_NAMESPACE.match, local_namespaces()) if m})
+    if not indexes:
+        raise SetupError("No local stand-in found, run local-setup first")
+
+    def endpoint(i: int, role: str) -> Endpoint:
+        namespace = f"{LOCAL_PREFIX}-{role}{i}"
+        return Endpoint(namespace, local_address(i, role), NetnsTarget(namespace))
+
+    return [Site(f"local{i}", endpoint(i, "hbn"), endpoint(i, "pod"), endpoint(i, "host"))
+            for i in indexes]
+
+
+def _tolerance(value: str) -> tuple[str, float]:
+    metric, sep, fraction = value.partition("=")
+    if not sep or metric not in DEFAULT_TOLERANCES:
+        raise argparse.ArgumentTypeError(
+            f"expected METRIC=FRACTION with METRIC one of {', '.join(DEFAULT_TOLERANCES)}")
+    return metric, float(fraction)
+
+
+def _worker_mtu(value: str) -> tuple[int, int]:
+    worker, sep, mtu = value.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError("expected WORKER=MTU")
+    return int(worker), int(mtu)
+
+
+def run(args: argparse.Namespace) -> int:
+    started = time.monotonic()
+    with ExitStack() as stack:
+        try:
+            sites, master, workers = discover_sites(args, stack)
+        except SetupError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return EXIT_FAILED
+        except (KubeConfigError, ApiError, OSError, http.client.HTTPException) as e:
+            print(f"Cannot discover the DPU workers through the API: {e}", file=sys.stderr)
+            return EXIT_UNAVAILABLE
+
+        paths = build_paths(sites, master)
+        PerfRunner(args.duration, args.latency_count, max(1, args.parallel), max(1, args.jobs)).run(paths)
+
+    baseline = load_baseline(args.baseline)
+    tolerances = {**DEFAULT_TOLERANCES, **baseline["tolerances"], **dict(args.tolerance)}
+    results = compare(paths, baseline, tolerances)
+    for r in results:
+        print(f"{'PASS' if r.passed else 'FAIL'} {r.name}: {r.message}", flush=True)
+    if args.save_baseline:
+        save_baseline(args.baseline, baseline, paths)
+        print(f"Baseline saved to {args.baseline}")
+
+    seconds = time.monotonic() - started
+    for path in (args.junit, args.json):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    write_junit(args.junit, results, seconds, "dpf-perf")
+    write_json(args.json, results, seconds, workers)
+    failed = [r for r in results if not r.passed]
+    print(f"\n{len(results)} checks on {len(paths)} paths in {seconds:.1f}s, {len(failed)} failed")
+    print(f"Results: {args.junit} {args.json}")
+    return EXIT_FAILED if failed else 0
+
+
+def main() -> int:
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    parser = argparse.ArgumentParser(
+        description='Measure DPU datapath bandwidth, packet rate and latency against baselines')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help='Run the performance tests')
+    run_parser.add_argument('--local', action='store_true',
+                            help='Run against the local stand-in created by local-setup')
+    run_parser.add_argument('--baseline', default=os.environ.get("PERF_BASELINE_FILE") or DEFAULT_BASELINE,
+                            help=f'Baseline file (default: {DEFAULT_BASELINE})')
+    run_parser.add_argument('--save-baseline', action='store_true',
+                            help='Record the measured values as the new baseline')
+    run_parser.add_argument('--tolerance', type=_tolerance, action='append', default=[],
+                            metavar='METRIC=FRACTION', help='Override the tolerance of a metric')
+    run_parser.add_argument('--duration', type=int, default=DEFAULT_DURATION,
+                            help=f'Seconds per iperf3 test (default: {DEFAULT_DURATION})')
+    run_parser.add_argument('--latency-count', type=int, default=DEFAULT_LATENCY_COUNT,
+                            help=f'Pings per latency test (default: {DEFAULT_LATENCY_COUNT})')
+    run_parser.add_argument('--parallel', type=int,
+                            default=int(os.environ.get("SANITY_TESTS_PARALLELISM") or DEFAULT_PARALLELISM),
+                            help=f'Concurrent execs of the latency tests (default: {DEFAULT_PARALLELISM})')
+    run_parser.add_argument('--jobs', '-j', type=int, default=1,
+                            help='Paths measured for throughput at the same time (default: 1)')
+    run_parser.add_argument('--namespace', default=os.environ.get("SANITY_TESTS_WORKLOAD_NAMESPACE")
+                            or DEFAULT_WORKLOAD_NAMESPACE, help='Namespace of the sriov test pods')
+    run_parser.add_argument('--workload-file', default=os.environ.get("SANITY_TESTS_PODS_WORKLOAD_FILE")
+                            or DEFAULT_WORKLOAD_FILE, help='Manifest deploying the sriov test pods')
+    run_parser.add_argument('--hosted-cluster', default=os.environ.get("HOSTED_CLUSTER_NAME"),
+                            help='Hosted cluster name (default: the first one)')
+    run_parser.add_argument('--junit', default=f"logs/dpf-perf_{stamp}.xml", help='JUnit XML report path')
+    run_parser.add_argument('--json', default=f"logs/dpf-perf_{stamp}.json", help='JSON report path')
+
+    setup = sub.add_parser('local-setup', help='Create the local stand-in (needs root)')
+    setup.add_argument('--workers', type=int, default=2, help='Number of workers (default: 2)')
+    setup.add_argument('--mtu', type=int, default=LOCAL_MTU, help=f'Link MTU (default: {LOCAL_MTU})')
+    setup.add_argument('--worker-mtu', type=_worker_mtu, action='append', default=[],
+                       metavar='WORKER=MTU', help='MTU of one worker\'s links, e.g. to mimic a mismatch')
+    sub.add_parser('local-teardown', help='Delete the local stand-in')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        return run(args)
+    try:
+        if args.command == 'local-setup':
+            local_teardown()
+            local_setup(args.workers, args.mtu, dict(args.worker_mtu))
+        else:
+            local_teardown()
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
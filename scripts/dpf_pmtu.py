@@ -0,0 +1,282 @@
+#!/usr/bin/python3
+"""
+Discovers the path MTU between every pair of DPU worker endpoints.
+
+The endpoints are those of the performance tests: per Ready DPU worker the
+sriov test pod, the hostnetwork test pod and the doca-hbn pod, plus the
+sriov master pod. From every endpoint to every other one, the largest
+ping that passes with the don't fragment bit set is found by binary search
+between --min-mtu and --max-mtu. The searches of one source run in parallel
+inside a single exec, and the sources run concurrently, so the whole sweep
+takes about as long as one search.
+
+Each discovered MTU is compared with the configured one: NODES_MTU on the
+host network and in HBN, and the OVN MTU derived from it (as rendered into
+ovn-configuration.yaml) on the pod network, the lower of the two ends
+counting. A path below its configured MTU fails. A path whose source
+interface MTU is above the path MTU is flagged as fragmentation-prone:
+full size packets depend on PMTU discovery or fragmentation to get through.
+
+With --local the sweep runs against the stand-in of dpf_perf.py local-setup,
+where every role is configured with NODES_MTU.
+"""
+
+import argparse
+import http.client
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from dpf_perf import Endpoint, Site, discover_sites
+from dpf_sanity import (DEFAULT_PARALLELISM, DEFAULT_WORKLOAD_FILE, DEFAULT_WORKLOAD_NAMESPACE,
+                        EXEC_GRACE, EXIT_FAILED, EXIT_UNAVAILABLE, SetupError, TestResult,
+                        exec_batch, write_json, write_junit)
+from kube_client import ApiError, KubeConfigError
+
+DEFAULT_NODES_MTU = 1500
+DEFAULT_MIN_MTU = 1280
+# The mtu_request of the DPU's physical and host ports in OVS
+DEFAULT_MAX_MTU = 9216
+# IPv4 and ICMP headers on top of the ping payload
+HEADERS = 28
+ROLES = ("pod", "host", "hbn")
+# Seconds a probe may take: two pings 0.2s apart, one second to answer
+PROBE_SECONDS = 1.2
+
+# Binary search for the largest payload that passes with DF set. Prints
+# the route's interface and MTU, then "pmtu N", "below N" or "unreachable".
+SEARCH = r'''
+dst=$1; lo=$2; hi=$(($3 + 1))
+probe() { ping -c 2 -i 0.2 -W 1 -M do -s "$1" "$dst" >/dev/null 2>&1; }
+dev=$(ip route get "$dst" 2>/dev/null | sed -n 's/.* dev \([^ ]*\).*/\1/p')
+[ -n "$dev" ] && echo "interface $dev $(cat "/sys/class/net/$dev/mtu" 2>/dev/null)"
+if ! ping -c 2 -i 0.2 -W 1 "$dst" >/dev/null 2>&1; then echo unreachable; exit 1; fi
+if ! probe "$lo"; then echo "below $((lo + 28))"; exit 0; fi
+while [ $((hi - lo)) -gt 1 ]; do
+    mid=$(((lo + hi) / 2))
+    if probe "$mid"; then lo=$mid; else hi=$mid; fi
+done
+echo "pmtu $((lo + 28))"
+'''
+
+
+@dataclass
+class Node:
+    """
+    An endpoint with the role and short label it has in the matrix.
+    """
+    label: str
+    role: str
+    endpoint: Endpoint
+
+
+@dataclass
+class PathMtu:
+    source: Node
+    destination: Node
+    configured: int
+    discovered: Optional[int] = None
+    interface: Optional[str] = None
+    interface_mtu: Optional[int] = None
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+    @property
+    def fragmentation_prone(self) -> bool:
+        return bool(self.discovered and self.interface_mtu and self.interface_mtu > self.discovered)
+
+
+def configured_mtus(nodes_mtu: int, local: bool) -> dict[str, int]:
+    """
+    Returns the MTU each endpoint role is configured with.
+    """
+    if local:
+        return {role: nodes_mtu for role in (*ROLES, "master")}
+    # As prepare_post_installation renders the OVN MTU
+    ovn_mtu = 1400 if nodes_mtu == 1500 else nodes_mtu - 60
+    return {"pod": ovn_mtu, "master": ovn_mtu, "host": nodes_mtu, "hbn": nodes_mtu}
+
+
+def nodes(sites: list[Site], master: Optional[Endpoint]) -> list[Node]:
+    found = [Node(f"{role}{i}", role, getattr(site, role))
+             for i, site in enumerate(sites) for role in ROLES]
+    if master:
+        found.append(Node("master", "master", master))
+    return [n for n in found if n.endpoint.ip]
+
+
+def build_pairs(all_nodes: list[Node], configured: dict[str, int]) -> list[PathMtu]:
+    return [PathMtu(src, dst, min(configured[src.role], configured[dst.role]))
+            for src in all_nodes if src.endpoint.target for dst in all_nodes if dst is not src]
+
+
+class Sweep:
+    def __init__(self, min_mtu: int, max_mtu: int, parallelism: int):
+        """
+        Args:
+            min_mtu: Smallest MTU searched
+            max_mtu: Largest MTU searched
+            parallelism: Concurrent execs, one per source
+        """
+        self.min_mtu = min_mtu
+        self.max_mtu = max_mtu
+        self.parallelism = parallelism
+
+    def _search(self, pairs: list[PathMtu]) -> None:
+        source = pairs[0].source
+        commands = [["sh", "-c", SEARCH, "pmtu", p.destination.endpoint.ip,
+                     str(self.min_mtu - HEADERS), str(self.max_mtu - HEADERS)] for p in pairs]
+        probes = (self.max_mtu - self.min_mtu).bit_length() + 2
+        for pair, (output, _, seconds) in zip(pairs, exec_batch(source.endpoint.target, commands,
+                                                                probes * PROBE_SECONDS + EXEC_GRACE)):
+            pair.seconds = seconds
+            for line in output.splitlines():
+                words = line.split()
+                if words[:1] == ["interface"] and len(words) == 3 and words[2].isdigit():
+                    pair.interface, pair.interface_mtu = words[1], int(words[2])
+                elif words[:1] == ["pmtu"]:
+                    pair.discovered = int(words[1])
+                elif words[:1] == ["below"]:
+                    pair.error = f"path MTU below {words[1]}"
+                elif words[:1] == ["unreachable"]:
+                    pair.error = "unreachable"
+            if pair.discovered is None and not pair.error:
+                pair.error = f"search failed: {output.splitlines()[-1] if output else 'no output'}"
+
+    def run(self, pairs: list[PathMtu]) -> None:
+        groups: dict[str, list[PathMtu]] = {}
+        for pair in pairs:
+            groups.setdefault(pair.source.label, []).append(pair)
+        with ThreadPoolExecutor(max_workers=self.parallelism) as pool:
+            list(pool.map(self._search, groups.values()))
+
+
+def results(pairs: list[PathMtu]) -> list[TestResult]:
+    tests = []
+    for p in pairs:
+        name = f"{p.source.label} -> {p.destination.label}"
+        passed = not p.error and p.discovered >= p.configured
+        if p.error:
+            message = p.error
+        elif p.discovered < p.configured:
+            message = f"path MTU {p.discovered} below configured {p.configured}"
+        else:
+            message = f"path MTU {p.discovered}, configured {p.configured}"
+        if p.fragmentation_prone:
+            message += f"; fragmentation-prone: {p.interface} MTU {p.interface_mtu} above path MTU"
+        tests.append(TestResult(name, f"{p.source.role}-{p.destination.role}", passed, p.seconds, message,
+                                details={"source": p.source.endpoint.name,
+                                         "destination": p.destination.endpoint.name,
+                                         "destination_ip": p.destination.endpoint.ip,
+                                         "configured_mtu": p.configured, "discovered_mtu": p.discovered,
+                                         "interface": p.interface, "interface_mtu": p.interface_mtu,
+                                         "fragmentation_prone": p.fragmentation_prone}))
+    return tests
+
+
+def print_matrix(all_nodes: list[Node], pairs: list[PathMtu]) -> None:
+    """
+    Prints discovered MTUs, sources as rows and destinations as columns.
+    Marks: ! below configured, ~ fragmentation-prone, x failed.
+    """
+    found = {(p.source.label, p.destination.label): p for p in pairs}
+    sources = [n for n in all_nodes if any(p.source is n for p in pairs)]
+    width = max(7, *(len(n.label) + 1 for n in all_nodes))
+    print("".ljust(width) + "".join(n.label.rjust(width) for n in all_nodes))
+    for src in sources:
+        cells = []
+        for dst in all_nodes:
+            p = found.get((src.label, dst.label))
+            if p is None:
+                cell = "-"
+            elif p.error:
+                cell = "x"
+            else:
+                cell = str(p.discovered) + ("!" if p.discovered < p.configured else "") \
+                    + ("~" if p.fragmentation_prone else "")
+            cells.append(cell.rjust(width))
+        print(src.label.ljust(width) + "".join(cells))
+    print("! below configured MTU, ~ fragmentation-prone, x failed")
+    for n in all_nodes:
+        print(f"  {n.label}: {n.endpoint.name} {n.endpoint.ip}")
+
+
+def _configured(value: str) -> tuple[str, int]:
+    role, sep, mtu = value.partition("=")
+    if not sep or role not in (*ROLES, "master"):
+        raise argparse.ArgumentTypeError(f"expected ROLE=MTU with ROLE one of {', '.join(ROLES)}, master")
+    return role, int(mtu)
+
+
+def main() -> int:
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    parser = argparse.ArgumentParser(
+        description='Binary search the path MTU between all DPU worker endpoints')
+    parser.add_argument('--local', action='store_true',
+                        help='Sweep the local stand-in created by dpf_perf.py local-setup')
+    parser.add_argument('--nodes-mtu', type=int, default=int(os.environ.get("NODES_MTU") or DEFAULT_NODES_MTU),
+                        help=f'Configured node MTU (default: NODES_MTU or {DEFAULT_NODES_MTU})')
+    parser.add_argument('--configured', type=_configured, action='append', default=[],
+                        metavar='ROLE=MTU', help='Override the configured MTU of pod, host, hbn or master')
+    parser.add_argument('--min-mtu', type=int, default=DEFAULT_MIN_MTU,
+                        help=f'Smallest MTU searched (default: {DEFAULT_MIN_MTU})')
+    parser.add_argument('--max-mtu', type=int, default=DEFAULT_MAX_MTU,
+                        help=f'Largest MTU searched (default: {DEFAULT_MAX_MTU})')
+    parser.add_argument('--parallel', '-j', type=int,
+                        default=int(os.environ.get("SANITY_TESTS_PARALLELISM") or DEFAULT_PARALLELISM),
+                        help=f'Sources searched concurrently (default: {DEFAULT_PARALLELISM})')
+    parser.add_argument('--namespace', default=os.environ.get("SANITY_TESTS_WORKLOAD_NAMESPACE")
+                        or DEFAULT_WORKLOAD_NAMESPACE, help='Namespace of the sriov test pods')
+    parser.add_argument('--workload-file', default=os.environ.get("SANITY_TESTS_PODS_WORKLOAD_FILE")
+                        or DEFAULT_WORKLOAD_FILE, help='Manifest deploying the sriov test pods')
+    parser.add_argument('--hosted-cluster', default=os.environ.get("HOSTED_CLUSTER_NAME"),
+                        help='Hosted cluster name (default: the first one)')
+    parser.add_argument('--junit', default=f"logs/dpf-pmtu_{stamp}.xml", help='JUnit XML report path')
+    parser.add_argument('--json', default=f"logs/dpf-pmtu_{stamp}.json", help='JSON report path')
+    args = parser.parse_args()
+    if not HEADERS < args.min_mtu <= args.max_mtu:
+        parser.error("--min-mtu must be above 28 and not above --max-mtu")
+
+    started = time.monotonic()
+    with ExitStack() as stack:
+        try:
+            sites, master, workers = discover_sites(args, stack)
+        except SetupError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return EXIT_FAILED
+        except (KubeConfigError, ApiError, OSError, http.client.HTTPException) as e:
+            print(f"Cannot discover the DPU workers through the API: {e}", file=sys.stderr)
+            return EXIT_UNAVAILABLE
+
+        configured = {**configured_mtus(args.nodes_mtu, args.local), **dict(args.configured)}
+        all_nodes = nodes(sites, master)
+        pairs = build_pairs(all_nodes, configured)
+        print(f"Searching the path MTU of {len(pairs)} paths between {len(all_nodes)} endpoints "
+              f"({args.min_mtu}-{args.max_mtu})", flush=True)
+        Sweep(args.min_mtu, args.max_mtu, max(1, args.parallel)).run(pairs)
+
+    seconds = time.monotonic() - started
+    print_matrix(all_nodes, pairs)
+    tests = results(pairs)
+    for path in (args.junit, args.json):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    write_junit(args.junit, tests, seconds, "dpf-pmtu")
+    write_json(args.json, tests, seconds, workers)
+
+    failed = [t for t in tests if not t.passed]
+    prone = [p for p in pairs if p.fragmentation_prone]
+    for t in failed:
+        print(f"FAIL {t.name}: {t.message}")
+    print(f"\n{len(pairs)} paths in {seconds:.1f}s, {len(failed)} below their configured MTU or failed, "
+          f"{len(prone)} fragmentation-prone")
+    print(f"Results: {args.junit} {args.json}")
+    return EXIT_FAILED if failed else 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,569 @@
+#!/usr/bin/python3
+"""
+Runs the DPF sanity checks concurrently and reports structured results.
+
+Covers the same checks as dpf-sanity-checks.sh: cluster operators on the
+management and hosted clusters, and the ping matrix between the sriov test
+pods, the doca-hbn pods of the Ready DPU workers and 8.8.8.8. The DPUs and
+the pods of both clusters are read with one list call each. The ping tests
+of one source pod share a single oc exec, in which they run in parallel;
+the execs of different pods run concurrently up to --parallel. The suite
+thus takes about as long as its slowest ping test.
+
+Results are written as JUnit XML and as JSON, with the duration of every
+test and the round trip times reported by ping.
+
+Exit status: 0 when every test passed, 1 when a test failed or the test
+setup is incomplete, 2 when the API cannot be used, in which case callers
+fall back to dpf-sanity-checks.sh. A malformed command line exits with 3.
+"""
+
+import argparse
+import base64
+import http.client
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from cli import ArgumentParser
+from kube_client import ApiError, KubeClient, KubeConfigError, resource_path
+
+EXIT_FAILED = 1
+EXIT_UNAVAILABLE = 2
+
+DPF_NAMESPACE = "dpf-operator-system"
+HBN_CONTAINER = "doca-hbn"
+HBN_INTERFACE = "pf2dpu2_if"
+EXTERNAL_IP = "8.8.8.8"
+# Ping payload sizes: standard and jumbo frames minus the IP and ICMP headers.
+MTU_SMALL = 1490
+MTU_JUMBO = 8970
+
+DEFAULT_WORKLOAD_FILE = "manifests/post-installation-manual/workload.yaml"
+DEFAULT_WORKLOAD_NAMESPACE = "workload"
+DEFAULT_PING_COUNT = 20
+DEFAULT_PARALLELISM = 8
+WORKLOAD_TIMEOUT = 300
+# Seconds allowed for an exec on top of one second per ping.
+EXEC_GRACE = 60
+
+PACKET_LOSS = re.compile(r"([0-9.]+)% packet loss")
+RTT = re.compile(r"= ([0-9.]+)/([0-9.]+)/([0-9.]+)")
+INET = re.compile(r"inet ([0-9.]+)/")
+
+
+class SetupError(Exception):
+    """Raised when the clusters are not in a state the tests can run in."""
+
+
+@dataclass
+class Worker:
+    name: str
+    hbn_pod: Optional[str] = None
+    hbn_ip: Optional[str] = None
+    pod: Optional[str] = None
+    hostnetwork_pod: Optional[str] = None
+
+
+@dataclass
+class Target:
+    """
+    Where an exec runs: a pod (and container) on one of the clusters.
+    """
+    kubeconfig: str
+    namespace: str
+    pod: str
+    container: Optional[str] = None
+
+    def exec_args(self, command: list[str]) -> list[str]:
+        args = ["oc", "exec", self.pod, "-n", self.namespace, f"--kubeconfig={self.kubeconfig}"]
+        if self.container:
+            args += ["-c", self.container]
+        return args + ["--"] + command
+
+
+@dataclass
+class PingTest:
+    name: str
+    source: Optional[Target]
+    destination: Optional[str]
+    mtu: Optional[int] = None
+    # Set when the test cannot run, e.g. no test pod on the worker
+    missing: Optional[str] = None
+
+    def command(self, count: int) -> list[str]:
+        size = ["-M", "do", "-s", str(self.mtu)] if self.mtu else []
+        return ["ping", "-c", str(count), *size, self.destination]
+
+
+@dataclass
+class TestResult:
+    name: str
+    suite: str
+    passed: bool
+    seconds: float
+    message: str = ""
+    output: str = ""
+    details: dict = field(default_factory=dict)
+
+
+def _running(pods: list[dict]) -> list[dict]:
+    return [p for p in pods if p.get("status", {}).get("phase") == "Running"
+            and not p["metadata"].get("deletionTimestamp")]
+
+
+def _is_true(obj: dict, condition_type: str) -> bool:
+    return any(c.get("type") == condition_type and c.get("status") == "True"
+               for c in obj.get("status", {}).get("conditions", []))
+
+
+def worker_name(dpu: dict) -> str:
+    """
+    Returns the host name of a DPU's worker, as matched against pod node
+    names. Older DPU objects lack spec.nodeName; their names start with
+    the host's FQDN.
+    """
+    node = dpu.get("spec", {}).get("nodeName")
+    if node:
+        return node
+    name = dpu["metadata"]["name"]
+    end = name.find(".com")
+    return name[:end + 4] if end >= 0 else name
+
+
+class Inventory:
+    """
+    The DPU workers and test pods of both clusters, read with one list per
+    collection.
+    """
+
+    def __init__(self, mgmt: KubeClient, hosted: KubeClient, namespace: str):
+        self.mgmt = mgmt
+        self.hosted = hosted
+        self.namespace = namespace
+        # Pod IPs of the test pods seen so far, by pod name
+        self.pod_ips: dict[str, str] = {}
+
+    def _test_pods(self, label_selector: Optional[str] = None) -> list[dict]:
+        pods = _running(self.mgmt.list(resource_path("v1", "pods", self.namespace),
+                                       label_selector=label_selector).get("items", []))
+        self.pod_ips.update({p["metadata"]["name"]: p["status"].get("podIP") for p in pods})
+        return pods
+
+    def workers(self) -> list[Worker]:
+        dpus = self.mgmt.list(resource_path("provisioning.dpu.nvidia.com/v1alpha1", "dpus",
+                                            DPF_NAMESPACE)).get("items", [])
+        ready = [d for d in dpus
+                 if d.get("status", {}).get("phase") == "Ready" and _is_true(d, "Ready")]
+        workers = [Worker(worker_name(d)) for d in sorted(ready, key=lambda d: d["metadata"]["name"])]
+
+        hbn_pods = _running(self.hosted.list(resource_path("v1", "pods", DPF_NAMESPACE)).get("items", []))
+        test_pods = self._test_pods()
+        for worker in workers:
+            for pod in hbn_pods:
+                name = pod["metadata"]["name"]
+                if "hbn" in name and worker.name in pod["spec"].get("nodeName", ""):
+                    worker.hbn_pod = name
+            for pod in test_pods:
+                name = pod["metadata"]["name"]
+                if worker.name not in pod["spec"].get("nodeName", ""):
+                    continue
+                if "hostnetwork" in name:
+                    worker.hostnetwork_pod = name
+                elif "master" not in name:
+                    worker.pod = name
+        return workers
+
+    def master_pod(self) -> Optional[str]:
+        pods = self._test_pods("app=sriov-test-master")
+        return pods[0]["metadata"]["name"] if pods else None
+
+    def unready_deployments(self) -> list[str]:
+        deployments = self.mgmt.list(resource_path("apps/v1", "deployments", self.namespace)).get("items", [])
+        return [f"{d['metadata']['name']} ({d.get('status', {}).get('readyReplicas', 0)}/"
+                f"{d['spec'].get('replicas', 1)})" for d in deployments
+                if d.get("status", {}).get("readyReplicas", 0) != d["spec"].get("replicas", 1)]
+
+
+def hosted_kubeconfig(mgmt: KubeClient, cluster_name: Optional[str]) -> str:
+    """
+    Writes the admin kubeconfig of the hosted cluster to a private
+    temporary file.
+    Returns:
+        str: The kubeconfig path; the caller removes it
+    """
+    clusters = mgmt.list("/apis/hypershift.openshift.io/v1beta1/hostedclusters").get("items", [])
+    if cluster_name:
+        clusters = [c for c in clusters if c["metadata"]["name"] == cluster_name]
+    if not clusters:
+        raise SetupError(f"Hosted cluster {cluster_name} not found" if cluster_name
+                         else "No hosted cluster found")
+    cluster = clusters[0]
+    secret_name = cluster.get("status", {}).get("kubeconfig", {}).get("name") \
+        or f"{cluster['metadata']['name']}-admin-kubeconfig"
+    secret = mgmt.get(resource_path("v1", "secrets", cluster["metadata"]["namespace"], secret_name))
+    data = secret.get("data", {}).get("kubeconfig")
+    if not data:
+        raise SetupError(f"Secret {secret_name} has no kubeconfig")
+    fd, path = tempfile.mkstemp(prefix="hosted-kubeconfig-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(base64.b64decode(data))
+    return path
+
+
+def check_cluster_operators(client: KubeClient, cluster: str) -> TestResult:
+    started = time.monotonic()
+    operators = client.list("/apis/config.openshift.io/v1/clusteroperators").get("items", [])
+    bad = [f"{o['metadata']['name']} {t}" for o in operators
+           for t in ("Degraded", "Progressing") if _is_true(o, t)]
+    return TestResult(f"Checking if any cluster operators are degraded or progressing on {cluster} cluster",
+                      "cluster-operators", not bad, time.monotonic() - started,
+                      "; ".join(bad), details={"operators": len(operators), "not_settled": bad})
+
+
+def ensure_workload(client: KubeClient, namespace: str, workload_file: str, kubeconfig: str) -> None:
+    """
+    Deploys the sriov test pods if their namespace does not exist yet.
+    """
+    try:
+        client.get(resource_path("v1", "namespaces", None, namespace))
+        return
+    except ApiError as e:
+        if e.status != 404:
+            raise
+    print(f"Namespace {namespace} does not exist, applying {workload_file}", flush=True)
+    for command in (["oc", "apply", "-f", workload_file],
+                    ["oc", "wait", "--for=condition=available", f"--timeout={WORKLOAD_TIMEOUT}s",
+                     "deployment", "--all", "-n", namespace]):
+        result = subprocess.run(command + [f"--kubeconfig={kubeconfig}"], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise SetupError(f"{' '.join(command)} failed: {result.stderr.strip()}")
+
+
+def discover_workers(inventory: Inventory, hosted_path: str, parallelism: int) -> list[Worker]:
+    """
+    Lists the Ready DPU workers with their test pods and doca-hbn addresses.
+    Raises:
+        SetupError: The test deployments are not ready or no DPU is Ready
+    """
+    unready = inventory.unready_deployments()
+    if unready:
+        raise SetupError(f"Deployments not ready in {inventory.namespace}: {', '.join(unready)}")
+    workers = inventory.workers()
+    if not workers:
+        raise SetupError(f"No DPU in Ready phase in {DPF_NAMESPACE}")
+    print(f"{len(workers)} DPU workers Ready: {' '.join(w.name for w in workers)}", flush=True)
+    hbn_addresses(workers, hosted_path, parallelism)
+    return workers
+
+
+def build_tests(workers: list[Worker], master: Optional[str], mgmt_kubeconfig: str,
+                hosted_kubeconfig_path: str, namespace: str) -> list[PingTest]:
+    """
+    Lists the ping matrix of dpf-sanity-checks.sh. Between the doca-hbn
+    pods every worker pings the next one, which for two workers are the
+    script's tests in both directions.
+    """
+    def pod(name: Optional[str]) -> Optional[Target]:
+        return Target(mgmt_kubeconfig, namespace, name) if name else None
+
+    def hbn(worker: Worker) -> Optional[Target]:
+        return Target(hosted_kubeconfig_path, DPF_NAMESPACE, worker.hbn_pod, HBN_CONTAINER) \
+            if worker.hbn_pod else None
+
+    def test(name: str, source: Optional[Target], destination: Optional[str],
+             mtu: Optional[int], worker: Worker, what: str) -> PingTest:
+        missing = None
+        if source is None:
+            missing = f"no {what} pod found for {worker.name}"
+        elif destination is None:
+            missing = f"no {HBN_INTERFACE} address found for {worker.name}"
+        return PingTest(name, source, destination, mtu, missing)
+
+    tests = []
+    for w in workers:
+        tests += [
+            test(f"Test pings from sriov master test pod '{master}' to doca-hbn pod "
+                 f"'{w.hbn_pod}' on node '{w.name}'", pod(master), w.hbn_ip, MTU_SMALL, w, "master"),
+            test(f"Test pings mtu {MTU_SMALL} from sriov worker test pod '{w.pod}' to doca-hbn pod ip "
+                 f"'{w.hbn_ip}' on DPU worker '{w.name}'", pod(w.pod), w.hbn_ip, MTU_SMALL, w, "test"),
+            test(f"Test pings mtu {MTU_SMALL} from sriov worker test pod on hostnetwork "
+                 f"'{w.hostnetwork_pod}' to doca-hbn pod ip '{w.hbn_ip}' on DPU worker '{w.name}'",
+                 pod(w.hostnetwork_pod), w.hbn_ip, MTU_SMALL, w, "hostnetwork test"),
+            test(f"Test pings mtu {MTU_JUMBO} from sriov worker test pod on hostnetwork "
+                 f"'{w.hostnetwork_pod}' to doca-hbn pod ip '{w.hbn_ip}' on DPU worker '{w.name}'",
+                 pod(w.hostnetwork_pod), w.hbn_ip, MTU_JUMBO, w, "hostnetwork test"),
+            test(f"Test pings from sriov worker test pod '{w.pod}' to {EXTERNAL_IP} on DPU worker "
+                 f"'{w.name}'", pod(w.pod), EXTERNAL_IP, None, w, "test"),
+            test(f"Test pings from sriov worker test pod on hostnetwork '{w.hostnetwork_pod}' to "
+                 f"{EXTERNAL_IP} on DPU worker '{w.name}'", pod(w.hostnetwork_pod), EXTERNAL_IP,
+                 None, w, "hostnetwork test"),
+        ]
+    if len(workers) > 1:
+        for i, w in enumerate(workers):
+            peer = workers[(i + 1) % len(workers)]
+            for mtu in (MTU_SMALL, MTU_JUMBO):
+                tests.append(test(f"Test pings mtu {mtu} from doca-hbn pod '{w.hbn_pod}' on DPU worker "
+                                  f"'{w.name}' to '{peer.hbn_pod}' on DPU worker '{peer.name}'",
+                                  hbn(w), peer.hbn_ip, mtu, w, "doca-hbn"))
+    return tests
+
+
+def batch_script(commands: list[list[str]]) -> str:
+    """
+    Builds a shell script running the commands in parallel. Every output
+    line is prefixed with the command's index, followed by a last line
+    "<index> __rc <exit status>".
+    """
+    lines = ['run() { id=$1; shift; { "$@" 2>&1; echo "__rc $?"; } | '
+             'while IFS= read -r line; do echo "$id $line"; done; }']
+    lines += [f"run {i} {shlex.join(command)} &" for i, command in enumerate(commands)]
+    lines.append("wait")
+    return "\n".join(lines)
+
+
+def exec_batch(target: Target, commands: list[list[str]],
+               timeout: float) -> list[tuple[str, Optional[int], float]]:
+    """
+    Runs commands in parallel in one exec on the target.
+    Args:
+        target: Where to run them
+        commands: The commands
+        timeout: Seconds after which the exec is killed
+    Returns:
+        list: (output, exit status or None, seconds until it finished) per command
+    """
+    started = time.monotonic()
+    outputs: list[list[str]] = [[] for _ in commands]
+    status: list[Optional[int]] = [None] * len(commands)
+    finished = [0.0] * len(commands)
+    process = subprocess.Popen(target.exec_args(["sh", "-c", batch_script(commands)]),
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    # stderr is drained concurrently so a chatty exec cannot fill its pipe
+    # and stall stdout.
+    errors: list[str] = []
+    reader = threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True)
+    reader.start()
+    timer = threading.Timer(timeout, process.kill)
+    timer.start()
+    try:
+        for line in process.stdout:
+            index, _, text = line.rstrip("\n").partition(" ")
+            if not index.isdigit() or int(index) >= len(commands):
+                continue
+            i = int(index)
+            if text.startswith("__rc "):
+                status[i] = int(text[5:])
+                finished[i] = time.monotonic() - started
+            else:
+                outputs[i].append(text)
+        process.wait()
+        reader.join()
+        error = "".join(errors).strip()
+    finally:
+        timer.cancel()
+    elapsed = time.monotonic() - started
+    results = []
+    for i in range(len(commands)):
+        output = "\n".join(outputs[i])
+        if status[i] is None and error:
+            output = f"{output}\n{error}".strip()
+        results.append((output, status[i], finished[i] if status[i] is not None else elapsed))
+    return results
+
+
+def hbn_addresses(workers: list[Worker], hosted: str, parallelism: int) -> None:
+    """
+    Reads the pf2dpu2_if address of every doca-hbn pod, concurrently.
+    """
+    def address(worker: Worker) -> None:
+        target = Target(hosted, DPF_NAMESPACE, worker.hbn_pod, HBN_CONTAINER)
+        output, _, _ = exec_batch(target, [["ip", "-4", "-o", "addr", "show", HBN_INTERFACE]],
+                                  EXEC_GRACE)[0]
+        match = INET.search(output)
+        worker.hbn_ip = match.group(1) if match else None
+        print(f"doca-hbn pod {worker.hbn_pod} on {worker.name}: "
+              f"{worker.hbn_ip or 'no ' + HBN_INTERFACE + ' address'}", flush=True)
+
+    with ThreadPoolExecutor(max_workers=parallelism) as pool:
+        list(pool.map(address, [w for w in workers if w.hbn_pod]))
+
+
+class Runner:
+    def __init__(self, ping_count: int, parallelism: int):
+        """
+        Args:
+            ping_count: Pings sent per test
+            parallelism: Concurrent oc exec processes
+        """
+        self.ping_count = ping_count
+        self.parallelism = parallelism
+        self._print_lock = threading.Lock()
+
+    def report(self, result: TestResult) -> None:
+        with self._print_lock:
+            status = "PASS" if result.passed else "FAIL"
+            message = f": {result.message}" if result.message and not result.passed else ""
+            print(f"{status} ({result.seconds:.1f}s) {result.name}{message}", flush=True)
+
+    def _ping_results(self, target: Target, tests: list[PingTest]) -> list[TestResult]:
+        runs = exec_batch(target, [t.command(self.ping_count) for t in tests],
+                          self.ping_count + EXEC_GRACE)
+        results = []
+        for test, (output, status, seconds) in zip(tests, runs):
+            loss = PACKET_LOSS.search(output)
+            rtt = RTT.search(output)
+            details = {"source": target.pod, "destination": test.destination, "mtu": test.mtu,
+                       "exit_status": status,
+                       "packet_loss": float(loss.group(1)) if loss else None,
+                       "rtt_ms": dict(zip(("min", "avg", "max"), map(float, rtt.groups())))
+                       if rtt else None}
+            if loss:
+                message = f"{loss.group(1)}% packet loss"
+            elif status is None:
+                message = "exec failed" + (f": {output.splitlines()[-1]}" if output else "")
+            else:
+                message = "no ping statistics in the output"
+            result = TestResult(test.name, "ping", bool(loss) and float(loss.group(1)) == 0,
+                                seconds, message, output, details)
+            self.report(result)
+            results.append(result)
+        return results
+
+    def run_pings(self, tests: list[PingTest]) -> list[TestResult]:
+        """
+        Runs the ping tests, one exec per source pod, returning the
+        results in test order.
+        """
+        results: dict[int, TestResult] = {}
+        groups: dict[tuple, list[int]] = {}
+        for i, test in enumerate(tests):
+            if test.missing:
+                results[i] = TestResult(test.name, "ping", False, 0.0, test.missing)
+                self.report(results[i])
+            else:
+                key = (test.source.kubeconfig, test.source.namespace, test.source.pod,
+                       test.source.container)
+                groups.setdefault(key, []).append(i)
+
+        def run_group(indexes: list[int]) -> None:
+            for i, result in zip(indexes, self._ping_results(tests[indexes[0]].source,
+                                                             [tests[i] for i in indexes])):
+                results[i] = result
+
+        with ThreadPoolExecutor(max_workers=self.parallelism) as pool:
+            list(pool.map(run_group, groups.values()))
+        return [results[i] for i in range(len(tests))]
+
+
+def write_junit(path: str, results: list[TestResult], seconds: float, name: str = "dpf-sanity") -> None:
+    suite = ET.Element("testsuite", name=name, tests=str(len(results)),
+                       failures=str(sum(not r.passed for r in results)), errors="0",
+                       time=f"{seconds:.3f}", timestamp=datetime.now().isoformat(timespec="seconds"))
+    for r in results:
+        case = ET.SubElement(suite, "testcase", classname=f"{name}.{r.suite}", name=r.name,
+                             time=f"{r.seconds:.3f}")
+        if not r.passed:
+            failure = ET.SubElement(case, "failure", message=r.message or "failed")
+            failure.text = r.output
+        elif r.output:
+            ET.SubElement(case, "system-out").text = r.output
+    ET.indent(suite)
+    ET.ElementTree(suite).write(path, encoding="utf-8", xml_declaration=True)
+
+
+def write_json(path: str, results: list[TestResult], seconds: float, workers: list) -> None:
+    """
+    Writes the results, with the workers (dataclasses) they were run on.
+    """
+    with open(path, "w") as f:
+        json.dump({"seconds": round(seconds, 3),
+                   "passed": sum(r.passed for r in results),
+                   "failed": sum(not r.passed for r in results),
+                   "workers": [asdict(w) for w in workers],
+                   "tests": [asdict(r) for r in results]}, f, indent=2)
+        f.write("\n")
+
+
+def run(args: argparse.Namespace, mgmt: KubeClient, mgmt_kubeconfig: str) -> tuple[list[TestResult], list[Worker]]:
+    hosted_path = hosted_kubeconfig(mgmt, args.hosted_cluster)
+    try:
+        hosted = KubeClient.from_kubeconfig(hosted_path)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            results = list(pool.map(lambda pair: check_cluster_operators(*pair),
+                                    ((mgmt, "management"), (hosted, "hosted"))))
+
+        runner = Runner(args.ping_count, max(1, args.parallel))
+        for result in results:
+            runner.report(result)
+
+        ensure_workload(mgmt, args.namespace, args.workload_file, mgmt_kubeconfig)
+        inventory = Inventory(mgmt, hosted, args.namespace)
+        workers = discover_workers(inventory, hosted_path, runner.parallelism)
+        tests = build_tests(workers, inventory.master_pod(), mgmt_kubeconfig, hosted_path, args.namespace)
+        print(f"Running {len(tests)} ping tests with {args.ping_count} pings each", flush=True)
+        results += runner.run_pings(tests)
+        return results, workers
+    finally:
+        os.unlink(hosted_path)
+
+
+def main() -> int:
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    parser = ArgumentParser(
+        description='Run the DPF sanity checks concurrently, writing JUnit XML and JSON results')
+    parser.add_argument('--namespace', default=os.environ.get("SANITY_TESTS_WORKLOAD_NAMESPACE")
+                        or DEFAULT_WORKLOAD_NAMESPACE, help='Namespace of the sriov test pods')
+    parser.add_argument('--workload-file', default=os.environ.get("SANITY_TESTS_PODS_WORKLOAD_FILE")
+                        or DEFAULT_WORKLOAD_FILE, help='Manifest deploying the sriov test pods')
+    parser.add_argument('--ping-count', type=int,
+                        default=int(os.environ.get("SANITY_TESTS_PING_COUNT") or DEFAULT_PING_COUNT),
+                        help='Pings sent per test')
+    parser.add_argument('--parallel', '-j', type=int,
+                        default=int(os.environ.get("SANITY_TESTS_PARALLELISM") or DEFAULT_PARALLELISM),
+                        help=f'Concurrent oc exec processes (default: {DEFAULT_PARALLELISM})')
+    parser.add_argument('--hosted-cluster', default=os.environ.get("HOSTED_CLUSTER_NAME"),
+                        help='Hosted cluster name (default: the first one)')
+    parser.add_argument('--junit', default=f"logs/dpf-sanity_{stamp}.xml", help='JUnit XML report path')
+    parser.add_argument('--json', default=f"logs/dpf-sanity_{stamp}.json", help='JSON report path')
+    args = parser.parse_args()
+
+    mgmt_kubeconfig = os.environ.get("KUBECONFIG", "").split(os.pathsep)[0]
+    started = time.monotonic()
+    try:
+        mgmt = KubeClient.from_kubeconfig(mgmt_kubeconfig)
+        results, workers = run(args, mgmt, mgmt_kubeconfig)
+    except SetupError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    except (KubeConfigError, ApiError, OSError, http.client.HTTPException) as e:
+        print(f"Cannot run the sanity checks through the API: {e}", file=sys.stderr)
+        return EXIT_UNAVAILABLE
+    seconds = time.monotonic() - started
+
+    for path in (args.junit, args.json):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    write_junit(args.junit, results, seconds)
+    write_json(args.json, results, seconds, workers)
+
+    failed = [r for r in results if not r.passed]
+    print(f"\n{len(results)} tests in {seconds:.1f}s, {len(failed)} failed")
+    for r in failed:
+        print(f"  FAIL {r.name}: {r.message}")
+    print(f"Results: {args.junit} {args.json}")
+    return EXIT_FAILED if failed else 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+"""
+Waits for Kubernetes objects to reach a condition using watch streams.
+
+Each wait is given as CONDITION[=ARG]:KIND/NAMESPACE/NAME, for example
+
+    exists:secret/clusters/doca-admin-kubeconfig
+    has-data-key=kubeconfig:secret/clusters/doca-admin-kubeconfig
+    pods-ready:pods/hypershift/app=operator
+    endpoints-populated:endpoints/dpf-operator-system/dpf-provisioning-webhook-service
+    condition=Ready:dpu/dpf-operator-system/*
+    deleted:dpu/*/*
+
+NAME may be a label selector (it contains "=") or "*" for every object;
+NAMESPACE may be "*" for all namespaces and is empty for cluster scoped
+kinds. All waits run concurrently in one process, each following its
+objects with a list and watch, so a condition is seen as soon as the event
+arrives instead of on the next poll.
+
+Exit status: 0 when every condition holds, 1 on timeout, 2 when the API
+cannot be used (no usable kubeconfig, unknown kind, access denied, API
+unreachable), in which case callers fall back to polling with oc, and 3
+for a malformed command line.
+"""
+
+import http.client
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from cli import ArgumentParser
+from kube_client import (ApiError, Discovery, KubeClient, KubeConfigError, Resource,
+                         UnknownKind, resource_path)
+
+EXIT_TIMEOUT = 1
+EXIT_UNAVAILABLE = 2
+
+DEFAULT_TIMEOUT = 300
+# Delay before restarting a watch after a transient API error.
+RETRY_DELAY = 5
+
+CONDITIONS = ("exists", "deleted", "has-data-key", "pods-ready", "endpoints-populated",
+              "condition")
+
+
+class WaitUnavailable(Exception):
+    """Raised when waiting through the API is not possible."""
+
+
+@dataclass
+class WaitSpec:
+    condition: str
+    arg: Optional[str]
+    kind: str
+    namespace: str
+    name: Optional[str] = None
+    selector: Optional[str] = None
+
+    @classmethod
+    def parse(cls, text: str) -> "WaitSpec":
+        """
+        Parses CONDITION[=ARG]:KIND/NAMESPACE/NAME.
+        """
+        condition, sep, target = text.partition(":")
+        condition, _, arg = condition.partition("=")
+        parts = target.split("/", 2)
+        if not sep or condition not in CONDITIONS or len(parts) != 3 or not parts[0]:
+            raise ValueError(f"Invalid wait {text!r}, expected CONDITION[=ARG]:KIND/NAMESPACE/NAME "
+                             f"with CONDITION one of {', '.join(CONDITIONS)}")
+        if condition in ("has-data-key", "condition") and not arg:
+            raise ValueError(f"Invalid wait {text!r}: {condition} needs =ARG")
+        kind, namespace, name = parts
+        spec = cls(condition, arg or None, kind, namespace)
+        if "=" in name:
+            spec.selector = name
+        elif name and name != "*":
+            spec.name = name
+        return spec
+
+    def describe(self) -> str:
+        condition = f"{self.condition}={self.arg}" if self.arg else self.condition
+        target = self.name or self.selector or "*"
+        return f"{condition} {self.kind}/{self.namespace}/{target}"
+
+
+def _is_true(obj: dict, condition_type: str) -> bool:
+    return any(c.get("type") == condition_type and c.get("status") == "True"
+               for c in obj.get("status", {}).get("conditions", []))
+
+
+def evaluate(spec: WaitSpec, objects: list[dict]) -> tuple[bool, str]:
+    """
+    Checks a condition against the current objects.
+    Returns:
+        tuple: Whether it holds and a short progress message
+    """
+    if spec.condition == "exists":
+        return bool(objects), f"{len(objects)} found"
+    if spec.condition == "deleted":
+        return not objects, f"{len(objects)} remaining"
+    if spec.condition == "has-data-key":
+        with_data = [o for o in objects if o.get("data", {}).get(spec.arg)]
+        return bool(objects) and len(with_data) == len(objects), \
+            f"{len(with_data)}/{len(objects)} with {spec.arg}"
+    if spec.condition == "pods-ready":
+        ready = [o for o in objects if _is_true(o, "Ready")]
+        return bool(objects) and len(ready) == len(objects), f"{len(ready)}/{len(objects)} ready"
+    if spec.condition == "endpoints-populated":
+        addresses = sum(len(subset.get("addresses", []))
+                        for o in objects for subset in o.get("subsets") or [])
+        return addresses > 0, f"{addresses} addresses"
+    true = [o for o in objects if _is_true(o, spec.arg)]
+    return bool(objects) and len(true) == len(objects), \
+        f"{len(true)}/{len(objects)} {spec.arg}"
+
+
+class Waiter:
+    """
+    Follows the objects of one wait spec until its condition holds.
+    """
+
+    def __init__(self, client: KubeClient, spec: WaitSpec, resource: Resource):
+        self.client = client
+        self.spec = spec
+        self.resource = resource
+        self.done = threading.Event()
+        self.error: Optional[Exception] = None
+        self.progress = "waiting"
+        self._objects: dict[tuple, dict] = {}
+
+    def _path(self) -> str:
+        namespace = None
+        if self.resource.namespaced and self.spec.namespace not in ("", "*"):
+            namespace = self.spec.namespace
+        return resource_path(self.resource.group_version, self.resource.plural, namespace)
+
+    def _update(self) -> bool:
+        satisfied, progress = evaluate(self.spec, list(self._objects.values()))
+        if progress != self.progress:
+            self.progress = progress
+            print(f"{self.spec.describe()}: {progress}", flush=True)
+        return satisfied
+
+    def run(self, stop: threading.Event) -> None:
+        field_selector = f"metadata.name={self.spec.name}" if self.spec.name else None
+        while not stop.is_set():
+            try:
+                for event, obj in self.client.list_and_watch(
+                        self._path(), field_selector, self.spec.selector, stop):
+                    if event == "SYNC":
+                        self._objects = {(o["metadata"].get("namespace"), o["metadata"]["name"]): o
+                                         for o in obj.get("items", [])}
+                    else:
+                        key = (obj["metadata"].get("namespace"), obj["metadata"]["name"])
+                        if event == "DELETED":
+                            self._objects.pop(key, None)
+                        else:
+                            self._objects[key] = obj
+                    if self._update():
+                        self.done.set()
+                        return
+            except ApiError as e:
+                if e.status in (401, 403):
+                    self.error = WaitUnavailable(f"{self.spec.describe()}: {e}")
+                    self.done.set()
+                    return
+                print(f"{self.spec.describe()}: {e}, retrying", flush=True)
+            except (OSError, http.client.HTTPException) as e:
+                print(f"{self.spec.describe()}: {e}, retrying", flush=True)
+            stop.wait(RETRY_DELAY)
+
+
+def wait_for(client: KubeClient, specs: list[WaitSpec], timeout: float) -> list[WaitSpec]:
+    """
+    Waits concurrently until every condition holds or the timeout expires.
+    Args:
+        client: The API client
+        specs: The conditions to wait for
+        timeout: Seconds to wait in total
+    Returns:
+        list: The specs whose condition did not hold in time (empty on success)
+    """
+    deadline = time.monotonic() + timeout
+    discovery = Discovery(client)
+    try:
+        waiters = [Waiter(client, spec, discovery.resolve(spec.kind)) for spec in specs]
+    except UnknownKind as e:
+        raise WaitUnavailable(str(e))
+    except (ApiError, OSError, http.client.HTTPException) as e:
+        raise WaitUnavailable(f"API discovery failed: {e}")
+
+    stop = threading.Event()
+    for waiter in waiters:
+        threading.Thread(target=waiter.run, args=(stop,), daemon=True).start()
+    try:
+        for waiter in waiters:
+            waiter.done.wait(max(0, deadline - time.monotonic()))
+            if waiter.error:
+                raise waiter.error
+    finally:
+        stop.set()
+    return [waiter.spec for waiter in waiters if not waiter.done.is_set()]
+
+
+def main() -> int:
+    parser = ArgumentParser(
+        description='Wait for Kubernetes objects to reach a condition using watches',
+        epilog='WAIT is CONDITION[=ARG]:KIND/NAMESPACE/NAME, where CONDITION is one of '
+        f'{", ".join(CONDITIONS)}; NAME may be a label selector or "*"')
+    parser.add_argument('waits', nargs='+', metavar='WAIT',
+                        help='Condition to wait for; all are waited for concurrently')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help=f'Seconds to wait (default: {DEFAULT_TIMEOUT})')
+    args = parser.parse_args()
+
+    try:
+        specs = [WaitSpec.parse(text) for text in args.waits]
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        client = KubeClient.from_kubeconfig()
+        pending = wait_for(client, specs, args.timeout)
+    except (KubeConfigError, WaitUnavailable, ApiError, OSError, http.client.HTTPException) as e:
+        print(f"Cannot wait through the API: {e}", file=sys.stderr)
+        return EXIT_UNAVAILABLE
+    except KeyError as e:
+        print(f"Cannot wait through the API: kubeconfig is missing {e}", file=sys.stderr)
+        return EXIT_UNAVAILABLE
+
+    for spec in pending:
+        print(f"Timed out after {args.timeout:g}s waiting for {spec.describe()}", file=sys.stderr)
+    return EXIT_TIMEOUT if pending else 0
+
+
+if __name__ == "__main__":
+    exit(main())
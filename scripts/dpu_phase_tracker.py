@@ -0,0 +1,473 @@
+#!/usr/bin/python3
+"""
+Tracks DPU provisioning phases and where the provisioning time goes.
+
+Follows the DPU, DPUSet, BFB and DPUDeployment objects with list and
+watch, and records when each object enters a phase (BFB download, OS
+install, rebooting, node join, Ready...) and when each of its conditions
+first became true. Phase durations, the time from DPU creation to Ready
+and to each condition are aggregated into histograms, exported in the
+OpenMetrics text format (a node-exporter textfile and/or an HTTP
+/metrics endpoint) and as a JSON timeline.
+
+Events can be recorded to a JSON lines file while watching and replayed
+offline later, so fixtures of past installs can be analyzed without a
+cluster.
+
+Exit status: 0 on success, 2 when the API cannot be used. A malformed
+command line exits with 3.
+"""
+
+import http.client
+import json
+import queue
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, Optional, TextIO
+
+from cli import ArgumentParser
+from kube_client import ApiError, KubeClient, KubeConfigError, resource_path
+from tracing import metric_labels, write_textfile
+
+EXIT_UNAVAILABLE = 2
+
+DPF_NAMESPACE = "dpf-operator-system"
+# Tracked kinds: (name, group version, plural)
+KINDS = (
+    ("dpu", "provisioning.dpu.nvidia.com/v1alpha1", "dpus"),
+    ("dpuset", "provisioning.dpu.nvidia.com/v1alpha1", "dpusets"),
+    ("bfb", "provisioning.dpu.nvidia.com/v1alpha1", "bfbs"),
+    ("dpudeployment", "svc.dpu.nvidia.com/v1alpha1", "dpudeployments"),
+)
+READY_PHASE = "Ready"
+DELETED_PHASE = "Deleted"
+# Histogram buckets in seconds, from quick phases to full OS installs
+BUCKETS = (5, 15, 30, 60, 120, 300, 600, 900, 1200, 1800, 2700, 3600, 5400, 7200)
+METRICS_PREFIX = "dpf_provisioning"
+RETRY_DELAY = 5
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()
+
+
+def _format_time(value: Optional[float]) -> Optional[str]:
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+@dataclass
+class Event:
+    time: float
+    type: str
+    kind: str
+    obj: dict
+
+    def to_json(self) -> str:
+        """
+        Serializes the event for a fixture, keeping only what the tracker reads.
+        """
+        metadata = self.obj.get("metadata", {})
+        status = self.obj.get("status") or {}
+        obj = {"metadata": {k: metadata[k] for k in ("name", "namespace", "uid", "creationTimestamp",
+                                                    "deletionTimestamp") if k in metadata},
+               "status": {k: status[k] for k in ("phase", "conditions") if k in status}}
+        return json.dumps({"time": self.time, "type": self.type, "kind": self.kind,
+                           "object": obj})
+
+    @classmethod
+    def from_json(cls, line: str) -> "Event":
+        data = json.loads(line)
+        return cls(data["time"], data["type"], data["kind"], data["object"])
+
+
+@dataclass
+class Histogram:
+    buckets: tuple = BUCKETS
+    values: list[float] = field(default_factory=list)
+
+    def observe(self, value: float) -> None:
+        self.values.append(max(0.0, value))
+
+    def quantile(self, q: float) -> float:
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+    def summary(self) -> dict:
+        return {"count": len(self.values), "sum": round(sum(self.values), 3),
+                "p50": round(self.quantile(0.5), 3), "p90": round(self.quantile(0.9), 3),
+                "max": round(max(self.values, default=0.0), 3)}
+
+    def openmetrics(self, metric: str, **labels) -> list[str]:
+        lines = []
+        for bound in self.buckets:
+            count = sum(1 for value in self.values if value <= bound)
+            lines.append(f"{metric}_bucket{metric_labels(**labels, le=bound)} {count}")
+        lines += [f"{metric}_bucket{metric_labels(**labels, le='+Inf')} {len(self.values)}",
+                  f"{metric}_sum{metric_labels(**labels)} {sum(self.values):.3f}",
+                  f"{metric}_count{metric_labels(**labels)} {len(self.values)}"]
+        return lines
+
+
+@dataclass
+class Transition:
+    phase: str
+    time: float
+    # False when the object was already in the phase when tracking started
+    start_known: bool = True
+    seconds: Optional[float] = None
+
+
+@dataclass
+class Track:
+    kind: str
+    namespace: Optional[str]
+    name: str
+    created: Optional[float] = None
+    uid: Optional[str] = None
+    transitions: list[Transition] = field(default_factory=list)
+    # First time each condition was true, from its lastTransitionTime
+    conditions: dict[str, float] = field(default_factory=dict)
+    ready: Optional[float] = None
+
+    @property
+    def phase(self) -> Optional[str]:
+        return self.transitions[-1].phase if self.transitions else None
+
+    def same_object(self, uid: Optional[str], created: Optional[float]) -> bool:
+        """
+        Whether an event with this uid and creation time is about the
+        tracked object rather than a new one with the same name.
+        """
+        if self.phase == DELETED_PHASE:
+            return False
+        if uid and self.uid:
+            return uid == self.uid
+        return created is None or self.created is None or created == self.created
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind, "namespace": self.namespace, "name": self.name,
+            "uid": self.uid,
+            "created": _format_time(self.created),
+            "phase": self.phase,
+            "ready_seconds": round(self.ready - self.created, 3)
+            if self.ready is not None and self.created is not None else None,
+            "transitions": [{"phase": t.phase, "at": _format_time(t.time),
+                             "start_known": t.start_known,
+                             "seconds": round(t.seconds, 3) if t.seconds is not None else None}
+                            for t in self.transitions],
+            "conditions": {name: {"at": _format_time(at),
+                                  "since_created": round(at - self.created, 3)
+                                  if self.created is not None else None}
+                           for name, at in sorted(self.conditions.items(), key=lambda c: c[1])},
+        }
+
+
+class PhaseTracker:
+    """
+    Builds per object timelines and duration histograms from watch events.
+    """
+
+    def __init__(self):
+        # The current object of each (kind, namespace, name)
+        self.tracks: dict[tuple, Track] = {}
+        # Objects that were deleted and replaced by one with the same name
+        self.replaced: list[Track] = []
+        # (kind, phase) -> time spent in the phase
+        self.phases: dict[tuple[str, str], Histogram] = {}
+        # (kind, condition) -> time from creation to the condition
+        self.conditions: dict[tuple[str, str], Histogram] = {}
+        self.ready = Histogram()
+        self._lock = threading.Lock()
+
+    def _enter(self, track: Track, phase: str, at: float, start_known: bool) -> None:
+        if track.transitions:
+            previous = track.transitions[-1]
+            if previous.start_known:
+                previous.seconds = at - previous.time
+                # A phase cut short by the deletion did not complete
+                if phase != DELETED_PHASE:
+                    self.phases.setdefault((track.kind, previous.phase), Histogram()).observe(
+                        previous.seconds)
+        track.transitions.append(Transition(phase, at, start_known))
+        print(f"{track.kind}/{track.name}: {phase}", flush=True)
+
+    def observe(self, event: Event) -> bool:
+        """
+        Applies one event.
+        Returns:
+            bool: Whether the object entered a new phase
+        """
+        metadata = event.obj.get("metadata", {})
+        status = event.obj.get("status") or {}
+        key = (event.kind, metadata.get("namespace"), metadata.get("name"))
+        created = _parse_time(metadata.get("creationTimestamp"))
+        with self._lock:
+            track = self.tracks.get(key)
+            # A delete and recreate reuses the name: start a new timeline
+            if track is not None and event.type != "DELETED" \
+                    and not track.same_object(metadata.get("uid"), created):
+                self.replaced.append(track)
+                track = None
+            if track is None:
+                track = Track(event.kind, metadata.get("namespace"), metadata.get("name"),
+                              created, metadata.get("uid"))
+                self.tracks[key] = track
+            elif event.type == "DELETED" and metadata.get("uid") and track.uid \
+                    and metadata.get("uid") != track.uid:
+                # Late deletion of an object that was already replaced
+                return False
+            elif track.uid is None:
+                track.uid = metadata.get("uid")
+
+            for condition in status.get("conditions") or []:
+                at = _parse_time(condition.get("lastTransitionTime"))
+                if condition.get("status") == "True" and at is not None \
+                        and condition.get("type") not in track.conditions:
+                    track.conditions[condition["type"]] = at
+                    if track.created is not None and event.type != "SYNC":
+                        self.conditions.setdefault((event.kind, condition["type"]),
+                                                   Histogram()).observe(at - track.created)
+
+            phase = DELETED_PHASE if event.type == "DELETED" else status.get("phase")
+            if not phase or phase == track.phase:
+                return False
+            # Objects present at the initial list entered their phase at an
+            # unknown time; objects added later started with their creation
+            first = not track.transitions
+            if first and event.type == "ADDED" and track.created is not None:
+                self._enter(track, phase, min(track.created, event.time), True)
+            else:
+                self._enter(track, phase, event.time, not (first and event.type == "SYNC"))
+            if phase == READY_PHASE and track.ready is None and event.type != "SYNC":
+                track.ready = event.time
+                if event.kind == "dpu" and track.created is not None:
+                    self.ready.observe(track.ready - track.created)
+            return True
+
+    def all_ready(self) -> bool:
+        with self._lock:
+            dpus = [t for t in self.tracks.values() if t.kind == "dpu" and t.phase != DELETED_PHASE]
+            return bool(dpus) and all(t.phase == READY_PHASE for t in dpus)
+
+    def openmetrics(self) -> str:
+        """
+        Renders the histograms and the current phase counts.
+        """
+        with self._lock:
+            prefix = METRICS_PREFIX
+            lines = [f"# HELP {prefix}_phase_duration_seconds Time objects spent in each phase.",
+                     f"# TYPE {prefix}_phase_duration_seconds histogram"]
+            for (kind, phase), histogram in sorted(self.phases.items()):
+                lines += histogram.openmetrics(f"{prefix}_phase_duration_seconds",
+                                               kind=kind, phase=phase)
+            lines += [f"# HELP {prefix}_condition_seconds Time from creation until each "
+                      f"condition was first true.",
+                      f"# TYPE {prefix}_condition_seconds histogram"]
+            for (kind, condition), histogram in sorted(self.conditions.items()):
+                lines += histogram.openmetrics(f"{prefix}_condition_seconds",
+                                               kind=kind, condition=condition)
+            lines += [f"# HELP {prefix}_dpu_ready_seconds Time from DPU creation to Ready.",
+                      f"# TYPE {prefix}_dpu_ready_seconds histogram"]
+            lines += self.ready.openmetrics(f"{prefix}_dpu_ready_seconds")
+            counts: dict[tuple[str, str], int] = {}
+            for track in self.tracks.values():
+                if track.phase and track.phase != DELETED_PHASE:
+                    counts[(track.kind, track.phase)] = counts.get((track.kind, track.phase), 0) + 1
+            lines += [f"# HELP {prefix}_objects Objects by kind and current phase.",
+                      f"# TYPE {prefix}_objects gauge"]
+            lines += [f"{prefix}_objects{metric_labels(kind=kind, phase=phase)} {count}"
+                      for (kind, phase), count in sorted(counts.items())]
+            lines.append("# EOF")
+            return "\n".join(lines) + "\n"
+
+    def timeline(self) -> dict:
+        with self._lock:
+            return {
+                "objects": [track.to_dict() for track in sorted(
+                    self.replaced + list(self.tracks.values()),
+                    key=lambda t: (t.kind, t.namespace or "", t.name or "", t.created or 0))],
+                "phases": [{"kind": kind, "phase": phase, **h.summary()}
+                           for (kind, phase), h in sorted(self.phases.items())],
+                "conditions": [{"kind": kind, "condition": condition, **h.summary()}
+                               for (kind, condition), h in sorted(self.conditions.items())],
+                "dpu_ready": self.ready.summary(),
+            }
+
+    def print_summary(self) -> None:
+        timeline = self.timeline()
+        rows = [(f"{p['kind']} {p['phase']}", p) for p in timeline["phases"]]
+        rows += [(f"{c['kind']} until {c['condition']}", c) for c in timeline["conditions"]]
+        if timeline["dpu_ready"]["count"]:
+            rows.append(("dpu until Ready", timeline["dpu_ready"]))
+        if not rows:
+            print("No complete phases observed")
+            return
+        width = max(len(name) for name, _ in rows)
+        print(f"{'PHASE'.ljust(width)}  {'COUNT':>5}  {'P50':>8}  {'P90':>8}  {'MAX':>8}")
+        for name, stats in rows:
+            print(f"{name.ljust(width)}  {stats['count']:>5}  {stats['p50']:>7.0f}s  "
+                  f"{stats['p90']:>7.0f}s  {stats['max']:>7.0f}s")
+
+
+def replay(paths: list[str]) -> Iterator[Event]:
+    """
+    Reads recorded events, in time order across files.
+    """
+    events = []
+    for path in paths:
+        with open(path) as f:
+            events += [Event.from_json(line) for line in f if line.strip()]
+    return iter(sorted(events, key=lambda e: e.time))
+
+
+def watch(client: KubeClient, namespace: Optional[str], stop: threading.Event) -> Iterator[Event]:
+    """
+    Follows every tracked kind concurrently, skipping kinds the cluster
+    does not serve.
+    Raises:
+        ApiError: Access to the API was denied
+    """
+    events: queue.Queue = queue.Queue()
+    paths = []
+    for kind, group_version, plural in KINDS:
+        path = resource_path(group_version, plural, namespace)
+        try:
+            client.list(path, metadata_only=True)
+        except ApiError as e:
+            if e.status != 404:
+                raise
+            print(f"Not tracking {kind}: not served by the cluster", flush=True)
+            continue
+        paths.append((kind, path))
+
+    def follow(kind: str, path: str) -> None:
+        while not stop.is_set():
+            try:
+                for event_type, obj in client.list_and_watch(path, stop=stop):
+                    now = time.time()
+                    if event_type == "SYNC":
+                        for item in obj.get("items", []):
+                            events.put(Event(now, "SYNC", kind, item))
+                    else:
+                        events.put(Event(now, event_type, kind, obj))
+            except (ApiError, OSError, http.client.HTTPException) as e:
+                print(f"Watching {kind}: {e}, retrying", flush=True)
+            stop.wait(RETRY_DELAY)
+
+    for kind, path in paths:
+        threading.Thread(target=follow, args=(kind, path), daemon=True).start()
+    while not stop.is_set():
+        try:
+            yield events.get(timeout=1)
+        except queue.Empty:
+            continue
+
+
+def serve_metrics(tracker: PhaseTracker, port: int) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = tracker.openmetrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; "
+                                             "charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving metrics on :{port}/metrics", flush=True)
+    return server
+
+
+def write_outputs(tracker: PhaseTracker, json_path: Optional[str],
+                  textfile: Optional[str]) -> None:
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(tracker.timeline(), f, indent=2)
+    if textfile:
+        write_textfile(textfile, tracker.openmetrics())
+
+
+def main() -> int:
+    parser = ArgumentParser(
+        description='Track DPU provisioning phases and export duration histograms')
+    parser.add_argument('--json', help='Write the JSON timeline to this file')
+    parser.add_argument('--textfile', help='Write OpenMetrics to this file (node-exporter textfile)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    watch_cmd = sub.add_parser('watch', help='Follow the provisioning objects on the cluster')
+    watch_cmd.add_argument('--namespace', '-n', default=DPF_NAMESPACE,
+                           help=f'Namespace of the objects, "*" for all (default: {DPF_NAMESPACE})')
+    watch_cmd.add_argument('--duration', type=float, default=0,
+                           help='Stop after this many seconds (default: until interrupted)')
+    watch_cmd.add_argument('--until-ready', action='store_true',
+                           help='Stop once every DPU is Ready')
+    watch_cmd.add_argument('--record', help='Append the events to this JSON lines file')
+    watch_cmd.add_argument('--listen', type=int, metavar='PORT',
+                           help='Serve the metrics on :PORT/metrics while watching')
+    replay_cmd = sub.add_parser('replay', help='Analyze recorded events offline')
+    replay_cmd.add_argument('files', nargs='+', metavar='FILE')
+    args = parser.parse_args()
+
+    tracker = PhaseTracker()
+    if args.command == 'replay':
+        for event in replay(args.files):
+            tracker.observe(event)
+        write_outputs(tracker, args.json, args.textfile)
+        tracker.print_summary()
+        return 0
+
+    try:
+        client = KubeClient.from_kubeconfig()
+    except KubeConfigError as e:
+        print(f"Cannot watch through the API: {e}", file=sys.stderr)
+        return EXIT_UNAVAILABLE
+    if args.listen:
+        serve_metrics(tracker, args.listen)
+    stop = threading.Event()
+    if args.duration > 0:
+        timer = threading.Timer(args.duration, stop.set)
+        timer.daemon = True
+        timer.start()
+    record: Optional[TextIO] = open(args.record, "a") if args.record else None
+    try:
+        for event in watch(client, None if args.namespace == "*" else args.namespace, stop):
+            if record:
+                record.write(event.to_json() + "\n")
+                record.flush()
+            if tracker.observe(event):
+                write_outputs(tracker, args.json, args.textfile)
+            if args.until_ready and tracker.all_ready():
+                print("All DPUs are Ready", flush=True)
+                break
+    except (ApiError, OSError, http.client.HTTPException) as e:
+        print(f"Cannot watch through the API: {e}", file=sys.stderr)
+        return EXIT_UNAVAILABLE
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        if record:
+            record.close()
+    write_outputs(tracker, args.json, args.textfile)
+    tracker.print_summary()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
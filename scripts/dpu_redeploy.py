@@ -0,0 +1,580 @@
+#!/usr/bin/python3
+"""
+Re-provisions the DPUs in batches instead of all at once.
+
+Each batch is drained through the maintenance operator: the batch creates
+a NodeMaintenance per host node, or joins the one another requestor
+already holds for the node through spec.additionalRequestors, since the
+operator serves one per node. Its DPU objects are deleted so that their
+DPUSet creates them again from the current BFB and flavor, and the batch
+is done once every new DPU is Ready. The next batch only starts once the previous one
+passed the health gate (its DPUs and host nodes Ready, no new DPU in
+Error) and its own DPUs fit under the max unavailable, counting every DPU
+that is not Ready. DPUs that were already not Ready when the redeploy
+started are left out of both checks and their nodes go first, since the
+redeploy is what repairs them. Nodes with more DPUs than the max
+unavailable are refused, and DPUs without spec.nodeName are skipped and
+reported. DPUs and maintenance objects are followed with watches, and
+the time spent draining, re-provisioning and gating is reported per
+batch.
+
+Exit status: 0 when every batch succeeded, 1 when a batch failed or timed
+out (later batches are not started), 2 when the API cannot be used. A
+malformed command line exits with 3.
+"""
+
+import http.client
+import json
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from cli import ArgumentParser
+from kube_client import ApiError, KubeClient, KubeConfigError, resource_path
+
+EXIT_FAILED = 1
+EXIT_UNAVAILABLE = 2
+
+DPF_NAMESPACE = "dpf-operator-system"
+DPU_GROUP_VERSION = "provisioning.dpu.nvidia.com/v1alpha1"
+MAINTENANCE_GROUP_VERSION = "maintenance.nvidia.com/v1alpha1"
+REQUESTOR_ID = "openshift-dpf"
+MAINTENANCE_PREFIX = "dpu-redeploy"
+READY_PHASE = "Ready"
+ERROR_PHASE = "Error"
+
+DEFAULT_BATCH_SIZE = 1
+DEFAULT_MAX_UNAVAILABLE = 1
+# Seconds per batch for the drain and for the DPUs to be Ready again
+DEFAULT_TIMEOUT = 3600
+DEFAULT_DRAIN_TIMEOUT = 600
+RETRY_DELAY = 5
+
+
+class RedeployUnavailable(Exception):
+    """Raised when the redeploy cannot be done through the API."""
+
+
+def _name(obj: dict) -> str:
+    return obj["metadata"]["name"]
+
+
+def _namespaced_name(obj: dict) -> str:
+    return f"{obj['metadata'].get('namespace')}/{obj['metadata']['name']}"
+
+
+class Store:
+    """
+    Follows a collection with list and watch and lets callers wait for a
+    predicate over its objects.
+    """
+
+    def __init__(self, client: KubeClient, path: str, stop: threading.Event,
+                 key: Callable[[dict], str] = _name):
+        """
+        Args:
+            client: The API client
+            path: The collection path
+            stop: Ends the watch once set
+            key: The key of an object in objects, its name by default
+        """
+        self.client = client
+        self.path = path
+        self.stop = stop
+        self.key = key
+        self.objects: dict[str, dict] = {}
+        self.synced = threading.Event()
+        self._cond = threading.Condition()
+
+    def run(self) -> None:
+        while not self.stop.is_set():
+            try:
+                for event, obj in self.client.list_and_watch(self.path, stop=self.stop):
+                    with self._cond:
+                        if event == "SYNC":
+                            self.objects = {self.key(o): o for o in obj.get("items", [])}
+                        elif event == "DELETED":
+                            self.objects.pop(self.key(obj), None)
+                        else:
+                            self.objects[self.key(obj)] = obj
+                        self._cond.notify_all()
+                    self.synced.set()
+            except (ApiError, OSError, http.client.HTTPException) as e:
+                print(f"Watching {self.path}: {e}, retrying", flush=True)
+            self.stop.wait(RETRY_DELAY)
+
+    def start(self) -> "Store":
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._cond:
+            return dict(self.objects)
+
+    def wait(self, predicate: Callable[[dict[str, dict]], bool], timeout: float) -> bool:
+        """
+        Waits until predicate holds for the objects.
+        Returns:
+            bool: Whether it held before the timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not predicate(self.objects):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+
+def _phase(obj: Optional[dict]) -> Optional[str]:
+    return ((obj or {}).get("status") or {}).get("phase")
+
+
+def _condition_true(obj: dict, condition_type: str) -> bool:
+    return any(c.get("type") == condition_type and c.get("status") == "True"
+               for c in (obj.get("status") or {}).get("conditions") or [])
+
+
+def dpu_ready(obj: Optional[dict]) -> bool:
+    return _phase(obj) == READY_PHASE
+
+
+def maintenance_ready(obj: Optional[dict]) -> bool:
+    """
+    Whether the node is drained: phase Ready, or the Ready condition of
+    the upstream maintenance operator.
+    """
+    return obj is not None and (_phase(obj) == READY_PHASE or _condition_true(obj, "Ready"))
+
+
+@dataclass
+class BatchReport:
+    index: int
+    nodes: list[str]
+    dpus: list[str]
+    drain_seconds: float = 0.0
+    provision_seconds: float = 0.0
+    gate_seconds: float = 0.0
+    error: Optional[str] = None
+    # NodeMaintenance objects (namespace/name) still held after a failure,
+    # with whether this batch created them or joined them
+    maintenances: list[tuple[str, bool]] = field(default_factory=list)
+
+    @property
+    def seconds(self) -> float:
+        return self.drain_seconds + self.provision_seconds + self.gate_seconds
+
+
+@dataclass
+class Redeployer:
+    client: KubeClient
+    namespace: str = DPF_NAMESPACE
+    batch_size: int = DEFAULT_BATCH_SIZE
+    max_unavailable: int = DEFAULT_MAX_UNAVAILABLE
+    timeout: float = DEFAULT_TIMEOUT
+    drain_timeout: float = DEFAULT_DRAIN_TIMEOUT
+    maintenance: bool = True
+    stop: threading.Event = field(default_factory=threading.Event)
+
+    def __post_init__(self):
+        self.dpu_path = resource_path(DPU_GROUP_VERSION, "dpus", self.namespace)
+        self.maintenance_path = resource_path(MAINTENANCE_GROUP_VERSION, "nodemaintenances",
+                                              self.namespace)
+        # Maintenance of other requestors may live in any namespace
+        self.all_maintenances_path = resource_path(MAINTENANCE_GROUP_VERSION, "nodemaintenances",
+                                                   None)
+        self.dpus: Optional[Store] = None
+        # By namespace/name
+        self.maintenances: Optional[Store] = None
+        # Node -> (namespace/name of its NodeMaintenance, whether it was created here)
+        self.held: dict[str, tuple[str, bool]] = {}
+        # (name, uid) of the DPUs that were not Ready before the redeploy
+        self.degraded: set[tuple[str, Optional[str]]] = set()
+
+    def check(self) -> None:
+        """
+        Verifies the DPU and maintenance kinds are served before anything changes.
+        Raises:
+            RedeployUnavailable: A kind is not served or access is denied
+        """
+        paths = [self.dpu_path] + ([self.all_maintenances_path] if self.maintenance else [])
+        for path in paths:
+            try:
+                self.client.list(path, metadata_only=True)
+            except ApiError as e:
+                if e.status == 404 and path == self.all_maintenances_path:
+                    raise RedeployUnavailable(
+                        "NodeMaintenance is not served; deploy the maintenance operator "
+                        "or redeploy without maintenance")
+                raise RedeployUnavailable(f"{path}: {e}")
+
+    def start(self) -> None:
+        self.dpus = Store(self.client, self.dpu_path, self.stop).start()
+        if self.maintenance:
+            self.maintenances = Store(self.client, self.all_maintenances_path, self.stop,
+                                      _namespaced_name).start()
+            self.maintenances.synced.wait(60)
+        if not self.dpus.synced.wait(60):
+            raise RedeployUnavailable("cannot list the DPUs")
+
+    def plan(self, nodes: Optional[list[str]] = None) -> list[tuple[str, list[str]]]:
+        """
+        Groups the DPUs by host node, in node order.
+        Returns:
+            list: (node, DPU names) pairs
+        """
+        by_node: dict[str, list[str]] = {}
+        for name, dpu in self.dpus.snapshot().items():
+            node = (dpu.get("spec") or {}).get("nodeName")
+            if node and (nodes is None or node in nodes):
+                by_node.setdefault(node, []).append(name)
+        return sorted((node, sorted(names)) for node, names in by_node.items())
+
+    def unassigned(self) -> list[str]:
+        """
+        Returns the DPUs without spec.nodeName, which cannot be drained and
+        are left out of the plan.
+        """
+        return sorted(name for name, dpu in self.dpus.snapshot().items()
+                      if not (dpu.get("spec") or {}).get("nodeName"))
+
+    def oversized(self, plan: list[tuple[str, list[str]]]) -> list[tuple[str, list[str]]]:
+        """
+        Returns the nodes of a plan with more DPUs than max unavailable,
+        which no batch can take without exceeding it.
+        """
+        return [(node, dpus) for node, dpus in plan if len(dpus) > self.max_unavailable]
+
+    def _degraded(self, name: str, dpu: dict) -> bool:
+        """
+        Whether a DPU is the same object that was not Ready before the
+        redeploy; once recreated it has a new uid and counts again.
+        """
+        return (name, dpu["metadata"].get("uid")) in self.degraded
+
+    def unavailable(self, objects: dict[str, dict]) -> int:
+        """
+        Counts the DPUs that are not Ready, except those that were already
+        not Ready before the redeploy.
+        """
+        return sum(1 for name, dpu in objects.items()
+                   if not dpu_ready(dpu) and not self._degraded(name, dpu))
+
+    def _existing_maintenance(self, node: str) -> Optional[dict]:
+        """
+        Returns the NodeMaintenance of a node that is not being deleted, if any.
+        """
+        for obj in self.maintenances.snapshot().values():
+            if (obj.get("spec") or {}).get("nodeName") == node \
+                    and not obj["metadata"].get("deletionTimestamp"):
+                return obj
+        return None
+
+    def _update_requestors(self, key: str, update: Callable[[list[str]], list[str]]) -> None:
+        """
+        Rewrites spec.additionalRequestors of a NodeMaintenance, retrying
+        when another requestor changed the object in between.
+        Args:
+            key: namespace/name of the NodeMaintenance
+            update: Returns the new list from the current one
+        """
+        namespace, _, name = key.partition("/")
+        path = resource_path(MAINTENANCE_GROUP_VERSION, "nodemaintenances", namespace, name)
+        for attempt in range(3):
+            obj = self.client.get(path)
+            current = (obj.get("spec") or {}).get("additionalRequestors") or []
+            requestors = update(current)
+            if requestors == current:
+                return
+            # The resourceVersion makes the merge patch fail with 409 rather
+            # than overwrite a concurrent change to the list
+            patch = {"metadata": {"resourceVersion": obj["metadata"]["resourceVersion"]},
+                     "spec": {"additionalRequestors": requestors}}
+            try:
+                self.client.request("PATCH", path, body=json.dumps(patch).encode("utf-8"),
+                                    content_type="application/merge-patch+json")
+                return
+            except ApiError as e:
+                if e.status != 409 or attempt == 2:
+                    raise
+
+    def _drain(self, nodes: list[str]) -> None:
+        for node in nodes:
+            existing = self._existing_maintenance(node)
+            if existing is not None:
+                key = _namespaced_name(existing)
+                created = (existing.get("spec") or {}).get("requestorID") == REQUESTOR_ID
+                if not created:
+                    print(f"Joining NodeMaintenance {key} of {node}", flush=True)
+                    self._update_requestors(
+                        key, lambda requestors: requestors if REQUESTOR_ID in requestors
+                        else requestors + [REQUESTOR_ID])
+                self.held[node] = (key, created)
+                continue
+            name = f"{MAINTENANCE_PREFIX}-{node}"
+            body = {"apiVersion": MAINTENANCE_GROUP_VERSION, "kind": "NodeMaintenance",
+                    "metadata": {"name": name, "namespace": self.namespace},
+                    "spec": {"nodeName": node, "reason": "DPU redeploy",
+                             "requestorID": REQUESTOR_ID, "cordon": True,
+                             "drainSpec": {"force": True, "deleteEmptyDir": True,
+                                           "timeoutSeconds": int(self.drain_timeout)}}}
+            try:
+                self.client.request("POST", self.maintenance_path,
+                                    body=json.dumps(body).encode("utf-8"),
+                                    content_type="application/json")
+            except ApiError as e:
+                if e.status != 409:
+                    raise
+            self.held[node] = (f"{self.namespace}/{name}", True)
+        keys = [self.held[node][0] for node in nodes]
+        if not self.maintenances.wait(
+                lambda objects: all(maintenance_ready(objects.get(k)) for k in keys),
+                self.drain_timeout):
+            raise Exception(f"nodes not drained within {self.drain_timeout:g}s")
+
+    def _release(self, nodes: list[str]) -> None:
+        """
+        Deletes the NodeMaintenance objects created for the nodes and leaves
+        the ones that were joined.
+        """
+        for node in nodes:
+            if node not in self.held:
+                continue
+            key, created = self.held[node]
+            namespace, _, name = key.partition("/")
+            try:
+                if created:
+                    self.client.request("DELETE", resource_path(
+                        MAINTENANCE_GROUP_VERSION, "nodemaintenances", namespace, name))
+                else:
+                    self._update_requestors(
+                        key, lambda requestors: [r for r in requestors if r != REQUESTOR_ID])
+            except ApiError as e:
+                if e.status != 404:
+                    raise
+            del self.held[node]
+
+    def _health(self, nodes: list[str], dpus: list[str]) -> Optional[str]:
+        objects = self.dpus.snapshot()
+        not_ready = [name for name in dpus if not dpu_ready(objects.get(name))]
+        if not_ready:
+            return f"DPUs not Ready: {', '.join(not_ready)}"
+        failed = sorted(name for name, dpu in objects.items()
+                        if _phase(dpu) == ERROR_PHASE and not self._degraded(name, dpu))
+        if failed:
+            return f"DPUs in {ERROR_PHASE}: {', '.join(failed)}"
+        for node in nodes:
+            try:
+                obj = self.client.get(resource_path("v1", "nodes", None, node))
+            except ApiError as e:
+                return f"node {node}: {e}"
+            if not _condition_true(obj, "Ready"):
+                return f"node {node} is not Ready"
+        return None
+
+    def run_batch(self, index: int, nodes: list[str], dpus: list[str]) -> BatchReport:
+        report = BatchReport(index, nodes, dpus)
+        print(f"Batch {index}: {', '.join(nodes)} ({len(dpus)} DPUs)", flush=True)
+        started = time.monotonic()
+        try:
+            if self.maintenance:
+                self._drain(nodes)
+                report.drain_seconds = time.monotonic() - started
+                print(f"Batch {index}: drained in {report.drain_seconds:.0f}s", flush=True)
+
+            started = time.monotonic()
+            objects = self.dpus.snapshot()
+            old_uids = {name: objects[name]["metadata"].get("uid")
+                        for name in dpus if name in objects}
+            for name in dpus:
+                try:
+                    self.client.request("DELETE", f"{self.dpu_path}/{name}")
+                except ApiError as e:
+                    if e.status != 404:
+                        raise
+
+            def reprovisioned(objects: dict[str, dict]) -> bool:
+                # The DPUSet recreates each DPU under the same name with a new uid
+                return all(name in objects and dpu_ready(objects[name])
+                           and objects[name]["metadata"].get("uid") != old_uids.get(name)
+                           for name in dpus)
+
+            ready = self.dpus.wait(reprovisioned, self.timeout)
+            report.provision_seconds = time.monotonic() - started
+            if not ready:
+                raise Exception(f"DPUs not Ready within {self.timeout:g}s")
+            print(f"Batch {index}: DPUs Ready in {report.provision_seconds:.0f}s", flush=True)
+
+            started = time.monotonic()
+            if self.maintenance:
+                self._release(nodes)
+            error = self._health(nodes, dpus)
+            report.gate_seconds = time.monotonic() - started
+            if error:
+                raise Exception(f"health gate failed: {error}")
+        except Exception as e:
+            # The batch's NodeMaintenance objects are kept so that workloads
+            # stay off the hosts until the DPUs are looked at
+            report.error = str(e)
+            report.maintenances = [self.held[node] for node in nodes if node in self.held]
+            print(f"Batch {index}: {e}", flush=True)
+        return report
+
+    def run(self, nodes: Optional[list[str]] = None, dry_run: bool = False) -> list[BatchReport]:
+        """
+        Redeploys the DPUs batch by batch, stopping at the first failed batch.
+        Args:
+            nodes: Host nodes to redeploy (default: every node with a DPU)
+            dry_run: Only print the batches
+        Returns:
+            list: The reports of the batches that ran
+        """
+        pending = self.plan(nodes)
+        objects = self.dpus.snapshot()
+        self.degraded = {(name, dpu["metadata"].get("uid")) for name, dpu in objects.items()
+                         if not dpu_ready(dpu)}
+        if self.degraded:
+            names = sorted(name for name, _ in self.degraded)
+            print(f"DPUs not Ready before the redeploy, not counted against max unavailable "
+                  f"nor the health gate: {', '.join(names)}", flush=True)
+            # Their nodes go first: they are down already and the redeploy repairs them
+            pending.sort(key=lambda p: not any(name in names for name in p[1]))
+        reports: list[BatchReport] = []
+        while pending:
+            node, dpus = pending[0]
+            if len(dpus) > self.max_unavailable:
+                reports.append(BatchReport(len(reports) + 1, [node], dpus,
+                                           error=f"{len(dpus)} DPUs on {node} exceed max "
+                                                 f"unavailable {self.max_unavailable}"))
+                break
+            # Wait for room for the next node under max unavailable, counting
+            # DPUs outside the rollout too
+            if not dry_run and not self.dpus.wait(
+                    lambda objects: self.unavailable(objects) + len(dpus) <= self.max_unavailable,
+                    self.timeout):
+                reports.append(BatchReport(len(reports) + 1, [], [],
+                                           error="too many DPUs unavailable to start a batch"))
+                break
+            room = self.max_unavailable - (0 if dry_run else self.unavailable(self.dpus.snapshot()))
+            batch, count = [], 0
+            while pending and len(batch) < self.batch_size:
+                node, dpus = pending[0]
+                if count + len(dpus) > room:
+                    break
+                batch.append(pending.pop(0))
+                count += len(dpus)
+            if not batch:
+                # A DPU became unavailable since the wait
+                continue
+            batch_nodes = [node for node, _ in batch]
+            batch_dpus = [name for _, names in batch for name in names]
+            if dry_run:
+                print(f"Batch {len(reports) + 1}: {', '.join(batch_nodes)} "
+                      f"({', '.join(batch_dpus)})")
+                reports.append(BatchReport(len(reports) + 1, batch_nodes, batch_dpus))
+                continue
+            report = self.run_batch(len(reports) + 1, batch_nodes, batch_dpus)
+            reports.append(report)
+            if report.error:
+                break
+        return reports
+
+
+def print_reports(reports: list[BatchReport], skipped: int) -> None:
+    print(f"{'BATCH':<6} {'DRAIN':>7} {'PROVISION':>10} {'GATE':>6} {'TOTAL':>7}  NODES")
+    for r in reports:
+        line = (f"{r.index:<6} {r.drain_seconds:>6.0f}s {r.provision_seconds:>9.0f}s "
+                f"{r.gate_seconds:>5.0f}s {r.seconds:>6.0f}s  {', '.join(r.nodes)}")
+        print(line + (f"  FAILED: {r.error}" if r.error else ""))
+    if skipped:
+        print(f"{skipped} nodes not redeployed")
+    held = [m for r in reports for m in r.maintenances]
+    if held:
+        print("NodeMaintenance objects kept on the hosts of the failed batch; "
+              "release them once the DPUs are fixed:")
+        for key, created in held:
+            namespace, _, name = key.partition("/")
+            if created:
+                print(f"  oc delete nodemaintenance -n {namespace} {name}")
+            else:
+                print(f"  {key}: remove {REQUESTOR_ID} from spec.additionalRequestors")
+
+
+def main() -> int:
+    parser = ArgumentParser(description='Redeploy the DPUs in rolling batches')
+    parser.add_argument('--namespace', '-n', default=DPF_NAMESPACE,
+                        help=f'Namespace of the DPUs (default: {DPF_NAMESPACE})')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'Host nodes per batch (default: {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--max-unavailable', type=int, default=DEFAULT_MAX_UNAVAILABLE,
+                        help=f'DPUs allowed to be not Ready at once, fleet wide, besides those '
+                             f'already not Ready at the start; nodes with more DPUs are refused '
+                             f'(default: {DEFAULT_MAX_UNAVAILABLE})')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help=f'Seconds for a batch to be Ready again (default: {DEFAULT_TIMEOUT})')
+    parser.add_argument('--drain-timeout', type=float, default=DEFAULT_DRAIN_TIMEOUT,
+                        help=f'Seconds for a batch to be drained (default: {DEFAULT_DRAIN_TIMEOUT})')
+    parser.add_argument('--no-maintenance', action='store_true',
+                        help='Do not drain the nodes through the maintenance operator')
+    parser.add_argument('--node', action='append', dest='nodes',
+                        help='Only redeploy the DPUs of this host node (repeatable)')
+    parser.add_argument('--json', help='Write the per batch timings to this file')
+    parser.add_argument('--dry-run', action='store_true', help='Only print the batches')
+    args = parser.parse_args()
+
+    try:
+        client = KubeClient.from_kubeconfig()
+        redeployer = Redeployer(client, args.namespace, max(1, args.batch_size),
+                                max(1, args.max_unavailable), args.timeout, args.drain_timeout,
+                                not args.no_maintenance)
+        redeployer.check()
+        redeployer.start()
+    except (KubeConfigError, RedeployUnavailable, OSError, http.client.HTTPException) as e:
+        print(f"Cannot redeploy through the API: {e}", file=sys.stderr)
+        return EXIT_UNAVAILABLE
+
+    plan = redeployer.plan(args.nodes)
+    unassigned = redeployer.unassigned()
+    for name in unassigned:
+        print(f"DPU {name} has no spec.nodeName, not redeployed", file=sys.stderr)
+    oversized = redeployer.oversized(plan)
+    if oversized:
+        for node, dpus in oversized:
+            print(f"Node {node} has {len(dpus)} DPUs, more than --max-unavailable "
+                  f"{args.max_unavailable}; raise it to redeploy this node", file=sys.stderr)
+        redeployer.stop.set()
+        return EXIT_FAILED
+    total = len(plan)
+    if not total:
+        print("No DPUs to redeploy")
+        return 0
+    started = time.monotonic()
+    try:
+        reports = redeployer.run(args.nodes, args.dry_run)
+    finally:
+        redeployer.stop.set()
+    if args.dry_run:
+        return 0
+
+    skipped = total - sum(len(r.nodes) for r in reports if not r.error)
+    print_reports(reports, skipped)
+    print(f"Redeploy took {time.monotonic() - started:.0f}s")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"batches": [{"index": r.index, "nodes": r.nodes, "dpus": r.dpus,
+                                    "drain_seconds": round(r.drain_seconds, 3),
+                                    "provision_seconds": round(r.provision_seconds, 3),
+                                    "gate_seconds": round(r.gate_seconds, 3),
+                                    "seconds": round(r.seconds, 3), "error": r.error,
+                                    "maintenances": [{"name": key, "created": created}
+                                                     for key, created in r.maintenances]}
+                                   for r in reports],
+                       "skipped_nodes": skipped, "unassigned_dpus": unassigned}, f, indent=2)
+    return EXIT_FAILED if any(r.error for r in reports) else 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -3,369 +3,57 @@
 import argparse
 import base64
 import gzip
+import hashlib
 import http.client
+import io
 import json
 import os
+import shutil
 import ssl
 import subprocess
-from dataclasses import dataclass
-from pathlib import Path
-from typing import Optional
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import BinaryIO, Iterator, Optional, Union
+
+from ignition_cache import (DEFAULT_CACHE_DIR, DEFAULT_MAX_AGE, DEFAULT_MAX_SIZE,
+                            DEFAULT_TTL, IgnitionCache, cache_key)
+from ignition_overlay import (MODES, OverlaySet, build_overlay_set, ignition_files,
+                              ignition_units, mode_layers)
+from ignition_patch import DEFAULT_PATCH_SET, PatchSet, apply_patch_set
+from kube_client import ApiError, KubeClient, KubeConfigError, resource_path
+from template_watch import DEFAULT_DEBOUNCE, DEFAULT_RESYNC, TemplateWatcher, apply_configmap
+from tracing import openmetrics, span, tracer, write_textfile
+
+HYPERSHIFT_API = "hypershift.openshift.io/v1beta1"
+
+# Read/write buffer size for streaming the ignition payload.
+CHUNK_SIZE = 64 * 1024
+# Spooled buffers stay in memory up to this size and spill to disk beyond it.
+SPOOL_SIZE = 4 * 1024 * 1024
+# Stands in for the encoded inner ignition until the template is written.
+ENCODED_IGN_PLACEHOLDER = "@@ENCODED_IGNITION@@"
+# Recorded in template manifests; bump when the generated output changes
+# for the same inputs so existing templates are regenerated.
+TEMPLATE_FORMAT = 2
+# Exit status when every template was already up to date.
+EXIT_UNCHANGED = 3
 
 
 @dataclass
-class FileContents:
-    inline: Optional[str] = None
-    source: Optional[str] = None
-
-
-@dataclass
-class FileEntry:
-    path: str
-    overwrite: bool
-    mode: int
-    contents: FileContents
-
-
-@dataclass
-class SystemdUnit:
-    name: str
-    enabled: bool
-    contents: Optional[str] = None
-
-
-FILES_PLAIN: list[FileEntry] = [
-    FileEntry(
-        path="/etc/hostname",
-        overwrite=True,
-        mode=644,
-        contents=FileContents(
-            source="data:," + "{{.DPUHostName}}"
-        )
-    ),
-    FileEntry(
-        path="/etc/temp_bfcfg_strings.env",
-        overwrite=True,
-        mode=420,
-        contents=FileContents(
-            source="data:," + "bfb_pre_install%20bfb_modify_os%20bfb_post_install"
-        )
-    ),
-    FileEntry(
-        path="/usr/local/bin/dpf-ovs-script.sh",
-        overwrite=True,
-        mode=755,
-        contents=FileContents(
-            source="data:text/plain;charset=utf-8;base64," +
-            "{{.OVSRawScript}}"
-        )
-    ),
-    FileEntry(
-        path="/etc/modules-load.d/br_netfilter.conf",
-        overwrite=True,
-        mode=420,
-        contents=FileContents(
-            source="data:," + "br_netfilter"
-        )
-    )
-]
-
-FILES: list[FileEntry] = [
-    FileEntry(
-        path="/etc/mellanox/mlnx-bf.conf",
-        overwrite=True,
-        mode=644,
-        contents=FileContents(
-            inline="""
-ALLOW_SHARED_RQ="no"
-IPSEC_FULL_OFFLOAD="no"
-ENABLE_ESWITCH_MULTIPORT="yes"
-"""
-        )
-    ),
-    FileEntry(
-        path="/etc/mellanox/mlnx-ovs.conf",
-        overwrite=True,
-        mode=644,
-        contents=FileContents(
-            inline="""
-CREATE_OVS_BRIDGES="no"
-OVS_DOCA="yes"
-"""
-        )
-    ),
-
-    FileEntry(
-        path="/etc/NetworkManager/system-connections/pf0vf0.nmconnection",
-        overwrite=True,
-        mode=600,
-        contents=FileContents(
-            inline="""[connection]
-id=pf0vf0
-type=ethernet
-interface-name=pf0vf0
-master=br-comm-ch
-slave-type=bridge
-
-[ethernet]
-
-[bridge-port]"""
-        )
-    ),
-    FileEntry(
-        path="/etc/NetworkManager/system-connections/br-comm-ch.nmconnection",
-        overwrite=True,
-        mode=600,
-        contents=FileContents(
-            inline="""[connection]
-id=br-comm-ch
-type=bridge
-interface-name=br-comm-ch
-autoconnect-ports=1
-autoconnect-slaves=1
-
-[ethernet]
-cloned-mac-address=stable
-
-[bridge]
-stp=false
-
-[ipv4]
-dhcp-client-id=mac
-dhcp-timeout=2147483647
-method=auto
-
-[ipv6]
-addr-gen-mode=eui64
-dhcp-timeout=2147483647
-method=disabled
-
-[proxy]""")
-    ),
-    FileEntry(
-        path="/etc/NetworkManager/system-connections/tmfifo_net0.nmconnection",
-        overwrite=True,
-        mode=600,
-        contents=FileContents(
-            inline="""[connection]
-id=tmfifo_net0
-type=ethernet
-interface-name=tmfifo_net0
-autoconnect=true
-
-[ethernet]
-
-[ipv4]
-method=manual
-address1=192.168.100.2/24
-never-default=true
-
-[ipv6]
-method=ignore
-""")
-    ),
-    # We disable IPv4 and IPv6 on the oob_net0 interface for DPF Host Trusted Mode.
-    # TODO: Fix this for DPF Zero Trust Mode.
-    FileEntry(
-        path="/etc/NetworkManager/system-connections/oob_net0.nmconnection",
-        overwrite=True,
-        mode=600,
-        contents=FileContents(
-            inline="""[connection]
-id=oob_net0
-type=ethernet
-interface-name=oob_net0
-autoconnect=true
-
-[ethernet]
-
-[ipv4]
-method=disabled
-
-[ipv6]
-method=disabled
-""")
-    ),
-    FileEntry(
-        path="/etc/crio/crio.conf.d/99-ulimits.conf",
-        overwrite=True,
-        mode=644,
-        contents=FileContents(
-            inline="""[crio.runtime]
-default_ulimits = [
-  "nofile=524288:524288"
-]
-""")
-    ),
-    FileEntry(
-        path="/etc/sysctl.d/98-dpunet.conf",
-        overwrite=True,
-        mode=644,
-        contents=FileContents(
-            inline="""
-net.ipv4.ip_forward=1
-net.bridge.bridge-nf-call-iptables=1
-net.bridge.bridge-nf-call-ip6tables=1
-net.ipv4.conf.all.rp_filter=2
-"""
-        )
-    ),
-    FileEntry(
-        path="/usr/local/bin/dpf-configure-sfs.sh",
-        overwrite=True,
-        mode=644,
-        contents=FileContents(
-            inline="""#!/bin/bash
-set -ex
-CMD=$1
-PF_TOTAL_SF=$2
-PF_TRUSTED_SF=$3
-
-case $CMD in
-    setup) ;;
-    *)
-    echo "invalid first argument. ./configure-sfs.sh {setup}"
-    exit 1
-    ;;
-esac
-
-set_GUID_for_SF() {
-    json_output=$(mlnx-sf -a show -j)
-
-    # Iterate over each key in the JSON result
-    echo "$json_output" | jq -c 'to_entries[]' | while read -r entry; do
-        key=$(echo "$entry" | jq -r '.key')
-        sf_netdev=$(echo "$entry" | jq -r '.value.sf_netdev')
-        aux_dev=$(echo "$entry" | jq -r '.value.aux_dev')
-
-        # Read the MAC address from the system file
-        mac_address=$(cat /sys/class/net/"$sf_netdev"/address)
-
-        # Update the MAC address using mlxdevm
-        /opt/mellanox/iproute2/sbin/mlxdevm port function set "$key" hw_addr "$mac_address"
-
-        # Unbind and bind the auxiliary device
-        echo "$aux_dev" > /sys/bus/auxiliary/devices/"$aux_dev"/driver/unbind
-        echo "$aux_dev" > /sys/bus/auxiliary/drivers/mlx5_core.sf/bind
-    done
-}
-
-if [ "$CMD" = "setup" ]; then
-    # Create SF on P0 for SFC
-    # System SF(index 0) has been removed, so DPF will create SF from index 0
-    for i in $(seq 0 $((PF_TOTAL_SF - 1 - $PF_TRUSTED_SF))); do
-        # Create SFs with random mac, kernel will allocate random MAC for SF netdev
-        /sbin/mlnx-sf --action create --device 0000:03:00.0 --sfnum ${i} || true
-    done
-
-    for i in $(seq 101 $((100 + $PF_TRUSTED_SF))); do
-        /sbin/mlnx-sf --action create --device 0000:03:00.0 --sfnum ${i} -t || true
-    done
-    
-    set_GUID_for_SF
-fi
-""")
-    ),
-    FileEntry(
-        path="/usr/local/bin/set-nvconfig-params.sh",
-        overwrite=True,
-        mode=755,
-        contents=FileContents(
-            inline="""#!/bin/bash
-set -e
-for dev in /dev/mst/*; do
-  echo "set NVConfig on dev ${dev}"
-  mlxconfig -d ${dev} -y set $@
-done
-echo "Finished setting nvconfig parameters"
-""")
-    ),
-    FileEntry(
-        path="/etc/sysconfig/openvswitch",
-        overwrite=True,
-        mode=600,
-        contents=FileContents(
-            inline="""OVS_USER_ID=\"root:root\"""")
-    ),
-]
-
-SYSTEMD_UNITS: list[SystemdUnit] = [
-    SystemdUnit(
-        name="bfup-workaround.service",
-        enabled=True,
-        contents="""[Unit]
-Description=Run bfup script 3 times with 2 minutes interval
-After=network.target
-
-[Service]
-ExecStart=/bin/bash -c 'for i in {1..3}; do /usr/bin/bfup; sleep 400; done'
-Type=oneshot
-RemainAfterExit=true
-
-[Install]
-WantedBy=multi-user.target
-"""
-    ),
-    SystemdUnit(
-        name="firstboot-dpf-ovs.service",
-        enabled=True,
-        contents="""[Unit]
-Description=DPF OVS setup for first boot
-After=network.target
-
-[Service]
-Type=oneshot
-ExecStart=/usr/local/bin/dpf-ovs-script.sh
-RemainAfterExit=true
-ConditionFirstBoot=true
-
-[Install]
-WantedBy=multi-user.target
-"""),
-    SystemdUnit(
-        name="bootstrap-dpf.service",
-        enabled=True,
-        contents="""[Unit]
-Description=Create Scalable Functions on the DPU required for DPF
-After=network.target
-Before=kubelet.service
-
-[Service]
-Type=oneshot
-ExecStart=/bin/bash /usr/local/bin/dpf-configure-sfs.sh setup {{.SFNum}} {{.TrustedSFs}}
-
-[Install]
-WantedBy=multi-user.target"""
-    ),
-    SystemdUnit(
-        name="set-nvconfig-params.service",
-        enabled=True,
-        contents="""[Unit]
-Description=Set firmware properties
-After=network.target
-
-[Service]
-Type=oneshot
-ExecStart=/usr/local/bin/set-nvconfig-params.sh {{.NVConfigParams}}
-RemainAfterExit=yes
-
-[Install]
-WantedBy=sysinit.target"""
-    )
-]
-
-
-def octal_to_decimal(num: int) -> int:
+class EncodeOptions:
     """
-    Converts an integer interpreted as octal to its decimal equivalent.
-
-    Args:
-      num (int): The integer representing an octal number.
-
-    Returns:
-      int: The decimal equivalent of the octal number.
+    Options for gzip encoding the inner ignition.
+    reproducible fixes the gzip mtime to 0 and sorts JSON keys, so identical
+    ignition content always encodes to identical bytes.
     """
-    return int(str(num), 8)
+    compresslevel: int = 9
+    reproducible: bool = True
+
+    @property
+    def mtime(self) -> Optional[float]:
+        return 0 if self.reproducible else None
 
 
 def execute_oc_command(namespace: str, command: list[str]) -> str:
@@ -378,9 +66,12 @@ def execute_oc_command(namespace: str, command: list[str]) -> str:
         str: The command output
     """
     try:
-        return subprocess.check_output(
-            ["oc", "-n", namespace] + command
-        ).decode('utf-8').strip()
+        with span("oc", namespace=namespace, command=" ".join(command[:2])) as s:
+            output = subprocess.check_output(
+                ["oc", "-n", namespace] + command
+            )
+            s["bytes"] = len(output)
+        return output.decode('utf-8').strip()
     except subprocess.CalledProcessError as e:
         print(f"Error executing oc command: {e}")
         raise
@@ -410,78 +101,386 @@ def get_ignition_token_secret(cluster_name: str, namespace: str) -> str:
     return ignition_token
 
 
-def pull_ignition(cluster_name: str, hc_namespace: str) -> dict:
+def fetch_ignition(endpoint: str, token: str, cache: Optional[IgnitionCache] = None,
+                   key: Optional[str] = None) -> tuple[BinaryIO, str]:
+    """
+    Downloads the raw ignition payload, revalidating against the cache if given.
+    Args:
+        endpoint: The ignition endpoint host
+        token: The ignition bearer token
+        cache: The ignition cache, or None to always download
+        key: The cache key for this pull
+    Returns:
+        tuple: The raw ignition payload, positioned at its start, and its sha256
+    """
+    with span("fetch_ignition", endpoint=endpoint) as s:
+        return _fetch_ignition(endpoint, token, cache, key, s)
+
+
+def _fetch_ignition(endpoint: str, token: str, cache: Optional[IgnitionCache],
+                    key: Optional[str], s: dict) -> tuple[BinaryIO, str]:
+    entry = cache.lookup(key) if cache else None
+    if entry and cache.is_fresh(entry):
+        cached = cache.open(entry)
+        if cached:
+            print("Using cached ignition file (fresh).")
+            s.update(cache="fresh", bytes=entry.size)
+            return cached, entry.sha256
+        # Evicted since the lookup: a miss
+        entry = None
+
+    headers = {"Authorization": f"Bearer {token}"}
+    if entry and entry.etag:
+        headers["If-None-Match"] = entry.etag
+
+    data = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+    digest = hashlib.sha256()
+    conn = http.client.HTTPSConnection(
+        endpoint, context=ssl._create_unverified_context())
+    try:
+        with span("https_connect", endpoint=endpoint):
+            conn.connect()
+        with span("https_request", endpoint=endpoint) as request_span:
+            conn.request("GET", "/ignition", headers=headers)
+            response = conn.getresponse()
+            request_span["status"] = response.status
+        if response.status == 304 and entry:
+            response.read()
+            data.close()
+            cached = cache.open(entry) if cache.mark_validated(entry) else None
+            if cached is None:
+                # Evicted while revalidating, download it unconditionally
+                conn.close()
+                return _fetch_ignition(endpoint, token, cache, key, s)
+            print("Ignition file not modified, using cached copy.")
+            s.update(cache="revalidated", bytes=entry.size)
+            return cached, entry.sha256
+        if response.status != 200:
+            raise Exception(
+                f"Failed to pull ignition file: {response.status} {response.reason}")
+        with span("download", endpoint=endpoint) as download_span:
+            while chunk := response.read(CHUNK_SIZE):
+                digest.update(chunk)
+                data.write(chunk)
+            download_span["bytes"] = data.tell()
+        etag = response.getheader("ETag")
+    except BaseException:
+        data.close()
+        raise
+    finally:
+        conn.close()
+    print("Downloaded ignition file successfully.")
+    s.update(cache="miss" if cache else "disabled", bytes=data.tell())
+
+    sha256 = digest.hexdigest()
+    if cache:
+        if not (entry and entry.sha256 == sha256 and cache.mark_validated(entry, etag)):
+            size = data.tell()
+            data.seek(0)
+            cache.store_stream(key, data, size, etag, sha256)
+    data.seek(0)
+    return data, sha256
+
+
+class OcBackend:
+    """
+    Cluster lookups through oc subprocesses.
+    """
+    name = "oc"
+
+    def get_ignition_endpoint(self, cluster_name: str, hc_namespace: str) -> str:
+        return execute_oc_command(
+            hc_namespace,
+            ["get", "hc", cluster_name, "-o",
+                "jsonpath={.status.ignitionEndpoint}"]
+        )
+
+    def get_ignition_token(self, cluster_name: str, namespace: str) -> str:
+        return get_ignition_token_secret(cluster_name, namespace)
+
+    def list_hosted_clusters(self, hc_namespace: str) -> dict[str, str]:
+        """
+        Lists the hosted clusters in a namespace with a single oc call.
+        Args:
+            hc_namespace: The namespace for hosted clusters
+        Returns:
+            dict: Ignition endpoint keyed by hosted cluster name
+        """
+        output = execute_oc_command(
+            hc_namespace,
+            ["get", "hc", "-o",
+                "jsonpath={range .items[*]}{.metadata.name}{\"\\t\"}"
+                "{.status.ignitionEndpoint}{\"\\n\"}{end}"]
+        )
+        clusters: dict[str, str] = {}
+        for line in output.splitlines():
+            name, _, endpoint = line.partition("\t")
+            if name:
+                clusters[name] = endpoint
+        return clusters
+
+
+class ApiBackend:
+    """
+    Cluster lookups through the pooled in-process API client.
+    """
+    name = "api"
+
+    def __init__(self, client: KubeClient):
+        self.client = client
+
+    def get_ignition_endpoint(self, cluster_name: str, hc_namespace: str) -> str:
+        hc = self.client.get(resource_path(
+            HYPERSHIFT_API, "hostedclusters", hc_namespace, cluster_name))
+        return hc.get("status", {}).get("ignitionEndpoint", "")
+
+    def get_ignition_token(self, cluster_name: str, namespace: str) -> str:
+        # Only names are needed to find the token secret, so list metadata
+        # instead of pulling every secret's data.
+        secrets = self.client.list(
+            resource_path("v1", "secrets", namespace), metadata_only=True)
+        names = [item["metadata"]["name"] for item in secrets.get("items", [])
+                 if f"token-{cluster_name}" in item["metadata"]["name"]]
+        if not names:
+            raise Exception("No token secrets found.")
+        secret = self.client.get(resource_path("v1", "secrets", namespace, names[0]))
+        # The ignition server expects the still base64 encoded token.
+        return secret.get("data", {}).get("token", "")
+
+    def list_hosted_clusters(self, hc_namespace: str) -> dict[str, str]:
+        hcs = self.client.list(resource_path(HYPERSHIFT_API, "hostedclusters", hc_namespace))
+        return {item["metadata"]["name"]: item.get("status", {}).get("ignitionEndpoint", "")
+                for item in hcs.get("items", [])}
+
+
+class FallbackBackend:
+    """
+    Uses the primary backend and retries a failed lookup with the fallback.
+    """
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f"{primary.name} (fallback: {fallback.name})"
+
+    def _call(self, method: str, *args):
+        try:
+            return getattr(self.primary, method)(*args)
+        except (ApiError, OSError) as e:
+            print(f"{self.primary.name} backend failed ({e}), retrying with {self.fallback.name}")
+            return getattr(self.fallback, method)(*args)
+
+    def get_ignition_endpoint(self, cluster_name: str, hc_namespace: str) -> str:
+        return self._call("get_ignition_endpoint", cluster_name, hc_namespace)
+
+    def get_ignition_token(self, cluster_name: str, namespace: str) -> str:
+        return self._call("get_ignition_token", cluster_name, namespace)
+
+    def list_hosted_clusters(self, hc_namespace: str) -> dict[str, str]:
+        return self._call("list_hosted_clusters", hc_namespace)
+
+
+def make_backend(kind: str):
     """
-    Pulls the ignition file from the cluster and saves it as hcp.ign.
+    Creates the cluster lookup backend.
+    Args:
+        kind: "api", "oc", or "auto" (API client with oc fallback)
+    Returns:
+        The backend instance
+    """
+    if kind == "oc":
+        return OcBackend()
+    if kind == "api":
+        return ApiBackend(KubeClient.from_kubeconfig())
+    try:
+        return FallbackBackend(ApiBackend(KubeClient.from_kubeconfig()), OcBackend())
+    except KubeConfigError as e:
+        print(f"API client unavailable ({e}), using oc")
+        return OcBackend()
+
+
+def pull_ignition(cluster_name: str, hc_namespace: str,
+                  cache: Optional[IgnitionCache] = None,
+                  ignition_endpoint: Optional[str] = None, backend=None) -> dict:
+    """
+    Pulls the ignition file from the cluster.
     Args:
         cluster_name: The name of the cluster to pull ignition from
         hc_namespace: The namespace for hosted clusters
+        cache: The ignition cache, or None to bypass it
+        ignition_endpoint: The already discovered ignition endpoint, if any
+        backend: The cluster lookup backend (default: oc)
     Returns:
         dict: The ignition file content
     """
-    print("Pulling ignition file from cluster...")
+    data, _ = pull_ignition_payload(
+        cluster_name, hc_namespace, cache, ignition_endpoint, backend)
+    with data:
+        # Return the response content as JSON
+        return parse_ignition(data)
+
+
+def parse_ignition(data: BinaryIO) -> dict:
+    """
+    Parses a raw ignition payload.
+    """
+    with span("parse_ignition") as s:
+        ign = json.load(data)
+        s["bytes"] = data.tell()
+    return ign
+
+
+def pull_ignition_payload(cluster_name: str, hc_namespace: str,
+                          cache: Optional[IgnitionCache] = None,
+                          ignition_endpoint: Optional[str] = None,
+                          backend=None) -> tuple[BinaryIO, str]:
+    """
+    Pulls the raw ignition payload from the cluster without parsing it.
+    Returns:
+        tuple: The raw ignition payload and its sha256
+    """
+    print(f"Pulling ignition file from cluster {cluster_name}...")
     namespace = f"{hc_namespace}-{cluster_name}"
+    backend = backend or OcBackend()
 
     try:
         # Get ignition endpoint
-        ignition_endpoint = execute_oc_command(
-            hc_namespace,
-            ["get", "hc", cluster_name, "-o",
-                "jsonpath={.status.ignitionEndpoint}"]
-        )
-        ignition_token = get_ignition_token_secret(cluster_name, namespace)
-
-        # Download ignition file
-        conn = http.client.HTTPSConnection(
-            ignition_endpoint, context=ssl._create_unverified_context())
-        conn.request("GET", "/ignition",
-                     headers={"Authorization": f"Bearer {ignition_token}"})
-        response = conn.getresponse()
-        if response.status != 200:
-            raise Exception(
-                f"Failed to pull ignition file: {response.status} {response.reason}")
-        data = response.read()
-        print("Downloaded ignition file successfully.")
-        # Return the response content as JSON
-        return json.loads(data.decode('utf-8'))
+        if not ignition_endpoint:
+            with span("get_ignition_endpoint", backend=backend.name):
+                ignition_endpoint = backend.get_ignition_endpoint(
+                    cluster_name, hc_namespace)
+        with span("get_ignition_token", backend=backend.name):
+            ignition_token = backend.get_ignition_token(cluster_name, namespace)
+
+        key = cache_key(cluster_name, hc_namespace,
+                        ignition_endpoint, ignition_token)
+        return fetch_ignition(ignition_endpoint, ignition_token, cache, key)
 
     except Exception as e:
         print(f"Error pulling ignition file: {e}")
         raise
 
 
-def preprocess_ignition_file(ign: dict) -> dict:
+def preprocess_ignition_file(ign: dict, patch_set: Optional[PatchSet] = None) -> dict:
     """
-    Preprocesses the ignition file to disable the machine-config-daemon-firstboot.service
-    and enable the openvswitch.service.
+    Preprocesses the ignition file by applying a patch set. The default patch
+    set disables the machine-config-daemon-firstboot.service and enables the
+    openvswitch.service.
+    Args:
+        ign: The ignition file content
+        patch_set: The patches to apply (default: ignition-patches/default.yaml)
     """
-
-    for s in ign['systemd']['units']:
-        if s['name'] == 'machine-config-daemon-firstboot.service':
-            s['enabled'] = False
-        if s['name'] == 'openvswitch.service':
-            s['enabled'] = True
+    patch_set = patch_set or PatchSet.load([DEFAULT_PATCH_SET])
+    with span("preprocess_ignition") as s:
+        result = apply_patch_set(ign, patch_set)
+        s.update(applied=len(result.applied), skipped=len(result.skipped))
+    print(result.summary())
 
     return ign
 
 
-def encode_ignition(ign: dict) -> str:
+def encode_ignition(ign: dict, options: EncodeOptions = EncodeOptions()) -> str:
     """
     Encodes the ignition file to base64.
     Args:
         ign: The ignition file content
+        options: The gzip encoding options
     Returns:
         str: The base64 encoded ignition file
     """
-    # Encode the ignition file to base64
-    gzipped_ign = gzip.compress(json.dumps(
-        ign, separators=(',', ':')).encode('utf-8'))
-    return base64.b64encode(gzipped_ign).decode()
+    # Same gzip stream as encode_ignition_stream, so both give identical bytes
+    out = io.BytesIO()
+    _encode_ignition_stream(ign, out, options)
+    return out.getvalue().decode()
+
+
+def iter_json(obj, depth: int = 3, sort_keys: bool = False) -> Iterator[str]:
+    """
+    Yields the compact JSON encoding of obj in pieces, splitting containers
+    down to the given depth so no single piece holds the whole document.
+    """
+    if depth and isinstance(obj, dict) and obj:
+        sep = "{"
+        for k in (sorted(obj) if sort_keys else obj):
+            yield sep + json.dumps(k) + ":"
+            yield from iter_json(obj[k], depth - 1, sort_keys)
+            sep = ","
+        yield "}"
+    elif depth and isinstance(obj, list) and obj:
+        sep = "["
+        for v in obj:
+            yield sep
+            yield from iter_json(v, depth - 1, sort_keys)
+            sep = ","
+        yield "]"
+    else:
+        yield json.dumps(obj, separators=(',', ':'), sort_keys=sort_keys)
+
+
+class Base64Writer:
+    """
+    File-like writer that base64 encodes into another file in 3 byte groups,
+    so chunks can be encoded independently.
+    """
+
+    def __init__(self, out: BinaryIO):
+        self.out = out
+        self.pending = b""
+
+    def write(self, data: bytes) -> int:
+        buf = self.pending + data
+        cut = len(buf) - len(buf) % 3
+        self.out.write(base64.b64encode(buf[:cut]))
+        self.pending = buf[cut:]
+        return len(data)
 
+    def flush(self) -> None:
+        pass
 
-def create_ignition_file(encoded_ign: str) -> dict:
+    def close(self) -> None:
+        self.out.write(base64.b64encode(self.pending))
+        self.pending = b""
+
+
+def encode_ignition_stream(ign: dict, out: BinaryIO,
+                           options: EncodeOptions = EncodeOptions()) -> None:
+    """
+    Writes the gzipped, base64 encoded ignition file to out, compressing and
+    encoding it incrementally instead of building each stage in memory.
+    Args:
+        ign: The ignition file content
+        out: The binary file to write the base64 text to
+        options: The gzip encoding options
+    """
+    with span("encode_ignition", level=options.compresslevel) as s:
+        start = out.tell() if out.seekable() else 0
+        _encode_ignition_stream(ign, out, options)
+        if out.seekable():
+            s["bytes"] = out.tell() - start
+
+
+def _encode_ignition_stream(ign: dict, out: BinaryIO, options: EncodeOptions) -> None:
+    b64 = Base64Writer(out)
+    with gzip.GzipFile(fileobj=b64, mode="wb", compresslevel=options.compresslevel,
+                       mtime=options.mtime) as gz:
+        pending: list[bytes] = []
+        size = 0
+        for piece in iter_json(ign, sort_keys=options.reproducible):
+            pending.append(piece.encode('utf-8'))
+            size += len(pending[-1])
+            if size >= CHUNK_SIZE:
+                gz.write(b"".join(pending))
+                pending, size = [], 0
+        gz.write(b"".join(pending))
+    b64.close()
+
+
+def create_ignition_file(encoded_ign: str, overlay: OverlaySet) -> dict:
     """
     Creates a new ignition file with the required structure.
+    Args:
+        encoded_ign: The base64 encoded inner ignition
+        overlay: The merged files and units for the DPU mode
     """
 
     ign = {
@@ -506,8 +505,8 @@ def create_ignition_file(encoded_ign: str) -> dict:
     }
 
     add_kernel_args(ign)
-    add_files(ign)
-    add_systemd_units(ign)
+    add_files(ign, overlay)
+    add_systemd_units(ign, overlay)
 
     return ign
 
@@ -523,112 +522,41 @@ def add_kernel_args(ign: dict) -> None:
     }
 
 
-def add_files(ign: dict) -> None:
+def add_files(ign: dict, overlay: OverlaySet) -> None:
     """
     Adds files to the ignition file.
     """
+    ign['storage']['files'].extend(ignition_files(overlay))
 
-    ign["ignition"]["version"] = "3.4.0"
 
-    for file in FILES_PLAIN:
-        ign['storage']['files'].append({
-            'path': file.path,
-            'overwrite': file.overwrite,
-            'mode': octal_to_decimal(file.mode),
-            'contents': {
-                'source': file.contents.source
-            }
-        })
-
-    for file in FILES:
-        ign['storage']['files'].append({
-            'path': file.path,
-            'overwrite': file.overwrite,
-            'mode': octal_to_decimal(file.mode),
-            'contents': {
-                'source': "data:text/plain;charset=utf-8;base64," + base64.b64encode(
-                    file.contents.inline.encode()).decode()
-            }
-        })
+def add_systemd_units(ign: dict, overlay: OverlaySet) -> None:
+    """
+    Adds systemd units to the ignition file.
+    """
+    ign['systemd']['units'].extend(ignition_units(overlay))
 
 
-def add_systemd_units(ign: dict) -> None:
+def mode_output_file(output_file: str, mode: str) -> str:
     """
-    Adds systemd units to the ignition file.
+    Returns the per-mode output path used when several modes are generated.
     """
+    root, ext = os.path.splitext(output_file)
+    return f"{root}-{mode}{ext}"
 
-    for unit in SYSTEMD_UNITS:
-        ign['systemd']['units'].append({
-            'name': unit.name,
-            'enabled': unit.enabled,
-            'contents': unit.contents
-        })
-
-
-def mtu9000_enable() -> None:
-    """
-    Adds MTU 9000 configuration files to the FILES list.
-    """
-    
-    global FILES
-
-    def nminterface(name: str, mtu: int) -> str:
-        return f"""[connection]
-id={name}
-type=ethernet
-interface-name={name}
-
-[ethernet]
-mtu={mtu}
-"""
-
-    FILES = [*FILES,
-             FileEntry(
-                 path="/etc/NetworkManager/system-connections/p0.nmconnection",
-                 overwrite=True,
-                 mode=600,
-                 contents=FileContents(
-                     inline=nminterface("p0", 9216)
-                 )),
-             FileEntry(
-                 path="/etc/NetworkManager/system-connections/p1.nmconnection",
-                 overwrite=True,
-                 mode=600,
-                 contents=FileContents(
-                     inline=nminterface("p1", 9216)
-                 )
-             ),
-             FileEntry(
-                 path="/etc/NetworkManager/system-connections/pf0hpf.nmconnection",
-                 overwrite=True,
-                 mode=600,
-                 contents=FileContents(
-                     inline=nminterface("pf0hpf", 9216)
-                 )
-             ),
-             FileEntry(
-                 path="/etc/NetworkManager/system-connections/pf1hpf.nmconnection",
-                 overwrite=True,
-                 mode=600,
-                 contents=FileContents(
-                     inline=nminterface("pf1hpf", 9216)
-                 )
-             )]
-    
-    for file in FILES:
-        if file.path == "/etc/NetworkManager/system-connections/pf0vf0.nmconnection":
-            if 'inline' in file.contents.__dict__ and file.contents.inline:
-                file.contents.inline = file.contents.inline.replace(
-                    "[ethernet]\n",
-                    f"[ethernet]\nmtu=9216\n"
-                )
-    
-
-
-def create_bfb_template_cm(ign: dict, configmap_path: str) -> None:
-    """Write ConfigMap to disk."""
+
+def create_bfb_template_cm(ign: dict, configmap_path: str,
+                           encoded_ign: Optional[BinaryIO] = None) -> None:
+    """
+    Write ConfigMap to disk.
+    Args:
+        ign: The outer ignition file
+        configmap_path: The output path
+        encoded_ign: The encoded inner ignition to stream in place of
+            ENCODED_IGN_PLACEHOLDER, if the outer ignition uses it
+    """
     # Create ignition template
     ignition_template = json.dumps(ign, separators=(',', ':'))
+    head, _, tail = ignition_template.partition(ENCODED_IGN_PLACEHOLDER)
 
     # Create ConfigMap
     yaml = """apiVersion: v1
@@ -638,16 +566,177 @@ metadata:
   namespace: dpf-operator-system
 data:
     BF_CFG_TEMPLATE: |
-        """ + ignition_template
-
-    with open(configmap_path, "w") as f:
-        f.write(yaml)
+        """ + head
+
+    with span("write_template", path=configmap_path) as s, open(configmap_path, "wb") as f:
+        f.write(yaml.encode('utf-8'))
+        if encoded_ign is not None:
+            encoded_ign.seek(0)
+            shutil.copyfileobj(encoded_ign, f, CHUNK_SIZE)
+            f.write(tail.encode('utf-8'))
+        s["bytes"] = f.tell()
     print(f"ConfigMap written to: {configmap_path}")
 
 
-def main():
+def file_sha256(path: str) -> Optional[str]:
+    """
+    Returns the sha256 of a file, or None if it does not exist.
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def manifest_path(output_file: str) -> str:
+    return output_file + ".manifest.json"
+
+
+def template_inputs(inner_sha256: str, overlay: OverlaySet, patch_set: PatchSet,
+                    options: EncodeOptions) -> dict:
+    """
+    Returns the inputs that determine a template's contents.
+    """
+    return {
+        "format": TEMPLATE_FORMAT,
+        "inner_ignition_sha256": inner_sha256,
+        "overlay_sha256": overlay.digest(),
+        "layers": overlay.layers,
+        "patches_sha256": patch_set.digest(),
+        "encoding": asdict(options),
+    }
+
+
+def template_unchanged(output_file: str, inputs: dict) -> bool:
+    """
+    Checks whether output_file was generated from the same inputs and has
+    not been modified since.
+    """
+    try:
+        with open(manifest_path(output_file)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (manifest.get("inputs") == inputs
+            and manifest.get("output_sha256") == file_sha256(output_file))
+
+
+def write_manifest(output_file: str, inputs: dict) -> None:
+    """
+    Records the inputs and output digest of a generated template.
+    """
+    manifest = {"inputs": inputs, "output_sha256": file_sha256(output_file)}
+    with open(manifest_path(output_file), "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+
+
+def generate_template(cluster_name: str, hc_namespace: str, output_file: str,
+                      overlays: dict[str, OverlaySet],
+                      cache: Optional[IgnitionCache] = None,
+                      ignition_endpoint: Optional[str] = None, backend=None,
+                      force: bool = False,
+                      options: EncodeOptions = EncodeOptions(),
+                      patch_set: Optional[PatchSet] = None) -> bool:
+    """
+    Runs the full pull, preprocess, encode and write pipeline for one cluster.
+    The inner ignition is encoded once and wrapped for every requested mode.
+    Outputs whose manifest shows the same inputs are left untouched.
+    Args:
+        overlays: The merged overlay set keyed by mode; with more than one
+            mode, each output file name gets a -<mode> suffix
+        force: Regenerate even if the inputs did not change
+        options: The gzip encoding options
+        patch_set: The inner ignition patches (default: the default patch set)
+    Returns:
+        bool: Whether any output file was written
+    """
+    patch_set = patch_set or PatchSet.load([DEFAULT_PATCH_SET])
+    with span("generate_template", cluster=cluster_name) as s:
+        payload, inner_sha256 = pull_ignition_payload(
+            cluster_name, hc_namespace, cache, ignition_endpoint, backend)
+        with payload:
+            pending = {}
+            for mode, overlay in overlays.items():
+                path = output_file if len(overlays) == 1 else mode_output_file(output_file, mode)
+                inputs = template_inputs(inner_sha256, overlay, patch_set, options)
+                if not force and template_unchanged(path, inputs):
+                    print(f"Template unchanged, skipping: {path}")
+                    continue
+                pending[path] = (overlay, inputs)
+            if not pending:
+                s["changed"] = False
+                return False
+            inner_ign = preprocess_ignition_file(parse_ignition(payload), patch_set)
+
+        with tempfile.SpooledTemporaryFile(SPOOL_SIZE) as encoded_ign:
+            encode_ignition_stream(inner_ign, encoded_ign, options)
+            del inner_ign
+            for path, (overlay, inputs) in pending.items():
+                ign = create_ignition_file(ENCODED_IGN_PLACEHOLDER, overlay)
+                create_bfb_template_cm(ign, path, encoded_ign)
+                write_manifest(path, inputs)
+        s["changed"] = True
+    return True
+
+
+def batch_output_file(output_file: str, cluster_name: str) -> str:
+    """
+    Returns the per-cluster output path used in batch mode.
+    """
+    directory, name = os.path.split(output_file)
+    return os.path.join(directory, f"{cluster_name}-{name}")
+
+
+def generate_templates(clusters: dict[str, str], hc_namespace: str, output_file: str,
+                       overlays: dict[str, OverlaySet], cache: Optional[IgnitionCache],
+                       workers: int, backend=None, force: bool = False,
+                       options: EncodeOptions = EncodeOptions(),
+                       patch_set: Optional[PatchSet] = None
+                       ) -> dict[str, Union[bool, Exception]]:
+    """
+    Generates templates for several hosted clusters on a bounded thread pool.
+    Args:
+        clusters: Ignition endpoint (or empty string) keyed by cluster name
+        hc_namespace: The namespace for hosted clusters
+        output_file: The output file name each cluster name is prefixed to
+        overlays: The merged overlay set keyed by mode
+        cache: The ignition cache, or None to bypass it
+        workers: The maximum number of clusters processed concurrently
+        backend: The cluster lookup backend, shared by all workers
+        force: Regenerate even if the inputs did not change
+        options: The gzip encoding options
+        patch_set: The inner ignition patches (default: the default patch set)
+    Returns:
+        dict: Per cluster, whether a template was written, or the raised exception
+    """
+    results: dict[str, Union[bool, Exception]] = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            name: pool.submit(generate_template, name, hc_namespace,
+                              batch_output_file(output_file, name), overlays, cache,
+                              endpoint or None, backend, force, options, patch_set)
+            for name, endpoint in clusters.items()
+        }
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+    return results
+
+
+def main(default_mode: str = "trusted") -> Optional[int]:
     parser = argparse.ArgumentParser(
         description='Generate OpenShift/DPF ignition template')
+    parser.add_argument('--mode', action='append', choices=list(MODES),
+                        help=f'DPU mode to generate the template for (default: {default_mode}); '
+                        'repeat to generate several modes from one pull, suffixing '
+                        'each output file name with -<mode>')
     parser.add_argument('--mtu9000', action='store_true',
                         help='Enable MTU 9000 configuration')
     parser.add_argument('--cluster', '-c', type=str, default='doca',
@@ -656,11 +745,86 @@ def main():
                         help='Namespace for hosted clusters (default: clusters)')
     parser.add_argument('--output-file', '-f', type=str,
                         default='hcp_template.yaml',)
+    parser.add_argument('--clusters', type=str,
+                        help='Comma separated hosted clusters to generate templates for; '
+                        'each output file name is prefixed with the cluster name')
+    parser.add_argument('--all-hosted-clusters', action='store_true',
+                        help='Generate templates for every hosted cluster in the namespace')
+    parser.add_argument('--backend', choices=['auto', 'api', 'oc'], default='auto',
+                        help='Cluster lookups via the in-process API client, oc, or the '
+                        'API client with oc fallback (default: auto)')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Maximum clusters processed concurrently in batch mode (default: 8)')
+    parser.add_argument('--force', action='store_true',
+                        help='Regenerate templates even if their manifest shows no input changed '
+                        f'(otherwise exits with status {EXIT_UNCHANGED} when nothing changed)')
+    parser.add_argument('--patch-set', action='append', default=[], metavar='FILE',
+                        help='Additional ignition patch set to apply to the hosted cluster '
+                        'ignition; may be repeated')
+    parser.add_argument('--no-default-patch-set', action='store_true',
+                        help=f'Do not apply the default patch set ({DEFAULT_PATCH_SET})')
+    parser.add_argument('--compression-level', type=int, default=9, choices=range(1, 10),
+                        metavar='1-9', help='gzip level for the inner ignition (default: 9)')
+    parser.add_argument('--reproducible', action=argparse.BooleanOptionalAction, default=True,
+                        help='Encode with a fixed gzip mtime and sorted JSON keys so identical '
+                        'ignition yields an identical template (default: on)')
+    parser.add_argument('--trace', action='store_true',
+                        help='Print a timing line for every step (oc/API calls, TLS, download, '
+                        'parse, encode, write) to stderr')
+    parser.add_argument('--metrics-json', type=str, metavar='FILE',
+                        help='Write every step as a JSON line, followed by a run summary, '
+                        'to FILE ("-" for stdout, with the progress output moved to stderr)')
+    parser.add_argument('--metrics-textfile', type=str, metavar='FILE',
+                        help='Write the run summary as an OpenMetrics textfile, e.g. for the '
+                        'node-exporter textfile collector')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running, regenerating and applying the template whenever the '
+                        'hosted cluster ignition endpoint, release or token changes')
+    parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE,
+                        help='In watch mode, seconds without further changes before regenerating '
+                        f'(default: {DEFAULT_DEBOUNCE})')
+    parser.add_argument('--resync', type=float, default=DEFAULT_RESYNC,
+                        help='In watch mode, seconds between unconditional regenerations '
+                        f'(default: {DEFAULT_RESYNC})')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always download the ignition file, bypassing the local cache')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR,
+                        help=f'Ignition cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_TTL,
+                        help='Seconds a cached ignition is used without revalidation '
+                        f'(default: {DEFAULT_TTL})')
+    parser.add_argument('--cache-max-age', type=float, default=DEFAULT_MAX_AGE,
+                        help='Evict cache entries unused for this many seconds')
+    parser.add_argument('--cache-max-size', type=int, default=DEFAULT_MAX_SIZE,
+                        help='Evict least recently used entries above this many bytes')
     args = parser.parse_args()
+    if args.watch and (args.clusters or args.all_hosted_clusters):
+        parser.error("--watch supports a single cluster only")
+
+    tracer.configure(trace=args.trace, metrics_json=args.metrics_json)
+    if args.metrics_json == "-":
+        # stdout carries only the JSON lines, so it can be piped to a parser
+        sys.stdout = sys.stderr
+    success = False
+    try:
+        with span("gen_template"):
+            status = run(args, default_mode)
+        success = True
+        return status
+    finally:
+        tracer.finish(success, args.metrics_textfile)
+
 
+def run(args: argparse.Namespace, default_mode: str) -> Optional[int]:
+    """
+    Generates the templates requested on the command line.
+    Returns:
+        The exit status, or None for success
+    """
     if args.mtu9000:
         print("Enabling MTU 9000 configuration...")
-        mtu9000_enable()
+    overlays = {mode: build_overlay_set(mode_layers(mode, args.mtu9000))
+                for mode in dict.fromkeys(args.mode or [default_mode])}
 
     # Check KUBECONFIG environment variable
     kubeconfig = os.environ.get('KUBECONFIG')
@@ -669,17 +833,102 @@ def main():
         return
     print(f"KUBECONFIG: {kubeconfig}")
 
-    inner_ign = pull_ignition(args.cluster, args.hosted_clusters_namespace)
-    inner_ign = preprocess_ignition_file(inner_ign)
-    encoded_ign = encode_ignition(inner_ign)
-    ign = create_ignition_file(encoded_ign)
-
-    create_bfb_template_cm(ign, args.output_file)
+    cache = None
+    if not args.no_cache:
+        cache = IgnitionCache(args.cache_dir, ttl=args.cache_ttl,
+                              max_age=args.cache_max_age, max_size=args.cache_max_size)
+
+    options = EncodeOptions(compresslevel=args.compression_level,
+                            reproducible=args.reproducible)
+    patch_set = PatchSet.load(
+        ([] if args.no_default_patch_set else [DEFAULT_PATCH_SET]) + args.patch_set)
+    backend = make_backend(args.backend)
+    print(f"Cluster lookups via: {backend.name}")
+
+    if args.watch:
+        return watch(args, overlays, cache, backend, options, patch_set)
+
+    if not (args.clusters or args.all_hosted_clusters):
+        changed = generate_template(args.cluster, args.hosted_clusters_namespace,
+                                    args.output_file, overlays, cache, backend=backend,
+                                    force=args.force, options=options, patch_set=patch_set)
+        return None if changed else EXIT_UNCHANGED
+
+    # Discover all targets once so workers skip the per-cluster endpoint lookup
+    discovered = backend.list_hosted_clusters(args.hosted_clusters_namespace)
+    if args.all_hosted_clusters:
+        clusters = discovered
+    else:
+        names = [n.strip() for n in args.clusters.split(",") if n.strip()]
+        clusters = {name: discovered.get(name, "") for name in names}
+    if not clusters:
+        raise Exception(
+            f"No hosted clusters found in namespace {args.hosted_clusters_namespace}")
+
+    results = generate_templates(clusters, args.hosted_clusters_namespace,
+                                 args.output_file, overlays, cache, args.workers, backend,
+                                 args.force, options, patch_set)
+
+    print("Template generation results:")
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            print(f"  {name}: FAILED ({result})")
+        elif result:
+            print(f"  {name}: OK ({batch_output_file(args.output_file, name)})")
+        else:
+            print(f"  {name}: UNCHANGED ({batch_output_file(args.output_file, name)})")
+    failed = [name for name, result in results.items() if isinstance(result, Exception)]
+    if failed:
+        raise Exception(
+            f"Template generation failed for {len(failed)}/{len(results)} clusters: {', '.join(failed)}")
+    if not any(results.values()):
+        return EXIT_UNCHANGED
+
+
+def watch(args: argparse.Namespace, overlays: dict[str, OverlaySet],
+          cache: Optional[IgnitionCache], backend, options: EncodeOptions,
+          patch_set: PatchSet) -> None:
+    """
+    Keeps the template of a single cluster up to date until interrupted.
+    """
+    try:
+        client = KubeClient.from_kubeconfig()
+    except KubeConfigError as e:
+        raise Exception(f"--watch needs the API client: {e}")
+    if cache is not None:
+        # Always revalidate; an unchanged ignition costs a 304, not a download
+        cache.ttl = 0
+    outputs = [args.output_file] if len(overlays) == 1 else \
+        [mode_output_file(args.output_file, mode) for mode in overlays]
+
+    def regenerate() -> bool:
+        # Each cycle reports its own metrics, so watch mode does not accumulate
+        tracer.reset()
+        success = False
+        try:
+            with span("gen_template"):
+                changed = generate_template(args.cluster, args.hosted_clusters_namespace,
+                                            args.output_file, overlays, cache, backend=backend,
+                                            force=args.force, options=options,
+                                            patch_set=patch_set)
+            success = True
+            return changed
+        finally:
+            if args.metrics_textfile:
+                write_textfile(args.metrics_textfile, openmetrics(tracer.summary(success)))
+
+    def apply() -> None:
+        for path in outputs:
+            apply_configmap(path, client)
+
+    print(f"Watching hosted cluster {args.cluster} in {args.hosted_clusters_namespace}")
+    TemplateWatcher(client, args.cluster, args.hosted_clusters_namespace,
+                    regenerate, apply, debounce=args.debounce, resync=args.resync).run()
 
 
 if __name__ == "__main__":
     try:
-        main()
+        exit(main())
     except Exception as e:
         print(f"An error occurred: {e}")
         exit(1)
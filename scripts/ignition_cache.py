@@ -0,0 +1,266 @@
+#!/usr/bin/python3
+"""
+Content-addressed on-disk cache for hosted-cluster ignition payloads.
+
+Payloads are stored once per content hash under objects/, and small index
+records map a (cluster, namespace, ignition endpoint, token hash) key to the
+object plus the validators (ETag, sha256) needed for conditional revalidation.
+"""
+
+import fcntl
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "openshift-dpf", "ignition")
+
+# Entries validated within this many seconds are served without any request.
+DEFAULT_TTL = 300
+# Entries not used for this many seconds are evicted.
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+# Total size budget for stored payloads, in bytes.
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    sha256: str
+    size: int
+    etag: Optional[str]
+    fetched_at: float
+    validated_at: float
+    used_at: float
+
+
+def cache_key(cluster_name: str, namespace: str, endpoint: str, token: str) -> str:
+    """
+    Builds the index key for an ignition pull.
+    Args:
+        cluster_name: The hosted cluster name
+        namespace: The hosted clusters namespace
+        endpoint: The ignition endpoint host
+        token: The ignition bearer token (only its hash is used)
+    Returns:
+        str: The hex key
+    """
+    token_hash = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    material = "\0".join([cluster_name, namespace, endpoint, token_hash])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class IgnitionCache:
+    """
+    Ignition payload cache with TTL-based freshness and size/age eviction.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, ttl: float = DEFAULT_TTL,
+                 max_age: float = DEFAULT_MAX_AGE, max_size: int = DEFAULT_MAX_SIZE):
+        self.root = Path(cache_dir)
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_size = max_size
+        self.index_dir = self.root / "index"
+        self.objects_dir = self.root / "objects"
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """
+        Serialises writers and eviction across threads and processes, so an
+        object is never removed between being stored and being indexed.
+        """
+        with open(self.root / ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _index_path(self, key: str) -> Path:
+        return self.index_dir / f"{key}.json"
+
+    def object_path(self, sha256: str) -> Path:
+        return self.objects_dir / f"{sha256}.ign"
+
+    def _write_atomic(self, path: Path, data: bytes) -> None:
+        self._copy_atomic(path, io.BytesIO(data))
+
+    def _copy_atomic(self, path: Path, src: BinaryIO) -> None:
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(src, f)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def _save_entry(self, entry: CacheEntry) -> None:
+        self._write_atomic(self._index_path(entry.key),
+                           json.dumps(asdict(entry)).encode('utf-8'))
+
+    def lookup(self, key: str) -> Optional[CacheEntry]:
+        """
+        Returns the index entry for a key if its payload is still present.
+        """
+        try:
+            entry = CacheEntry(**json.loads(self._index_path(key).read_text()))
+        except (OSError, ValueError, TypeError):
+            return None
+        if not self.object_path(entry.sha256).is_file():
+            return None
+        return entry
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.validated_at < self.ttl
+
+    def read(self, entry: CacheEntry) -> bytes:
+        """
+        Reads a cached payload and records the access for LRU eviction.
+        """
+        f = self.open(entry)
+        if f is None:
+            raise FileNotFoundError(f"ignition cache entry {entry.key} was evicted")
+        with f:
+            return f.read()
+
+    def _current(self, entry: CacheEntry) -> Optional[CacheEntry]:
+        """
+        Re-reads an entry under the lock; None when it was evicted or now
+        points at another payload since it was looked up.
+        """
+        current = self.lookup(entry.key)
+        if current is None or current.sha256 != entry.sha256:
+            return None
+        return current
+
+    def open(self, entry: CacheEntry) -> Optional[BinaryIO]:
+        """
+        Opens a cached payload for streaming and records the access for LRU eviction.
+        Returns:
+            BinaryIO: The payload, or None when the entry was evicted meanwhile
+        """
+        with self._locked():
+            current = self._current(entry)
+            if current is None:
+                return None
+            # The open file stays readable even if a later eviction unlinks it
+            f = self.object_path(current.sha256).open("rb")
+            current.used_at = time.time()
+            self._save_entry(current)
+        entry.used_at = current.used_at
+        return f
+
+    def mark_validated(self, entry: CacheEntry, etag: Optional[str] = None) -> bool:
+        """
+        Records a successful revalidation (304 or matching hash) of an entry.
+        Returns:
+            bool: False when the entry was evicted meanwhile (a cache miss)
+        """
+        with self._locked():
+            current = self._current(entry)
+            if current is None:
+                return False
+            now = time.time()
+            current.validated_at = current.used_at = now
+            if etag:
+                current.etag = etag
+            self._save_entry(current)
+        entry.validated_at, entry.used_at, entry.etag = now, now, current.etag
+        return True
+
+    def store(self, key: str, data: bytes, etag: Optional[str] = None,
+              sha256: Optional[str] = None) -> CacheEntry:
+        """
+        Stores a payload under its content hash and points the key at it.
+        Args:
+            key: The index key from cache_key()
+            data: The raw ignition payload
+            etag: The ETag returned by the ignition server, if any
+            sha256: The payload hash, if already computed
+        Returns:
+            CacheEntry: The new index entry
+        """
+        digest = sha256 or hashlib.sha256(data).hexdigest()
+        return self.store_stream(key, io.BytesIO(data), len(data), etag, digest)
+
+    def store_stream(self, key: str, src: BinaryIO, size: int, etag: Optional[str],
+                     sha256: str) -> CacheEntry:
+        """
+        Stores a payload read from a file object without holding it in memory.
+        Args:
+            key: The index key from cache_key()
+            src: The payload, read from its current position to the end
+            size: The payload size in bytes
+            etag: The ETag returned by the ignition server, if any
+            sha256: The payload hash
+        Returns:
+            CacheEntry: The new index entry
+        """
+        obj = self.object_path(sha256)
+        with self._locked():
+            if not obj.is_file():
+                self._copy_atomic(obj, src)
+            now = time.time()
+            entry = CacheEntry(key=key, sha256=sha256, size=size, etag=etag,
+                               fetched_at=now, validated_at=now, used_at=now)
+            self._save_entry(entry)
+            self._evict()
+        return entry
+
+    def evict(self) -> None:
+        """
+        Drops entries unused for longer than max_age, then removes the least
+        recently used payloads until the total size fits max_size.
+        """
+        with self._locked():
+            self._evict()
+
+    def _evict(self) -> None:
+        now = time.time()
+        entries: list[CacheEntry] = []
+        for path in self.index_dir.glob("*.json"):
+            try:
+                entry = CacheEntry(**json.loads(path.read_text()))
+            except (OSError, ValueError, TypeError):
+                path.unlink(missing_ok=True)
+                continue
+            if now - entry.used_at > self.max_age:
+                path.unlink(missing_ok=True)
+                continue
+            entries.append(entry)
+
+        # Several keys may share one payload; an object lives as long as its
+        # most recently used referrer.
+        objects: dict[str, float] = {}
+        for entry in entries:
+            objects[entry.sha256] = max(objects.get(entry.sha256, 0), entry.used_at)
+
+        for path in self.objects_dir.glob("*.ign"):
+            if path.stem not in objects:
+                path.unlink(missing_ok=True)
+
+        sizes = {sha: self.object_path(sha).stat().st_size
+                 for sha in objects if self.object_path(sha).is_file()}
+        total = sum(sizes.values())
+        for sha in sorted(sizes, key=lambda s: objects[s]):
+            if total <= self.max_size:
+                break
+            self.object_path(sha).unlink(missing_ok=True)
+            total -= sizes[sha]
+            for entry in entries:
+                if entry.sha256 == sha:
+                    self._index_path(entry.key).unlink(missing_ok=True)
@@ -0,0 +1,204 @@
+#!/usr/bin/python3
+"""
+Declarative file and systemd unit overlays for the DPU ignition template.
+
+Each overlay is a YAML file in ignition-overlays/ with up to three lists:
+
+files:   {path, mode, overwrite, inline | source, after}
+units:   {name, enabled, contents, after}
+edits:   {path, find, replace}
+
+Layers are merged in order. An entry whose path (or name) already exists
+updates only the fields it sets and keeps its position; a new entry is
+inserted after the entry named by `after`, or appended. Edits replace text
+in the inline contents of an existing file and are skipped if the file is
+not part of the mode.
+"""
+
+import base64
+import hashlib
+import json
+import threading
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+OVERLAY_DIR = Path(__file__).resolve().parent / "ignition-overlays"
+
+# Overlay layers making up each DPU mode.
+MODES: dict[str, list[str]] = {
+    "trusted": ["base", "trusted"],
+    "zero-trust": ["base", "zero-trust"],
+}
+
+
+@dataclass
+class FileContents:
+    inline: Optional[str] = None
+    source: Optional[str] = None
+
+
+@dataclass
+class FileEntry:
+    path: str
+    overwrite: bool
+    mode: int
+    contents: FileContents
+
+
+@dataclass
+class SystemdUnit:
+    name: str
+    enabled: bool
+    contents: Optional[str] = None
+
+
+@dataclass
+class OverlaySet:
+    layers: list[str]
+    files: list[FileEntry] = field(default_factory=list)
+    units: list[SystemdUnit] = field(default_factory=list)
+
+    def digest(self) -> str:
+        """
+        Returns a hash of the merged files and units.
+        """
+        data = json.dumps({"files": [asdict(f) for f in self.files],
+                           "units": [asdict(u) for u in self.units]},
+                          sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+_overlays: dict[str, dict] = {}
+_lock = threading.Lock()
+
+
+def load_overlay(name: str) -> dict:
+    """
+    Loads an overlay file by name, once per process.
+    """
+    with _lock:
+        if name not in _overlays:
+            import yaml
+            path = OVERLAY_DIR / f"{name}.yaml"
+            if not path.is_file():
+                raise Exception(f"Ignition overlay not found: {path}")
+            _overlays[name] = yaml.safe_load(path.read_text()) or {}
+        return _overlays[name]
+
+
+def _insert(entries: list, key: str, entry, after: Optional[str]) -> None:
+    if after is None:
+        entries.append(entry)
+        return
+    for i, existing in enumerate(entries):
+        if getattr(existing, key) == after:
+            entries.insert(i + 1, entry)
+            return
+    raise Exception(f"Overlay anchor not found: {after}")
+
+
+def _merge_file(files: list[FileEntry], spec: dict) -> None:
+    existing = next((f for f in files if f.path == spec["path"]), None)
+    if existing is None:
+        entry = FileEntry(path=spec["path"], overwrite=spec.get("overwrite", True),
+                          mode=spec["mode"],
+                          contents=FileContents(inline=spec.get("inline"),
+                                                source=spec.get("source")))
+        _insert(files, "path", entry, spec.get("after"))
+        return
+    if "overwrite" in spec:
+        existing.overwrite = spec["overwrite"]
+    if "mode" in spec:
+        existing.mode = spec["mode"]
+    if "inline" in spec or "source" in spec:
+        existing.contents = FileContents(inline=spec.get("inline"),
+                                         source=spec.get("source"))
+
+
+def _merge_unit(units: list[SystemdUnit], spec: dict) -> None:
+    existing = next((u for u in units if u.name == spec["name"]), None)
+    if existing is None:
+        entry = SystemdUnit(name=spec["name"], enabled=spec.get("enabled", True),
+                            contents=spec.get("contents"))
+        _insert(units, "name", entry, spec.get("after"))
+        return
+    if "enabled" in spec:
+        existing.enabled = spec["enabled"]
+    if "contents" in spec:
+        existing.contents = spec["contents"]
+
+
+def build_overlay_set(layers: list[str]) -> OverlaySet:
+    """
+    Merges overlay layers into the final file and unit lists.
+    Args:
+        layers: Overlay names, in merge order
+    Returns:
+        OverlaySet: The merged files and units
+    """
+    result = OverlaySet(layers=list(layers))
+    for name in layers:
+        overlay = load_overlay(name)
+        for spec in overlay.get("files") or []:
+            _merge_file(result.files, spec)
+        for spec in overlay.get("units") or []:
+            _merge_unit(result.units, spec)
+        for edit in overlay.get("edits") or []:
+            for f in result.files:
+                if f.path == edit["path"] and f.contents.inline:
+                    f.contents.inline = f.contents.inline.replace(
+                        edit["find"], edit["replace"])
+    return result
+
+
+def mode_layers(mode: str, mtu9000: bool = False) -> list[str]:
+    """
+    Returns the overlay layers for a DPU mode.
+    """
+    if mode not in MODES:
+        raise Exception(f"Unknown mode {mode}, expected one of: {', '.join(MODES)}")
+    return MODES[mode] + (["mtu9000"] if mtu9000 else [])
+
+
+_data_urls: dict[str, str] = {}
+
+
+def inline_data_url(inline: str) -> str:
+    """
+    Returns the base64 data URL for inline file contents, memoized by
+    content hash so shared files are encoded once across modes.
+    """
+    digest = hashlib.sha256(inline.encode('utf-8')).hexdigest()
+    url = _data_urls.get(digest)
+    if url is None:
+        url = "data:text/plain;charset=utf-8;base64," + base64.b64encode(
+            inline.encode()).decode()
+        _data_urls[digest] = url
+    return url
+
+
+def ignition_files(overlay: OverlaySet) -> list[dict]:
+    """
+    Returns the ignition storage.files entries for an overlay set.
+    """
+    return [{
+        'path': f.path,
+        'overwrite': f.overwrite,
+        'mode': f.mode,
+        'contents': {
+            'source': f.contents.source if f.contents.inline is None
+            else inline_data_url(f.contents.inline)
+        }
+    } for f in overlay.files]
+
+
+def ignition_units(overlay: OverlaySet) -> list[dict]:
+    """
+    Returns the ignition systemd.units entries for an overlay set.
+    """
+    return [{
+        'name': u.name,
+        'enabled': u.enabled,
+        'contents': u.contents
+    } for u in overlay.units]
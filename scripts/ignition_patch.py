@@ -0,0 +1,191 @@
+#!/usr/bin/python3
+"""
+Declarative patch sets for the hosted-cluster (inner) ignition.
+
+A patch set is a YAML file in the same style as the ignition overlays:
+
+units:   {name, op: enable | disable | replace, enabled, contents}
+files:   {path, op: add | remove | override, mode, overwrite, inline | source}
+
+Patch sets are validated and checked for conflicts (two different
+operations on the same unit or file) when loaded, then applied to a
+document in a single pass over name and path indexes built once, so the
+cost stays linear in the document size however many patches a site adds.
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from ignition_overlay import inline_data_url
+
+PATCH_DIR = Path(__file__).resolve().parent / "ignition-patches"
+DEFAULT_PATCH_SET = str(PATCH_DIR / "default.yaml")
+
+UNIT_OPS = ("enable", "disable", "replace")
+FILE_OPS = ("add", "remove", "override")
+
+
+@dataclass
+class PatchOp:
+    kind: str
+    op: str
+    target: str
+    spec: dict
+    origin: str
+
+    def describe(self) -> str:
+        return f"{self.op} {self.kind} {self.target}"
+
+
+@dataclass
+class PatchResult:
+    applied: list[str] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        lines = [f"Applied {len(self.applied)} ignition patches"
+                 + (f", skipped {len(self.skipped)}" if self.skipped else "")]
+        lines += [f"  {line}" for line in self.applied]
+        lines += [f"  skipped {line}" for line in self.skipped]
+        return "\n".join(lines)
+
+
+def _parse_ops(data: dict, origin: str) -> list[PatchOp]:
+    ops = []
+    for kind, key, allowed in (("unit", "name", UNIT_OPS), ("file", "path", FILE_OPS)):
+        for spec in data.get(f"{kind}s") or []:
+            spec = dict(spec)
+            target = spec.pop(key, None)
+            op = spec.pop("op", None)
+            if not target or op not in allowed:
+                raise Exception(f"{origin}: invalid {kind} patch {spec}, "
+                                f"expected {key} and op in {', '.join(allowed)}")
+            if kind == "file" and op != "remove" and "inline" in spec and "source" in spec:
+                raise Exception(f"{origin}: file patch {target} sets both inline and source")
+            if kind == "file" and op == "add" and "mode" not in spec:
+                raise Exception(f"{origin}: file patch {target} needs a mode")
+            ops.append(PatchOp(kind, op, target, spec, origin))
+    return ops
+
+
+@dataclass
+class PatchSet:
+    ops: list[PatchOp]
+    sources: list[str]
+
+    @classmethod
+    def load(cls, paths: list[str]) -> "PatchSet":
+        """
+        Loads and combines patch set files.
+        Args:
+            paths: The patch set files, in order
+        Returns:
+            PatchSet: The combined, conflict free operations
+        """
+        import yaml
+        ops: list[PatchOp] = []
+        for path in paths:
+            with open(path) as f:
+                ops += _parse_ops(yaml.safe_load(f) or {}, path)
+
+        # Identical operations from several sets are fine; different
+        # operations on the same target are ambiguous.
+        seen: dict[tuple[str, str], PatchOp] = {}
+        unique: list[PatchOp] = []
+        conflicts = []
+        for op in ops:
+            existing = seen.get((op.kind, op.target))
+            if existing is None:
+                seen[(op.kind, op.target)] = op
+                unique.append(op)
+            elif (existing.op, existing.spec) != (op.op, op.spec):
+                conflicts.append(f"{existing.describe()} ({existing.origin}) vs "
+                                 f"{op.describe()} ({op.origin})")
+        if conflicts:
+            raise Exception("Conflicting ignition patches:\n  " + "\n  ".join(conflicts))
+        return cls(ops=unique, sources=list(paths))
+
+    def digest(self) -> str:
+        data = json.dumps([[op.kind, op.op, op.target, op.spec] for op in self.ops],
+                          sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _file_fields(spec: dict) -> dict:
+    entry = {k: spec[k] for k in ("overwrite", "mode") if k in spec}
+    if "inline" in spec:
+        entry["contents"] = {"source": inline_data_url(spec["inline"])}
+    elif "source" in spec:
+        entry["contents"] = {"source": spec["source"]}
+    return entry
+
+
+def _index(entries: list, key: str) -> dict[str, list[int]]:
+    index: dict[str, list[int]] = {}
+    for i, entry in enumerate(entries):
+        index.setdefault(entry.get(key), []).append(i)
+    return index
+
+
+def apply_patch_set(ign: dict, patch_set: PatchSet) -> PatchResult:
+    """
+    Applies a patch set to an ignition document in place.
+    Args:
+        ign: The ignition document
+        patch_set: The operations to apply
+    Returns:
+        PatchResult: The applied and skipped operations
+    """
+    result = PatchResult()
+    units: Optional[list] = ign.get("systemd", {}).get("units")
+    files: Optional[list] = ign.get("storage", {}).get("files")
+    unit_index = _index(units or [], "name")
+    file_index = _index(files or [], "path")
+    removed: set[int] = set()
+
+    for op in patch_set.ops:
+        if op.kind == "unit":
+            positions = unit_index.get(op.target, [])
+            if op.op in ("enable", "disable"):
+                if not positions:
+                    result.skipped.append(f"{op.describe()} (not present)")
+                    continue
+                for i in positions:
+                    units[i]["enabled"] = op.op == "enable"
+            else:
+                unit = {"name": op.target, **op.spec}
+                if units is None:
+                    units = ign.setdefault("systemd", {}).setdefault("units", [])
+                if positions:
+                    for i in positions:
+                        units[i] = dict(unit)
+                else:
+                    unit_index[op.target] = [len(units)]
+                    units.append(unit)
+        else:
+            positions = [i for i in file_index.get(op.target, []) if i not in removed]
+            if op.op == "remove":
+                if not positions:
+                    result.skipped.append(f"{op.describe()} (not present)")
+                    continue
+                removed.update(positions)
+            elif op.op == "add" and positions:
+                raise Exception(f"Cannot add file {op.target} ({op.origin}): "
+                                "it is already in the ignition, use override")
+            elif positions:
+                for i in positions:
+                    files[i].update(_file_fields(op.spec))
+            else:
+                if files is None:
+                    files = ign.setdefault("storage", {}).setdefault("files", [])
+                file_index[op.target] = [len(files)]
+                files.append({"path": op.target, "overwrite": True, **_file_fields(op.spec)})
+        result.applied.append(op.describe())
+
+    if removed:
+        files[:] = [f for i, f in enumerate(files) if i not in removed]
+    return result
+
@@ -0,0 +1,285 @@
+#!/usr/bin/python3
+"""
+Cached existence checks for the idempotency guards of the shell scripts.
+
+Instead of one oc get per guard, each collection (a kind in a namespace,
+or cluster wide) is listed once with metadata only and its object names
+are kept in a small snapshot file shared by the script processes. Names
+found in a snapshot younger than the TTL answer "exists" without a
+request. A name that is not found is confirmed with a direct GET, so an
+object created since the snapshot is never reported missing. Helm
+releases are read from the release secrets Helm keeps in the namespace.
+
+Exit status of the queries: 0 exists, 1 missing, 2 when the API cannot
+be used, in which case callers fall back to oc and helm. A malformed
+command line exits with 3.
+"""
+
+import hashlib
+import http.client
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from cli import ArgumentParser
+from kube_client import (ApiError, Discovery, KubeClient, KubeConfigError, Resource,
+                         UnknownKind, resource_path)
+
+EXIT_MISSING = 1
+EXIT_UNAVAILABLE = 2
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "openshift-dpf", "inventory")
+# Collections listed within this many seconds answer without a request.
+DEFAULT_TTL = 60
+# Kind to resource mappings are kept longer; new CRDs are found on a miss.
+DISCOVERY_TTL = 600
+
+# Namespace of namespaced objects given without one, as for oc.
+DEFAULT_NAMESPACE = "default"
+DPF_NAMESPACE = "dpf-operator-system"
+# Collections listed by "snapshot": (kind, namespace or None).
+SNAPSHOT = (
+    ("namespaces", None),
+    ("customresourcedefinitions", None),
+    ("secrets", DPF_NAMESPACE),
+    ("configmaps", DPF_NAMESPACE),
+    ("dpfoperatorconfigs.operator.dpu.nvidia.com", DPF_NAMESPACE),
+    ("dpuclusters.provisioning.dpu.nvidia.com", DPF_NAMESPACE),
+    ("bfbs.provisioning.dpu.nvidia.com", DPF_NAMESPACE),
+    ("dpudeployments.svc.dpu.nvidia.com", DPF_NAMESPACE),
+)
+SNAPSHOT_HELM_NAMESPACES = (DPF_NAMESPACE,)
+
+
+class Inventory:
+    """
+    Existence index over metadata-only lists, persisted between processes.
+    """
+
+    def __init__(self, client: KubeClient, cache_dir: str = DEFAULT_CACHE_DIR,
+                 ttl: float = DEFAULT_TTL):
+        self.client = client
+        self.ttl = ttl
+        self.discovery = Discovery(client)
+        key = hashlib.sha256(client.config.server.encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(cache_dir, f"{key}.json")
+        self.data = self._read()
+        self._changed: dict[str, dict] = {}
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data.setdefault("kinds", {})
+        data.setdefault("collections", {})
+        return data
+
+    def _put(self, section: str, key: str, value: dict) -> None:
+        self.data[section][key] = value
+        self._changed[f"{section}\0{key}"] = value
+
+    def save(self) -> None:
+        """
+        Merges this process's updates into the snapshot file; concurrent
+        processes may each have added collections.
+        """
+        if not self._changed:
+            return
+        data = self._read()
+        for key, value in self._changed.items():
+            section, _, name = key.partition("\0")
+            data[section][name] = value
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+        self._changed = {}
+
+    def invalidate(self) -> None:
+        self.data = {"kinds": {}, "collections": {}}
+        self._changed = {}
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def resolve(self, kind: str) -> Resource:
+        """
+        Maps a kind name (as accepted by oc get) to its API resource.
+        Raises:
+            UnknownKind: The kind is not served by the cluster
+        """
+        cached = self.data["kinds"].get(kind)
+        if cached and time.time() - cached["at"] < DISCOVERY_TTL:
+            return Resource(cached["group_version"], cached["plural"], cached["namespaced"])
+        resource = self.discovery.resolve(kind)
+        self._put("kinds", kind, {"group_version": resource.group_version,
+                                  "plural": resource.plural,
+                                  "namespaced": resource.namespaced, "at": time.time()})
+        return resource
+
+    def _list(self, resource: Resource, namespace: Optional[str],
+              label_selector: Optional[str] = None) -> list[dict]:
+        path = resource_path(resource.group_version, resource.plural,
+                             namespace if resource.namespaced else None)
+        return self.client.list(path, label_selector=label_selector,
+                                metadata_only=True).get("items", [])
+
+    def names(self, kind: str, namespace: Optional[str] = None,
+              refresh: bool = False) -> set[str]:
+        """
+        Returns the object names of a collection, listing it if the
+        snapshot is missing or older than the TTL.
+        """
+        resource = self.resolve(kind)
+        namespace = (namespace or DEFAULT_NAMESPACE) if resource.namespaced else None
+        key = f"{resource.group_version}/{resource.plural}/{namespace or ''}"
+        cached = self.data["collections"].get(key)
+        if refresh or not cached or time.time() - cached["at"] >= self.ttl:
+            items = self._list(resource, namespace)
+            cached = {"at": time.time(), "names": sorted(i["metadata"]["name"] for i in items)}
+            self._put("collections", key, cached)
+        return set(cached["names"])
+
+    def exists(self, kind: str, name: str, namespace: Optional[str] = None) -> bool:
+        """
+        Checks whether an object exists. Cached names are trusted, misses
+        are confirmed with a GET.
+        """
+        try:
+            resource = self.resolve(kind)
+        except UnknownKind:
+            # Like oc get, a kind the cluster does not serve has no objects
+            return False
+        if name in self.names(kind, namespace):
+            return True
+        namespace = (namespace or DEFAULT_NAMESPACE) if resource.namespaced else None
+        try:
+            self.client.get(resource_path(resource.group_version, resource.plural,
+                                          namespace, name))
+        except ApiError as e:
+            if e.status == 404:
+                return False
+            raise
+        key = f"{resource.group_version}/{resource.plural}/{namespace or ''}"
+        cached = self.data["collections"][key]
+        self._put("collections", key, {**cached, "names": sorted({*cached["names"], name})})
+        return True
+
+    def helm_releases(self, namespace: str, refresh: bool = False) -> dict[str, list[str]]:
+        """
+        Returns the statuses of each Helm release's revisions in a namespace.
+        """
+        key = f"helm/{namespace}"
+        cached = self.data["collections"].get(key)
+        if refresh or not cached or time.time() - cached["at"] >= self.ttl:
+            releases: dict[str, list[str]] = {}
+            for item in self._list(self.resolve("secrets"), namespace, "owner=helm"):
+                labels = item["metadata"].get("labels", {})
+                releases.setdefault(labels.get("name", ""), []).append(labels.get("status", ""))
+            cached = {"at": time.time(), "releases": releases}
+            self._put("collections", key, cached)
+        return cached["releases"]
+
+    def helm_release_deployed(self, namespace: str, name: str) -> bool:
+        if "deployed" in self.helm_releases(namespace).get(name, []):
+            return True
+        return "deployed" in self.helm_releases(namespace, refresh=True).get(name, [])
+
+    def snapshot(self) -> int:
+        """
+        Lists the collections most guards ask about, concurrently.
+        Returns:
+            int: The number of collections listed
+        """
+        def collect(entry: tuple[str, Optional[str]]) -> bool:
+            kind, namespace = entry
+            try:
+                self.names(kind, namespace, refresh=True)
+                return True
+            except UnknownKind:
+                # e.g. DPF kinds before the operator is installed
+                return False
+
+        with ThreadPoolExecutor(max_workers=len(SNAPSHOT)) as pool:
+            listed = sum(pool.map(collect, SNAPSHOT))
+        for namespace in SNAPSHOT_HELM_NAMESPACES:
+            self.helm_releases(namespace, refresh=True)
+            listed += 1
+        return listed
+
+
+def manifest_objects(path: str) -> list[tuple[str, str, Optional[str]]]:
+    """
+    Lists (kind, name, namespace) for every document of a manifest file.
+    Documents without a fixed name (generateName) cannot be looked up and are
+    reported and skipped.
+    """
+    import yaml
+    with open(path) as f:
+        docs = [doc for doc in yaml.safe_load_all(f) if doc]
+    objects = []
+    for doc in docs:
+        group = doc.get("apiVersion", "").rpartition("/")[0]
+        kind = doc["kind"].lower() + (f".{group}" if group else "")
+        metadata = doc.get("metadata") or {}
+        if not metadata.get("name"):
+            print(f"{path}: skipping {doc['kind']} without metadata.name", file=sys.stderr, flush=True)
+            continue
+        objects.append((kind, metadata["name"], metadata.get("namespace")))
+    return objects
+
+
+def main() -> int:
+    parser = ArgumentParser(
+        description='Cached existence checks for Kubernetes objects and Helm releases')
+    parser.add_argument('--ttl', type=float, default=DEFAULT_TTL,
+                        help=f'Seconds a listed collection is trusted (default: {DEFAULT_TTL})')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help=f'Snapshot directory (default: {DEFAULT_CACHE_DIR})')
+    sub = parser.add_subparsers(dest='command', required=True)
+    exists = sub.add_parser('exists', help='Check whether an object exists')
+    exists.add_argument('kind', help='Kind as accepted by oc get, e.g. crd or subscription')
+    exists.add_argument('name')
+    exists.add_argument('--namespace', '-n')
+    exists_file = sub.add_parser('exists-file', help='Check whether every object of a manifest exists')
+    exists_file.add_argument('file')
+    helm = sub.add_parser('helm-release', help='Check whether a Helm release is deployed')
+    helm.add_argument('namespace')
+    helm.add_argument('name')
+    sub.add_parser('snapshot', help='List the commonly checked collections')
+    sub.add_parser('invalidate', help='Drop the snapshot')
+    args = parser.parse_args()
+
+    try:
+        inventory = Inventory(KubeClient.from_kubeconfig(), args.cache_dir, args.ttl)
+        if args.command == 'invalidate':
+            inventory.invalidate()
+            return 0
+        if args.command == 'snapshot':
+            started = time.monotonic()
+            listed = inventory.snapshot()
+            print(f"Inventory snapshot: {listed} collections in {time.monotonic() - started:.2f}s")
+            found = True
+        elif args.command == 'exists':
+            found = inventory.exists(args.kind, args.name, args.namespace)
+        elif args.command == 'exists-file':
+            found = all(inventory.exists(*obj) for obj in manifest_objects(args.file))
+        else:
+            found = inventory.helm_release_deployed(args.namespace, args.name)
+        inventory.save()
+    except (KubeConfigError, UnknownKind, ApiError, OSError, http.client.HTTPException) as e:
+        print(f"Cannot query the API: {e}", file=sys.stderr)
+        return EXIT_UNAVAILABLE
+    return 0 if found else EXIT_MISSING
+
+
+if __name__ == "__main__":
+    exit(main())
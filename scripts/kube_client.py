@@ -0,0 +1,415 @@
+#!/usr/bin/python3
+"""
+Minimal in-process Kubernetes API client.
+
+Reads KUBECONFIG directly and keeps one keep-alive HTTPS connection per
+thread, so repeated lookups do not pay for an oc fork and a fresh TLS
+handshake each time.
+"""
+
+import atexit
+import base64
+import http.client
+import json
+import os
+import shutil
+import ssl
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterator, Optional
+from urllib.parse import urlencode, urlparse
+
+from tracing import span
+
+# Server side watch duration; the stream is resumed from the last resourceVersion.
+WATCH_TIMEOUT = 300
+
+# Metadata-only list responses are much smaller than full objects (no secret data).
+METADATA_ONLY = "application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1,application/json"
+# Group versions fetched at once when resolving a kind.
+DISCOVERY_WORKERS = 16
+
+
+class KubeConfigError(Exception):
+    """Raised when the kubeconfig cannot be used by this client."""
+
+
+class UnknownKind(Exception):
+    """Raised when the cluster does not serve a kind."""
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, reason: str, body: str = ""):
+        super().__init__(f"{status} {reason}: {body[:200]}")
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+
+_tmp_dir: Optional[str] = None
+
+
+def _materialize(data_b64: str, name: str) -> str:
+    """
+    Writes base64 kubeconfig data to a private file, since ssl only loads
+    certificates and keys from paths.
+    """
+    global _tmp_dir
+    if _tmp_dir is None:
+        _tmp_dir = tempfile.mkdtemp(prefix="kube-client-")
+        atexit.register(shutil.rmtree, _tmp_dir, True)
+    path = os.path.join(_tmp_dir, name)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(base64.b64decode(data_b64))
+    return path
+
+
+@dataclass
+class KubeConfig:
+    server: str
+    ca_file: Optional[str] = None
+    insecure: bool = False
+    token: Optional[str] = None
+    client_cert: Optional[str] = None
+    client_key: Optional[str] = None
+    # Namespace of the current context, as used by oc for objects without one
+    namespace: str = "default"
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "KubeConfig":
+        """
+        Loads the current context of a kubeconfig file.
+        Args:
+            path: The kubeconfig path (default: first entry of $KUBECONFIG)
+        Returns:
+            KubeConfig: The resolved cluster and credentials
+        """
+        path = path or os.environ.get("KUBECONFIG", "").split(os.pathsep)[0]
+        if not path:
+            raise KubeConfigError("KUBECONFIG is not set")
+        try:
+            import yaml
+        except ImportError:
+            raise KubeConfigError("PyYAML is required to read kubeconfig files")
+        try:
+            with open(path) as f:
+                config = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as e:
+            raise KubeConfigError(f"Cannot read kubeconfig {path}: {e}")
+
+        base = os.path.dirname(os.path.abspath(path))
+
+        def named(section: str, name: str) -> dict:
+            for item in config.get(section) or []:
+                if item.get("name") == name:
+                    return item.get(section[:-1]) or {}
+            raise KubeConfigError(f"{section[:-1]} {name} not found in {path}")
+
+        def resolve(p: str) -> str:
+            return p if os.path.isabs(p) else os.path.join(base, p)
+
+        context = named("contexts", config.get("current-context", ""))
+        cluster = named("clusters", context.get("cluster", ""))
+        user = named("users", context.get("user", ""))
+
+        if "exec" in user or "auth-provider" in user:
+            raise KubeConfigError("exec and auth-provider credentials are not supported")
+
+        kc = cls(server=cluster["server"].rstrip("/"),
+                 insecure=bool(cluster.get("insecure-skip-tls-verify")),
+                 namespace=context.get("namespace") or "default")
+        if cluster.get("certificate-authority-data"):
+            kc.ca_file = _materialize(cluster["certificate-authority-data"], "ca.crt")
+        elif cluster.get("certificate-authority"):
+            kc.ca_file = resolve(cluster["certificate-authority"])
+
+        if user.get("token"):
+            kc.token = user["token"]
+        elif user.get("tokenFile"):
+            with open(resolve(user["tokenFile"])) as f:
+                kc.token = f.read().strip()
+        if user.get("client-certificate-data"):
+            kc.client_cert = _materialize(user["client-certificate-data"], "client.crt")
+            kc.client_key = _materialize(user["client-key-data"], "client.key")
+        elif user.get("client-certificate"):
+            kc.client_cert = resolve(user["client-certificate"])
+            kc.client_key = resolve(user["client-key"])
+        return kc
+
+
+class KubeClient:
+    """
+    Thread-safe API client with a keep-alive connection per thread.
+    """
+
+    def __init__(self, config: KubeConfig, timeout: float = 30):
+        self.config = config
+        self.timeout = timeout
+        url = urlparse(config.server)
+        self.host = url.hostname
+        self.port = url.port or 443
+        self.prefix = url.path.rstrip("/")
+        if config.insecure:
+            self.context = ssl._create_unverified_context()
+        else:
+            self.context = ssl.create_default_context(cafile=config.ca_file)
+        if config.client_cert:
+            self.context.load_cert_chain(config.client_cert, config.client_key)
+        self._local = threading.local()
+
+    @classmethod
+    def from_kubeconfig(cls, path: Optional[str] = None) -> "KubeClient":
+        return cls(KubeConfig.load(path))
+
+    def _connection(self, timeout: Optional[float]) -> http.client.HTTPSConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPSConnection(
+                self.host, self.port, context=self.context, timeout=self.timeout)
+            self._local.conn = conn
+        conn.timeout = timeout if timeout is not None else self.timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(conn.timeout)
+        return conn
+
+    def _drop_connection(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _headers(self, accept: str, content_type: Optional[str]) -> dict:
+        headers = {"Accept": accept, "User-Agent": "openshift-dpf/kube-client"}
+        if self.config.token:
+            headers["Authorization"] = f"Bearer {self.config.token}"
+        if content_type:
+            headers["Content-Type"] = content_type
+        return headers
+
+    def url(self, path: str, query: Optional[dict] = None) -> str:
+        query = {k: v for k, v in (query or {}).items() if v is not None}
+        return self.prefix + path + ("?" + urlencode(query) if query else "")
+
+    def request(self, method: str, path: str, query: Optional[dict] = None,
+                body: Optional[bytes] = None, accept: str = "application/json",
+                content_type: Optional[str] = None) -> dict:
+        """
+        Sends a request over the pooled connection and decodes the JSON reply.
+        Args:
+            method: The HTTP method
+            path: The API path, e.g. /api/v1/namespaces
+            query: Query parameters; None values are dropped
+            body: The request body
+            accept: The Accept header
+            content_type: The Content-Type header for the body
+        Returns:
+            dict: The decoded response
+        """
+        url = self.url(path, query)
+        headers = self._headers(accept, content_type)
+        with span("api", method=method, path=path) as s:
+            # A keep-alive connection may have been closed by the server between
+            # requests; retry once on a fresh connection in that case.
+            for attempt in range(2):
+                conn = self._connection(None)
+                s["reused"] = conn.sock is not None
+                try:
+                    conn.request(method, url, body=body, headers=headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                    break
+                except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                        BrokenPipeError, ConnectionResetError):
+                    self._drop_connection()
+                    if attempt:
+                        raise
+            s.update(status=response.status, bytes=len(data))
+        if response.status >= 400:
+            raise ApiError(response.status, response.reason,
+                           data.decode("utf-8", "replace"))
+        return json.loads(data) if data else {}
+
+    def get(self, path: str, **query) -> dict:
+        return self.request("GET", path, query)
+
+    def list(self, path: str, field_selector: Optional[str] = None,
+             label_selector: Optional[str] = None, metadata_only: bool = False) -> dict:
+        """
+        Lists a collection, optionally returning object metadata only.
+        """
+        return self.request("GET", path,
+                            {"fieldSelector": field_selector, "labelSelector": label_selector},
+                            accept=METADATA_ONLY if metadata_only else "application/json")
+
+    def watch(self, path: str, resource_version: Optional[str] = None,
+              field_selector: Optional[str] = None, label_selector: Optional[str] = None,
+              timeout_seconds: int = WATCH_TIMEOUT) -> Iterator[dict]:
+        """
+        Streams watch events for a collection until the server ends the watch.
+        The stream uses its own connection so the pooled one stays usable.
+        Args:
+            path: The collection path
+            resource_version: The version to resume from
+            field_selector: The field selector
+            label_selector: The label selector
+            timeout_seconds: How long the server keeps the watch open
+        Returns:
+            Iterator: Events like {"type": "MODIFIED", "object": {...}}
+        """
+        query = {"watch": "true", "allowWatchBookmarks": "true",
+                 "resourceVersion": resource_version, "fieldSelector": field_selector,
+                 "labelSelector": label_selector, "timeoutSeconds": timeout_seconds}
+        conn = http.client.HTTPSConnection(self.host, self.port, context=self.context,
+                                           timeout=timeout_seconds + 30)
+        try:
+            conn.request("GET", self.url(path, query),
+                         headers=self._headers("application/json", None))
+            response = conn.getresponse()
+            if response.status >= 400:
+                raise ApiError(response.status, response.reason,
+                               response.read().decode("utf-8", "replace"))
+            while line := response.readline():
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            conn.close()
+
+    def list_and_watch(self, path: str, field_selector: Optional[str] = None,
+                       label_selector: Optional[str] = None,
+                       stop: Optional[threading.Event] = None) -> Iterator[tuple[str, dict]]:
+        """
+        Lists a collection and then follows it with watches, resuming from
+        the last seen resourceVersion and relisting when it has expired.
+        Args:
+            path: The collection path
+            field_selector: The field selector
+            label_selector: The label selector
+            stop: Ends the iteration once set (checked between watch streams)
+        Returns:
+            Iterator: ("SYNC", list) after every (re)list, then (event type, object)
+        """
+        resource_version = None
+        while not (stop and stop.is_set()):
+            if resource_version is None:
+                items = self.list(path, field_selector, label_selector)
+                resource_version = items.get("metadata", {}).get("resourceVersion")
+                yield "SYNC", items
+            try:
+                for event in self.watch(path, resource_version, field_selector, label_selector):
+                    obj = event.get("object", {})
+                    if event.get("type") == "ERROR":
+                        if obj.get("code") == 410:
+                            resource_version = None
+                            break
+                        raise ApiError(obj.get("code", 500), obj.get("reason", ""),
+                                       obj.get("message", ""))
+                    resource_version = obj.get("metadata", {}).get(
+                        "resourceVersion", resource_version)
+                    if event.get("type") != "BOOKMARK":
+                        yield event["type"], obj
+                    if stop and stop.is_set():
+                        return
+            except ApiError as e:
+                if e.status != 410:
+                    raise
+                resource_version = None
+            except (OSError, http.client.HTTPException):
+                # Dropped stream; resume from the last seen version
+                time.sleep(1)
+
+
+def resource_path(group_version: str, plural: str, namespace: Optional[str] = None,
+                  name: Optional[str] = None) -> str:
+    """
+    Builds the API path for a resource collection or object.
+    Args:
+        group_version: "v1" for the core group, otherwise "<group>/<version>"
+        plural: The resource plural, e.g. secrets
+        namespace: The namespace, or None for cluster-scoped or all namespaces
+        name: The object name, or None for the collection
+    Returns:
+        str: The API path
+    """
+    path = "/api/v1" if group_version == "v1" else f"/apis/{group_version}"
+    if namespace:
+        path += f"/namespaces/{namespace}"
+    path += f"/{plural}"
+    if name:
+        path += f"/{name}"
+    return path
+
+
+@dataclass
+class Resource:
+    group_version: str
+    plural: str
+    namespaced: bool
+
+
+class Discovery:
+    """
+    Resolves kind names (plural, singular, kind or short name, optionally
+    qualified with the group as in deployments.apps) to API resources.
+    """
+
+    def __init__(self, client: KubeClient):
+        self.client = client
+        self._resolved: dict[str, Resource] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _match(name: str, group_version: str, resources: list) -> Optional[Resource]:
+        for r in resources:
+            if "/" in r["name"]:
+                continue
+            names = {r["name"], r.get("singularName") or "", r["kind"].lower(),
+                     *r.get("shortNames", [])}
+            if name in names:
+                return Resource(group_version, r["name"], r["namespaced"])
+        return None
+
+    def _lookup(self, kind: str) -> Optional[Resource]:
+        name, _, group = kind.lower().partition(".")
+        if not group:
+            core = self.client.get("/api/v1")
+            resource = self._match(name, "v1", core.get("resources", []))
+            if resource:
+                return resource
+
+        versions = [g["preferredVersion"]["groupVersion"]
+                    for g in self.client.get("/apis").get("groups", [])
+                    if not group or g["name"] == group]
+
+        def fetch(group_version: str) -> list:
+            try:
+                return self.client.get(f"/apis/{group_version}").get("resources", [])
+            except ApiError as e:
+                # Aggregated APIs may be temporarily unavailable
+                if e.status == 503:
+                    return []
+                raise
+
+        with ThreadPoolExecutor(max_workers=DISCOVERY_WORKERS) as pool:
+            for group_version, resources in zip(versions, pool.map(fetch, versions)):
+                resource = self._match(name, group_version, resources)
+                if resource:
+                    return resource
+        return None
+
+    def resolve(self, kind: str) -> Resource:
+        """
+        Returns the API resource of a kind name.
+        Raises:
+            UnknownKind: The cluster does not serve the kind
+        """
+        with self._lock:
+            if kind not in self._resolved:
+                resource = self._lookup(kind)
+                if resource is None:
+                    raise UnknownKind(f"Unknown kind {kind}")
+                self._resolved[kind] = resource
+            return self._resolved[kind]
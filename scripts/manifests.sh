@@ -90,14 +90,14 @@ function prepare_nfs() {
         log "INFO" "Selected master IP: ${selected_master_ip}"
 
         # Build node affinity YAML block (properly indented with 6 spaces)
-        node_affinity="affinity:\\
-        nodeAffinity:\\
-          requiredDuringSchedulingIgnoredDuringExecution:\\
-            nodeSelectorTerms:\\
-            - matchExpressions:\\
-              - key: kubernetes.io/hostname\\
-                operator: In\\
-                values:\\
+        node_affinity="affinity:
+        nodeAffinity:
+          requiredDuringSchedulingIgnoredDuringExecution:
+            nodeSelectorTerms:
+            - matchExpressions:
+              - key: kubernetes.io/hostname
+                operator: In
+                values:
                 - ${selected_master_node}"
 
         # Set HOST_CLUSTER_API to the selected master IP
@@ -210,8 +210,8 @@ function deploy_core_operator_sources() {
     for f in "$MANIFESTS_DIR/cluster-installation/nfd-subscription.yaml" \
              "$MANIFESTS_DIR/cluster-installation/sriov-subscription.yaml"; do
         if [ -f "$f" ]; then
-            cp "$f" "$GENERATED_DIR/"
-            sed -i "s|<CATALOG_SOURCE_NAME>|$CATALOG_SOURCE_NAME|g" "$GENERATED_DIR/$(basename "$f")"
+            process_template "$f" "$GENERATED_DIR/$(basename "$f")" \
+                "<CATALOG_SOURCE_NAME>" "$CATALOG_SOURCE_NAME"
             apply_manifest "$GENERATED_DIR/$(basename "$f")" true
         fi
     done
@@ -262,91 +262,60 @@ prepare_dpf_manifests() {
         mkdir -p "${GENERATED_DIR}"
     fi
 
-    # Copy and process manifests
-    log "INFO" "Processing manifests from ${MANIFESTS_DIR} to ${GENERATED_DIR}"
-    
     # Clean up any existing Helm values files that might have been left from previous runs
     find "$GENERATED_DIR" -maxdepth 1 -type f -name "*-values.yaml" -delete 2>/dev/null || true
-    
-    # Build list of files to exclude (all Helm values files)
-    local excluded_files=(
-        "*-values.yaml"
-    )
-    
-    # Copy all manifests except Helm values files using utility function
-    copy_manifests_with_exclusions "$MANIFESTS_DIR/dpf-installation" "$GENERATED_DIR" "${excluded_files[@]}"
-
-    # Copy cert-manager manifest (required for DPF deployment)
-    log "INFO" "Copying Cert-Manager manifest (required for DPF operator)..."
-    cp "$MANIFESTS_DIR/cluster-installation/openshift-cert-manager.yaml" "$GENERATED_DIR/"
-
-    log "INFO" "DPF manifest preparation completed successfully"
-
-    # Update manifests with configuration
-    # Check if bfb-pvc.yaml exists before modifying
-    if [ ! -f "$GENERATED_DIR/bfb-pvc.yaml" ]; then
-        log "ERROR" "bfb-pvc.yaml not found in $GENERATED_DIR"
-        return 1
-    fi
-    
-    # For single-node clusters (VM_COUNT < 2), we use direct NFS PV binding, so remove storageClassName
-    if [ "${VM_COUNT}" -lt 2 ]; then
-        if ! grep -v 'storageClassName: ""' "$GENERATED_DIR/bfb-pvc.yaml" > "$GENERATED_DIR/bfb-pvc.yaml.tmp"; then
-            log "ERROR" "Failed to process bfb-pvc.yaml for single-node cluster"
-            return 1
-        fi
-        mv "$GENERATED_DIR/bfb-pvc.yaml.tmp" "$GENERATED_DIR/bfb-pvc.yaml"
-    else
-        sed -i "s|storageClassName: \"\"|storageClassName: \"$BFB_STORAGE_CLASS\"|g" "$GENERATED_DIR/bfb-pvc.yaml"
-    fi
-
-    # Update static DPU cluster template
-    sed -i "s|<KUBERNETES_VERSION>|$OPENSHIFT_VERSION|g" "$GENERATED_DIR/static-dpucluster-template.yaml"
-    sed -i "s|<HOSTED_CLUSTER_NAME>|$HOSTED_CLUSTER_NAME|g" "$GENERATED_DIR/static-dpucluster-template.yaml"
 
-    # Extract NGC API key and update secrets
+    # Extract NGC API key for the secrets
     NGC_API_KEY=$(jq -r '.auths."nvcr.io".password // empty' "$DPF_PULL_SECRET" 2>/dev/null)
     if [ -z "$NGC_API_KEY" ] || [ "$NGC_API_KEY" = "null" ]; then
         log "ERROR" "Failed to extract NGC API key from pull secret"
         return 1
     fi
-    
-    # Process ngc-secrets.yaml using process_template function
-    process_template \
-        "$MANIFESTS_DIR/dpf-installation/ngc-secrets.yaml" \
-        "$GENERATED_DIR/ngc-secrets.yaml" \
-        "<NGC_API_KEY>" "$NGC_API_KEY"
-
-    # Update pull secret
-    # Encode pull secret (Linux/GNU base64)
-    PULL_SECRET=$(cat "$DPF_PULL_SECRET" | base64 -w 0)
-    if [ -z "$PULL_SECRET" ]; then
-        log "ERROR" "Failed to encode pull secret"
-        return 1
+
+    # Render all manifests except Helm values files in one pass
+    local render_args=(
+        --exclude "*-values.yaml"
+        --set "HOSTED_CLUSTER_NAME=${HOSTED_CLUSTER_NAME}"
+        --set "NGC_API_KEY=${NGC_API_KEY}"
+        --set-base64-file "PULL_SECRET_BASE64=${DPF_PULL_SECRET}"
+        --set "CLUSTER_NAME=${CLUSTER_NAME}"
+        --set "BASE_DOMAIN=${BASE_DOMAIN}"
+        --replace nfd-cr-template.yaml "api.<CLUSTER_FQDN>" "${HOST_CLUSTER_API}"
+    )
+
+    # For single-node clusters (VM_COUNT < 2), we use direct NFS PV binding, so remove storageClassName
+    if [ "${VM_COUNT}" -lt 2 ]; then
+        render_args+=(--delete-line bfb-pvc.yaml 'storageClassName: ""')
+    else
+        render_args+=(--replace bfb-pvc.yaml 'storageClassName: ""' "storageClassName: \"${BFB_STORAGE_CLASS}\"")
     fi
-    local escaped_secret=$(escape_sed_replacement "$PULL_SECRET")
-    sed -i "s|<PULL_SECRET_BASE64>|$escaped_secret|g" "$GENERATED_DIR/dpf-pull-secret.yaml"
 
-    prepare_nfs
-    
-    # Process dpfoperatorconfig.yaml
-    process_template \
-        "$MANIFESTS_DIR/dpf-installation/dpfoperatorconfig.yaml" \
-        "$GENERATED_DIR/dpfoperatorconfig.yaml" \
-        "<CLUSTER_NAME>" "$CLUSTER_NAME" \
-        "<BASE_DOMAIN>" "$BASE_DOMAIN"
-    
     if [ -n "$NODES_MTU" ] && [ "$NODES_MTU" == "9000" ]; then
         log "INFO" "Appending networking configuration with MTU: $NODES_MTU"
-        cat >> "$GENERATED_DIR/dpfoperatorconfig.yaml" <<-EOF
-  networking:
+        render_args+=(--append dpfoperatorconfig.yaml "  networking:
     controlPlaneMTU: $NODES_MTU
     highSpeedMTU: $NODES_MTU
-EOF
+")
     else
        log "INFO" "NODES_MTU is not set. Skipping networking configuration."
     fi
 
+    log "INFO" "Rendering manifests from ${MANIFESTS_DIR}/dpf-installation to ${GENERATED_DIR}"
+    if ! render_manifests "$MANIFESTS_DIR/dpf-installation" "$GENERATED_DIR" "${render_args[@]}"; then
+        log "ERROR" "Failed to render DPF manifests"
+        return 1
+    fi
+
+    # Copy cert-manager manifest (required for DPF deployment)
+    log "INFO" "Copying Cert-Manager manifest (required for DPF operator)..."
+    cp "$MANIFESTS_DIR/cluster-installation/openshift-cert-manager.yaml" "$GENERATED_DIR/"
+
+    # prepare_nfs may point HOST_CLUSTER_API at the NFS master, so it runs
+    # after the manifests using it are rendered
+    prepare_nfs
+
+    log "INFO" "DPF manifest preparation completed successfully"
+
     # Final verification: ensure no Helm values files are in the generated directory
     if find "$GENERATED_DIR" -maxdepth 1 -type f -name "*-values.yaml" | grep -q .; then
         log "ERROR" "Helm values files found in generated directory. These should not be processed during cluster installation."
@@ -0,0 +1,335 @@
+#!/usr/bin/python3
+"""
+Runs the installation as a dependency graph instead of a fixed sequence.
+
+Each step is one existing script command; independent branches (VM
+creation and DPF manifest rendering, the DPF operator prerequisites and
+the hosted cluster) run concurrently. Completed steps are checkpointed
+in logs/pipeline-<env hash>/, next to one log file per step, so a rerun
+with the same .env resumes at the failed step instead of walking every
+earlier step's idempotency checks again. Changing .env starts a fresh
+checkpoint.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOG_DIR = os.path.join(REPO_DIR, "logs")
+ENV_FILE = os.path.join(REPO_DIR, ".env")
+DEFAULT_JOBS = 4
+# Settings resolved through env.sh (with its defaults) for the step conditions
+CONFIG_VARS = ("DPF_VERSION",)
+
+
+def dpf_requires_argocd(env: dict) -> bool:
+    """
+    DPF v25.7+ requires ArgoCD and the Maintenance Operator (see dpf.sh).
+    """
+    version = env.get("DPF_VERSION", "")
+    return bool(re.match(r"^v25\.[7-9]", version) or re.match(r"^v2[6-9]", version))
+
+
+@dataclass
+class Step:
+    name: str
+    # None for steps that only group their dependencies
+    command: Optional[list[str]]
+    after: list[str] = field(default_factory=list)
+    # Skipped (and treated as done) when this returns False for the configuration
+    when: Optional[Callable[[dict], bool]] = None
+
+
+# The installation performed by "make all". Steps that write GENERATED_DIR
+# run one after another: prepare-manifests recreates it before
+# cluster-install reads it, prepare-dpf-manifests renders into it once the
+# cluster is reachable (prepare_nfs looks up control plane nodes with oc),
+# and apply-dpf-manifests applies every file in it.
+STEPS = [
+    Step("verify-files", ["scripts/utils.sh", "verify-files"]),
+    Step("check-cluster", ["scripts/cluster.sh", "check-create-cluster"], ["verify-files"]),
+    Step("download-iso", ["scripts/cluster.sh", "download-iso"], ["check-cluster"]),
+    Step("create-vms", ["scripts/vm.sh", "create"], ["download-iso"]),
+    Step("prepare-manifests", ["scripts/manifests.sh", "prepare-manifests"], ["check-cluster"]),
+    Step("cluster-install", ["scripts/cluster.sh", "cluster-install"],
+         ["create-vms", "prepare-manifests"]),
+    Step("update-etc-hosts", ["scripts/update-etc-hosts.sh", "update_etc_hosts"],
+         ["cluster-install"]),
+    Step("kubeconfig", ["scripts/cluster.sh", "get-kubeconfig"], ["cluster-install"]),
+    Step("verify-cluster-access", ["scripts/dpf.sh", "verify-cluster-access"],
+         ["kubeconfig", "update-etc-hosts"]),
+    Step("prepare-dpf-manifests", ["scripts/manifests.sh", "prepare-dpf-manifests"],
+         ["prepare-manifests", "verify-cluster-access"]),
+    Step("apply-namespaces", ["scripts/dpf.sh", "apply-namespaces"],
+         ["verify-cluster-access", "prepare-dpf-manifests"]),
+    Step("deploy-argocd", ["scripts/dpf.sh", "deploy-argocd"], ["apply-namespaces"],
+         when=dpf_requires_argocd),
+    Step("deploy-maintenance-operator", ["scripts/dpf.sh", "deploy-maintenance-operator"],
+         ["apply-namespaces"], when=dpf_requires_argocd),
+    Step("enable-ip-forwarding", ["scripts/dpf.sh", "enable-ip-forwarding"],
+         ["verify-cluster-access"]),
+    Step("deploy-nfd", ["scripts/dpf.sh", "deploy-nfd"],
+         ["verify-cluster-access", "prepare-dpf-manifests"]),
+    Step("deploy-cert-manager", ["scripts/dpf.sh", "deploy-cert-manager"], ["apply-namespaces"]),
+    Step("install-dpf-operator", ["scripts/dpf.sh", "install-dpf-operator"],
+         ["deploy-cert-manager"]),
+    Step("create-hosted-cluster", ["scripts/dpf.sh", "create-hosted-cluster"],
+         ["apply-namespaces"]),
+    Step("apply-dpf-manifests", ["scripts/dpf.sh", "apply-dpf-manifests"],
+         ["install-dpf-operator", "deploy-argocd", "deploy-maintenance-operator",
+          "enable-ip-forwarding", "deploy-nfd", "create-hosted-cluster"]),
+    Step("configure-hypershift", ["scripts/dpf.sh", "configure-hypershift"],
+         ["apply-dpf-manifests"]),
+    Step("wait-dpf-operator", ["scripts/dpf.sh", "wait-dpf-operator"], ["apply-dpf-manifests"]),
+    Step("deploy-dpf", None, ["configure-hypershift", "wait-dpf-operator"]),
+    Step("prepare-dpu-files", ["scripts/post-install.sh", "prepare"],
+         ["kubeconfig", "prepare-dpf-manifests"]),
+    Step("deploy-dpu-services", ["scripts/post-install.sh", "apply"],
+         ["deploy-dpf", "prepare-dpu-files"]),
+    Step("enable-ovn-injector", ["scripts/enable-ovn-injector.sh"], ["deploy-dpf"]),
+    Step("all", None, ["deploy-dpu-services", "enable-ovn-injector"]),
+]
+
+
+def load_config(env: dict) -> dict:
+    """
+    Resolves CONFIG_VARS the way the scripts see them, by sourcing env.sh.
+    """
+    script = "source scripts/env.sh >/dev/null && " + " && ".join(
+        f'printf "%s\\0" "${{{name}:-}}"' for name in CONFIG_VARS)
+    out = subprocess.run(["bash", "-c", script], cwd=REPO_DIR, env=env, check=True,
+                         stdout=subprocess.PIPE, text=True).stdout
+    return dict(zip(CONFIG_VARS, out.split("\0")))
+
+
+def env_digest(path: str = ENV_FILE) -> str:
+    """
+    Returns a short hash of the .env file that keys the checkpoints.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        data = b""
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+class Checkpoints:
+    """
+    Completed steps of one configuration, stored as JSON.
+    """
+
+    def __init__(self, state_dir: str):
+        self.state_dir = state_dir
+        self.path = os.path.join(state_dir, "checkpoints.json")
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self.steps: dict[str, dict] = json.load(f)
+        except FileNotFoundError:
+            self.steps = {}
+
+    def is_done(self, step: Step) -> bool:
+        record = self.steps.get(step.name)
+        return bool(record) and record.get("command") == step.command
+
+    def mark_done(self, step: Step, seconds: float) -> None:
+        with self._lock:
+            self.steps[step.name] = {"command": step.command, "seconds": round(seconds, 1),
+                                     "finished": int(time.time())}
+            self._save()
+
+    def clear(self, names: list[str]) -> None:
+        with self._lock:
+            for name in names:
+                self.steps.pop(name, None)
+            self._save()
+
+    def _save(self) -> None:
+        os.makedirs(self.state_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.state_dir, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.steps, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+class Pipeline:
+    def __init__(self, steps: list[Step], checkpoints: Checkpoints, jobs: int = DEFAULT_JOBS,
+                 keep_going: bool = False, env: Optional[dict] = None):
+        self.steps = {step.name: step for step in steps}
+        self.checkpoints = checkpoints
+        self.jobs = max(1, jobs)
+        self.keep_going = keep_going
+        self.env = dict(os.environ if env is None else env)
+        self._print_lock = threading.Lock()
+        for step in steps:
+            for dep in step.after:
+                if dep not in self.steps:
+                    raise Exception(f"Step {step.name} depends on unknown step {dep}")
+
+    def select(self, targets: list[str]) -> list[str]:
+        """
+        Returns the targets and everything they depend on, in dependency order.
+        """
+        order: list[str] = []
+        visiting: set[str] = set()
+
+        def visit(name: str) -> None:
+            if name in order:
+                return
+            if name not in self.steps:
+                raise Exception(f"Unknown step {name}")
+            if name in visiting:
+                raise Exception(f"Dependency cycle at step {name}")
+            visiting.add(name)
+            for dep in self.steps[name].after:
+                visit(dep)
+            visiting.discard(name)
+            order.append(name)
+
+        for target in targets:
+            visit(target)
+        return order
+
+    def _log(self, name: str, line: str) -> None:
+        with self._print_lock:
+            sys.stdout.write(f"[{name}] {line}")
+            if not line.endswith("\n"):
+                sys.stdout.write("\n")
+            sys.stdout.flush()
+
+    def _execute(self, step: Step) -> None:
+        os.makedirs(self.checkpoints.state_dir, exist_ok=True)
+        log_path = os.path.join(self.checkpoints.state_dir, f"{step.name}.log")
+        start = time.monotonic()
+        self._log(step.name, f"starting: {' '.join(step.command)}")
+        with open(log_path, "a") as log:
+            log.write(f"=== {time.strftime('%Y-%m-%d %H:%M:%S')} {' '.join(step.command)}\n")
+            proc = subprocess.Popen(step.command, cwd=REPO_DIR, env=self.env,
+                                    stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, text=True, errors="replace")
+            for line in proc.stdout:
+                log.write(line)
+                self._log(step.name, line)
+            rc = proc.wait()
+        seconds = time.monotonic() - start
+        if rc != 0:
+            raise Exception(f"exited with status {rc} after {seconds:.0f}s (log: {log_path})")
+        self.checkpoints.mark_done(step, seconds)
+        self._log(step.name, f"done in {seconds:.0f}s")
+
+    def run(self, targets: list[str]) -> bool:
+        """
+        Runs the targets and their dependencies, skipping checkpointed steps.
+        Returns:
+            bool: Whether every selected step completed
+        """
+        selected = self.select(targets)
+        config = load_config(self.env) if any(self.steps[n].when for n in selected) else {}
+        done: set[str] = set()
+        failed: dict[str, str] = {}
+        for name in selected:
+            step = self.steps[name]
+            if step.command is not None and self.checkpoints.is_done(step):
+                print(f"Skipping {name} (checkpointed)")
+                done.add(name)
+            elif step.when is not None and not step.when(config):
+                print(f"Skipping {name} (not needed for this configuration)")
+                done.add(name)
+
+        running: dict[Future, str] = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            while True:
+                stop = failed and not self.keep_going
+                for name in selected:
+                    if stop or len(running) >= self.jobs:
+                        break
+                    step = self.steps[name]
+                    if (name in done or name in failed or name in running.values()
+                            or not all(dep in done for dep in step.after)):
+                        continue
+                    if step.command is None:
+                        done.add(name)
+                        continue
+                    running[pool.submit(self._execute, step)] = name
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                        done.add(name)
+                    except Exception as e:
+                        failed[name] = str(e)
+                        self._log(name, f"FAILED: {e}")
+
+        blocked = [name for name in selected if name not in done and name not in failed]
+        for name, error in failed.items():
+            print(f"Step {name} failed: {error}")
+        if blocked:
+            print(f"Not run: {', '.join(blocked)}")
+        if not failed and not blocked:
+            print(f"Pipeline complete: {', '.join(targets)}")
+        return not failed and not blocked
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description='Run the installation steps as a dependency graph with checkpoints')
+    parser.add_argument('action', choices=['run', 'status', 'graph'], nargs='?', default='run')
+    parser.add_argument('targets', nargs='*', default=['all'],
+                        help='Steps to run, with their dependencies (default: all)')
+    parser.add_argument('--jobs', '-j', type=int, default=DEFAULT_JOBS,
+                        help=f'Maximum steps running at once (default: {DEFAULT_JOBS})')
+    parser.add_argument('--keep-going', '-k', action='store_true',
+                        help='Keep running independent steps after a failure')
+    parser.add_argument('--rerun', action='append', default=[], metavar='STEP',
+                        help='Clear the checkpoint of STEP so it runs again; may be repeated')
+    parser.add_argument('--reset', action='store_true',
+                        help='Clear all checkpoints of the current configuration')
+    args = parser.parse_args()
+
+    state_dir = os.path.join(LOG_DIR, f"pipeline-{env_digest()}")
+    checkpoints = Checkpoints(state_dir)
+    pipeline = Pipeline(STEPS, checkpoints, args.jobs, args.keep_going)
+
+    if args.action == 'graph':
+        for name in pipeline.select(args.targets):
+            step = pipeline.steps[name]
+            print(f"{name}: {' '.join(step.after) or '-'}")
+        return 0
+    if args.action == 'status':
+        for name in pipeline.select(args.targets):
+            step = pipeline.steps[name]
+            if step.command is None:
+                continue
+            state = "pending"
+            if checkpoints.is_done(step):
+                state = f"done ({checkpoints.steps[name]['seconds']}s)"
+            print(f"{name:<28} {state}")
+        print(f"Checkpoints: {checkpoints.path}")
+        return 0
+
+    if args.reset:
+        checkpoints.clear(list(checkpoints.steps))
+    if args.rerun:
+        pipeline.select(args.rerun)
+        checkpoints.clear(args.rerun)
+    print(f"Checkpoints: {checkpoints.path}")
+    return 0 if pipeline.run(args.targets) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -19,238 +19,110 @@ GENERATED_POST_INSTALL_DIR="${GENERATED_DIR}/post-install"
 # BFB Configuration with defaults
 BFB_URL=${BFB_URL:-"http://10.8.2.236/bfb/rhcos_4.19.0-ec.4_installer_2025-04-23_07-48-42.bfb"}
 
+# Local BFB cache (BFB_PREFETCH=true): the BFB is downloaded once into
+# BFB_CACHE_DIR and the BFB object points at its copy under BFB_CACHE_URL
+BFB_PREFETCH=${BFB_PREFETCH:-"false"}
+BFB_CACHE_UNAVAILABLE=2
+
 # HBN OVN Configuration with defaults
 HBN_OVN_NETWORK=${HBN_OVN_NETWORK:-"10.0.120.0/22"}
 
 # Ensure directories exist
 mkdir -p "${GENERATED_POST_INSTALL_DIR}"
 
-# List of files that need special processing (excluded from direct copy)
-SPECIAL_FILES=(
-    "bfb.yaml"
-    "hbn-ovn-ipam.yaml"
-    "dpu-service-nads.yaml"
-    "dpuflavor-1500.yaml"
-    "dpuflavor-9000.yaml"
-    "dpuflavor.yaml"
-    "sriov-policy.yaml"
-    "ovn-template.yaml"
-    "ovn-configuration.yaml"
-    "hbn-template.yaml"
-    "hbn-configuration.yaml"
-    "dts-template.yaml"
-    "blueman-template.yaml"
-    "dpu-node-ipam-controller.yaml"
-    "dpudeployment.yaml"
-)
-
-# Function to update BFB manifest
-function update_bfb_manifest() {
-    log [INFO] "Updating BFB manifest..."
-    # Extract filename from URL
-    local bfb_filename=$(basename "${BFB_URL}")
-    # Copy the file
-    cp "${POST_INSTALL_DIR}/bfb.yaml" "${GENERATED_POST_INSTALL_DIR}/bfb.yaml"
-    # Update the manifest with custom values (escape special characters)
-    local escaped_filename=$(escape_sed_replacement "${bfb_filename}")
-    local escaped_url=$(escape_sed_replacement "${BFB_URL}")
-    sed -i "s|<BFB_FILENAME>|${escaped_filename}|g" "${GENERATED_POST_INSTALL_DIR}/bfb.yaml"
-    sed -i "s|<BFB_URL>|\"${escaped_url}\"|g" "${GENERATED_POST_INSTALL_DIR}/bfb.yaml"
-    log [INFO] "BFB manifest updated successfully"
+# Download BFB_URL into the local BFB cache and point BFB_URL at the cached copy
+function prefetch_bfb() {
+    if [ "${BFB_PREFETCH}" != "true" ]; then
+        return 0
+    fi
+    log [INFO] "Prefetching ${BFB_URL} into the BFB cache..."
+    local local_url rc=0
+    local_url=$(python3 "$(dirname "${BASH_SOURCE[0]}")/bfb_cache.py" fetch "${BFB_URL}") || rc=$?
+    if [ "$rc" -eq "$BFB_CACHE_UNAVAILABLE" ]; then
+        log [WARN] "BFB_CACHE_URL is not set, the BFB is downloaded from ${BFB_URL}"
+        return 0
+    elif [ "$rc" -ne 0 ]; then
+        log [ERROR] "Failed to prefetch ${BFB_URL}"
+        return 1
+    fi
+    log [INFO] "BFB served from the local cache at ${local_url}"
+    BFB_URL="${local_url}"
 }
 
-# Function to update HBN OVN manifests
-function update_hbn_ovn_manifests() {
-    log [INFO] "Updating HBN OVN manifests..."
+# Function to prepare post-installation manifests
+function prepare_post_installation() {
+    log [INFO] "Starting post-installation manifest preparation..."
     
+    # Check if post-installation directory exists
+    if [ ! -d "${POST_INSTALL_DIR}" ]; then
+        log [ERROR] "Post-installation directory not found: ${POST_INSTALL_DIR}"
+        exit 1
+    fi
+    get_kubeconfig
+
     # DPU_HOST_CIDR must be set by user
     if [ -z "${DPU_HOST_CIDR}" ]; then
         log [ERROR] "DPU_HOST_CIDR environment variable is not set. Please set it to the DPU nodes subnet (e.g., 10.6.135.0/24)"
         return 1
     fi
-    # Update hbn-ovn-ipam.yaml
-    update_file_multi_replace \
-        "${POST_INSTALL_DIR}/hbn-ovn-ipam.yaml" \
-        "${GENERATED_POST_INSTALL_DIR}/hbn-ovn-ipam.yaml" \
-        "<HBN_OVN_NETWORK>" \
-        "${HBN_OVN_NETWORK}"
-    
-    # Skip ovn-dpuservice.yaml - now handled by DPUDeployment
-    # Services are now managed through DPUDeployment with templates and configurations
-    
-    # Update ovn-template.yaml for DPUDeployment
-    if [ -f "${POST_INSTALL_DIR}/ovn-template.yaml" ]; then
-        update_file_multi_replace \
-            "${POST_INSTALL_DIR}/ovn-template.yaml" \
-            "${GENERATED_POST_INSTALL_DIR}/ovn-template.yaml" \
-            "<DPF_VERSION>" "${DPF_VERSION}" \
-            "<OVN_CHART_VERSION>" "${OVN_CHART_VERSION}" \
-            "<OVN_TEMPLATE_CHART_URL>" "${OVN_TEMPLATE_CHART_URL}" \
-            "<OVN_KUBERNETES_IMAGE_REPO>" "${OVN_KUBERNETES_IMAGE_REPO}" \
-            "<OVN_KUBERNETES_IMAGE_TAG>" "${OVN_KUBERNETES_IMAGE_TAG}" \
-            "<OVN_KUBERNETES_UTILS_IMAGE_REPO>" "${OVN_KUBERNETES_UTILS_IMAGE_REPO}" \
-            "<OVN_KUBERNETES_UTILS_IMAGE_TAG>" "${OVN_KUBERNETES_UTILS_IMAGE_TAG}" \
-            "<OVN_CHART_URL>" "${OVN_CHART_URL}"
-    fi
-
-    # Update ovn-configuration.yaml for DPUDeployment
-    if [ -f "${POST_INSTALL_DIR}/ovn-configuration.yaml" ]; then
-        local ovn_mtu=""
 
-        if [ "$NODES_MTU" != "1500" ]; then
-            ovn_mtu=$((NODES_MTU - 60))
-        else
-            ovn_mtu=1400
-        fi
-        log "INFO" "ovn-configuration will be set with MTU:$ovn_mtu"
-        update_file_multi_replace \
-            "${POST_INSTALL_DIR}/ovn-configuration.yaml" \
-            "${GENERATED_POST_INSTALL_DIR}/ovn-configuration.yaml" \
-            "<HBN_OVN_NETWORK>" "${HBN_OVN_NETWORK}" \
-            "<HOST_CLUSTER_API>" "${HOST_CLUSTER_API}" \
-            "<DPU_HOST_CIDR>" "${DPU_HOST_CIDR}" \
-            "<NODES_MTU>" "${ovn_mtu}"
-    fi
-    
-    # Update hbn-configuration.yaml 
-    if [ -f "${POST_INSTALL_DIR}/hbn-configuration.yaml" ]; then
-        update_file_multi_replace \
-            "${POST_INSTALL_DIR}/hbn-configuration.yaml" \
-            "${GENERATED_POST_INSTALL_DIR}/hbn-configuration.yaml"
+    # Validate DPF_VERSION is set
+    if [ -z "$DPF_VERSION" ]; then
+        log [ERROR] "DPF_VERSION is not set. Required for service template updates"
+        return 1
     fi
 
-    log [INFO] "HBN OVN manifests updated successfully"
-}
+    local ovn_mtu=1400
+    if [ "$NODES_MTU" != "1500" ]; then
+        ovn_mtu=$((NODES_MTU - 60))
+    fi
+    log "INFO" "ovn-configuration will be set with MTU:$ovn_mtu"
 
-# Function to update VF configuration
-function update_vf_configuration() {
-    log [INFO] "Updating VF configuration in manifests..."
-    
-    # Calculate VF range upper bound
-    local vf_range_upper=$((NUM_VFS - 1))
+    prefetch_bfb
 
+    # dpuflavor.yaml is rendered from the flavor matching the node MTU
+    local mtu_source_file="dpuflavor-9000.yaml"
+    local other_flavor_file="dpuflavor-1500.yaml"
     if [ "$NODES_MTU" == "1500" ]; then
         mtu_source_file="dpuflavor-1500.yaml"
-    else
-        mtu_source_file="dpuflavor-9000.yaml"
+        other_flavor_file="dpuflavor-9000.yaml"
     fi
-
     log "INFO" "Creating unified dpuflavor.yaml from $mtu_source_file for MTU $NODES_MTU"
-    
-    # Copy and process the appropriate source file as dpuflavor.yaml
-    update_file_multi_replace \
-        "${POST_INSTALL_DIR}/$mtu_source_file" \
-        "${GENERATED_POST_INSTALL_DIR}/dpuflavor.yaml" \
-        "<NUM_VFS>" "${NUM_VFS}"
-    
-    # Update sriov-policy.yaml
-
-    update_file_multi_replace \
-        "${POST_INSTALL_DIR}/sriov-policy.yaml" \
-        "${GENERATED_POST_INSTALL_DIR}/sriov-policy.yaml" \
-        "<DPU_INTERFACE>" "$DPU_INTERFACE" \
-        "<NUM_VFS>" "${NUM_VFS}" \
-        "<NUM_VFS-1>" "${vf_range_upper}"
-    
-    log [INFO] "VF configuration updated successfully"
-}
 
-# Function to update service template versions
-function update_service_templates() {
-    log [INFO] "Updating service template versions..."
-    
-    # Validate DPF_VERSION is set
-    if [ -z "$DPF_VERSION" ]; then
-        log [ERROR] "DPF_VERSION is not set. Required for service template updates"
+    # Render every post-installation manifest in one pass
+    if ! render_manifests "${POST_INSTALL_DIR}" "${GENERATED_POST_INSTALL_DIR}" \
+        --rename "${mtu_source_file}=dpuflavor.yaml" \
+        --exclude "${other_flavor_file}" \
+        --set "BFB_FILENAME=$(basename "${BFB_URL}")" \
+        --set "BFB_URL=\"${BFB_URL}\"" \
+        --set "HBN_OVN_NETWORK=${HBN_OVN_NETWORK}" \
+        --set "HOST_CLUSTER_API=${HOST_CLUSTER_API}" \
+        --set "DPU_HOST_CIDR=${DPU_HOST_CIDR}" \
+        --set "NODES_MTU=${ovn_mtu}" \
+        --set "SVC_MTU=${NODES_MTU}" \
+        --set "DPU_INTERFACE=${DPU_INTERFACE}" \
+        --set "NUM_VFS=${NUM_VFS}" \
+        --set "NUM_VFS-1=$((NUM_VFS - 1))" \
+        --set "DPF_VERSION=${DPF_VERSION}" \
+        --set "OVN_CHART_VERSION=${OVN_CHART_VERSION}" \
+        --set "OVN_TEMPLATE_CHART_URL=${OVN_TEMPLATE_CHART_URL}" \
+        --set "OVN_CHART_URL=${OVN_CHART_URL}" \
+        --set "OVN_KUBERNETES_IMAGE_REPO=${OVN_KUBERNETES_IMAGE_REPO}" \
+        --set "OVN_KUBERNETES_IMAGE_TAG=${OVN_KUBERNETES_IMAGE_TAG}" \
+        --set "OVN_KUBERNETES_UTILS_IMAGE_REPO=${OVN_KUBERNETES_UTILS_IMAGE_REPO}" \
+        --set "OVN_KUBERNETES_UTILS_IMAGE_TAG=${OVN_KUBERNETES_UTILS_IMAGE_TAG}" \
+        --set "HBN_HELM_REPO_URL=${HBN_HELM_REPO_URL}" \
+        --set "HBN_HELM_CHART_VERSION=${HBN_HELM_CHART_VERSION}" \
+        --set "HBN_IMAGE_REPO=${HBN_IMAGE_REPO}" \
+        --set "HBN_IMAGE_TAG=${HBN_IMAGE_TAG}" \
+        --set "DTS_HELM_REPO_URL=${DTS_HELM_REPO_URL}" \
+        --set "DTS_HELM_CHART_VERSION=${DTS_HELM_CHART_VERSION}" \
+        --set "HOSTED_CONTROL_PLANE_NAMESPACE=${HOSTED_CONTROL_PLANE_NAMESPACE}" \
+        --set "HOSTED_CLUSTER_NAME=${HOSTED_CLUSTER_NAME}"; then
+        log [ERROR] "Failed to render post-installation manifests"
         return 1
     fi
     
-    # Update all service templates with DPF_VERSION if they exist
-    local templates=("hbn-template.yaml" "dts-template.yaml" "blueman-template.yaml")
-    
-    for template in "${templates[@]}"; do
-        if [ -f "${POST_INSTALL_DIR}/${template}" ]; then
-            # HBN template needs helm repo URL, version, and image configuration
-            if [[ "${template}" == "hbn-template.yaml" ]]; then
-                update_file_multi_replace \
-                    "${POST_INSTALL_DIR}/${template}" \
-                    "${GENERATED_POST_INSTALL_DIR}/${template}" \
-                    "<HBN_HELM_REPO_URL>" "${HBN_HELM_REPO_URL}" \
-                    "<HBN_HELM_CHART_VERSION>" "${HBN_HELM_CHART_VERSION}" \
-                    "<HBN_IMAGE_REPO>" "${HBN_IMAGE_REPO}" \
-                    "<HBN_IMAGE_TAG>" "${HBN_IMAGE_TAG}"
-                log [INFO] "Updated ${template} with HBN helm and image configuration"
-            # DTS template needs helm repo URL and version
-            elif [[ "${template}" == "dts-template.yaml" ]]; then
-                update_file_multi_replace \
-                    "${POST_INSTALL_DIR}/${template}" \
-                    "${GENERATED_POST_INSTALL_DIR}/${template}" \
-                    "<DTS_HELM_REPO_URL>" "${DTS_HELM_REPO_URL}" \
-                    "<DTS_HELM_CHART_VERSION>" "${DTS_HELM_CHART_VERSION}"
-                log [INFO] "Updated ${template} with DTS helm configuration"
-            else
-                update_file_multi_replace \
-                    "${POST_INSTALL_DIR}/${template}" \
-                    "${GENERATED_POST_INSTALL_DIR}/${template}" \
-                    "<DPF_VERSION>" "${DPF_VERSION}"
-                log [INFO] "Updated ${template} with DPF_VERSION"
-            fi
-        fi
-    done
-    
-    # Update IPAM controller manifest
-    if [ -f "${POST_INSTALL_DIR}/dpu-node-ipam-controller.yaml" ]; then
-        update_file_multi_replace \
-            "${POST_INSTALL_DIR}/dpu-node-ipam-controller.yaml" \
-            "${GENERATED_POST_INSTALL_DIR}/dpu-node-ipam-controller.yaml" \
-            "<HOSTED_CONTROL_PLANE_NAMESPACE>" "${HOSTED_CONTROL_PLANE_NAMESPACE}" \
-            "<HOSTED_CLUSTER_NAME>" "${HOSTED_CLUSTER_NAME}"
-        log [INFO] "Updated dpu-node-ipam-controller.yaml with namespace and cluster name"
-    fi
-    
-    log [INFO] "Service template versions updated successfully"
-}
-
-
-
-function update_dpu_service_nad() {
-   local svc_file="dpu-service-nads.yaml" 
-
-   if [ -f "${POST_INSTALL_DIR}/${svc_file}" ]; then
-       update_file_multi_replace \
-         "${POST_INSTALL_DIR}/${svc_file}" \
-         "${GENERATED_POST_INSTALL_DIR}/${svc_file}" \
-         "<SVC_MTU>" "${NODES_MTU}"
-   fi
-
-   log [INFO] "Updated ${svc_file} with MTU: ${NODES_MTU}"
-}
-
-# Function to prepare post-installation manifests
-function prepare_post_installation() {
-    log [INFO] "Starting post-installation manifest preparation..."
-    
-    # Check if post-installation directory exists
-    if [ ! -d "${POST_INSTALL_DIR}" ]; then
-        log [ERROR] "Post-installation directory not found: ${POST_INSTALL_DIR}"
-        exit 1
-    fi
-    get_kubeconfig
-    # Update manifests with custom values
-    update_bfb_manifest
-    update_hbn_ovn_manifests
-    update_vf_configuration
-    update_service_templates
-    update_dpu_service_nad
-    
-    # Copy DPUDeployment
-    if [ -f "${POST_INSTALL_DIR}/dpudeployment.yaml" ]; then
-        cp "${POST_INSTALL_DIR}/dpudeployment.yaml" "${GENERATED_POST_INSTALL_DIR}/dpudeployment.yaml"
-    fi
-
-    # Copy remaining manifests using utility function (exclude special files)
-    copy_manifests_with_exclusions "${POST_INSTALL_DIR}" "${GENERATED_POST_INSTALL_DIR}" "${SPECIAL_FILES[@]}"
-    
     log [INFO] "Post-installation manifest preparation completed successfully"
 }
 
@@ -273,6 +145,16 @@ function apply_post_installation() {
     local webhook_ready=false
     local max_attempts=30
     local attempt=0
+
+    local rc=0
+    dpfwait $((max_attempts * 5)) \
+        "endpoints-populated:endpoints/dpf-operator-system/dpf-provisioning-webhook-service" || rc=$?
+    if [ "$rc" -eq 0 ]; then
+        log [INFO] "DPF provisioning webhook service is ready"
+        webhook_ready=true
+    elif [ "$rc" -ne "$DPFWAIT_UNAVAILABLE" ]; then
+        attempt=$max_attempts
+    fi
     
     while [ $attempt -lt $max_attempts ] && [ "$webhook_ready" = "false" ]; do
         attempt=$((attempt + 1))
@@ -300,39 +182,95 @@ function apply_post_installation() {
         fi
     fi
     
-    # Apply each YAML file in the generated post-installation directory
+    # dpu-services-scc.yaml goes to the hosted cluster when its kubeconfig exists
+    local scc_file="${GENERATED_POST_INSTALL_DIR}/dpu-services-scc.yaml"
+    local hosted_scc=false
+    if [ -f "$scc_file" ] && [ -f "${HOSTED_CLUSTER_NAME}.kubeconfig" ]; then
+        hosted_scc=true
+    fi
+
+    local files=()
     for file in "${GENERATED_POST_INSTALL_DIR}"/*.yaml; do
-        if [ -f "$file" ]; then
-            local filename=$(basename "$file")
+        if [ -f "$file" ] && { [ "$hosted_scc" = "false" ] || [ "$file" != "$scc_file" ]; }; then
+            files+=("$file")
+        fi
+    done
+
+    if [ "$hosted_scc" = "true" ]; then
+        log [INFO] "Applying SCC to hosted cluster: $(basename "$scc_file")"
+        local rc=0
+        KUBECONFIG="${HOSTED_CLUSTER_NAME}.kubeconfig" bulk_apply "$scc_file" || rc=$?
+        if [ "$rc" -eq "$BULK_APPLY_UNAVAILABLE" ]; then
+            KUBECONFIG="${HOSTED_CLUSTER_NAME}.kubeconfig" apply_manifest "$scc_file" "true"
+        elif [ "$rc" -ne 0 ]; then
+            return 1
+        fi
+    fi
+
+    # Applied in dependency order by kind, with dpudeployment.yaml last
+    log [INFO] "Applying ${#files[@]} post-installation manifests..."
+    local rc=0
+    bulk_apply "${files[@]}" || rc=$?
+    if [ "$rc" -eq "$BULK_APPLY_UNAVAILABLE" ]; then
+        for file in "${files[@]}"; do
             # Skip dpudeployment.yaml as it will be applied last
-            if [[ "${filename}" != "dpudeployment.yaml" ]]; then
-                # Special handling for SCC - must be applied to hosted cluster
-                if [[ "${filename}" == "dpu-services-scc.yaml" ]] && [[ -f "${HOSTED_CLUSTER_NAME}.kubeconfig" ]]; then
-                    log [INFO] "Applying SCC to hosted cluster: ${filename}"
-                    local saved_kubeconfig="${KUBECONFIG}"
-                    export KUBECONFIG="${HOSTED_CLUSTER_NAME}.kubeconfig"
-                    apply_manifest "$file" "true"
-                    export KUBECONFIG="${saved_kubeconfig}"
-                else
-                    log [INFO] "Applying post-installation manifest: ${filename}"
-                    apply_manifest "$file" "true"
-                fi
+            if [[ "$(basename "$file")" != "dpudeployment.yaml" ]]; then
+                log [INFO] "Applying post-installation manifest: $(basename "$file")"
+                apply_manifest "$file" "true"
             fi
+        done
+
+        # Apply dpudeployment.yaml last if it exists, with apply_always=true
+        if [ -f "${GENERATED_POST_INSTALL_DIR}/dpudeployment.yaml" ]; then
+            log [INFO] "Applying dpudeployment.yaml (last manifest)..."
+            apply_manifest "${GENERATED_POST_INSTALL_DIR}/dpudeployment.yaml" "true"
         fi
-    done
-    
-    # Apply dpudeployment.yaml last if it exists, with apply_always=true
-    if [ -f "${GENERATED_POST_INSTALL_DIR}/dpudeployment.yaml" ]; then
-        log [INFO] "Applying dpudeployment.yaml (last manifest)..."
-        apply_manifest "${GENERATED_POST_INSTALL_DIR}/dpudeployment.yaml" "true"
-    else
+    elif [ "$rc" -ne 0 ]; then
+        log [ERROR] "Failed to apply post-installation manifests"
+        return 1
+    fi
+
+    if [ ! -f "${GENERATED_POST_INSTALL_DIR}/dpudeployment.yaml" ]; then
         log [WARN] "dpudeployment.yaml not found in ${GENERATED_POST_INSTALL_DIR}"
     fi
     
     log [INFO] "Post-installation manifest application completed successfully"
 }
 
+# Re-provision the DPUs in batches (REDEPLOY_MODE=rolling): the manifests are
+# applied in place, then dpu_redeploy.py drains each batch of hosts, recreates
+# their DPUs and waits for them to be Ready before the next batch.
+function rolling_redeploy() {
+    log [INFO] "Redeploying DPUs in batches of ${REDEPLOY_BATCH_SIZE:-1} node(s), at most ${REDEPLOY_MAX_UNAVAILABLE:-1} unavailable..."
+    prepare_post_installation
+    apply_post_installation
+
+    local args=(--batch-size "${REDEPLOY_BATCH_SIZE:-1}"
+                --max-unavailable "${REDEPLOY_MAX_UNAVAILABLE:-1}"
+                --timeout "${REDEPLOY_TIMEOUT:-3600}")
+    if [ "${REDEPLOY_MAINTENANCE:-true}" != "true" ]; then
+        args+=(--no-maintenance)
+    fi
+    mkdir -p logs
+    local rc=0
+    python3 "$(dirname "${BASH_SOURCE[0]}")/dpu_redeploy.py" "${args[@]}" \
+        --json "logs/dpu-redeploy-$(date +%Y%m%d_%H%M%S).json" || rc=$?
+    if [ "$rc" -eq 2 ]; then
+        log [ERROR] "Rolling redeploy needs API access; use REDEPLOY_MODE=all to redeploy every DPU at once"
+        return 1
+    elif [ "$rc" -ne 0 ]; then
+        log [ERROR] "Rolling redeploy stopped; the hosts of the failed batch stay in maintenance until the NodeMaintenance objects listed above are released"
+        return 1
+    fi
+    log [INFO] "Rolling redeploy completed successfully"
+}
+
 function redeploy() {
+    if [ "${REDEPLOY_MODE:-all}" = "rolling" ]; then
+        rolling_redeploy
+        return
+    fi
+
     log [INFO] "Redeploying DPU..."
     prepare_post_installation
 
@@ -341,7 +279,13 @@ function redeploy() {
     oc delete -f "${GENERATED_POST_INSTALL_DIR}/bfb.yaml" || true
 
     # wait till all dpu are removed
-    if ! retry 60 5 oc wait --for=delete dpu -A --all; then
+    local rc=0
+    dpfwait 300 "deleted:dpu/*/*" || rc=$?
+    if [ "$rc" -eq "$DPFWAIT_UNAVAILABLE" ]; then
+        rc=0
+        retry 60 5 oc wait --for=delete dpu -A --all || rc=$?
+    fi
+    if [ "$rc" -ne 0 ]; then
         log [ERROR] "Failed to wait for DPU deletion"
         return 1
     fi
@@ -355,7 +299,7 @@ function redeploy() {
 # If script is executed directly (not sourced), run the appropriate function
 if [[ "${BASH_SOURCE[0]}" == "${0}" ]]; then
     if [ $# -lt 1 ]; then
-        log [ERROR] "Usage: $0 <prepare|apply|redeploy>"
+        log [ERROR] "Usage: $0 <prepare|apply|redeploy|prefetch-bfb>"
         exit 1
     fi
     
@@ -369,9 +313,12 @@ if [[ "${BASH_SOURCE[0]}" == "${0}" ]]; then
         redeploy)
             redeploy
             ;;
+        prefetch-bfb)
+            BFB_PREFETCH=true prefetch_bfb
+            ;;
         *)
             log [ERROR] "Unknown command: $1"
-            log [ERROR] "Available commands: prepare, apply, redeploy"
+            log [ERROR] "Available commands: prepare, apply, redeploy, prefetch-bfb"
             exit 1
             ;;
     esac
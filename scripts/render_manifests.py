@@ -0,0 +1,207 @@
+#!/usr/bin/python3
+"""
+Renders manifest templates in a single pass.
+
+Placeholders are <NAME> tokens (upper case, digits, "_" and "-"). The
+variable context is built once from --set and --set-base64-file, every
+template is read once, all placeholders are substituted in one regex pass
+and each output is written once. Substituted values are not scanned again,
+so a value that happens to contain "<...>" is left alone.
+
+Rendering fails, and writes nothing, if any placeholder is left without a
+value. SOURCE may be a directory, rendering every *.yaml and *.yml in it
+(files render in parallel), or a single template, with OUTPUT the file to
+write.
+"""
+
+import argparse
+import base64
+import fnmatch
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+PLACEHOLDER = re.compile(r"<([A-Z][A-Z0-9_-]*)>")
+MANIFEST_PATTERNS = ("*.yaml", "*.yml")
+DEFAULT_JOBS = 8
+
+
+@dataclass
+class Edits:
+    """
+    File specific edits, keyed by output file name, applied before the
+    placeholders.
+    """
+    replace: dict[str, list[tuple[str, str]]] = field(default_factory=dict)
+    delete_lines: dict[str, list[str]] = field(default_factory=dict)
+    append: dict[str, list[str]] = field(default_factory=dict)
+
+
+@dataclass
+class Rendered:
+    source: str
+    output: str
+    text: str
+    leftovers: list[str]
+
+
+def render_text(text: str, context: dict[str, str]) -> tuple[str, list[str]]:
+    """
+    Substitutes every placeholder found in the context.
+    Args:
+        text: The template text
+        context: Placeholder names (without brackets) to values
+    Returns:
+        tuple: The rendered text and the "line N: <NAME>" placeholders left
+    """
+    leftovers = []
+
+    def substitute(match: re.Match) -> str:
+        value = context.get(match.group(1))
+        if value is None:
+            line = text.count("\n", 0, match.start()) + 1
+            leftovers.append(f"line {line}: {match.group(0)}")
+            return match.group(0)
+        return value
+
+    return PLACEHOLDER.sub(substitute, text), leftovers
+
+
+def render_file(source: str, output: str, context: dict[str, str], edits: Edits) -> Rendered:
+    with open(source) as f:
+        text = f.read()
+    name = os.path.basename(output)
+    for old, new in edits.replace.get(name, []):
+        if old not in text:
+            raise Exception(f"{source}: {old!r} not found")
+        text = text.replace(old, new)
+    for needle in edits.delete_lines.get(name, []):
+        text = "".join(line for line in text.splitlines(keepends=True) if needle not in line)
+    for extra in edits.append.get(name, []):
+        text += extra
+    text, leftovers = render_text(text, context)
+    return Rendered(source, output, text, leftovers)
+
+
+def plan(source: str, output: str, exclude: list[str], rename: dict[str, str]) -> list[tuple[str, str]]:
+    """
+    Lists the (template, output) pairs to render.
+    """
+    if os.path.isfile(source):
+        return [(source, output)]
+    if not os.path.isdir(source):
+        raise Exception(f"Template source not found: {source}")
+    pairs = []
+    for name in sorted(os.listdir(source)):
+        path = os.path.join(source, name)
+        if not os.path.isfile(path) or not any(fnmatch.fnmatch(name, p) for p in MANIFEST_PATTERNS):
+            continue
+        if name not in rename and any(fnmatch.fnmatch(name, p) for p in exclude):
+            continue
+        pairs.append((path, os.path.join(output, rename.get(name, name))))
+    for name in rename:
+        if not os.path.isfile(os.path.join(source, name)):
+            raise Exception(f"Template to rename not found: {os.path.join(source, name)}")
+    return pairs
+
+
+def render(source: str, output: str, context: dict[str, str], edits: Optional[Edits] = None,
+           exclude: Optional[list[str]] = None, rename: Optional[dict[str, str]] = None,
+           jobs: int = DEFAULT_JOBS) -> list[Rendered]:
+    """
+    Renders templates and writes them, unless a placeholder is left.
+    Args:
+        source: A template directory or a single template
+        output: The output directory, or the output file for a single template
+        context: Placeholder names to values
+        edits: File specific literal edits
+        exclude: Glob patterns of template names to skip
+        rename: Template names to output names
+        jobs: Files rendered concurrently
+    Returns:
+        list: The rendered files
+    """
+    edits = edits or Edits()
+    pairs = plan(source, output, exclude or [], rename or {})
+    names = {os.path.basename(out) for _, out in pairs}
+    unknown = {*edits.replace, *edits.delete_lines, *edits.append} - names
+    if unknown:
+        raise Exception(f"Edits for files that are not rendered: {', '.join(sorted(unknown))}")
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        rendered = list(pool.map(lambda pair: render_file(*pair, context, edits), pairs))
+
+    leftovers = [f"{r.source} {leftover}" for r in rendered for leftover in r.leftovers]
+    if leftovers:
+        raise Exception("Placeholders without a value:\n  " + "\n  ".join(leftovers))
+
+    for r in rendered:
+        os.makedirs(os.path.dirname(r.output) or ".", exist_ok=True)
+        with open(r.output, "w") as f:
+            f.write(r.text)
+    return rendered
+
+
+def _pair(value: str, option: str) -> tuple[str, str]:
+    key, sep, rest = value.partition("=")
+    if not sep or not key:
+        raise argparse.ArgumentTypeError(f"{option} expects KEY=VALUE, got {value!r}")
+    return key, rest
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description='Render manifest templates in one pass, failing on placeholders left without a value')
+    parser.add_argument('source', help='Template directory or single template file')
+    parser.add_argument('output', help='Output directory, or output file for a single template')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='Value for <NAME>; may be repeated')
+    parser.add_argument('--set-base64-file', action='append', default=[], metavar='NAME=PATH',
+                        help='Base64 encoded contents of PATH as the value for <NAME>')
+    parser.add_argument('--exclude', action='append', default=[], metavar='GLOB',
+                        help='Skip templates matching GLOB (directory source only)')
+    parser.add_argument('--rename', action='append', default=[], metavar='TEMPLATE=OUTPUT',
+                        help='Write TEMPLATE under another name (directory source only)')
+    parser.add_argument('--replace', action='append', nargs=3, default=[],
+                        metavar=('FILE', 'OLD', 'NEW'),
+                        help='Replace literal text in output FILE before substitution')
+    parser.add_argument('--delete-line', action='append', nargs=2, default=[],
+                        metavar=('FILE', 'TEXT'), help='Drop the lines of output FILE containing TEXT')
+    parser.add_argument('--append', action='append', nargs=2, default=[],
+                        metavar=('FILE', 'TEXT'), help='Append TEXT to output FILE')
+    parser.add_argument('--jobs', '-j', type=int, default=DEFAULT_JOBS,
+                        help=f'Files rendered concurrently (default: {DEFAULT_JOBS})')
+    args = parser.parse_args()
+
+    try:
+        context = dict(_pair(value, "--set") for value in args.set)
+        for value in args.set_base64_file:
+            key, path = _pair(value, "--set-base64-file")
+            with open(path, "rb") as f:
+                context[key] = base64.b64encode(f.read()).decode("ascii")
+        rename = dict(_pair(value, "--rename") for value in args.rename)
+    except (argparse.ArgumentTypeError, OSError) as e:
+        parser.error(str(e))
+
+    edits = Edits()
+    for name, old, new in args.replace:
+        edits.replace.setdefault(name, []).append((old, new))
+    for name, text in args.delete_line:
+        edits.delete_lines.setdefault(name, []).append(text)
+    for name, text in args.append:
+        edits.append.setdefault(name, []).append(text)
+
+    try:
+        rendered = render(args.source, args.output, context, edits, args.exclude, rename, args.jobs)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    for r in rendered:
+        print(f"Rendered {os.path.basename(r.source)} -> {r.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
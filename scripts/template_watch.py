@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+"""
+Watch loop that keeps the BFB ignition template in sync with a hosted cluster.
+
+The HostedCluster and its ignition token secrets are followed with watch
+streams. Changes that can affect the ignition (endpoint, release image,
+configuration, token rotation) mark the template dirty; once no further
+change arrived for the debounce interval the template is regenerated,
+and applied only if its inputs actually changed. A periodic resync covers
+ignition changes that are not visible on these objects.
+"""
+
+import hashlib
+import json
+import subprocess
+import threading
+import time
+from typing import Callable, Optional
+
+from kube_client import KubeClient, resource_path
+from tracing import span
+
+HYPERSHIFT_API = "hypershift.openshift.io/v1beta1"
+
+DEFAULT_DEBOUNCE = 10
+DEFAULT_RESYNC = 600
+# Failed regenerations are retried after this many seconds.
+RETRY_DELAY = 30
+FIELD_MANAGER = "gen-template"
+
+
+def hosted_cluster_fingerprint(hc: Optional[dict]) -> str:
+    """
+    Hashes the HostedCluster fields that determine its ignition.
+    """
+    if not hc:
+        return ""
+    data = {
+        "endpoint": hc.get("status", {}).get("ignitionEndpoint"),
+        "release": hc.get("spec", {}).get("release", {}).get("image"),
+        "configuration": hc.get("spec", {}).get("configuration"),
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def apply_configmap(path: str, client: Optional[KubeClient] = None) -> None:
+    """
+    Applies a ConfigMap manifest, with server side apply through the API
+    client if available, otherwise with oc apply.
+    """
+    if client is None:
+        with span("apply_template", path=path, method="oc"):
+            subprocess.check_call(["oc", "apply", "-f", path])
+        return
+
+    import yaml
+    with open(path) as f:
+        manifest = yaml.safe_load(f)
+    metadata = manifest["metadata"]
+    with span("apply_template", path=path, method="api"):
+        client.request("PATCH",
+                       resource_path("v1", "configmaps", metadata["namespace"], metadata["name"]),
+                       {"fieldManager": FIELD_MANAGER, "force": "true"},
+                       body=json.dumps(manifest).encode('utf-8'),
+                       content_type="application/apply-patch+yaml")
+    print(f"Applied configmap {metadata['namespace']}/{metadata['name']}")
+
+
+class TemplateWatcher:
+    """
+    Regenerates the template when the hosted cluster's ignition inputs change.
+    """
+
+    def __init__(self, client: KubeClient, cluster_name: str, hc_namespace: str,
+                 regenerate: Callable[[], bool], apply: Callable[[], None],
+                 debounce: float = DEFAULT_DEBOUNCE, resync: float = DEFAULT_RESYNC):
+        """
+        Args:
+            client: The API client used for the watches
+            cluster_name: The hosted cluster name
+            hc_namespace: The namespace for hosted clusters
+            regenerate: Regenerates the template, returning whether it changed
+            apply: Applies the regenerated template
+            debounce: Seconds without changes before regenerating
+            resync: Seconds between unconditional regenerations
+        """
+        self.client = client
+        self.cluster_name = cluster_name
+        self.hc_namespace = hc_namespace
+        self.regenerate = regenerate
+        self.apply = apply
+        self.debounce = debounce
+        self.resync = resync
+        self.stop = threading.Event()
+        self._cond = threading.Condition()
+        self._dirty_since: Optional[float] = None
+        self._last_change = 0.0
+        self._fingerprints: dict[str, str] = {}
+        self._errors: list[BaseException] = []
+
+    def _mark(self, source: str, fingerprint: str) -> None:
+        with self._cond:
+            if self._fingerprints.get(source) == fingerprint:
+                return
+            first = source not in self._fingerprints
+            self._fingerprints[source] = fingerprint
+            if first:
+                return
+            print(f"Change detected: {source}")
+            now = time.monotonic()
+            self._last_change = now
+            if self._dirty_since is None:
+                self._dirty_since = now
+            self._cond.notify()
+
+    def _watch_hosted_cluster(self) -> None:
+        path = resource_path(HYPERSHIFT_API, "hostedclusters", self.hc_namespace)
+        selector = f"metadata.name={self.cluster_name}"
+        for event, obj in self.client.list_and_watch(path, field_selector=selector,
+                                                     stop=self.stop):
+            if event == "SYNC":
+                items = obj.get("items", [])
+                obj = items[0] if items else None
+            elif event == "DELETED":
+                obj = None
+            self._mark("hostedcluster", hosted_cluster_fingerprint(obj))
+
+    def _watch_token_secrets(self) -> None:
+        namespace = f"{self.hc_namespace}-{self.cluster_name}"
+        path = resource_path("v1", "secrets", namespace)
+        prefix = f"token-{self.cluster_name}"
+        versions: dict[str, str] = {}
+        for event, obj in self.client.list_and_watch(path, stop=self.stop):
+            if event == "SYNC":
+                versions = {item["metadata"]["name"]: item["metadata"]["resourceVersion"]
+                            for item in obj.get("items", [])
+                            if prefix in item["metadata"]["name"]}
+            elif prefix in obj["metadata"]["name"]:
+                if event == "DELETED":
+                    versions.pop(obj["metadata"]["name"], None)
+                else:
+                    versions[obj["metadata"]["name"]] = obj["metadata"]["resourceVersion"]
+            else:
+                continue
+            self._mark("token secrets", hashlib.sha256(
+                json.dumps(versions, sort_keys=True).encode()).hexdigest())
+
+    def _run_watch(self, target: Callable[[], None]) -> None:
+        try:
+            target()
+        except BaseException as e:
+            with self._cond:
+                self._errors.append(e)
+                self._cond.notify()
+
+    def _cycle(self, reason: str) -> bool:
+        print(f"Regenerating template ({reason})...")
+        try:
+            with span("watch_cycle", reason=reason):
+                # The first cycle applies even an unchanged template, in case the
+                # ConfigMap was deleted while nothing was watching
+                if self.regenerate() or reason == "startup":
+                    self.apply()
+                else:
+                    print("Template inputs unchanged, nothing to apply")
+            return True
+        except Exception as e:
+            print(f"Template regeneration failed: {e}")
+            return False
+
+    def run(self) -> None:
+        """
+        Generates the template once, then follows changes until stopped or
+        a watch fails.
+        """
+        next_resync = time.monotonic() + self.resync
+        if not self._cycle("startup"):
+            next_resync = time.monotonic() + RETRY_DELAY
+
+        for target in (self._watch_hosted_cluster, self._watch_token_secrets):
+            threading.Thread(target=self._run_watch, args=(target,), daemon=True).start()
+
+        while not self.stop.is_set():
+            with self._cond:
+                now = time.monotonic()
+                if self._errors:
+                    raise self._errors[0]
+                if self._dirty_since is not None:
+                    # Wait for the burst of changes to settle
+                    deadline = self._last_change + self.debounce
+                else:
+                    deadline = next_resync
+                if now < deadline:
+                    self._cond.wait(deadline - now)
+                    continue
+                reason = "change" if self._dirty_since is not None else "resync"
+                self._dirty_since = None
+            ok = self._cycle(reason)
+            # A failed cycle is retried through an early resync
+            next_resync = time.monotonic() + (self.resync if ok else RETRY_DELAY)
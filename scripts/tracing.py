@@ -0,0 +1,208 @@
+#!/usr/bin/python3
+"""
+Lightweight spans and metrics for the template generation scripts.
+
+Code wraps steps in `with span("name", key=value) as s:` and may add
+attributes (byte counts, status codes) to `s` while it runs. Finished spans
+are aggregated for a summary and can be streamed as JSON lines, printed as a
+human readable trace, or aggregated into an OpenMetrics textfile for the
+node-exporter textfile collector. Spans are thread-safe; child spans inherit
+the `cluster` attribute of their parent.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, TextIO
+
+# Attributes copied from a parent span to its children.
+INHERITED_ATTRS = ("cluster",)
+
+
+class Tracer:
+    def __init__(self):
+        self.stages: dict[str, dict] = {}
+        self.started = time.time()
+        self.trace: Optional[TextIO] = None
+        self.json_lines: Optional[TextIO] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._next_id = 1
+
+    def configure(self, trace: bool = False, metrics_json: Optional[str] = None) -> None:
+        """
+        Enables span output.
+        Args:
+            trace: Print each finished span to stderr
+            metrics_json: File to stream spans to as JSON lines ("-" for stdout)
+        """
+        self.trace = sys.stderr if trace else None
+        if metrics_json == "-":
+            self.json_lines = sys.stdout
+        elif metrics_json:
+            self.json_lines = open(metrics_json, "w")
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[dict]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        parent = stack[-1] if stack else None
+        if parent:
+            for key in INHERITED_ATTRS:
+                if key in parent["attrs"] and key not in attrs:
+                    attrs[key] = parent["attrs"][key]
+        with self._lock:
+            span_id = self._next_id
+            self._next_id += 1
+        record = {"type": "span", "id": span_id, "parent": parent["id"] if parent else None,
+                  "name": name, "thread": threading.current_thread().name,
+                  "start": time.time(), "attrs": attrs}
+        stack.append(record)
+        start = time.perf_counter()
+        try:
+            yield attrs
+            record["status"] = "ok"
+        except BaseException as e:
+            record["status"] = "error"
+            record["error"] = str(e)
+            raise
+        finally:
+            record["duration"] = time.perf_counter() - start
+            stack.pop()
+            self._finish(record, len(stack))
+
+    def _finish(self, record: dict, depth: int) -> None:
+        cluster = record["attrs"].get("cluster", "")
+        key = f"{record['name']}/{cluster}" if cluster else record["name"]
+        with self._lock:
+            stage = self.stages.setdefault(key, {"name": record["name"], "cluster": cluster,
+                                                 "count": 0, "errors": 0,
+                                                 "seconds": 0.0, "bytes": 0})
+            stage["count"] += 1
+            stage["errors"] += record["status"] == "error"
+            stage["seconds"] += record["duration"]
+            stage["bytes"] += int(record["attrs"].get("bytes", 0) or 0)
+            if self.trace:
+                attrs = " ".join(f"{k}={v}" for k, v in record["attrs"].items())
+                error = f" error={record['error']}" if "error" in record else ""
+                self.trace.write(f"[trace] {'  ' * depth}{record['name']} "
+                                 f"{record['duration'] * 1000:.1f}ms {attrs}{error}\n")
+                self.trace.flush()
+            if self.json_lines:
+                self.json_lines.write(json.dumps(record, default=str) + "\n")
+                self.json_lines.flush()
+
+    def summary(self, success: bool) -> dict:
+        """
+        Returns the finished spans aggregated by name and cluster.
+        """
+        with self._lock:
+            stages = [dict(stage) for stage in self.stages.values()]
+        return {"type": "summary", "success": success, "start": self.started,
+                "seconds": time.time() - self.started, "stages": stages}
+
+    def reset(self) -> None:
+        """
+        Starts a new run, e.g. for each cycle of a long running process.
+        """
+        with self._lock:
+            self.stages = {}
+            self.started = time.time()
+
+    def finish(self, success: bool, textfile: Optional[str] = None) -> None:
+        """
+        Writes the run summary to the JSON lines output and the textfile.
+        Args:
+            success: Whether the run succeeded
+            textfile: OpenMetrics textfile to write, if any
+        """
+        summary = self.summary(success)
+        if self.json_lines:
+            self.json_lines.write(json.dumps(summary) + "\n")
+            self.json_lines.flush()
+            if self.json_lines is not sys.stdout:
+                self.json_lines.close()
+            self.json_lines = None
+        if textfile:
+            write_textfile(textfile, openmetrics(summary))
+
+
+def metric_labels(**labels) -> str:
+    """
+    Formats an OpenMetrics label set, e.g. {stage="download"}, escaping the
+    values and leaving out empty ones.
+    Returns:
+        str: The label set, or "" when no label has a value
+    """
+    items = []
+    for key, value in labels.items():
+        if value:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            items.append(f'{key}="{value}"')
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+# OpenMetrics series rendered per stage: (suffix, summary field, help text).
+STAGE_METRICS = (
+    ("seconds", "seconds", "Time spent in each stage during the last run."),
+    ("calls", "count", "Number of times each stage ran during the last run."),
+    ("errors", "errors", "Number of failed stage runs during the last run."),
+    ("bytes", "bytes", "Bytes processed by each stage during the last run."),
+)
+
+
+def openmetrics(summary: dict, prefix: str = "gen_template") -> str:
+    """
+    Renders a run summary in the OpenMetrics text format.
+    """
+    lines = []
+    for suffix, field, help_text in STAGE_METRICS:
+        metric = f"{prefix}_stage_{suffix}"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+        for stage in summary["stages"]:
+            value = stage[field]
+            if field == "bytes" and not value:
+                continue
+            value = f"{value:.6f}" if isinstance(value, float) else value
+            labels = metric_labels(stage=stage['name'], cluster=stage['cluster'])
+            lines.append(f"{metric}{labels} {value}")
+    lines += [
+        f"# HELP {prefix}_last_run_seconds Duration of the last run.",
+        f"# TYPE {prefix}_last_run_seconds gauge",
+        f"{prefix}_last_run_seconds {summary['seconds']:.6f}",
+        f"# HELP {prefix}_last_run_timestamp_seconds Start time of the last run.",
+        f"# TYPE {prefix}_last_run_timestamp_seconds gauge",
+        f"{prefix}_last_run_timestamp_seconds {summary['start']:.3f}",
+        f"# HELP {prefix}_last_run_success Whether the last run succeeded.",
+        f"# TYPE {prefix}_last_run_success gauge",
+        f"{prefix}_last_run_success {int(summary['success'])}",
+        "# EOF",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str, text: str) -> None:
+    """
+    Atomically replaces a metrics textfile, so the collector never reads a
+    partial file.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+# Process wide tracer used by the generator modules.
+tracer = Tracer()
+span = tracer.span
@@ -4,6 +4,9 @@
 HOSTS_FILE="/etc/hosts"
 PING_TIMEOUT=2
 PING_COUNT=1
+# Exit status of vm_ip_resolver.py when libvirt cannot be used
+VM_IP_RESOLVER_UNAVAILABLE=2
+VM_IP_RESOLVER="$(dirname "${BASH_SOURCE[0]}")/vm_ip_resolver.py"
 
 source "$(dirname "${BASH_SOURCE[0]}")/env.sh"
 
@@ -103,13 +106,35 @@ find_vm_ip() {
     return 1
 }
 
+# Find the IP address of the first VM matching prefix from one index of
+# DHCP leases and neighbour tables, waiting up to VM_IP_WAIT seconds for
+# neighbour events. Falls back to find_vm_ip when libvirt cannot be used.
+resolve_vm_ip() {
+    local vm_prefix=$1
+    local rc=0
+    python3 "$VM_IP_RESOLVER" resolve --prefix "$vm_prefix" --first \
+        --wait "${VM_IP_WAIT:-0}" || rc=$?
+    if [ "$rc" -eq "$VM_IP_RESOLVER_UNAVAILABLE" ]; then
+        find_vm_ip "$vm_prefix"
+    else
+        return "$rc"
+    fi
+}
+
 # Update hosts file entry
 update_hosts_file() {
     local ip=$1
     local fqdn=$2
-    local temp_file=$(mktemp)
+    local temp_file
     local updated=0
 
+    # One atomic write of the complete file
+    if python3 "$VM_IP_RESOLVER" hosts "${ip}=${fqdn}" --file "$HOSTS_FILE"; then
+        return 0
+    fi
+
+    temp_file=$(mktemp)
+
     # Read hosts file line by line and update/add entry
     while IFS= read -r line || [ -n "$line" ]; do
         if [[ $line =~ ^[^#]*[[:space:]]+"$fqdn"([[:space:]]|$) ]]; then
@@ -158,7 +183,7 @@ update_etc_hosts() {
             return 1
         fi
         
-        local vm_ip=$(find_vm_ip "$vm_prefix")
+        local vm_ip=$(resolve_vm_ip "$vm_prefix")
         if [ -n "$vm_ip" ]; then
             echo "Found VM IP: $vm_ip"
             final_ip=$vm_ip
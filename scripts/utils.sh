@@ -74,6 +74,28 @@ function verify_files() {
 # -----------------------------------------------------------------------------
 # Resource waiting functions
 # -----------------------------------------------------------------------------
+# Exit status of dpfwait.py when the API cannot be watched
+DPFWAIT_UNAVAILABLE=2
+
+# Wait for conditions with dpfwait.py watch streams.
+# Usage: dpfwait TIMEOUT WAIT [WAIT...]
+# Returns 0 when all conditions hold, 1 on timeout, 3 on a malformed WAIT, and
+# DPFWAIT_UNAVAILABLE when the caller should fall back to polling (also when
+# USE_DPFWAIT=false).
+function dpfwait() {
+    local timeout=$1
+    shift
+    if [ "${USE_DPFWAIT:-true}" != "true" ]; then
+        return "$DPFWAIT_UNAVAILABLE"
+    fi
+    local rc=0
+    python3 "$(dirname "${BASH_SOURCE[0]}")/dpfwait.py" --timeout "$timeout" "$@" || rc=$?
+    if [ "$rc" -eq "$DPFWAIT_UNAVAILABLE" ]; then
+        log "INFO" "Watch based wait unavailable, polling instead"
+    fi
+    return "$rc"
+}
+
 function wait_for_resource() {
     local namespace=$1
     local resource_type=$2
@@ -83,6 +105,16 @@ function wait_for_resource() {
 
     log "INFO" "Waiting for $resource_type/$resource_name in namespace $namespace..."
 
+    local rc=0
+    dpfwait $((max_attempts * delay)) "exists:${resource_type}/${namespace}/${resource_name}" || rc=$?
+    if [ "$rc" -eq 0 ]; then
+        log "INFO" "$resource_type/$resource_name found in namespace $namespace"
+        return 0
+    elif [ "$rc" -ne "$DPFWAIT_UNAVAILABLE" ]; then
+        log "ERROR" "Timed out waiting for $resource_type/$resource_name in namespace $namespace"
+        return 1
+    fi
+
     for i in $(seq 1 "$max_attempts"); do
         if oc get "$resource_type" -n "$namespace" "$resource_name" &>/dev/null; then
             log "INFO" "$resource_type/$resource_name found in namespace $namespace"
@@ -105,6 +137,12 @@ function wait_for_secret_with_data() {
 
     log "INFO" "Waiting for secret/$secret_name with valid data for key $key in namespace $namespace..."
 
+    local rc=0
+    dpfwait $((max_attempts * delay)) "has-data-key=${key}:secret/${namespace}/${secret_name}" || rc=$?
+    if [ "$rc" -ne "$DPFWAIT_UNAVAILABLE" ]; then
+        return "$rc"
+    fi
+
     # Use retry to check for secret data existence
     retry "$max_attempts" "$delay" bash -c '
         ns="$1"; secret="$2"; key="$3"
@@ -119,6 +157,18 @@ function wait_for_pods() {
     local max_attempts=$3
     local delay=$4
 
+    local rc=0
+    dpfwait $((max_attempts * delay)) "pods-ready:pods/${namespace}/${label}" || rc=$?
+    if [ "$rc" -eq 0 ]; then
+        log "INFO" "All $label pods are ready (all containers running)"
+        return 0
+    elif [ "$rc" -ne "$DPFWAIT_UNAVAILABLE" ]; then
+        log "ERROR" "$label pods failed to become ready within $((max_attempts * delay)) seconds"
+        oc get pods -n "$namespace" -l "$label"
+        oc describe pod -n "$namespace" -l "$label"
+        exit 1
+    fi
+
     for i in $(seq 1 "$max_attempts"); do
         # Display pod status (allow this to fail without exiting)
         oc get pods -n "$namespace" -l "$label" 2>&1 || true
@@ -160,9 +210,52 @@ function wait_for_pods() {
 # -----------------------------------------------------------------------------
 # Resource checking functions
 # -----------------------------------------------------------------------------
+# Exit status of inventory.py when the API cannot be used
+INVENTORY_UNAVAILABLE=2
+
+# Cached existence queries with inventory.py.
+# Usage: inventory exists KIND NAME [-n NAMESPACE] | exists-file FILE |
+#        helm-release NAMESPACE NAME | snapshot
+# Returns 0 when found, 1 when missing and INVENTORY_UNAVAILABLE when the
+# caller should fall back to oc (also when USE_INVENTORY=false).
+function inventory() {
+    if [ "${USE_INVENTORY:-true}" != "true" ]; then
+        return "$INVENTORY_UNAVAILABLE"
+    fi
+    python3 "$(dirname "${BASH_SOURCE[0]}")/inventory.py" "$@"
+}
+
+# List the commonly checked collections once, so the guards that follow
+# answer from the snapshot
+function inventory_snapshot() {
+    inventory snapshot || true
+}
+
+# Check whether an object exists.
+# Usage: resource_exists KIND NAME [NAMESPACE]
+function resource_exists() {
+    local kind=$1
+    local name=$2
+    local namespace=${3:-}
+    local rc=0
+    if [ -n "$namespace" ]; then
+        inventory exists "$kind" "$name" -n "$namespace" 2>/dev/null || rc=$?
+    else
+        inventory exists "$kind" "$name" 2>/dev/null || rc=$?
+    fi
+    if [ "$rc" -ne "$INVENTORY_UNAVAILABLE" ]; then
+        return "$rc"
+    fi
+    if [ -n "$namespace" ]; then
+        oc get "$kind" -n "$namespace" "$name" &>/dev/null
+    else
+        oc get "$kind" "$name" &>/dev/null
+    fi
+}
+
 function check_namespace_exists() {
     local namespace=$1
-    if oc get namespace "$namespace" &>/dev/null; then
+    if resource_exists namespace "$namespace"; then
         log [INFO] "Namespace $namespace already exists"
         return 0
     fi
@@ -171,7 +264,7 @@ function check_namespace_exists() {
 
 function check_crd_exists() {
     local crd=$1
-    if oc get crd "$crd" &>/dev/null; then
+    if resource_exists crd "$crd"; then
         log [INFO] "CRD $crd already exists"
         return 0
     fi
@@ -181,7 +274,7 @@ function check_crd_exists() {
 function check_secret_exists() {
     local namespace=$1
     local secret=$2
-    if oc get secret -n "$namespace" "$secret" &>/dev/null; then
+    if resource_exists secret "$secret" "$namespace"; then
         log [INFO] "Secret $secret already exists in namespace $namespace"
         return 0
     fi
@@ -191,15 +284,31 @@ function check_secret_exists() {
 function check_helm_release_exists() {
     local namespace=$1
     local release_name=$2
-    if helm list -n "$namespace" 2>/dev/null | grep -q "^${release_name}[[:space:]].*deployed"; then
+    local rc=0
+    inventory helm-release "$namespace" "$release_name" 2>/dev/null || rc=$?
+    if [ "$rc" -eq "$INVENTORY_UNAVAILABLE" ]; then
+        rc=0
+        helm list -n "$namespace" 2>/dev/null | grep -q "^${release_name}[[:space:]].*deployed" || rc=1
+    fi
+    if [ "$rc" -eq 0 ]; then
         log "INFO" "Helm release $release_name already exists in namespace $namespace"
         return 0
     fi
     return 1
 }
 
+# Check whether the objects of a manifest exist (all documents of the file)
 function check_resource_exists() {
     local file=$1
+    local rc=0
+    inventory exists-file "$file" 2>/dev/null || rc=$?
+    if [ "$rc" -eq 0 ]; then
+        log "INFO" "All objects of $(basename "$file") already exist."
+        return 0
+    elif [ "$rc" -ne "$INVENTORY_UNAVAILABLE" ]; then
+        return 1
+    fi
+
     local resource_type=$(grep -m 1 "kind:" "$file" | awk '{print $2}')
     local resource_name=$(grep -m 1 "name:" "$file" | awk '{print $2}')
     local namespace=$(grep -m 1 "namespace:" "$file" | awk '{print $2}')
@@ -245,6 +354,26 @@ function apply_manifest() {
     return 0
 }
 
+# Exit status of bulk_apply.py when the API cannot be used
+BULK_APPLY_UNAVAILABLE=2
+
+# Apply manifests with bulk_apply.py (server side apply in dependency order).
+# Usage: bulk_apply [OPTIONS] FILE|DIR...
+# Returns 0 when everything was applied, 1 on failures, and
+# BULK_APPLY_UNAVAILABLE when the caller should fall back to oc apply
+# (also when USE_BULK_APPLY=false).
+function bulk_apply() {
+    if [ "${USE_BULK_APPLY:-true}" != "true" ]; then
+        return "$BULK_APPLY_UNAVAILABLE"
+    fi
+    local rc=0
+    python3 "$(dirname "${BASH_SOURCE[0]}")/bulk_apply.py" "$@" || rc=$?
+    if [ "$rc" -eq "$BULK_APPLY_UNAVAILABLE" ]; then
+        log "INFO" "Bulk apply unavailable, applying with oc instead"
+    fi
+    return "$rc"
+}
+
 function retry() {
     local retries=$1
     local delay=$2
@@ -265,18 +394,34 @@ function retry() {
 }
 
 # -----------------------------------------------------------------------------
-# Helper functions
+# Template processing functions
 # -----------------------------------------------------------------------------
-# Escape string for safe use in sed replacement
-escape_sed_replacement() {
-    local str="$1"
-    # Escape backslashes first, then ampersands, then forward slashes
-    printf '%s' "$str" | sed 's/\\/\\\\/g; s/&/\\&/g; s/\//\\\//g'
+# Render manifest templates in a single pass with render_manifests.py.
+# Usage: render_manifests SOURCE OUTPUT [--set NAME=VALUE ...] [OPTIONS]
+# SOURCE is a template directory or a single template. Fails without
+# writing anything if a <PLACEHOLDER> is left without a value.
+function render_manifests() {
+    python3 "$(dirname "${BASH_SOURCE[0]}")/render_manifests.py" "$@"
+}
+
+# Convert "<NAME>" "value" pairs into render_manifests --set arguments
+# (stored in the global RENDER_ARGS array)
+function placeholder_pairs_to_args() {
+    RENDER_ARGS=()
+    while [ $# -gt 0 ]; do
+        local placeholder=$1
+        local value=$2
+        local name=${placeholder#<}
+        name=${name%>}
+        if [ "<${name}>" != "$placeholder" ]; then
+            log "ERROR" "Invalid placeholder ${placeholder}, expected <NAME>"
+            return 1
+        fi
+        RENDER_ARGS+=(--set "${name}=${value}")
+        shift 2
+    done
 }
 
-# -----------------------------------------------------------------------------
-# Template processing functions
-# -----------------------------------------------------------------------------
 function process_template() {
     local template_file=$1
     local output_file=$2
@@ -290,32 +435,12 @@ function process_template() {
         return 1
     fi
     
-    # Ensure output directory exists
-    local output_dir=$(dirname "$output_file")
-    if [ ! -d "$output_dir" ]; then
-        mkdir -p "$output_dir" || {
-            log "ERROR" "Failed to create output directory: $output_dir"
-            return 1
-        }
-    fi
-    
-    # Copy template to output
-    cp "$template_file" "$output_file" || {
-        log "ERROR" "Failed to copy $template_file to $output_file"
+    placeholder_pairs_to_args "$@"
+    render_manifests "$template_file" "$output_file" "${RENDER_ARGS[@]}" >/dev/null || {
+        log "ERROR" "Failed to render $template_file to $output_file"
         return 1
     }
     
-    # Apply each substitution
-    while [ $# -gt 0 ]; do
-        local placeholder=$1
-        local value=$2
-        # Escape the replacement value for sed
-        local escaped_value=$(escape_sed_replacement "$value")
-        sed -i "s|${placeholder}|${escaped_value}|g" "$output_file"
-        log "DEBUG" "Replaced ${placeholder} with ${value} in $(basename "$output_file")"
-        shift 2
-    done
-    
     log "INFO" "Template processed successfully: $(basename "$output_file")"
 }
 
@@ -328,19 +453,10 @@ update_file_multi_replace() {
     local source_file=$1
     local target_file=$2
     shift 2
-    local pairs=("$@")
 
     log [INFO] "Updating ${source_file} with multiple replacements..."
-        
-    cp "${source_file}" "${target_file}"
-    local i=0
-    while [ $i -lt ${#pairs[@]} ]; do
-        local placeholder="${pairs[$i]}"
-        local value="${pairs[$((i+1))]}"
-        sed -i "s|${placeholder}|${value}|g" "${target_file}"
-        log [INFO] "Replaced ${placeholder} with ${value} in ${target_file}"
-        i=$((i+2))
-    done
+    placeholder_pairs_to_args "$@"
+    render_manifests "${source_file}" "${target_file}" "${RENDER_ARGS[@]}" >/dev/null
     log [INFO] "Updated ${source_file} with all replacements successfully"
 }
 
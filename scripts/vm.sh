@@ -21,6 +21,9 @@ PHYSICAL_NIC=${PHYSICAL_NIC:-$(ip route | awk '/default/ {print $5; exit}')}
 # ISO path derived from env.sh variables
 ISO_PATH="${ISO_FOLDER}/${CLUSTER_NAME}.iso"
 
+# Exit status of vm_provision.py when libvirt cannot be used
+VM_PROVISION_UNAVAILABLE=2
+
 
 # -----------------------------------------------------------------------------
 # VM Management Functions
@@ -33,6 +36,31 @@ ISO_PATH="${ISO_FOLDER}/${CLUSTER_NAME}.iso"
 # * connection to the given physical NIC and a VNC graphics device.
 # * The function waits for all VMs to be running using a retry mechanism
 # * and prints a success message upon completion.
+# *
+# * Unless VM_PROVISIONER=shell, the VMs are created concurrently by
+# * vm_provision.py, which waits for libvirt lifecycle events instead of
+# * polling. The shell loop below is the fallback.
+
+# Create the VMs with vm_provision.py.
+# Returns 0 when all VMs are running, 1 on failure and VM_PROVISION_UNAVAILABLE
+# when the caller should fall back to the shell loop.
+function provision_vms() {
+    if [ "${VM_PROVISIONER:-python}" = "shell" ]; then
+        return "$VM_PROVISION_UNAVAILABLE"
+    fi
+    python3 "$(dirname "${BASH_SOURCE[0]}")/vm_provision.py" create \
+        --prefix "$VM_PREFIX" \
+        --count "$VM_COUNT" \
+        --memory "$RAM" \
+        --vcpus "$VCPUS" \
+        --disk-size "$DISK_SIZE1" "$DISK_SIZE2" \
+        --bridge "$BRIDGE_NAME" \
+        --iso "$ISO_PATH" \
+        --mac-prefix "$MAC_PREFIX" \
+        --static-net-file "$STATIC_NET_FILE" \
+        --nodes-mtu "$NODES_MTU" \
+        --jobs "${VM_CREATE_JOBS:-8}"
+}
 
 function create_vms() {
     # First check if cluster is already installed
@@ -51,6 +79,16 @@ function create_vms() {
         echo "Skipping bridge creation as SKIP_BRIDGE_CONFIG is set to true."
     fi
 
+    local rc=0
+    provision_vms || rc=$?
+    if [ "$rc" -eq 0 ]; then
+        log "VM creation completed successfully!"
+        return 0
+    elif [ "$rc" -ne "$VM_PROVISION_UNAVAILABLE" ]; then
+        log "ERROR" "VM creation failed"
+        exit 1
+    fi
+
     # --- MAC Address Generation Functions ---
     # from utils: generate_mac_from_machine_id
 
@@ -0,0 +1,396 @@
+#!/usr/bin/python3
+"""
+Resolves the IP addresses of the lab VMs and updates /etc/hosts.
+
+Instead of one virsh domifaddr and a full ARP table scan per VM, the MACs
+of all VMs matching the prefix are collected once and looked up in a
+single MAC to IP index, built from the libvirt networks' DHCP lease files,
+/proc/net/arp and a netlink neighbour dump. With --wait, VMs that are not
+resolved yet are resolved from netlink neighbour events as they appear.
+/etc/hosts is rewritten with one write of the complete file.
+
+Exit status: 0 when resolved (or updated), 1 when a VM has no address, 2
+when libvirt cannot be used, in which case callers fall back to the shell
+functions. A malformed command line exits with 3.
+"""
+
+import ipaddress
+import json
+import os
+import select
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+from cli import ArgumentParser
+
+EXIT_MISSING = 1
+EXIT_UNAVAILABLE = 2
+
+HOSTS_FILE = "/etc/hosts"
+LEASES_DIR = "/var/lib/libvirt/dnsmasq"
+ARP_FILE = "/proc/net/arp"
+DEFAULT_JOBS = 8
+
+# rtnetlink constants, from linux/netlink.h, linux/rtnetlink.h and linux/neighbour.h
+NLMSG_HEADER = struct.Struct("=IHHII")
+NDMSG = struct.Struct("=BBHiHBB")
+RTATTR = struct.Struct("=HH")
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTM_NEWNEIGH = 28
+RTM_GETNEIGH = 30
+RTMGRP_NEIGH = 0x4
+NDA_DST = 1
+NDA_LLADDR = 2
+NUD_INCOMPLETE = 0x01
+NUD_FAILED = 0x20
+NUD_NOARP = 0x40
+# ATF_COM in /proc/net/arp: the entry is complete
+ATF_COM = 0x2
+
+
+class ResolverUnavailable(Exception):
+    """Raised when the VMs cannot be listed through libvirt."""
+
+
+@dataclass
+class Vm:
+    name: str
+    macs: list[str]
+    ip: Optional[str] = None
+    source: Optional[str] = None
+
+
+@dataclass
+class NeighborIndex:
+    """
+    MAC to IPv4 address index; the first source to provide a MAC wins,
+    so DHCP leases take precedence over the neighbour tables.
+    """
+    entries: dict[str, tuple[str, str]] = field(default_factory=dict)
+
+    def add(self, mac: str, ip: str, source: str) -> None:
+        self.entries.setdefault(mac.lower(), (ip, source))
+
+    def lookup(self, mac: str) -> Optional[tuple[str, str]]:
+        return self.entries.get(mac.lower())
+
+
+def read_leases(index: NeighborIndex, leases_dir: str = LEASES_DIR) -> None:
+    """
+    Adds the active leases of the libvirt networks' dnsmasq status files.
+    """
+    try:
+        names = sorted(n for n in os.listdir(leases_dir) if n.endswith(".status"))
+    except OSError:
+        return
+    now = time.time()
+    for name in names:
+        try:
+            with open(os.path.join(leases_dir, name)) as f:
+                leases = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for lease in leases:
+            ip = lease.get("ip-address", "")
+            if lease.get("expiry-time", now) >= now and "." in ip and lease.get("mac-address"):
+                index.add(lease["mac-address"], ip, "dhcp lease")
+
+
+def read_arp(index: NeighborIndex, path: str = ARP_FILE) -> None:
+    """
+    Adds the complete entries of the kernel ARP table.
+    """
+    try:
+        with open(path) as f:
+            lines = f.readlines()[1:]
+    except OSError:
+        return
+    # IP address  HW type  Flags  HW address  Mask  Device
+    for line in lines:
+        parts = line.split()
+        if len(parts) >= 4 and int(parts[2], 16) & ATF_COM:
+            index.add(parts[3], parts[0], "arp")
+
+
+def _attributes(data: bytes, offset: int, end: int) -> dict[int, bytes]:
+    attributes = {}
+    while offset + RTATTR.size <= end:
+        length, kind = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        attributes[kind] = data[offset + RTATTR.size:offset + length]
+        offset += (length + 3) & ~3
+    return attributes
+
+
+def parse_neighbors(data: bytes) -> tuple[list[tuple[str, str]], bool]:
+    """
+    Parses rtnetlink messages into usable IPv4 neighbours.
+    Returns:
+        tuple: The (mac, ip) pairs, and whether the dump is done
+    """
+    neighbors = []
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        length, kind, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+        if length < NLMSG_HEADER.size:
+            break
+        if kind == NLMSG_DONE:
+            return neighbors, True
+        if kind == NLMSG_ERROR:
+            error = struct.unpack_from("=i", data, offset + NLMSG_HEADER.size)[0]
+            if error:
+                raise OSError(-error, os.strerror(-error))
+        elif kind == RTM_NEWNEIGH:
+            body = offset + NLMSG_HEADER.size
+            family, _, _, _, state, _, _ = NDMSG.unpack_from(data, body)
+            attributes = _attributes(data, body + NDMSG.size, offset + length)
+            usable = not state & (NUD_INCOMPLETE | NUD_FAILED | NUD_NOARP)
+            if family == socket.AF_INET and usable \
+                    and len(attributes.get(NDA_LLADDR, b"")) == 6 and NDA_DST in attributes:
+                mac = ":".join(f"{b:02x}" for b in attributes[NDA_LLADDR])
+                neighbors.append((mac, str(ipaddress.IPv4Address(attributes[NDA_DST]))))
+        offset += (length + 3) & ~3
+    return neighbors, False
+
+
+def dump_neighbors(index: NeighborIndex) -> None:
+    """
+    Adds the IPv4 neighbours of all interfaces from one netlink dump.
+    """
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+    except OSError:
+        return
+    with sock:
+        request = NDMSG.pack(socket.AF_INET, 0, 0, 0, 0, 0, 0)
+        sock.send(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(request), RTM_GETNEIGH,
+                                    NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + request)
+        done = False
+        while not done:
+            neighbors, done = parse_neighbors(sock.recv(65536))
+            for mac, ip in neighbors:
+                index.add(mac, ip, "neighbor")
+
+
+def build_index(leases_dir: str = LEASES_DIR, arp_file: str = ARP_FILE) -> NeighborIndex:
+    index = NeighborIndex()
+    read_leases(index, leases_dir)
+    read_arp(index, arp_file)
+    dump_neighbors(index)
+    return index
+
+
+def _interface_macs(xml: str) -> list[str]:
+    root = ElementTree.fromstring(xml)
+    return [mac.get("address").lower() for mac in root.findall("./devices/interface/mac")
+            if mac.get("address")]
+
+
+def list_vms(prefix: str, uri: Optional[str] = None, jobs: int = DEFAULT_JOBS) -> list[Vm]:
+    """
+    Lists the VMs whose name starts with prefix, with the MACs of their
+    interfaces, in name order.
+    Raises:
+        ResolverUnavailable: Neither the libvirt binding nor virsh can be used
+    """
+    try:
+        import libvirt
+    except ImportError:
+        libvirt = None
+    if libvirt is not None:
+        try:
+            conn = libvirt.openReadOnly(uri)
+        except libvirt.libvirtError as e:
+            raise ResolverUnavailable(f"cannot connect to libvirt: {e}")
+        try:
+            vms = [Vm(dom.name(), _interface_macs(dom.XMLDesc()))
+                   for dom in conn.listAllDomains() if dom.name().startswith(prefix)]
+        finally:
+            conn.close()
+        return sorted(vms, key=lambda vm: vm.name)
+
+    if not shutil.which("virsh"):
+        raise ResolverUnavailable("virsh is not installed")
+    virsh = ["virsh"] + (["-c", uri] if uri else [])
+    result = subprocess.run(virsh + ["list", "--all", "--name"], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ResolverUnavailable(f"virsh list failed: {result.stderr.strip()}")
+    names = sorted(n for n in result.stdout.split() if n.startswith(prefix))
+
+    def macs(name: str) -> list[str]:
+        output = subprocess.run(virsh + ["domiflist", name], capture_output=True,
+                                text=True).stdout
+        # Interface  Type  Source  Model  MAC, after a separator line
+        return [parts[4].lower() for parts in (line.split() for line in output.splitlines()[2:])
+                if len(parts) >= 5]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(names) or 1))) as pool:
+        return [Vm(name, found) for name, found in zip(names, pool.map(macs, names))]
+
+
+def resolve(vms: list[Vm], index: NeighborIndex) -> list[Vm]:
+    """
+    Fills in the address of every VM found in the index.
+    Returns:
+        list: The VMs still without an address
+    """
+    for vm in vms:
+        for mac in vm.macs:
+            found = index.lookup(mac)
+            if vm.ip is None and found:
+                vm.ip, vm.source = found
+    return [vm for vm in vms if vm.ip is None]
+
+
+def wait_for_neighbors(vms: list[Vm], index: NeighborIndex, timeout: float,
+                       first: bool = False) -> list[Vm]:
+    """
+    Resolves missing VMs from netlink neighbour events until all (or with
+    first, any) are resolved or the timeout expires. The lease files are
+    read again before giving up.
+    Returns:
+        list: The VMs still without an address
+    """
+    missing = resolve(vms, index)
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        sock.bind((0, RTMGRP_NEIGH))
+    except OSError as e:
+        print(f"Cannot subscribe to neighbour events: {e}", file=sys.stderr)
+        return missing
+    deadline = time.monotonic() + timeout
+    with sock:
+        while missing and not (first and len(missing) < len(vms)):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not select.select([sock], [], [], remaining)[0]:
+                break
+            for mac, ip in parse_neighbors(sock.recv(65536))[0]:
+                index.add(mac, ip, "neighbor")
+            missing = resolve(missing, index)
+    read_leases(index)
+    return resolve(missing, index)
+
+
+def update_hosts(entries: dict[str, str], path: str = HOSTS_FILE, backup: bool = True) -> str:
+    """
+    Points each name at its address: lines mapping the name are replaced,
+    missing names are appended. The file is written once, atomically
+    where the file system allows it.
+    Args:
+        entries: Addresses by host name
+        path: The hosts file
+        backup: Keep the previous content as path.bak
+    Returns:
+        str: The new content
+    """
+    with open(path) as f:
+        original = f.read()
+    lines = []
+    pending = dict(entries)
+    for line in original.splitlines():
+        names = line.split("#", 1)[0].split()[1:]
+        name = next((n for n in names if n in entries), None)
+        if name is None:
+            lines.append(line)
+        elif name in pending:
+            lines.append(f"{pending.pop(name)}\t{name}")
+    lines += [f"{ip}\t{name}" for name, ip in pending.items()]
+    content = "\n".join(lines) + "\n"
+    if content == original:
+        return content
+
+    if backup:
+        with open(f"{path}.bak", "w") as f:
+            f.write(original)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".hosts-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.chmod(tmp, os.stat(path).st_mode & 0o777)
+        os.replace(tmp, path)
+    except OSError:
+        # /etc/hosts is a bind mount in containers and cannot be replaced
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        with open(path, "w") as f:
+            f.write(content)
+    return content
+
+
+def main() -> int:
+    parser = ArgumentParser(
+        description='Resolve the lab VM addresses in one pass and update /etc/hosts')
+    parser.add_argument('--connect', '-c', help='libvirt URI (default: the libvirt default)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    resolve_cmd = sub.add_parser('resolve', help='Print "NAME IP" for every VM matching a prefix')
+    resolve_cmd.add_argument('--prefix', default=os.environ.get('VM_PREFIX', 'vm-dpf'))
+    resolve_cmd.add_argument('--first', action='store_true',
+                             help='Print only the address of the first resolved VM')
+    resolve_cmd.add_argument('--wait', type=float, default=0, metavar='SECONDS',
+                             help='Wait for neighbour events of unresolved VMs (default: 0)')
+    hosts = sub.add_parser('hosts', help='Point host names at addresses in the hosts file')
+    hosts.add_argument('entries', nargs='+', metavar='IP=NAME')
+    hosts.add_argument('--file', default=HOSTS_FILE, help=f'Hosts file (default: {HOSTS_FILE})')
+    hosts.add_argument('--no-backup', action='store_true', help='Do not keep FILE.bak')
+    args = parser.parse_args()
+
+    if args.command == 'hosts':
+        entries = {}
+        for entry in args.entries:
+            ip, _, name = entry.partition("=")
+            if not name:
+                parser.error(f"expected IP=NAME, got {entry}")
+            entries[name] = ip
+        update_hosts(entries, args.file, not args.no_backup)
+        print(f"Updated {args.file}" + ("" if args.no_backup else f" (Backup created at {args.file}.bak)"))
+        for name, ip in entries.items():
+            print(f"{ip}\t{name}")
+        return 0
+
+    try:
+        vms = list_vms(args.prefix, args.connect)
+    except ResolverUnavailable as e:
+        print(f"Cannot list the VMs: {e}", file=sys.stderr)
+        return EXIT_UNAVAILABLE
+    if not vms:
+        print(f"No VMs found matching prefix: {args.prefix}", file=sys.stderr)
+        return EXIT_MISSING
+
+    index = build_index()
+    if args.wait > 0:
+        missing = wait_for_neighbors(vms, index, args.wait, args.first)
+    else:
+        missing = resolve(vms, index)
+    resolved = [vm for vm in vms if vm.ip]
+    for vm in resolved:
+        print(f"Found IP: {vm.ip} for VM: {vm.name} ({vm.source})", file=sys.stderr)
+    for vm in missing:
+        print(f"Could not find IP address for VM: {vm.name}", file=sys.stderr)
+    if args.first:
+        if not resolved:
+            return EXIT_MISSING
+        print(resolved[0].ip)
+        return 0
+    for vm in resolved:
+        print(f"{vm.name} {vm.ip}")
+    return EXIT_MISSING if missing else 0
+
+
+if __name__ == "__main__":
+    exit(main())
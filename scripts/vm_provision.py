@@ -0,0 +1,555 @@
+#!/usr/bin/python3
+"""
+Creates the lab VMs concurrently and waits for all of them together.
+
+The VM plan (names, MACs and network arguments) is built in one pass:
+from the interfaces of the static network file when it applies, otherwise
+VM_COUNT VMs with MACs derived from MAC_PREFIX or from the machine id, as
+scripts/vm.sh does. Domains are created with virt-install by a bounded
+pool, and readiness comes from libvirt lifecycle events: the libvirt
+Python binding when installed, otherwise a single "virsh event" stream.
+A fake backend simulates libvirt for tests.
+
+Exit status: 0 when every VM is running, 1 when a VM failed or timed out,
+2 when libvirt cannot be used (nothing was created), in which case
+callers fall back to the shell loop, 3 on a malformed command line.
+"""
+
+import abc
+import hashlib
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from cli import ArgumentParser
+
+EXIT_FAILED = 1
+EXIT_UNAVAILABLE = 2
+
+MAC_BASE = "52:54:00"
+MAC_PREFIX_PATTERN = re.compile(r"^[0-9A-Fa-f]{2}:[0-9A-Fa-f]{2}$")
+MACHINE_ID_FILE = "/etc/machine-id"
+OS_VARIANT = "rhel9.4"
+NIC_MODEL = "e1000e"
+
+DEFAULT_JOBS = 8
+# Same budget as the shell loop: 24 retries * 5s
+DEFAULT_TIMEOUT = 120
+DEFAULT_LOG_DIR = "logs/vms"
+# Seconds between listings that catch lifecycle events the stream missed
+RECONCILE_INTERVAL = 10
+
+RUNNING = "running"
+# Lifecycle events that leave a domain running, by their virsh names
+RUNNING_EVENTS = {"Started", "Resumed"}
+STOPPED_EVENTS = {"Stopped", "Shutdown", "Crashed", "Suspended", "Undefined"}
+
+# One line per event of "virsh event --loop", e.g.
+# event 'lifecycle' for domain 'vm-dpf1': Started Booted
+VIRSH_EVENT = re.compile(r"event 'lifecycle' for domain '?([^':]+)'?: (\w+)")
+
+
+class ProvisionUnavailable(Exception):
+    """Raised when libvirt cannot be used to create the VMs."""
+
+
+@dataclass
+class VmSpec:
+    name: str
+    mac: str
+    network: str
+    virt_install: list[str] = field(default_factory=list)
+
+
+@dataclass
+class VmConfig:
+    prefix: str
+    count: int
+    memory: int
+    vcpus: int
+    disk_sizes: tuple[int, int]
+    bridge: str
+    iso: str
+    mac_prefix: str = ""
+    static_net_file: Optional[str] = None
+    nodes_mtu: str = "1500"
+
+
+def mac_from_machine_id(vm_name: str, machine_id_file: str = MACHINE_ID_FILE) -> str:
+    """
+    Derives a stable MAC from the host machine id and the VM name, as
+    generate_mac_from_machine_id in utils.sh.
+    """
+    try:
+        with open(machine_id_file) as f:
+            machine_id = f.readline().strip()
+    except OSError:
+        raise Exception(f"Could not find {machine_id_file} file.")
+    digest = hashlib.sha256(f"{machine_id}-{vm_name}".encode("utf-8")).hexdigest()
+    return f"{MAC_BASE}:{digest[0:2]}:{digest[2:4]}:{digest[4:6]}"
+
+
+def mac_with_prefix(index: int, prefix: str) -> str:
+    if not MAC_PREFIX_PATTERN.match(prefix):
+        raise Exception(f"Invalid MAC_PREFIX format: {prefix}. Must be 4 hex digits "
+                        f"with colon (e.g., 'C0:00', 'A1:B2')")
+    return f"{MAC_BASE}:{prefix}:{index:02x}"
+
+
+def static_macs(path: str) -> list[str]:
+    """
+    Lists the MAC of every interface of the static network file, in order.
+    """
+    import yaml
+    with open(path) as f:
+        config = yaml.safe_load(f) or {}
+    return [interface["mac-address"]
+            for entry in config.get("static_network_config") or []
+            for interface in entry.get("interfaces") or []]
+
+
+def virt_install_args(config: VmConfig, name: str, network: str) -> list[str]:
+    return ["virt-install", "--name", name, "--memory", str(config.memory),
+            "--vcpus", str(config.vcpus),
+            f"--os-variant={OS_VARIANT}",
+            "--disk", f"pool=default,size={config.disk_sizes[0]}",
+            "--disk", f"pool=default,size={config.disk_sizes[1]}",
+            "--network", network,
+            "--graphics=vnc",
+            "--events", "on_reboot=restart",
+            "--cdrom", config.iso,
+            "--cpu", "host-passthrough",
+            "--noautoconsole",
+            "--wait=-1"]
+
+
+def build_plan(config: VmConfig) -> list[VmSpec]:
+    """
+    Builds the specs of all VMs. With a static network file (used when
+    NODES_MTU is not 1500) there is one VM per interface of the file,
+    otherwise config.count VMs.
+    """
+    if config.static_net_file and os.path.isfile(config.static_net_file) \
+            and config.nodes_mtu != "1500":
+        macs = static_macs(config.static_net_file)
+    elif config.mac_prefix:
+        macs = [mac_with_prefix(i, config.mac_prefix) for i in range(1, config.count + 1)]
+    else:
+        macs = [mac_from_machine_id(f"{config.prefix}{i}") for i in range(1, config.count + 1)]
+
+    plan = []
+    for i, mac in enumerate(macs, 1):
+        name = f"{config.prefix}{i}"
+        network = f"bridge={config.bridge},model={NIC_MODEL},mac={mac}"
+        plan.append(VmSpec(name, mac, network, virt_install_args(config, name, network)))
+    return plan
+
+
+class Backend(abc.ABC):
+    """
+    Creates domains and reports their lifecycle events.
+    """
+
+    @abc.abstractmethod
+    def states(self) -> dict[str, str]:
+        """
+        Returns the state of every defined domain by name.
+        """
+
+    @abc.abstractmethod
+    def subscribe(self, on_event: Callable[[str, bool], None]) -> None:
+        """
+        Starts delivering lifecycle events as on_event(domain, running).
+        """
+
+    def create(self, vm: VmSpec, log_dir: str):
+        """
+        Starts creating a domain.
+        Returns:
+            The creation process, with wait() and returncode
+        """
+        os.makedirs(log_dir, exist_ok=True)
+        log = open(os.path.join(log_dir, f"{vm.name}.log"), "ab")
+        # virt-install keeps running until the installation ends, detach it
+        # from this process like nohup does in the shell loop
+        process = subprocess.Popen(vm.virt_install, stdin=subprocess.DEVNULL, stdout=log,
+                                   stderr=subprocess.STDOUT, start_new_session=True)
+        log.close()
+        return process
+
+    def close(self) -> None:
+        pass
+
+
+class LibvirtBackend(Backend):
+    """
+    Lifecycle events through the libvirt Python binding.
+    """
+
+    def __init__(self, uri: Optional[str] = None):
+        try:
+            import libvirt
+        except ImportError:
+            raise ProvisionUnavailable("the libvirt Python binding is not installed")
+        if not shutil.which("virt-install"):
+            raise ProvisionUnavailable("virt-install is not installed")
+        self.libvirt = libvirt
+        libvirt.virEventRegisterDefaultImpl()
+        try:
+            self.conn = libvirt.open(uri)
+        except libvirt.libvirtError as e:
+            raise ProvisionUnavailable(f"cannot connect to libvirt: {e}")
+        self._callback = None
+
+    def states(self) -> dict[str, str]:
+        return {dom.name(): RUNNING if dom.state()[0] == self.libvirt.VIR_DOMAIN_RUNNING else "other"
+                for dom in self.conn.listAllDomains()}
+
+    def subscribe(self, on_event: Callable[[str, bool], None]) -> None:
+        libvirt = self.libvirt
+        running = {libvirt.VIR_DOMAIN_EVENT_STARTED, libvirt.VIR_DOMAIN_EVENT_RESUMED}
+
+        def callback(conn, dom, event, detail, opaque):
+            on_event(dom.name(), event in running)
+
+        self._callback = self.conn.domainEventRegisterAny(
+            None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, callback, None)
+
+        def loop():
+            while True:
+                libvirt.virEventRunDefaultImpl()
+
+        threading.Thread(target=loop, daemon=True).start()
+
+    def close(self) -> None:
+        if self._callback is not None:
+            self.conn.domainEventDeregisterAny(self._callback)
+        self.conn.close()
+
+
+class VirshBackend(Backend):
+    """
+    Lifecycle events from one long running "virsh event" process.
+    """
+
+    def __init__(self, uri: Optional[str] = None):
+        for tool in ("virsh", "virt-install"):
+            if not shutil.which(tool):
+                raise ProvisionUnavailable(f"{tool} is not installed")
+        self.virsh = ["virsh"] + (["-c", uri] if uri else [])
+        self._events: Optional[subprocess.Popen] = None
+
+    def states(self) -> dict[str, str]:
+        result = subprocess.run(self.virsh + ["list", "--all"], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise ProvisionUnavailable(f"virsh list failed: {result.stderr.strip()}")
+        states = {}
+        # " Id   Name      State", a separator line, then " 1    vm-dpf1   running"
+        for line in result.stdout.splitlines()[2:]:
+            parts = line.split()
+            if len(parts) >= 3:
+                states[parts[1]] = " ".join(parts[2:])
+        return states
+
+    def subscribe(self, on_event: Callable[[str, bool], None]) -> None:
+        self._events = subprocess.Popen(
+            self.virsh + ["event", "--all", "--loop", "--event", "lifecycle"],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+
+        def read():
+            for line in self._events.stdout:
+                match = VIRSH_EVENT.search(line)
+                if match and match.group(2) in RUNNING_EVENTS | STOPPED_EVENTS:
+                    on_event(match.group(1), match.group(2) in RUNNING_EVENTS)
+
+        threading.Thread(target=read, daemon=True).start()
+
+    def close(self) -> None:
+        if self._events and self._events.poll() is None:
+            self._events.terminate()
+            self._events.wait()
+
+
+class FakeProcess:
+    def __init__(self):
+        self.returncode: Optional[int] = None
+        self._done = threading.Event()
+
+    def exit(self, status: int) -> None:
+        self.returncode = status
+        self._done.set()
+
+    def wait(self) -> int:
+        self._done.wait()
+        return self.returncode
+
+
+class FakeBackend(Backend):
+    """
+    In-memory libvirt for tests: a created domain starts after a random
+    delay, or its creation fails for the names given in fail.
+    """
+
+    def __init__(self, delay: tuple[float, float] = (0.5, 2.0), fail: tuple[str, ...] = (),
+                 existing: Optional[dict[str, str]] = None):
+        self.delay = delay
+        self.fail = set(fail)
+        self.domains = dict(existing or {})
+        self.on_event: Optional[Callable[[str, bool], None]] = None
+        self.created: list[str] = []
+        self._timers: list[threading.Timer] = []
+
+    def states(self) -> dict[str, str]:
+        return dict(self.domains)
+
+    def subscribe(self, on_event: Callable[[str, bool], None]) -> None:
+        self.on_event = on_event
+
+    def create(self, vm: VmSpec, log_dir: str) -> FakeProcess:
+        process = FakeProcess()
+        self.created.append(vm.name)
+
+        def finish():
+            if vm.name in self.fail:
+                process.exit(1)
+                return
+            self.domains[vm.name] = RUNNING
+            if self.on_event:
+                self.on_event(vm.name, True)
+
+        timer = threading.Timer(random.uniform(*self.delay), finish)
+        timer.daemon = True
+        timer.start()
+        self._timers.append(timer)
+        return process
+
+    def close(self) -> None:
+        for timer in self._timers:
+            timer.cancel()
+
+
+def open_backend(name: str, uri: Optional[str] = None) -> Backend:
+    """
+    Opens a backend by name; "auto" prefers the libvirt binding over virsh.
+    Raises:
+        ProvisionUnavailable: No usable backend
+    """
+    if name == "fake":
+        return FakeBackend()
+    if name == "libvirt":
+        return LibvirtBackend(uri)
+    if name == "virsh":
+        return VirshBackend(uri)
+    try:
+        return LibvirtBackend(uri)
+    except ProvisionUnavailable:
+        return VirshBackend(uri)
+
+
+class Provisioner:
+    def __init__(self, backend: Backend, jobs: int = DEFAULT_JOBS,
+                 timeout: float = DEFAULT_TIMEOUT, log_dir: str = DEFAULT_LOG_DIR):
+        """
+        Args:
+            backend: Creates the domains and delivers their events
+            jobs: Domains being created at once
+            timeout: Seconds for each VM to reach running, counted from the
+                start of its creation
+            log_dir: Directory of the virt-install logs
+        """
+        self.backend = backend
+        self.jobs = jobs
+        self.timeout = timeout
+        self.log_dir = log_dir
+        self._cond = threading.Condition()
+        self.running: set[str] = set()
+        self.failed: dict[str, str] = {}
+        self.exited: dict[str, int] = {}
+
+    def _on_event(self, name: str, running: bool) -> None:
+        with self._cond:
+            if running:
+                self.running.add(name)
+            else:
+                self.running.discard(name)
+            self._cond.notify_all()
+
+    def _reconcile(self) -> None:
+        """
+        Applies a fresh listing of the domain states, for events that were
+        missed (e.g. before the event stream attached). Called with the
+        condition held; it is released while the backend is queried.
+        """
+        self._cond.release()
+        try:
+            states = self.backend.states()
+        except Exception as e:
+            print(f"Failed to list the VM states: {e}", flush=True)
+            return
+        finally:
+            self._cond.acquire()
+        for name, state in states.items():
+            if state == RUNNING:
+                self.running.add(name)
+            else:
+                self.running.discard(name)
+
+    def _watch(self, name: str, process) -> None:
+        status = process.wait()
+        with self._cond:
+            self.exited[name] = status
+            self._cond.notify_all()
+
+    def run(self, plan: list[VmSpec]) -> dict[str, str]:
+        """
+        Creates the VMs that are not defined yet and waits until every VM
+        of the plan is running. A VM that is queued behind the job limit
+        only starts its timeout when its creation starts.
+        Returns:
+            dict: The error of each VM that did not come up, by name
+        """
+        # Subscribe before looking at the states so no transition is missed
+        self.backend.subscribe(self._on_event)
+        states = self.backend.states()
+        queue = []
+        deadlines: dict[str, float] = {}
+        with self._cond:
+            for vm in plan:
+                if vm.name not in states:
+                    queue.append(vm)
+                elif states[vm.name] == RUNNING:
+                    self.running.add(vm.name)
+                else:
+                    print(f"VM {vm.name} is already defined ({states[vm.name]}), waiting for it",
+                          flush=True)
+                    deadlines[vm.name] = time.monotonic() + self.timeout
+        reported: set[str] = set()
+        creating: set[str] = set()
+        next_reconcile = time.monotonic() + RECONCILE_INTERVAL
+
+        with self._cond:
+            while True:
+                for name in sorted(self.running - reported):
+                    print(f"VM {name} is running.", flush=True)
+                    reported.add(name)
+                creating -= self.running
+                for name, status in self.exited.items():
+                    if name in creating and status != 0:
+                        self.failed[name] = (f"virt-install exited with status {status}, "
+                                             f"see {os.path.join(self.log_dir, name)}.log")
+                        creating.discard(name)
+                        print(f"VM {name}: {self.failed[name]}", flush=True)
+                while queue and len(creating) < self.jobs:
+                    vm = queue.pop(0)
+                    print(f"Starting VM creation for {vm.name} with MAC: {vm.mac}...", flush=True)
+                    process = self.backend.create(vm, self.log_dir)
+                    creating.add(vm.name)
+                    deadlines[vm.name] = time.monotonic() + self.timeout
+                    threading.Thread(target=self._watch, args=(vm.name, process),
+                                     daemon=True).start()
+
+                waiting = [vm.name for vm in plan
+                           if vm.name not in self.running and vm.name not in self.failed]
+                if not waiting:
+                    break
+                now = time.monotonic()
+                expired = [name for name in waiting if name in deadlines and deadlines[name] <= now]
+                # Never time out on events alone: check the listing first
+                if expired or now >= next_reconcile:
+                    self._reconcile()
+                    next_reconcile = time.monotonic() + RECONCILE_INTERVAL
+                    if any(name in self.running for name in waiting):
+                        continue
+                if expired:
+                    for name in expired:
+                        self.failed[name] = (f"did not reach running state within "
+                                             f"{self.timeout:g} seconds")
+                        creating.discard(name)
+                        print(f"VM {name}: {self.failed[name]}", flush=True)
+                    # Its job slot goes to the next queued VM
+                    continue
+                wake = min([next_reconcile] + [deadlines[name] for name in waiting
+                                               if name in deadlines])
+                self._cond.wait(wake - time.monotonic())
+        return self.failed
+
+
+def main() -> int:
+    parser = ArgumentParser(
+        description='Create the lab VMs concurrently and wait until they are running')
+    parser.add_argument('command', choices=['create', 'plan'],
+                        help='create the VMs, or print the plan')
+    parser.add_argument('--prefix', default=os.environ.get('VM_PREFIX', 'vm-dpf'))
+    parser.add_argument('--count', type=int, default=int(os.environ.get('VM_COUNT', '3')))
+    parser.add_argument('--memory', type=int, default=int(os.environ.get('RAM', '41984')),
+                        help='Memory in MiB')
+    parser.add_argument('--vcpus', type=int, default=int(os.environ.get('VCPUS', '14')))
+    parser.add_argument('--disk-size', type=int, nargs=2, metavar=('SIZE1', 'SIZE2'),
+                        default=(int(os.environ.get('DISK_SIZE1', '120')),
+                                 int(os.environ.get('DISK_SIZE2', '80'))),
+                        help='Sizes of the two disks in GiB')
+    parser.add_argument('--bridge', default=os.environ.get('BRIDGE_NAME', 'br0'))
+    parser.add_argument('--iso', help='Installation ISO (default: ISO_FOLDER/CLUSTER_NAME.iso)')
+    parser.add_argument('--mac-prefix', default=os.environ.get('MAC_PREFIX', ''),
+                        help='Two MAC octets, e.g. C0:00 (default: derived from the machine id)')
+    parser.add_argument('--static-net-file', default=os.environ.get('STATIC_NET_FILE'))
+    parser.add_argument('--nodes-mtu', default=os.environ.get('NODES_MTU', '1500'))
+    parser.add_argument('--jobs', '-j', type=int,
+                        default=int(os.environ.get('VM_CREATE_JOBS', DEFAULT_JOBS)),
+                        help=f'VMs created at once (default: {DEFAULT_JOBS})')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help=f'Seconds for each VM to reach running once its creation '
+                             f'starts (default: {DEFAULT_TIMEOUT})')
+    parser.add_argument('--backend', choices=['auto', 'libvirt', 'virsh', 'fake'], default='auto')
+    parser.add_argument('--connect', '-c', help='libvirt URI (default: the libvirt default)')
+    parser.add_argument('--log-dir', default=DEFAULT_LOG_DIR,
+                        help=f'Directory of the virt-install logs (default: {DEFAULT_LOG_DIR})')
+    args = parser.parse_args()
+
+    iso = args.iso or os.path.join(
+        os.environ.get('ISO_FOLDER', os.environ.get('DISK_PATH', '/var/lib/libvirt/images')),
+        f"{os.environ.get('CLUSTER_NAME', 'doca')}.iso")
+    config = VmConfig(args.prefix, args.count, args.memory, args.vcpus, tuple(args.disk_size),
+                      args.bridge, iso, args.mac_prefix, args.static_net_file, args.nodes_mtu)
+    try:
+        plan = build_plan(config)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+
+    if args.command == 'plan':
+        for vm in plan:
+            print(f"{vm.name} {vm.mac} {vm.network}")
+        return 0
+
+    try:
+        backend = open_backend(args.backend, args.connect)
+    except ProvisionUnavailable as e:
+        print(f"Cannot provision through libvirt: {e}", file=sys.stderr)
+        return EXIT_UNAVAILABLE
+
+    started = time.monotonic()
+    try:
+        failed = Provisioner(backend, max(1, args.jobs), args.timeout, args.log_dir).run(plan)
+    except ProvisionUnavailable as e:
+        print(f"Cannot provision through libvirt: {e}", file=sys.stderr)
+        return EXIT_UNAVAILABLE
+    finally:
+        backend.close()
+
+    for name, error in sorted(failed.items()):
+        print(f"Error: VM {name} {error}")
+    print(f"{len(plan) - len(failed)} of {len(plan)} VMs running "
+          f"in {time.monotonic() - started:.1f}s")
+    return EXIT_FAILED if failed else 0
+
+
+if __name__ == "__main__":
+    exit(main())
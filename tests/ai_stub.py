@@ -0,0 +1,130 @@
+"""
+A stub of the Assisted Installer API and of the SSO token endpoint.
+
+The cluster moves one status further on every GET of the cluster, through
+STATUSES until ready and through INSTALL_STATUSES once the installation
+was posted. Token exchanges can be made to fail.
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+PREFIX = "/api/assisted-install/v2"
+CLUSTER_ID = "abc"
+STATUSES = ("insufficient", "ready")
+INSTALL_STATUSES = ("preparing-for-installation", "installing", "installing", "finalizing",
+                    "installed")
+
+
+class AssistedStub:
+    def __init__(self, name: str = "doca", expires_in: int = 0, authenticated: bool = True):
+        """
+        Args:
+            name: The cluster name
+            expires_in: Lifetime of the access tokens; with 0 every request
+                exchanges the offline token again
+            authenticated: Whether API requests need an access token, as
+                opposed to a local mock API
+        """
+        self.name = name
+        self.expires_in = expires_in
+        self.authenticated = authenticated
+        # Replies of the next token exchanges as (status, body); a
+        # successful exchange once they are used up
+        self.token_replies: list[tuple[int, bytes]] = []
+        self.token_requests = 0
+        self.installs = 0
+        self.unauthorized = 0
+        self._step = 0
+        self._statuses = STATUSES
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}{PREFIX}"
+
+    @property
+    def token_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/token"
+
+    def _cluster(self, advance: bool) -> dict:
+        with self._lock:
+            status = self._statuses[min(self._step, len(self._statuses) - 1)]
+            if advance:
+                self._step += 1
+        percentage = {"installing": 50, "finalizing": 95, "installed": 100}.get(status, 0)
+        hosts = [{"requested_hostname": f"vm-dpf{i}", "status": status,
+                  "progress": {"installation_percentage": percentage}} for i in (1, 2)]
+        return {"id": CLUSTER_ID, "name": self.name, "status": status, "status_info": "",
+                "progress": {"total_percentage": percentage}, "updated_at": "1", "hosts": hosts}
+
+    def _token(self) -> tuple[int, bytes]:
+        with self._lock:
+            self.token_requests += 1
+            if self.token_replies:
+                return self.token_replies.pop(0)
+        return 200, json.dumps({"access_token": f"access-{self.token_requests}",
+                                "expires_in": self.expires_in}).encode()
+
+    def _install(self) -> None:
+        with self._lock:
+            self.installs += 1
+            self._statuses = INSTALL_STATUSES
+            self._step = 0
+
+    def start(self) -> "AssistedStub":
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status: int, body: bytes) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def authorized(self) -> bool:
+                if not stub.authenticated or \
+                        self.headers.get("Authorization", "").startswith("Bearer access-"):
+                    return True
+                stub.unauthorized += 1
+                self.reply(401, b"{}")
+                return False
+
+            def do_GET(self):
+                if not self.authorized():
+                    return
+                if self.path == f"{PREFIX}/clusters":
+                    self.reply(200, json.dumps([stub._cluster(advance=False)]).encode())
+                elif self.path == f"{PREFIX}/clusters/{CLUSTER_ID}":
+                    self.reply(200, json.dumps(stub._cluster(advance=True)).encode())
+                else:
+                    self.reply(404, b"{}")
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.path == "/token":
+                    self.reply(*stub._token())
+                elif not self.authorized():
+                    return
+                elif self.path == f"{PREFIX}/clusters/{CLUSTER_ID}/actions/install":
+                    stub._install()
+                    self.reply(202, b"{}")
+                else:
+                    self.reply(404, b"{}")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,94 @@
+"""
+Tests of scripts/ai_client.py against the stub API of ai_stub.py.
+"""
+
+import io
+import os
+import sys
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import ai_client  # noqa: E402
+from ai_stub import AssistedStub  # noqa: E402
+
+
+@mock.patch.multiple(ai_client, MIN_INTERVAL=0.01, NEAR_INTERVAL=0.01, MAX_INTERVAL=0.01)
+class WaiterTest(unittest.TestCase):
+    def setUp(self):
+        self.stub = AssistedStub().start()
+        self.addCleanup(self.stub.stop)
+        self.client = ai_client.AssistedClient(self.stub.url, "offline", self.stub.token_url)
+        self.output = io.StringIO()
+
+    def install(self) -> bool:
+        with redirect_stdout(self.output):
+            return ai_client.Waiter(self.client, "doca", timeout=10).install()
+
+    def test_install(self):
+        self.assertTrue(self.install())
+        self.assertEqual(self.stub.installs, 1)
+        self.assertEqual(self.stub.unauthorized, 0)
+        output = self.output.getvalue()
+        self.assertIn("Starting installation of cluster doca", output)
+        self.assertIn("Cluster doca reached status: installed", output)
+
+    def test_token_refresh_failures_are_retried(self):
+        # The first exchange succeeds, the next polls hit an SSO outage and
+        # a garbled reply
+        self.stub.token_replies = [
+            (200, b'{"access_token": "access-1", "expires_in": 0}'),
+            (503, b"Service Unavailable"),
+            (200, b"<html>"),
+            (200, b'{"expires_in": 0}'),
+        ]
+        self.assertTrue(self.install())
+        self.assertEqual(self.stub.installs, 1)
+        output = self.output.getvalue()
+        self.assertIn("token exchange failed: 503", output)
+        self.assertIn("malformed token exchange reply", output)
+        self.assertIn("Cluster doca reached status: installed", output)
+
+    def test_status_already_passed(self):
+        with redirect_stdout(self.output):
+            self.client.install("abc")
+            self.assertTrue(ai_client.Waiter(self.client, "doca", timeout=10).wait("ready"))
+        self.assertEqual(self.stub.installs, 1)
+
+
+@mock.patch.multiple(ai_client, MIN_INTERVAL=0.01, NEAR_INTERVAL=0.01, MAX_INTERVAL=0.01)
+class MainTest(unittest.TestCase):
+    def setUp(self):
+        self.stub = AssistedStub(authenticated=False).start()
+        self.addCleanup(self.stub.stop)
+
+    def main(self, *args: str) -> int:
+        environment = {"AI_URL": self.stub.url, "AI_OFFLINETOKEN": ""}
+        with mock.patch.dict(os.environ, environment), \
+                mock.patch.object(ai_client, "OFFLINE_TOKEN_FILE", "/nonexistent"), \
+                mock.patch.object(sys, "argv", ["ai_client.py", "--cluster", "doca", *args]), \
+                redirect_stdout(io.StringIO()):
+            return ai_client.main()
+
+    def test_install(self):
+        self.assertEqual(self.main("install"), 0)
+        self.assertEqual(self.stub.installs, 1)
+        self.assertEqual(self.stub.token_requests, 0)
+
+    def test_unavailable(self):
+        with mock.patch.object(ai_client.AssistedClient, "find_cluster",
+                               side_effect=ConnectionRefusedError()), \
+                mock.patch("sys.stderr", io.StringIO()):
+            self.assertEqual(self.main("wait", "ready"), ai_client.EXIT_UNAVAILABLE)
+
+    def test_usage_error(self):
+        with mock.patch("sys.stderr", io.StringIO()), self.assertRaises(SystemExit) as e:
+            self.main("--bogus")
+        self.assertEqual(e.exception.code, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
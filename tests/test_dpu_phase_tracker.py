@@ -0,0 +1,81 @@
+"""
+Tests of scripts/dpu_phase_tracker.py on recorded events.
+"""
+
+import io
+import json
+import os
+import sys
+import unittest
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+from dpu_phase_tracker import DELETED_PHASE, Event, PhaseTracker, replay  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+# Watch recording of a DPU (and its DPUSet) provisioned to Ready, deleted
+# and provisioned again under the same name
+DELETE_RECREATE = os.path.join(FIXTURES, "dpu-delete-recreate.jsonl")
+
+
+def track(events) -> PhaseTracker:
+    tracker = PhaseTracker()
+    with redirect_stdout(io.StringIO()):
+        for event in events:
+            tracker.observe(event)
+    return tracker
+
+
+def without_uid(events):
+    for event in events:
+        del event.obj["metadata"]["uid"]
+        yield event
+
+
+class DeleteRecreateTest(unittest.TestCase):
+    def check(self, tracker: PhaseTracker) -> None:
+        timeline = tracker.timeline()
+        dpus = [o for o in timeline["objects"] if o["kind"] == "dpu"]
+        self.assertEqual([o["phase"] for o in dpus], [DELETED_PHASE, "Ready"])
+        self.assertEqual([[t["phase"] for t in o["transitions"]] for o in dpus],
+                         [["Initializing", "OS Installing", "Rebooting", "Ready", DELETED_PHASE],
+                          ["Initializing", "OS Installing", "Rebooting", "Ready"]])
+        # Both provisionings reached Ready
+        self.assertEqual(timeline["dpu_ready"]["count"], 2)
+        self.assertTrue(all(o["ready_seconds"] is not None for o in dpus))
+        phases = {(p["kind"], p["phase"]): p["count"] for p in timeline["phases"]}
+        self.assertNotIn(("dpu", DELETED_PHASE), phases)
+        # The Ready phase ended by the deletion is not a phase duration
+        self.assertNotIn(("dpu", "Ready"), phases)
+        self.assertEqual(phases[("dpu", "OS Installing")], 2)
+        self.assertTrue(tracker.all_ready())
+        metrics = tracker.openmetrics()
+        self.assertIn('dpf_provisioning_objects{kind="dpu",phase="Ready"} 1', metrics)
+        self.assertNotIn(f'phase="{DELETED_PHASE}"', metrics)
+
+    def test_by_uid(self):
+        self.check(track(replay([DELETE_RECREATE])))
+
+    def test_without_uid(self):
+        self.check(track(without_uid(replay([DELETE_RECREATE]))))
+
+    def test_recreated_while_not_watching(self):
+        # A relist after a dropped watch shows the new object without a
+        # DELETED event for the old one
+        events = [e for e in replay([DELETE_RECREATE]) if e.type != "DELETED"]
+        tracker = track(events)
+        dpus = [o for o in tracker.timeline()["objects"] if o["kind"] == "dpu"]
+        self.assertEqual([o["uid"] for o in dpus], ["7f3c2a1e-0001", "9b41d6c0-0002"])
+        self.assertEqual(tracker.timeline()["dpu_ready"]["count"], 2)
+
+    def test_late_deletion_of_replaced_object(self):
+        events = list(replay([DELETE_RECREATE]))
+        deleted = next(e for e in events if e.type == "DELETED" and e.kind == "dpu")
+        late = Event(events[-1].time + 1, "DELETED", "dpu", json.loads(json.dumps(deleted.obj)))
+        tracker = track(events + [late])
+        self.assertTrue(tracker.all_ready())
+
+
+if __name__ == "__main__":
+    unittest.main()
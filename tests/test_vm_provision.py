@@ -0,0 +1,86 @@
+"""
+Tests of scripts/vm_provision.py against the fake libvirt backend.
+"""
+
+import io
+import os
+import sys
+import time
+import unittest
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+from vm_provision import RUNNING, FakeBackend, Provisioner, VmSpec  # noqa: E402
+
+
+def plan(count: int) -> list[VmSpec]:
+    return [VmSpec(f"vm-{i}", f"52:54:00:00:00:{i:02x}", "bridge=br0") for i in range(1, count + 1)]
+
+
+def provision(backend: FakeBackend, vms: list[VmSpec], jobs: int, timeout: float):
+    provisioner = Provisioner(backend, jobs, timeout, log_dir="unused")
+    started = time.monotonic()
+    with redirect_stdout(io.StringIO()):
+        failed = provisioner.run(vms)
+    backend.close()
+    return provisioner, failed, time.monotonic() - started
+
+
+class ProvisionerTest(unittest.TestCase):
+    def test_creates_in_parallel(self):
+        backend = FakeBackend(delay=(0.3, 0.3))
+        provisioner, failed, elapsed = provision(backend, plan(6), jobs=6, timeout=5)
+        self.assertEqual(failed, {})
+        self.assertEqual(provisioner.running, {vm.name for vm in plan(6)})
+        # Six 0.3s creations at once, not one after the other
+        self.assertLess(elapsed, 1.2)
+
+    def test_job_limit(self):
+        backend = FakeBackend(delay=(0.2, 0.2))
+        _, failed, elapsed = provision(backend, plan(4), jobs=2, timeout=5)
+        self.assertEqual(failed, {})
+        self.assertGreaterEqual(elapsed, 0.4)
+
+    def test_skips_running_domains(self):
+        backend = FakeBackend(delay=(0.1, 0.1), existing={"vm-1": RUNNING})
+        _, failed, _ = provision(backend, plan(2), jobs=2, timeout=5)
+        self.assertEqual(failed, {})
+        self.assertEqual(backend.created, ["vm-2"])
+
+    def test_creation_failure(self):
+        backend = FakeBackend(delay=(0.1, 0.1), fail=("vm-2",))
+        provisioner, failed, _ = provision(backend, plan(3), jobs=3, timeout=5)
+        self.assertEqual(set(failed), {"vm-2"})
+        self.assertIn("virt-install exited with status 1", failed["vm-2"])
+        self.assertEqual(provisioner.running, {"vm-1", "vm-3"})
+
+    def test_timeout(self):
+        backend = FakeBackend(delay=(60, 60))
+        _, failed, elapsed = provision(backend, plan(2), jobs=2, timeout=0.3)
+        self.assertEqual(set(failed), {"vm-1", "vm-2"})
+        self.assertIn("within 0.3 seconds", failed["vm-1"])
+        self.assertLess(elapsed, 2)
+
+    def test_timeout_is_per_vm(self):
+        # One job: vm-2 waits 0.4s behind vm-1, more than the timeout, and
+        # still comes up since its timeout starts with its creation
+        backend = FakeBackend(delay=(0.4, 0.4))
+        _, failed, _ = provision(backend, plan(2), jobs=1, timeout=0.6)
+        self.assertEqual(failed, {})
+
+    def test_timed_out_vm_frees_its_job(self):
+        backend = FakeBackend()
+        create = backend.create
+
+        def create_vm1_hangs(vm, log_dir):
+            backend.delay = (60, 60) if vm.name == "vm-1" else (0.1, 0.1)
+            return create(vm, log_dir)
+
+        backend.create = create_vm1_hangs
+        _, failed, _ = provision(backend, plan(2), jobs=1, timeout=0.3)
+        self.assertEqual(set(failed), {"vm-1"})
+
+
+if __name__ == "__main__":
+    unittest.main()